@@ -103,6 +103,8 @@ class BaseConfig():
     REPLACE_ATTRIBUTE_KEYS = False
     LOWERCASE_ATTRIBUTE_KEYS = False
     LOWERCASE_HOSTNAMES = False
+    # Rows an importer writes with one bulk operation
+    IMPORT_BATCH_SIZE = 500
     LABELS_ITERATE_FIRST_LEVEL = False
     LABELS_IMPORT_EMPTY = False
 
@@ -153,11 +155,25 @@ class BaseConfig():
     # Checkmk's activate-changes wait-for-completion is a redirect-based
     # long-poll; raise this if a big activation still hits "Exceeded N redirects".
     HTTP_MAX_REDIRECTS = 100
+    # Requests Plugin.map_requests() runs in parallel, also the size of the
+    # connection pool. Per account: custom field 'http_workers'.
+    HTTP_MAX_WORKERS = 8
+    # Requests per second to one target host, 0 = unlimited.
+    # Per account: custom field 'http_rate_limit'.
+    HTTP_RATE_LIMIT = 0
 
     SWAGGER_ENABLED = True
     DEBUG = False
     ADVANCED_RULE_DEBUG = False
 
+    # Where per-host rule caches live: 'collection' (own collection,
+    # bulk written) or 'host' (inside the Host document, as before)
+    RULE_CACHE_BACKEND = 'collection'
+    # Hosts whose cache entries are kept in memory per process
+    RULE_CACHE_LRU_HOSTS = 2000
+    # Queued cache writes sent in one bulk upsert
+    RULE_CACHE_WRITE_BATCH = 500
+
     CMDB_MODE = False
 
     MONGODB_SETTINGS = _get_mongo_settings('127.0.0.1')
@@ -358,12 +374,46 @@ class BaseConfig():
     # but needs more RAM.
     CMK_COLLECT_BULK_OPERATIONS = False
 
+    # Hosts a worker calculates per task during the host, rule and tag
+    # export. Host export results stream back batch by batch, so
+    # create/update bulks are sent while the calculation is still running.
+    CMK_CALCULATION_BATCH_SIZE = 50
+
+    # Downtime export: hosts sharing the same downtime are set with one
+    # request (livestatus query over the hostnames), this many per request,
+    # 1 sends one request per host. Up to CMK_DOWNTIME_REQUEST_WORKERS
+    # requests are sent at the same time.
+    CMK_DOWNTIME_BULK_HOSTS = 100
+    CMK_DOWNTIME_REQUEST_WORKERS = 8
+
+    # Let MongoDB collect the distinct label and inventory values for the
+    # group export with one aggregation instead of calculating every host.
+    # Much faster on big installations, but custom attributes, rewrites,
+    # filters and template labels are not applied to the values.
+    CMK_GROUPS_DISTINCT_QUERY = False
+
     # Checkmk API will break for get_hosts at some point
     # In the example it was at 50k hosts.
     # Activating this, Syncer will query Hosts Folder by Folder.
     # That will take longer, but will not break Checkmk.
     CMK_GET_HOST_BY_FOLDER = False
 
+    # Parse the host list of Checkmk while it is downloaded and keep only
+    # the compacted hosts, instead of decoding the whole response at once.
+    # Keeps the memory low on big sites without the slower folder by
+    # folder fetch.
+    CMK_STREAM_HOSTS = False
+
+    # Keep the last known state of the Checkmk hosts in the database. Until
+    # CMK_HOST_STATE_MAX_AGE seconds passed, the export only fetches the
+    # hosts it changed itself or which appeared in or moved between folders.
+    # Attribute changes done directly in Checkmk show up with the next full
+    # fetch (or `checkmk export_hosts --full-fetch`).
+    CMK_HOST_STATE_CACHE = False
+    CMK_HOST_STATE_MAX_AGE = 86400
+    # More hosts to refetch than this, and all hosts are fetched at once
+    CMK_HOST_STATE_MAX_DELTA = 500
+
     # Log all Changed done on Hosts
     CMK_DETAILED_LOG = False
 
@@ -371,6 +421,36 @@ class BaseConfig():
     CMK_JINJA_USE_REPLACERS_FOR_HOSTNAMES = False
 
     NETBOX_IMPORT_NESTED = False
+    # Load referenced objects (sites, roles, platforms...) once per run
+    # instead of looking them up for every exported object
+    NETBOX_PREFETCH_REFERENCES = True
+    # Objects per bulk create/update request of the Netbox exports
+    NETBOX_BULK_SIZE = 100
+
+    # Category reads per JSON-RPC batch request of the i-doit import.
+    # The batches are sent in parallel, see HTTP_MAX_WORKERS.
+    IDOIT_BATCH_SIZE = 50
+
+    # Objects per page of the VMware PropertyCollector reads
+    VMWARE_PAGE_SIZE = 1000
+
+    # Rows per fetchmany() call of the MySQL and ODBC/MSSQL imports,
+    # account field fetch_size
+    SQL_FETCH_SIZE = 1000
+
+    # Incremental ServiceNow imports read the whole table again when the
+    # last full read is older than this (seconds)
+    SERVICENOW_FULL_SYNC_INTERVAL = 86400
+
+    # The Jira Cloud export skips hosts whose attributes did not change
+    # since the last export, and compares all hosts with Jira again after
+    # this many seconds
+    JIRA_EXPORT_FULL_SYNC_INTERVAL = 86400
+    # Up to this many changed hosts per object type are looked up in Jira
+    # by name, more load all objects of the type
+    JIRA_EXPORT_LOOKUP_LIMIT = 1000
+    # Repeats of a Jira write answered with 429 Too Many Requests
+    JIRA_RATE_LIMIT_RETRIES = 5
 
     PROCESS_TIMEOUT = 15
 
@@ -2,14 +2,17 @@
 """
 Inventory Helpers
 """
+from bisect import bisect_left
+
 from application.models.host import Host
+from application.models.host_import import write_operation
 from application.helpers.syncer_jinja import render_jinja
 from application.modules.debug import ColorCodes as CC
 from syncerapi.v1.core import (
     app_config,
 )
 
-def inventorize_host(host_obj, labels, key, config):
+def inventorize_host(host_obj, labels, key, config, save=True):
     """
     Add Inventorize Information to host
     """
@@ -20,11 +23,107 @@ def inventorize_host(host_obj, labels, key, config):
         if changed is not None:
             host_obj.mark_inventorized(changed=changed)
         print(f" {CC.OKBLUE} * {CC.ENDC} {host_obj.hostname}: Updated Inventory")
-        host_obj.save()
+        if save:
+            host_obj.save()
     else:
         print(f" {CC.WARNING} * {CC.ENDC} Syncer does not have this Host")
 
 
+def _plain_key(key):
+    """
+    Inventory key which can be addressed as inventory.<key> in an update
+    """
+    return '.' not in key and not key.startswith('$')
+
+
+def _inventory_delta(host_obj, inventory_before):
+    """
+    (sets, unsets) of everything inventorize_host() changed on the host.
+
+    Replacing keys in the inventory dict marks the whole dict as changed,
+    so the inventory part is diffed against the state it was loaded with
+    and only the changed keys are written.
+    """
+    # pylint: disable-next=protected-access
+    sets, unsets = host_obj._delta()
+    if 'inventory' in sets:
+        inventory = sets['inventory']
+        changed = {key: value for key, value in inventory.items()
+                   if key not in inventory_before or inventory_before[key] != value}
+        removed = [key for key in inventory_before if key not in inventory]
+        if all(_plain_key(key) for key in [*changed, *removed]):
+            del sets['inventory']
+            sets.update({f'inventory.{key}': value for key, value in changed.items()})
+            unsets.update({f'inventory.{key}': 1 for key in removed})
+    return sets, unsets
+
+
+class _DomainIndex:  # pylint: disable=too-few-public-methods
+    """
+    All hostnames, reversed and sorted: the hosts ending with a domain
+    are one range in it instead of a collection scan per object
+    """
+
+    def __init__(self):
+        self._reversed = sorted(name[::-1] for name in Host.objects.scalar('hostname'))
+
+    def match(self, suffix):
+        """
+        Hostnames ending with suffix
+        """
+        needle = suffix[::-1]
+        names = []
+        for idx in range(bisect_left(self._reversed, needle), len(self._reversed)):
+            name = self._reversed[idx]
+            if not name.startswith(needle):
+                break
+            names.append(name[::-1])
+        return names
+
+
+class _InventoryBatch:
+    """
+    Inventory updates of up to IMPORT_BATCH_SIZE objects: the hosts are
+    loaded with one query, updated in memory and written with one bulk_write
+    """
+
+    def __init__(self):
+        self.size = app_config.get('IMPORT_BATCH_SIZE', 500)
+        self._rows = []
+        self._hostnames = set()
+
+    def add(self, hostnames, labels, key, config):
+        """
+        Queue inventory data for the given hosts
+        """
+        self._rows.append((hostnames, labels, key, config))
+        self._hostnames.update(hostnames)
+        if len(self._rows) >= self.size or len(self._hostnames) >= self.size:
+            self.flush()
+
+    def flush(self):
+        """
+        Apply and write the queued inventory data
+        """
+        rows, self._rows = self._rows, []
+        hostnames, self._hostnames = self._hostnames, set()
+        if not rows:
+            return
+        hosts = {host_obj.hostname: host_obj
+                 for host_obj in Host.objects(hostname__in=list(hostnames))}
+        inventory_before = {name: dict(host_obj.inventory)
+                            for name, host_obj in hosts.items()}
+        for row_hostnames, labels, key, config in rows:
+            for hostname in row_hostnames:
+                inventorize_host(hosts.get(hostname), labels, key, config, save=False)
+        operations = []
+        for name, host_obj in hosts.items():
+            if operation := write_operation(
+                    host_obj, _inventory_delta(host_obj, inventory_before[name])):
+                operations.append(operation)
+        if operations:
+            # pylint: disable-next=protected-access
+            Host._get_collection().bulk_write(operations, ordered=False)
 
 
 def run_inventory(config, objects, sub_key=None):  # pylint: disable=too-many-branches
@@ -55,7 +154,8 @@ def run_inventory(config, objects, sub_key=None):  # pylint: disable=too-many-br
     Side Effects:
         - Prints progress information to stdout
         - Calls inventorize_host() to store inventory data
-        - May create or update Host objects in the database
+        - Updates existing Host objects in the database, loaded and
+          written in batches of IMPORT_BATCH_SIZE objects
         - Processes collected hosts in a second pass for additional data aggregation
     
     Note:
@@ -67,6 +167,8 @@ def run_inventory(config, objects, sub_key=None):  # pylint: disable=too-many-br
     if sub_key:
         inv_key += "_" + sub_key
     collected_by_key = {}
+    domain_index = None
+    batch = _InventoryBatch()
     for hostname, labels in objects:
         if isinstance(labels, list):
             labels = {'list':labels}
@@ -86,21 +188,26 @@ def run_inventory(config, objects, sub_key=None):  # pylint: disable=too-many-br
                     collected_by_key[value].append(hostname)
 
         if config.get('inventorize_match_by_domain'):
-            for host_obj in Host.objects(hostname__endswith=hostname):
-                inventorize_host(host_obj, labels, inv_key, config)
+            if domain_index is None:
+                domain_index = _DomainIndex()
+            batch.add(domain_index.match(hostname), labels, inv_key, config)
         else:
-            host_obj = Host.get_host(hostname, create=False)
-            inventorize_host(host_obj, labels, inv_key, config)
+            batch.add([hostname.strip()], labels, inv_key, config)
+    batch.flush()
 
     if collected_by_key:
         print(f"{CC.OKBLUE}Run 2: {CC.ENDC} Add extra collected data")
 
         for hostname, subs in collected_by_key.items():
             # Loop ALL hosts to delete empty collections if not found anymore
-            host_obj = Host.get_host(hostname, create=False)
+            # Match the collected value like Host.get_host() would
+            hostname = hostname.strip()
+            if app_config['LOWERCASE_HOSTNAMES']:
+                hostname = hostname.lower()
             # Stringify the enumeration index — the MongoDB-key validator
             # in update_inventory() runs before _fix_key() and refuses
             # raw ints, while the on-disk shape (``<key>__0``, ``__1``, …)
             # has always been string-keyed via ``_fix_key``.
-            inventorize_host(host_obj, {str(i): v for i, v in enumerate(subs)},
-                             f"{inv_key}_collection", False)
+            batch.add([hostname], {str(i): v for i, v in enumerate(subs)},
+                      f"{inv_key}_collection", False)
+        batch.flush()
@@ -0,0 +1,111 @@
+"""
+Incremental JSON parsing
+
+Collection endpoints answer with one JSON object holding all items in a
+single array, e.g. Checkmk's ``{"links": [...], "value": [...]}``.
+Decoding the whole body keeps the raw text and every item in memory at
+the same time. `iter_json_array` reads the body chunk by chunk and hands
+out the items of the array one by one, so only the item being decoded
+has to fit in memory.
+"""
+import codecs
+import json
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+class _Buffer:
+    """
+    Text of the chunks not consumed yet
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        # A multi byte character can be split between two chunks
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self.text = ''
+        self.pos = 0
+        self.exhausted = False
+
+    def fill(self):
+        """
+        Append the next chunk, False if there is none left
+        """
+        for chunk in self._chunks:
+            if isinstance(chunk, bytes):
+                chunk = self._decoder.decode(chunk)
+            if chunk:
+                self.text = self.text[self.pos:] + chunk
+                self.pos = 0
+                return True
+        self.exhausted = True
+        return False
+
+    def peek(self):
+        """
+        Next character which is not whitespace, '' at the end
+        """
+        while True:
+            while self.pos < len(self.text) and self.text[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, chars):
+        """
+        Consume the next character, which must be one of `chars`
+        """
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"Expected one of {chars!r} at offset {self.pos}, "
+                             f"got {char or 'end of data'!r}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        """
+        Decode the next JSON value
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # A number could go on in the next chunk
+            if end == len(self.text) and not self.exhausted and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_array(chunks, key='value'):
+    """
+    Yield the items of the array `key` of the top level JSON object
+    spread over `chunks` (str or UTF-8 bytes, e.g. from
+    `response.iter_content()`). Nothing is yielded if the key is missing.
+    Raises ValueError on malformed JSON.
+    """
+    buffer = _Buffer(chunks)
+    buffer.expect('{')
+    if buffer.peek() == '}':
+        return
+    while True:
+        name = buffer.value()
+        buffer.expect(':')
+        if name == key and buffer.peek() == '[':
+            buffer.expect('[')
+            if buffer.peek() == ']':
+                return
+            while True:
+                yield buffer.value()
+                if buffer.expect(',]') == ']':
+                    return
+        buffer.value()
+        if buffer.expect(',}') == '}':
+            return
@@ -184,6 +184,14 @@ PRESETS = [
              'default': False,
              'hint': 'Iterate hosts via folder traversal — use for '
                      'very large Checkmk instances.'},
+            {'key': 'CMK_STREAM_HOSTS', 'type': 'bool', 'default': False,
+             'hint': 'Parse the Checkmk host list while downloading it — '
+                     'low memory without the folder traversal.'},
+            {'key': 'CMK_HOST_STATE_CACHE', 'type': 'bool', 'default': False,
+             'hint': 'Keep the Checkmk hosts between exports and only '
+                     'refetch changed ones.'},
+            {'key': 'CMK_HOST_STATE_MAX_AGE', 'type': 'int', 'default': 86400,
+             'hint': 'Seconds until the host snapshot is fully refetched.'},
             {'key': 'CMK_WRITE_STATUS_BACK', 'type': 'bool', 'default': False,
              'hint': 'Update existing hosts in Checkmk on every sync pass.'},
         ],
@@ -286,6 +294,12 @@ PRESETS = [
              'hint': 'Sleep between retries, in seconds.'},
             {'key': 'HTTP_MAX_RETRIES', 'type': 'int', 'default': 2,
              'hint': 'Number of automatic retries on transient errors.'},
+            {'key': 'HTTP_MAX_WORKERS', 'type': 'int', 'default': 8,
+             'hint': 'Requests an export sends in parallel, and the '
+                     'connection pool size. Account field: http_workers.'},
+            {'key': 'HTTP_RATE_LIMIT', 'type': 'int', 'default': 0,
+             'hint': 'Max requests per second to one target host, '
+                     '0 = unlimited. Account field: http_rate_limit.'},
             {'key': 'DISABLE_SSL_ERRORS', 'type': 'bool', 'default': False,
              'hint': 'Skip TLS certificate verification on outbound '
                      'calls. Dev / lab only.'},
@@ -0,0 +1,129 @@
+"""
+Paged HTTP sources
+
+Import APIs hand out big data sets in pages. `iter_pages` follows the
+pagination style configured on the account and yields the records page
+by page, so an import can process them while the next pages load and
+never holds the whole data set.
+
+Account fields:
+
+- ``pagination``: ``page``, ``offset``, ``cursor``, ``next_link`` or
+  ``link_header``; empty means a single request
+- ``page_size`` and ``page_size_param``: records per page and its query
+  parameter (``per_page``, ``limit`` for offset)
+- ``page_param``: query parameter of the page number, offset or cursor
+  (``page``, ``offset``, ``cursor``)
+- ``page_start``: number of the first page (1, 0 for offset)
+- ``next_key``: dotted path of the cursor or next URL in the body
+- ``page_workers``: pages loaded at the same time (page and offset only)
+"""
+from urllib.parse import urljoin
+
+PAGINATION_STYLES = ('page', 'offset', 'cursor', 'next_link', 'link_header')
+
+_DEFAULT_PARAMS = {
+    'page': ('page', 'per_page'),
+    'offset': ('offset', 'limit'),
+    'cursor': ('cursor', 'per_page'),
+    'next_link': (None, 'per_page'),
+    'link_header': (None, 'per_page'),
+}
+
+
+def dig(data, path):
+    """
+    Value at the dotted `path` of nested dicts, None if missing
+    """
+    for key in path.split('.'):
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+def pagination_style(config):
+    """
+    Configured pagination style of an account, None for a single request
+    """
+    style = (config.get('pagination') or '').strip().lower()
+    if not style:
+        return None
+    if style not in PAGINATION_STYLES:
+        raise ValueError(f"Unknown pagination {style!r}, "
+                         f"use one of {', '.join(PAGINATION_STYLES)}")
+    return style
+
+
+def _int_setting(config, key, default):
+    value = config.get(key)
+    return int(value) if value not in (None, '') else default
+
+
+# pylint: disable-next=too-many-locals,too-many-branches
+def iter_pages(plugin, request, decode, records):
+    """
+    Yield the records of every page.
+
+    `request` holds the keyword arguments of `plugin.inner_request()` for
+    the first page, `decode(response)` returns the body of a page and
+    `records(body)` the list of records in it.
+    """
+    config = plugin.config
+    style = pagination_style(config)
+    page_param, size_param = _DEFAULT_PARAMS[style]
+    page_param = config.get('page_param') or page_param
+    size_param = config.get('page_size_param') or size_param
+    page_size = _int_setting(config, 'page_size', 100)
+    base_params = dict(request.get('params') or {})
+    base_params[size_param] = page_size
+
+    def fetch(url, params):
+        response = plugin.inner_request(**dict(request, url=url, params=params))
+        body = decode(response)
+        return response, body, list(records(body))
+
+    if style in ('page', 'offset'):
+        step = page_size if style == 'offset' else 1
+        start = _int_setting(config, 'page_start', 0 if style == 'offset' else 1)
+        workers = max(_int_setting(config, 'page_workers', 1), 1)
+        first = 0
+        while True:
+            window = [start + (first + index) * step for index in range(workers)]
+            for _, result, error in plugin.map_requests(
+                    lambda number: fetch(request['url'], dict(base_params,
+                                                              **{page_param: number})),
+                    window, workers):
+                if error:
+                    raise error
+                page = result[2]
+                if page:
+                    yield page
+                if len(page) < page_size:
+                    return
+            first += workers
+
+    url, params = request['url'], base_params
+    seen = set()
+    while url:
+        response, body, page = fetch(url, params)
+        if page:
+            yield page
+        if style == 'link_header':
+            next_url = (getattr(response, 'links', None) or {}).get('next', {}).get('url')
+            # The link carries the query of the next page already
+            params = None
+        else:
+            next_value = dig(body, config.get('next_key') or 'next')
+            if style == 'cursor':
+                next_url = request['url'] if next_value else None
+                params = dict(base_params, **{page_param: next_value})
+            else:
+                next_url = urljoin(url, next_value) if next_value else None
+                params = None
+        # An API repeating its last cursor or link would never end
+        marker = (next_url, str(params))
+        if marker in seen:
+            return
+        seen.add(marker)
+        url = next_url
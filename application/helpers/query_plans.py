@@ -0,0 +1,87 @@
+"""
+Hot queries and the plans MongoDB picks for them.
+
+An index the planner does not choose is as good as a missing one, and
+nothing in a normal run tells you: the export just gets slower as the
+collection grows. Models register the queries every sync runs here and
+``cmdbsyncer sys explain_queries`` asks MongoDB for the winning plan of
+each, flagging every one that falls back to a full collection scan.
+
+Same shape as ``application.helpers.stale_indexes``, so plugin and
+Enterprise models can register from their own package on import.
+"""
+from bson import ObjectId
+
+# name -> callable returning the QuerySet to explain, in registration order.
+_HOT_QUERIES = {}
+
+
+def register_hot_query(name, build_queryset):
+    """
+    Register `build_queryset`, a callable returning the QuerySet a hot
+    path runs, under `name`. Registering a name again replaces it.
+    """
+    _HOT_QUERIES[name] = build_queryset
+
+
+def plan_stages(plan):
+    """
+    Return the stage names of an explain() plan tree, root first.
+    Handles the classic (`inputStage`/`inputStages`) and the slot based
+    engine layout (`queryPlan`) of the winning plan.
+    """
+    stages = []
+    pending = [plan]
+    while pending:
+        node = pending.pop(0)
+        if not isinstance(node, dict):
+            continue
+        if 'queryPlan' in node:
+            pending.append(node['queryPlan'])
+            continue
+        if 'stage' in node:
+            stages.append(node['stage'])
+        if 'inputStage' in node:
+            pending.append(node['inputStage'])
+        pending.extend(node.get('inputStages', []))
+    return stages
+
+
+def explain_hot_queries():
+    """
+    Explain every registered query. Yields (name, stages, error) with
+    `stages` the winning plan's stage names; `error` is set instead if
+    the query could not be explained.
+    """
+    for name, build_queryset in _HOT_QUERIES.items():
+        try:
+            explained = build_queryset().explain()
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            yield name, [], str(error)
+            continue
+        winning_plan = explained.get('queryPlanner', {}).get('winningPlan', {})
+        yield name, plan_stages(winning_plan), None
+
+
+def _host():
+    # pylint: disable-next=import-outside-toplevel
+    from application.models.host import Host
+    return Host
+
+
+# The queries every import and export runs over the Host collection.
+# Placeholder values are fine: the plan depends on the shape, not the value.
+register_hot_query('get_export_hosts', lambda: _host().get_export_hosts())
+register_hot_query('objects_by_filter', lambda: _host().objects_by_filter(['host']))
+register_hot_query('active_non_template', lambda: _host().active_non_template())
+register_hot_query('delete_host_not_found_on_import', lambda: _host().objects(
+    source_account_name='account', last_import_id__ne='import',
+    deleted_at__exists=False))
+register_hot_query('get_dependents', lambda: _host().objects(__raw__={'relations': {
+    '$elemMatch': {'type': 'depends_on', 'target_host': ObjectId()}}}))
+register_hot_query('template_consumers',
+                   lambda: _host().objects(cmdb_templates=ObjectId()))
+register_hot_query('matchable_templates', lambda: _host().objects(
+    object_type='template', cmdb_match__ne=None))
+register_hot_query('project_hosts', lambda: _host().objects(project='project'))
+register_hot_query('archived_hosts', lambda: _host().objects(deleted_at__exists=True))
@@ -129,3 +129,27 @@ def build_select_query(fields, table):
     safe_fields = ", ".join(_validate_identifier(field) for field in fields.split(','))
     safe_table = _validate_table_expression(table)
     return f"SELECT {safe_fields} FROM {safe_table}"
+
+
+def fetch_size(config, default):
+    """Rows per fetch: the account's ``fetch_size`` field or `default`."""
+    value = config.get('fetch_size')
+    size = int(value) if value not in (None, '') else int(default)
+    if size < 1:
+        raise ValueError(f"fetch_size must be positive, got {size}")
+    return size
+
+
+def iter_rows(cursor, size):
+    """
+    Yield the rows of an executed cursor, fetched `size` rows at a time.
+
+    With an unbuffered (MySQL) or forward-only (ODBC) cursor the driver
+    only holds the current chunk, so the importers can process a result
+    set of any size without keeping it in memory.
+    """
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield from rows
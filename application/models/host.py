@@ -177,6 +177,29 @@ class Host(db.Document):
         # HostQuerySet.delete() so the side documents a delete rule cannot
         # reach are cleaned up on all paths, including future ones.
         'queryset_class': HostQuerySet,
+        # Each index backs one of the hot queries registered in
+        # application.helpers.query_plans, see `sys explain_queries`.
+        'indexes': [
+            # delete_host_not_found_on_import: the rows of one account
+            # outside the current import
+            ['source_account_name', 'last_import_id'],
+            # get_export_hosts, active_non_template and the unfiltered
+            # objects_by_filter
+            ['is_object', 'deleted_at', 'lifecycle_state'],
+            # objects_by_filter with an object filter, template lookups
+            ['object_type', 'deleted_at', 'lifecycle_state'],
+            # Only templates carry a match pattern
+            {'fields': ['cmdb_match'],
+             'partialFilterExpression': {'object_type': 'template'}},
+            # Consumers of a template
+            'cmdb_templates',
+            # get_dependents: inbound relation edges
+            ['relations.target_host', 'relations.type'],
+            'project',
+            # Archive view and purge, only the soft-deleted rows
+            {'fields': ['deleted_at'],
+             'partialFilterExpression': {'deleted_at': {'$exists': True}}},
+        ],
     }
 
 
@@ -377,6 +400,17 @@ class Host(db.Document):
             return new_host
         return False
 
+    @staticmethod
+    def import_session(account_dict, import_id="N/A", **kwargs):
+        """
+        Batched import of many rows of one account,
+        see HostImportSession for the usage
+        """
+        # Imported here: host_import imports Host itself.
+        # pylint: disable=import-outside-toplevel
+        from application.models.host_import import HostImportSession
+        return HostImportSession(account_dict, import_id, **kwargs)
+
     @staticmethod
     def rewrite_hostname(old_name, template, attributes):
         """
@@ -2,13 +2,15 @@
 Cleanup of the documents that hang off a Host but cannot be reached by a
 MongoEngine delete rule.
 
-Three stores need this. ``HostInventoryTree`` and ``FieldApproval`` are
+Four stores need this. ``HostInventoryTree`` and ``FieldApproval`` are
 keyed by the hostname / id as a plain string, so no rule can be attached
-at all. ``HostRelation.target_host`` is a reference inside an embedded
-document, where MongoEngine has no document-level hook to hang a rule
-on — a deleted host would otherwise leave a dangling reference in every
-host that pointed at it, and dereferencing that raises ``DoesNotExist``
-rather than returning ``None``.
+at all. ``HostRuleCache`` holds the host id as a plain ObjectId, as it
+is written in raw bulk upserts. ``HostRelation.target_host`` is a
+reference inside an embedded document, where MongoEngine has no
+document-level hook to hang a rule on — a deleted host would otherwise
+leave a dangling reference in every host that pointed at it, and
+dereferencing that raises ``DoesNotExist`` rather than returning
+``None``.
 
 ``HostLabelEvent`` is deliberately absent: it holds a real
 ``ReferenceField`` with ``reverse_delete_rule=CASCADE``, which
@@ -51,6 +53,7 @@ def _purge_side_documents(host_ids, hostnames):
     from application.models.host import Host
     from application.models.host_inventory_tree import HostInventoryTree
     from application.models.field_approval import FieldApproval
+    from application.modules.rule.cache import HostRuleCache
 
     if hostnames:
         HostInventoryTree.objects(hostname__in=hostnames).delete()
@@ -66,6 +69,7 @@ def _purge_side_documents(host_ids, hostnames):
         )
 
     if host_ids:
+        HostRuleCache.objects(host_id__in=host_ids).delete()
         Host.objects(__raw__={'relations.target_host': {'$in': host_ids}}).update(
             __raw__={'$pull': {'relations': {
                 'target_host': {'$in': host_ids}}}},
@@ -0,0 +1,153 @@
+"""
+Batched Host Import
+
+Importers used to load the host of every row with its own query and
+write it back with a full save() — two round trips per row. A
+HostImportSession collects the rows, loads the existing hosts of a batch
+with one query, applies the usual update_host() / set_account() logic in
+memory and writes the changes of the whole batch with one bulk_write of
+partial updates.
+"""
+import datetime
+
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from application import app
+from application.models.host import Host
+
+
+def write_operation(host, delta=None):
+    """
+    Insert for a new host, else a partial update of the changed fields.
+    `delta` are the (sets, unsets) to write instead of host._delta()
+    """
+    if host.pk is None:
+        host.pk = ObjectId()
+        return InsertOne(host.to_mongo())
+    # pylint: disable-next=protected-access
+    sets, unsets = delta if delta is not None else host._delta()
+    update = {}
+    if sets:
+        update['$set'] = sets
+    if unsets:
+        update['$unset'] = unsets
+    if not update:
+        return None
+    return UpdateOne({'_id': host.pk}, update)
+
+
+class HostImportSession:  # pylint: disable=too-many-instance-attributes
+    """
+    Import the rows of one account in batches
+
+        with Host.import_session(account_dict, import_id) as session:
+            for hostname, labels in rows:
+                session.add(hostname, labels)
+
+    Rows are processed when the batch is full and when the session ends.
+    `on_result(hostname, saved)` is called for every processed row, saved
+    is False if set_account() refused the host (e.g. owned by a master
+    account). Failed rows end up in `errors` as (hostname, message).
+    """
+
+    # pylint: disable-next=too-many-arguments,too-many-positional-arguments
+    def __init__(self, account_dict, import_id="N/A", batch_size=None,
+                 on_result=None):
+        self.account_dict = account_dict
+        self.import_id = import_id
+        self.batch_size = batch_size or app.config.get('IMPORT_BATCH_SIZE', 500)
+        self.on_result = on_result
+        self.num_rows = 0
+        self.num_saved = 0
+        self.errors = []
+        self._rows = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        # Rows added before an error are written, as with the old per row save
+        self.flush()
+        return False
+
+    def add(self, hostname, labels):
+        """
+        Queue one row, same hostname handling as Host.get_host()
+        """
+        self.num_rows += 1
+        if not isinstance(hostname, str):
+            self.errors.append((str(hostname), "Hostname field does not contain a string"))
+            return
+        hostname = hostname.strip()
+        if app.config['LOWERCASE_HOSTNAMES']:
+            hostname = hostname.lower()
+        if not hostname:
+            self.errors.append((f"row {self.num_rows}", "Empty hostname"))
+            return
+        if hostname in self._rows:
+            # A later row of the same host has to see the earlier one applied
+            self.flush()
+        self._rows[hostname] = labels
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Process and write the queued rows
+        """
+        rows, self._rows = self._rows, {}
+        if not rows:
+            return
+        existing = {host.hostname: host
+                    for host in Host.objects(hostname__in=list(rows))}
+        results = []
+        operations = []
+        written = []
+        for hostname, labels in rows.items():
+            host = existing.get(hostname)
+            if host is None:
+                host = Host()
+                host.hostname = hostname
+                host.create_time = datetime.datetime.now()
+            try:
+                host.update_host(labels)
+                saved = host.set_account(account_dict=self.account_dict,
+                                         import_id=self.import_id)
+                if saved:
+                    host.validate()
+                    if operation := write_operation(host):
+                        operations.append(operation)
+                        written.append(hostname)
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                self.errors.append((hostname, str(error)))
+                continue
+            results.append((hostname, saved))
+
+        failed = self._bulk_write(operations, written)
+        for hostname, saved in results:
+            if hostname in failed:
+                continue
+            if saved:
+                self.num_saved += 1
+            if self.on_result:
+                self.on_result(hostname, saved)
+
+    def _bulk_write(self, operations, hostnames):
+        """
+        Send the writes, return the hostnames which failed
+        """
+        if not operations:
+            return set()
+        try:
+            # pylint: disable-next=protected-access
+            Host._get_collection().bulk_write(operations, ordered=False)
+        except BulkWriteError as error:
+            failed = set()
+            for write_error in error.details.get('writeErrors', []):
+                hostname = hostnames[write_error['index']]
+                failed.add(hostname)
+                self.errors.append((hostname, write_error.get('errmsg', '')))
+            return failed
+        return set()
@@ -74,6 +74,8 @@ def clear_host_debug_cache(hostname, prefix):
     """
     from mongoengine.errors import DoesNotExist  # pylint: disable=import-outside-toplevel
     from application.models.host import Host  # pylint: disable=import-outside-toplevel
+    # pylint: disable-next=import-outside-toplevel
+    from application.modules.rule.cache import get_cache_store
     try:
         db_host = Host.objects.get(hostname=hostname)
     except DoesNotExist:
@@ -85,6 +87,9 @@ def clear_host_debug_cache(hostname, prefix):
     if 'CustomAttributeRule' in db_host.cache:
         del db_host.cache['CustomAttributeRule']
     db_host.save()
+    store = get_cache_store()
+    store.clear(db_host, prefix)
+    store.clear(db_host, 'CustomAttributeRule')
     return db_host
 
 
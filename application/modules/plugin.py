@@ -9,9 +9,12 @@ import atexit
 import uuid
 import os
 import tempfile
+import threading
 
 from pprint import pformat
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
 
 from mongoengine.errors import DoesNotExist
 import requests
@@ -22,6 +25,7 @@ from application.modules.debug import ColorCodes
 from application.modules.custom_attributes.models import CustomAttributeRule as \
     CustomAttributeRuleModel
 from application.modules.custom_attributes.rules import CustomAttributeRule
+from application.modules.rule.cache import fingerprint, get_cache_store
 
 from application.modules.debug import attribute_table
 
@@ -51,6 +55,36 @@ _SENSITIVE_BODY_KEYS = frozenset({
     'private_key', 'client_secret',
 })
 
+# Sessions are shared between the worker threads of map_requests(). The
+# locks live on module level so Plugin instances stay picklable for the
+# multiprocessing pools of the exports.
+_HTTP_LOCK = threading.Lock()
+_SAVE_REQUESTS_LOCK = threading.Lock()
+# netloc -> _RateLimiter, shared by all plugins of the process
+_RATE_LIMITERS = {}
+
+
+class _RateLimiter:  # pylint: disable=too-few-public-methods
+    """
+    Spaces out the requests to one target to at most `rate` per second
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        """
+        Block until the next request may be sent
+        """
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
 
 def _redact_body(obj):
     """Recursively mask sensitive keys in dict/list bodies."""
@@ -283,11 +317,96 @@ class Plugin():
                 pass
             self._http_session = None
 
+    def _account_number(self, field, config_key, default, cast=int):
+        """
+        Numeric account custom field `field`, falling back to the global
+        `config_key`
+        """
+        value = self.config.get(field)
+        if value not in (None, ''):
+            try:
+                return cast(value)
+            except (TypeError, ValueError):
+                logger.warning(f"Ignoring invalid {field} {value!r} "
+                               f"on account {self.config.get('name')!r}")
+        return cast(app.config.get(config_key, default))
 
+    def http_workers(self):
+        """
+        Number of requests map_requests() runs at the same time. The
+        account field `http_workers` wins over HTTP_MAX_WORKERS.
+        """
+        return max(self._account_number('http_workers', 'HTTP_MAX_WORKERS', 8), 1)
+
+    def _get_http_session(self):
+        """
+        Return the Session of the plugin, created on first use with a
+        connection pool large enough for http_workers() threads
+        """
+        with _HTTP_LOCK:
+            if self._http_session is None:
+                session = requests.Session()
+                # requests defaults to 30 redirects. Checkmk's activate-changes
+                # 'wait-for-completion' endpoint is a redirect-based long-poll, so
+                # a large/slow activation exceeds that default and raises
+                # TooManyRedirects. Allow a configurable, more generous ceiling.
+                session.max_redirects = app.config['HTTP_MAX_REDIRECTS']
+                # The default pool keeps 10 connections per host, more
+                # workers would open and drop a connection per request
+                pool_size = self.http_workers()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                                        pool_maxsize=pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._http_session = session
+            return self._http_session
+
+    def _throttle(self, url):
+        """
+        Apply the rate limit of the target host, if one is configured
+        (account field `http_rate_limit` or HTTP_RATE_LIMIT, requests
+        per second per host, 0 means unlimited)
+        """
+        rate = self._account_number('http_rate_limit', 'HTTP_RATE_LIMIT', 0, float)
+        if rate <= 0:
+            return
+        target = urlsplit(url).netloc
+        with _HTTP_LOCK:
+            limiter = _RATE_LIMITERS.get(target)
+            if limiter is None or limiter.interval != 1.0 / rate:
+                limiter = _RATE_LIMITERS[target] = _RateLimiter(rate)
+        limiter.wait()
+
+    def map_requests(self, func, items, max_workers=None):
+        """
+        Run `func(item)` for all `items` on up to `max_workers` threads
+        (default: http_workers()), for exports sending many independent
+        requests through inner_request().
 
+        Yields (item, result, exception) in the order of `items`;
+        exception is None if `func` returned. Errors don't stop the other
+        items, the caller decides how to report them.
+        """
+        items = list(items)
+        workers = min(max_workers or self.http_workers(), len(items))
+
+        def call(item):
+            try:
+                return func(item), None
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                return None, error
+
+        if workers <= 1:
+            for item in items:
+                yield (item, *call(item))
+            return
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for item, (result, error) in zip(items, executor.map(call, items)):
+                yield item, result, error
 
     def inner_request(self, method, url, data=None, json=None,  # pylint: disable=too-many-branches,too-many-statements
-                      headers=None, auth=None, params=None, cert=None, read_only=False):
+                      headers=None, auth=None, params=None, cert=None, read_only=False,
+                      stream=False):
         """
         Execute HTTP requests with built-in retry logic and logging.
         
@@ -307,6 +426,9 @@ class Plugin():
             read_only (bool, optional): Mark a non-GET request as read-only
                 (e.g. a search/query POST). Such requests still execute live
                 in dry_run mode because they don't mutate the target system.
+            stream (bool, optional): Don't download the body up front, the
+                caller reads it with ``iter_content()``. The body is not
+                logged then.
 
         Returns:
             requests.Response: Response object from the HTTP request
@@ -350,6 +472,8 @@ class Plugin():
             payload['params'] = params
         if cert:
             payload['cert'] = cert
+        if stream:
+            payload['stream'] = True
 
         log_dict = _redact_payload(payload)
         if 'json' in log_dict:
@@ -361,7 +485,7 @@ class Plugin():
             # save_requests is a debug dump for offline replay — keep the
             # full, unredacted payload here. Access must be protected on
             # the file-system level.
-            with open(path, "a", encoding="utf-8") as save_fh:
+            with _SAVE_REQUESTS_LOCK, open(path, "a", encoding="utf-8") as save_fh:
                 save_fh.write(f"{method}||{url}||{payload}\n")
 
         if self.dry_run:
@@ -395,13 +519,7 @@ class Plugin():
         max_retries = app.config['HTTP_MAX_RETRIES']
         retry_wait = app.config['HTTP_REPEAT_TIMEOUT']
         resp = None
-        if self._http_session is None:
-            self._http_session = requests.Session()
-            # requests defaults to 30 redirects. Checkmk's activate-changes
-            # 'wait-for-completion' endpoint is a redirect-based long-poll, so
-            # a large/slow activation exceeds that default and raises
-            # TooManyRedirects. Allow a configurable, more generous ceiling.
-            self._http_session.max_redirects = app.config['HTTP_MAX_REDIRECTS']
+        session = self._get_http_session()
         # Repeating a request the target may already have applied turns a
         # timeout into a phantom error: a slow Checkmk keeps processing a
         # bulk-create long after our read timeout expired, so the retry comes
@@ -411,8 +529,9 @@ class Plugin():
         # target. Everything else is repeated for read-only requests only.
         safe_to_repeat = read_only or method in ('get', 'head', 'options')
         for attempt in range(1, max_retries+1):
+            self._throttle(url)
             try:
-                resp = self._http_session.request(method, url, **payload)
+                resp = session.request(method, url, **payload)
                 break
             except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
                 if not safe_to_repeat and not isinstance(e, requests.exceptions.ConnectTimeout):
@@ -426,6 +545,8 @@ class Plugin():
                 else:
                     raise
 
+        if stream:
+            return resp
         try:
             if resp:
                 # Redact so that response bodies that echo access/refresh
@@ -471,7 +592,9 @@ class Plugin():
         Args:
             db_host (Host): Database host object containing host information
             cache (str|bool): Cache key prefix for attribute caching.
-                            If False, caching is disabled.
+                            If False, caching is disabled. A cached result
+                            is used as long as the host data and the
+                            applied rules did not change.
                             
         Returns:
             dict: Dictionary containing 'all' and 'filtered' attribute sets:
@@ -479,47 +602,22 @@ class Plugin():
                 - 'filtered': Attributes after applying filter rules
             bool: False if host should be ignored based on filter rules
         """
-        # Get Attributes
+        attributes = self._get_base_attributes(db_host)
+
+        self.init_custom_attributes()
+        stamp = None
+        store = None
         if cache:
             cache += "_hostattribute"
-            db_host.cache.setdefault(cache, {})
-            if 'attributes' in db_host.cache[cache]:
+            store = get_cache_store()
+            stamp = self._attribute_cache_stamp(db_host, attributes)
+            cached = store.get(db_host, cache)
+            if cached is not None and cached[0] == stamp:
                 logger.debug(f"Using Attribute Cache for {db_host.hostname}")
-                if 'ignore_host' in db_host.cache[cache]['attributes']['filtered']:
+                if 'ignore_host' in cached[1]['filtered']:
                     return False
-                return db_host.cache[cache]['attributes']
-        attributes = {}
-        # The account which imported the host is a field of the host document,
-        # not a label, so rules had no way to match on it. Seed it as an
-        # attribute before any rule runs, so custom attribute, rewrite, filter
-        # and action/export rules can all condition on the host's origin.
-        attributes['SOURCE_ACCOUNT'] = db_host.source_account_name or ''
-        attributes.update(db_host.labels.items())
-        attributes.update(db_host.inventory.items())
-        # Template labels are merged in virtually here and never persisted
-        # onto the host document. The host's own data (labels + inventory,
-        # already applied above) always wins: a template only contributes
-        # keys the host does not provide itself. A template also never
-        # overrides a value an earlier template already supplied.
-        for tmpl in (db_host.cmdb_templates or []):
-            for key, value in (tmpl.labels or {}).items():
-                if key in attributes:
-                    continue
-                if isinstance(value, str) and '{{' in value:
-                    try:
-                        value = render_jinja(
-                            value,
-                            HOSTNAME=db_host.hostname,
-                            **attributes,
-                        )
-                    except Exception as exp:  # pylint: disable=broad-exception-caught
-                        logger.debug(
-                            f"CMDB template Jinja render failed for "
-                            f"{tmpl.hostname}.{key}: {exp}"
-                        )
-                attributes[key] = value
+                return cached[1]
 
-        self.init_custom_attributes()
         attributes.update(
             self.custom_attributes.get_outcomes(
                 db_host,
@@ -558,21 +656,63 @@ class Plugin():
             )
             data['filtered'] = attributes_filtered
             if attributes_filtered.get('ignore_host') and cache:
-                db_host.cache[cache]['attributes'] = data
-                if persist_cache:
-                    db_host.save()
-                else:
-                    setattr(db_host, '_cache_dirty', True)
+                store.set(db_host, cache, stamp, data, persist=persist_cache)
                 return False
 
         if cache:
-            db_host.cache[cache]['attributes'] = data
-            if persist_cache:
-                db_host.save()
-            else:
-                setattr(db_host, '_cache_dirty', True)
+            store.set(db_host, cache, stamp, data, persist=persist_cache)
         return data
 
+    def _attribute_cache_stamp(self, db_host, base_attributes):
+        """
+        Stamp of a cached get_attributes() result: a fingerprint of the
+        host data going into it plus the rule versions of the custom
+        attribute, rewrite and filter rules applied to it
+        """
+        rule_stamps = [engine.rule_version_stamp()
+                       for engine in (self.custom_attributes, self.rewrite, self.filter)
+                       if engine]
+        return f"{'/'.join(rule_stamps)}:" \
+               f"{fingerprint(db_host.hostname, base_attributes)}"
+
+    @staticmethod
+    def _get_base_attributes(db_host):
+        """
+        Attributes of the host before any rule was applied:
+        Labels, Inventory and the labels of its CMDB templates
+        """
+        attributes = {}
+        # The account which imported the host is a field of the host document,
+        # not a label, so rules had no way to match on it. Seed it as an
+        # attribute before any rule runs, so custom attribute, rewrite, filter
+        # and action/export rules can all condition on the host's origin.
+        attributes['SOURCE_ACCOUNT'] = db_host.source_account_name or ''
+        attributes.update(db_host.labels.items())
+        attributes.update(db_host.inventory.items())
+        # Template labels are merged in virtually here and never persisted
+        # onto the host document. The host's own data (labels + inventory,
+        # already applied above) always wins: a template only contributes
+        # keys the host does not provide itself. A template also never
+        # overrides a value an earlier template already supplied.
+        for tmpl in (db_host.cmdb_templates or []):
+            for key, value in (tmpl.labels or {}).items():
+                if key in attributes:
+                    continue
+                if isinstance(value, str) and '{{' in value:
+                    try:
+                        value = render_jinja(
+                            value,
+                            HOSTNAME=db_host.hostname,
+                            **attributes,
+                        )
+                    except Exception as exp:  # pylint: disable=broad-exception-caught
+                        logger.debug(
+                            f"CMDB template Jinja render failed for "
+                            f"{tmpl.hostname}.{key}: {exp}"
+                        )
+                attributes[key] = value
+        return attributes
+
 #   .-- Get Host Data
     def get_host_data(self, db_host, attributes):
         """
@@ -616,6 +756,7 @@ class Plugin():
             # run silently printed nothing.
             db_host.cache = {}
             db_host.save()
+            get_cache_store().clear(db_host)
         except DoesNotExist:
             print(f"{cc.FAIL}Host not Found{cc.ENDC}")
             return
@@ -0,0 +1,417 @@
+"""
+Rule Outcome Cache Stamps
+
+Cached rule results on a host are stamped with a fingerprint of what went
+into them (the host's attributes) and with the change counter of every
+rule collection involved. A rule edit only bumps the counter of its own
+collection, so just the caches built from that collection turn stale —
+instead of wiping the cache of every host for every rule type.
+
+The cached results themselves live in a store of their own (see
+get_cache_store()): by default one small document per host and cache name
+in a separate collection, written in bulk and fronted by an in-process LRU,
+so a cache update no longer rewrites the (big) Host document.
+"""
+import atexit
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from multiprocessing import util as mp_util
+
+import bson
+from bson.codec_options import CodecOptions
+from bson.errors import InvalidDocument
+from bson.raw_bson import RawBSONDocument
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+from application import app, db, logger
+
+# Counter bumped by changes that affect every rule type (e.g. projects)
+ALL_RULES = '__all__'
+
+
+class RuleVersion(db.Document):
+    """
+    Change counter of one rule collection
+    """
+    name = db.StringField(required=True, unique=True)
+    version = db.IntField(default=0)
+
+    meta = {
+        'collection': 'rule_version',
+        'strict': False,
+    }
+
+
+def bump_rule_version(name=ALL_RULES):
+    """
+    Mark all cached outcomes of the given rule collection as stale
+    """
+    RuleVersion.objects(name=name).update_one(inc__version=1, upsert=True)
+
+
+def rule_versions():
+    """
+    Return the current counters as {collection name: version}
+    """
+    return {entry.name: entry.version
+            for entry in RuleVersion.objects.only('name', 'version')}
+
+
+def rules_collection(rules):
+    """
+    Name of the collection a rules QuerySet (or list of rules) comes from,
+    None if it can not be determined (e.g. empty list)
+    """
+    document = getattr(rules, '_document', None)
+    if document is None:
+        try:
+            document = type(next(iter(rules)))
+        except (StopIteration, TypeError):
+            return None
+    get_name = getattr(document, '_get_collection_name', None)
+    if get_name is None:
+        return None
+    return get_name()
+
+
+def fingerprint(*parts):
+    """
+    Stable short hash of JSON like data, used to detect changed input
+    """
+    try:
+        payload = json.dumps(parts, sort_keys=True, default=str,
+                             separators=(',', ':'))
+    except TypeError:
+        # Keys which can not be sorted against each other
+        payload = repr(parts)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class HostRuleCache(db.Document):
+    """
+    Cached rule outcome / attribute set of one host
+    """
+    host_id = db.ObjectIdField(required=True)
+    cache_name = db.StringField(required=True)
+    stamp = db.StringField()
+    value = db.DynamicField()
+
+    meta = {
+        'collection': 'host_rule_cache',
+        'strict': False,
+        'indexes': [
+            {'fields': ['host_id', 'cache_name'], 'unique': True},
+        ],
+    }
+
+
+def _pack(stamp, value):
+    """
+    BSON encoded cache entry. Kept encoded in the LRU, so callers
+    mutating a returned value can not change the cached one.
+    Raises InvalidDocument for values MongoDB can not store.
+    """
+    return bson.encode({'stamp': stamp, 'value': value})
+
+
+def _unpack(packed):
+    entry = bson.decode(packed)
+    return entry.get('stamp'), entry.get('value')
+
+
+class HostDocumentCacheStore:
+    """
+    Legacy backend: Entries live in the cache dict of the Host document
+    """
+
+    @staticmethod
+    def get(db_host, name, fresh=False):  # pylint: disable=unused-argument
+        """
+        Return (stamp, value) of the entry or None,
+        always read from the given Host document
+        """
+        entry = db_host.cache.get(name)
+        if isinstance(entry, dict) and 'value' in entry:
+            return entry.get('stamp'), entry['value']
+        return None
+
+    @staticmethod
+    def set(db_host, name, stamp, value, persist=True):
+        """
+        Store entry, with persist=False the caller has to save the host
+        (it is marked with _cache_dirty)
+        """
+        db_host.cache[name] = {'stamp': stamp, 'value': value}
+        if persist:
+            db_host.save()
+        else:
+            setattr(db_host, '_cache_dirty', True)
+
+    @classmethod
+    def get_many(cls, db_hosts, name):
+        """
+        {host pk: (stamp, value) or None} of the entry `name` of every host
+        """
+        return {getattr(db_host, 'pk', None): cls.get(db_host, name)
+                for db_host in db_hosts}
+
+    @staticmethod
+    def entries(db_host, fresh=False):  # pylint: disable=unused-argument
+        """
+        All entries of the host as {name: {'stamp': .., 'value': ..}}
+        """
+        return {name: entry for name, entry in db_host.cache.items()
+                if isinstance(entry, dict) and 'value' in entry}
+
+    @staticmethod
+    def clear(db_host, prefix=''):
+        """
+        Remove the host's entries starting with prefix (case-insensitive),
+        the caller saves the host
+        """
+        prefix = prefix.lower()
+        for name in list(db_host.cache.keys()):
+            if name.lower().startswith(prefix):
+                del db_host.cache[name]
+
+    def clear_hosts(self, host_ids):
+        """
+        Nothing to do: Host.cache is reset by the caller
+        """
+
+    def clear_all(self, prefix=''):
+        """
+        Nothing to do: Host.cache is reset by the caller
+        """
+
+    def flush(self):
+        """
+        Nothing queued, every write goes through the Host document
+        """
+
+
+class CollectionCacheStore:
+    """
+    Entries live in the host_rule_cache collection.
+
+    Reads load all entries of a host with one query and keep them in a
+    LRU of the last `lru_hosts` hosts. The LRU is never invalidated by
+    other processes, so long running readers (the web views) pass
+    fresh=True to bypass it. Writes are queued and sent as one
+    unordered bulk upsert once `write_batch` are pending, when flush() is
+    called, and at the latest when the process (or pool worker) exits.
+    """
+
+    def __init__(self, lru_hosts=2000, write_batch=500):
+        self.lru_hosts = lru_hosts
+        self.write_batch = write_batch
+        self._hosts = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # The parent flushes what it queued; a child sending the same
+        # (maybe older) writes again could overwrite its newer results.
+        # Pool workers leave through multiprocessing, which skips atexit.
+        self._pending = {}
+        self._lock = threading.Lock()
+        mp_util.Finalize(self, self.flush, exitpriority=10)
+
+    @staticmethod
+    def _collection():
+        # pylint: disable=protected-access
+        return HostRuleCache._get_collection().with_options(
+            codec_options=CodecOptions(document_class=RawBSONDocument))
+
+    def _load_entries(self, host_id):
+        """
+        {name: packed entry} of the host, read from the collection
+        """
+        return {
+            doc['cache_name']: doc.raw
+            for doc in self._collection().find(
+                {'host_id': host_id},
+                {'_id': 0, 'cache_name': 1, 'stamp': 1, 'value': 1})
+        }
+
+    def _host_entries(self, host_id, fresh=False):
+        """
+        {name: packed entry} of the host, loaded once into the LRU.
+        With fresh, queued writes are sent and the collection is read
+        without touching the LRU.
+        """
+        if fresh:
+            self.flush()
+            return self._load_entries(host_id)
+        with self._lock:
+            entries = self._hosts.get(host_id)
+            if entries is not None:
+                self._hosts.move_to_end(host_id)
+                return entries
+        entries = self._load_entries(host_id)
+        with self._lock:
+            entries = self._hosts.setdefault(host_id, entries)
+            while len(self._hosts) > self.lru_hosts:
+                self._hosts.popitem(last=False)
+        return entries
+
+    def get(self, db_host, name, fresh=False):
+        """
+        Return (stamp, value) of the entry or None
+        """
+        host_id = getattr(db_host, 'pk', None)
+        if host_id is None:
+            return None
+        packed = self._host_entries(host_id, fresh).get(name)
+        if packed is None:
+            return None
+        return _unpack(packed)
+
+    # pylint: disable-next=too-many-arguments,too-many-positional-arguments,unused-argument
+    def set(self, db_host, name, stamp, value, persist=True):
+        """
+        Store entry. The write is queued in any case, `persist`
+        only matters for the Host document backend.
+        """
+        host_id = getattr(db_host, 'pk', None)
+        if host_id is None:
+            return
+        try:
+            packed = _pack(stamp, value)
+        except (InvalidDocument, OverflowError, TypeError) as exp:
+            logger.debug("Rule cache %s of %s not storable: %s",
+                         name, db_host.hostname, exp)
+            return
+        entries = self._host_entries(host_id)
+        with self._lock:
+            entries[name] = packed
+            self._pending[(host_id, name)] = UpdateOne(
+                {'host_id': host_id, 'cache_name': name},
+                {'$set': RawBSONDocument(packed)},
+                upsert=True,
+            )
+            due = len(self._pending) >= self.write_batch
+        if due:
+            self.flush()
+
+    def get_many(self, db_hosts, name):
+        """
+        {host pk: (stamp, value) or None} of the entry `name` of every host,
+        read fresh from the collection with one query (e.g. for a list page)
+        """
+        result = {pk: None for pk in (getattr(db_host, 'pk', None) for db_host in db_hosts)
+                  if pk is not None}
+        if not result:
+            return result
+        self.flush()
+        for doc in self._collection().find(
+                {'host_id': {'$in': list(result)}, 'cache_name': name},
+                {'_id': 0, 'host_id': 1, 'stamp': 1, 'value': 1}):
+            result[doc['host_id']] = _unpack(doc.raw)
+        return result
+
+    def entries(self, db_host, fresh=False):
+        """
+        All entries of the host as {name: {'stamp': .., 'value': ..}}
+        """
+        host_id = getattr(db_host, 'pk', None)
+        if host_id is None:
+            return {}
+        result = {}
+        for name, packed in self._host_entries(host_id, fresh).items():
+            stamp, value = _unpack(packed)
+            result[name] = {'stamp': stamp, 'value': value}
+        return result
+
+    def clear(self, db_host, prefix=''):
+        """
+        Remove the host's entries starting with prefix (case-insensitive)
+        """
+        host_id = getattr(db_host, 'pk', None)
+        if host_id is None:
+            return
+        prefix = prefix.lower()
+        with self._lock:
+            self._hosts.pop(host_id, None)
+            for key in [key for key in self._pending
+                        if key[0] == host_id and key[1].lower().startswith(prefix)]:
+                del self._pending[key]
+        query = {'host_id': host_id}
+        if prefix:
+            query['cache_name'] = {'$regex': f'^{re.escape(prefix)}', '$options': 'i'}
+        self._collection().delete_many(query)
+
+    def clear_hosts(self, host_ids):
+        """
+        Remove all entries of the hosts with the given ids
+        """
+        host_ids = list(host_ids)
+        if not host_ids:
+            return
+        wanted = set(host_ids)
+        with self._lock:
+            for host_id in wanted:
+                self._hosts.pop(host_id, None)
+            for key in [key for key in self._pending if key[0] in wanted]:
+                del self._pending[key]
+        self._collection().delete_many({'host_id': {'$in': host_ids}})
+
+    def clear_all(self, prefix=''):
+        """
+        Remove the entries of all hosts starting with prefix (case-insensitive)
+        """
+        with self._lock:
+            self._hosts.clear()
+            self._pending = {}
+        query = {}
+        if prefix:
+            query['cache_name'] = {'$regex': f'^{re.escape(prefix)}', '$options': 'i'}
+        self._collection().delete_many(query)
+
+    def flush(self):
+        """
+        Send all queued writes as one bulk upsert
+        """
+        with self._lock:
+            operations = list(self._pending.values())
+            self._pending = {}
+        if not operations:
+            return
+        try:
+            self._collection().bulk_write(operations, ordered=False)
+        except PyMongoError as exp:
+            # Only costs a recalculation on the next run
+            logger.warning("Could not write %d rule cache entries: %s",
+                           len(operations), exp)
+
+
+_BACKENDS = {
+    'collection': lambda: CollectionCacheStore(
+        app.config.get('RULE_CACHE_LRU_HOSTS', 2000),
+        app.config.get('RULE_CACHE_WRITE_BATCH', 500),
+    ),
+    'host': HostDocumentCacheStore,
+}
+_STORES = {}
+
+
+def get_cache_store():
+    """
+    The process wide store for per-host rule caches,
+    selected by RULE_CACHE_BACKEND ('collection' or 'host')
+    """
+    backend = app.config.get('RULE_CACHE_BACKEND', 'collection')
+    store = _STORES.get(backend)
+    if store is None:
+        if backend not in _BACKENDS:
+            raise ValueError(f"Unknown RULE_CACHE_BACKEND: {backend}")
+        store = _STORES[backend] = _BACKENDS[backend]()
+    return store
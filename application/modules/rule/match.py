@@ -133,3 +133,98 @@ def match(attr_value, needle, condition, negate=False):
         raise MatchException(f"Condition Failed: {condition}, "\
                              f"Attributes Value: {attr_value}, "\
                              f"Needed: {needle}. Hint: {error}") from error
+
+
+# Conditions compared on lower-cased strings (mirrors match()).
+_LOWERCASE_CONDITIONS = frozenset(['equal', 'in', 'not_in', 'swith', 'ewith'])
+
+
+def _in_list_needle(needle):
+    """
+    Pre-split an `in_list` needle into a frozenset (falls back to a tuple
+    if the user supplied a list with unhashable entries)
+    """
+    if not isinstance(needle, list):
+        needle = [x.strip() for x in needle.split(',')]
+    try:
+        return frozenset(needle)
+    except TypeError:
+        return tuple(needle)
+
+
+def _build_check(needle, condition):
+    """
+    Return a one-argument function doing what check_condition() does
+    after match() coerced both sides, with all needle work done up front
+    """
+    if condition in _LOWERCASE_CONDITIONS:
+        needle = str(needle).lower()
+        if condition == 'equal':
+            return lambda value: str(value).lower() == needle
+        if condition == 'in':
+            return lambda value: needle in str(value).lower()
+        if condition == 'not_in':
+            return lambda value: needle not in str(value).lower()
+        if condition == 'swith':
+            return lambda value: str(value).lower().startswith(needle)
+        return lambda value: str(value).lower().endswith(needle)
+    if condition == 'string_in_list':
+        def _string_in_list(value):
+            if not isinstance(value, list):
+                value = [x.strip() for x in value.split(',')]
+            return needle in value
+        return _string_in_list
+    if condition == 'in_list':
+        members = _in_list_needle(needle)
+        if isinstance(members, tuple):
+            return lambda value: value in members
+        def _in_list(value):
+            try:
+                return value in members
+            except TypeError:
+                # Unhashable attribute value (list/dict) — compare by
+                # equality, which can never hit a list of strings anyway
+                return False
+        return _in_list
+    if condition == 'regex':
+        pattern = _compiled_regex(needle)
+        return lambda value: pattern.match(str(value)) is not None
+    if condition == 'bool':
+        needle = make_bool(needle)
+        return lambda value: make_bool(value) == needle
+    return lambda _value: False
+
+
+def compile_match(needle, condition, negate=False):
+    """
+    Compile a match() call with a fixed needle into a predicate
+
+    The returned function takes only the attribute value and returns
+    exactly what match(value, needle, condition, negate) would. Needles are
+    lower-cased, `in_list` needles split and regexes bound once here
+    instead of on every call. Should the fast path raise, the call is
+    repeated through match() so the caller gets the same MatchException.
+    """
+    if condition == 'ignore':
+        result = not negate
+        return lambda _value: result
+    try:
+        check = _build_check(needle, condition)
+    except Exception:  # pylint: disable=broad-exception-caught
+        # Broken needle (e.g. invalid regex): let match() raise per call,
+        # as it did before compiling
+        return lambda value: match(value, needle, condition, negate)
+
+    if negate:
+        def _predicate(value):
+            try:
+                return not check(value)
+            except Exception:  # pylint: disable=broad-exception-caught
+                return match(value, needle, condition, negate)
+    else:
+        def _predicate(value):
+            try:
+                return check(value)
+            except Exception:  # pylint: disable=broad-exception-caught
+                return match(value, needle, condition, negate)
+    return _predicate
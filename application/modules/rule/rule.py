@@ -11,7 +11,10 @@ from rich.table import Table
 from rich import box
 
 from application import logger, app
-from application.modules.rule.match import match
+from application.modules.rule.match import match, compile_match
+from application.modules.rule.cache import (
+    ALL_RULES, fingerprint, get_cache_store, rule_versions, rules_collection,
+)
 from application.helpers.syncer_jinja import render_jinja
 
 
@@ -42,6 +45,59 @@ def format_condition(condition):
     return (f"hostname {condition.get('hostname_match')}{hostname_negate} "
             f"'{condition.get('hostname', '')}'")
 
+def index_key(condition):
+    """
+    Return the literal a host must have for this condition to match,
+    or None if the condition can not be used for the rule index.
+
+    Only plain, not negated `equal` comparisons qualify: a tag condition
+    gives ('tag', tag, lower-cased value), a hostname condition gives
+    ('hostname', lower-cased hostname).
+    """
+    if condition.get('match_type') == 'tag':
+        if (condition.get('tag_match'), condition.get('value_match')) != ('equal', 'equal') \
+                or condition.get('tag_match_negate') \
+                or condition.get('value_match_negate'):
+            return None
+        tag = condition.get('tag')
+        value = condition.get('value')
+        if not isinstance(tag, str) or 'custom_fields' in tag:
+            return None
+        if not isinstance(value, str) or '{{' in value or '{%' in value:
+            return None
+        return ('tag', tag, value.lower())
+    hostname = condition.get('hostname')
+    hostname_match = condition.get('hostname_match')
+    if (not isinstance(hostname, str)
+            or not isinstance(hostname_match, str)
+            or hostname_match.lower() != 'equal'
+            or condition.get('hostname_match_negate')):
+        return None
+    return ('hostname', hostname.lower())
+
+
+def rule_index_keys(rule):
+    """
+    Return the index keys of which a host needs at least one to
+    possibly match the prepared rule, or None if the rule must always
+    be evaluated.
+    """
+    conditions = rule['conditions']
+    if rule['condition_typ'] == 'all':
+        # Every condition must match, so one literal is enough to file it
+        for condition in conditions:
+            if key := index_key(condition):
+                return [key]
+        return None
+    if rule['condition_typ'] == 'any':
+        # One condition is enough to match, so all of them need a literal
+        keys = [index_key(condition) for condition in conditions]
+        if keys and all(keys):
+            return keys
+        return None
+    return None
+
+
 class Rule():
     """
     Base Rule Class
@@ -68,10 +124,29 @@ class Rule():
         # Cached (id(self.rules), [rule objs], [rule.to_mongo() docs]).
         # Invalidated automatically when self.rules is reassigned.
         self._rule_docs_cache = None
+        # Cached (id(prepared rules), [[condition predicate, ...], ...]).
+        # Built from the _iter_rule_docs output, so it follows its lifetime.
+        self._compiled_rules_cache = None
+        # Cached (id(prepared rules), rule index), see _iter_rule_index.
+        self._rule_index_cache = None
+        # Cached (id(self.rules), version stamp), see rule_version_stamp.
+        self._version_stamp_cache = None
         # Default cache key derived from the concrete rule-engine class.
         # Computed once — get_outcomes is otherwise on the hot path.
         self._default_cache_key = self.__class__.__qualname__.replace('.', '')
 
+    def __getstate__(self):
+        # Engines are handed to pool workers through pickle (always so
+        # under spawn/forkserver). The compiled conditions are closures
+        # and can not be pickled; all of these caches are keyed by id(),
+        # which means nothing in another process, so the worker simply
+        # builds them again on its first check_rules().
+        state = self.__dict__.copy()
+        for key in ('_rule_docs_cache', '_compiled_rules_cache',
+                    '_rule_index_cache', '_version_stamp_cache'):
+            state[key] = None
+        return state
+
 
     @staticmethod
     def replace(input_raw, exceptions=None, regex=None):
@@ -239,6 +314,141 @@ class Rule():
         self._rule_docs_cache = (current_key, objs, prepared)
         return objs, prepared
 
+    def _compile_attribute_condition(self, condition):
+        """
+        Compile a tag condition into a predicate taking the hostname.
+        Mirrors _check_attribute_match without the ADVANCED_RULE_DEBUG
+        logging, which keeps using the interpreter.
+        """
+        needed_tag = condition['tag']
+        tag_match = condition['tag_match']
+        tag_match_negate = condition['tag_match_negate']
+        needed_value = condition['value']
+
+        if (not isinstance(needed_value, str)
+                or '{{' in needed_value
+                or '{%' in needed_value):
+            # Needs a per-host Jinja render, nothing to precompute
+            return lambda _hostname, _hostname_lower: \
+                    self._check_attribute_match(condition)
+
+        if tag_match == 'ignore' and tag_match_negate:
+            return lambda _hostname, _hostname_lower: \
+                    needed_tag not in self.attributes
+
+        value_matches = compile_match(needed_value, condition['value_match'],
+                                      condition['value_match_negate'])
+
+        if (tag_match == 'equal' and not tag_match_negate
+                and 'custom_fields' not in needed_tag):
+            def _tag_lookup(_hostname, _hostname_lower):
+                attributes = self.attributes
+                if needed_tag not in attributes:
+                    return False
+                return value_matches(attributes[needed_tag])
+            return _tag_lookup
+
+        tag_matches = compile_match(needed_tag, tag_match, tag_match_negate)
+        custom_field_keys = set()
+        if 'custom_fields' in needed_tag:
+            custom_field_keys = {needed_tag}
+
+        def _tag_scan(_hostname, _hostname_lower):
+            for tag, value in self.attributes.items():
+                if custom_field_keys and tag == "custom_fields" \
+                        and isinstance(value, dict):
+                    for name, content in value.items():
+                        if f'custom_fields["{name}"]' in custom_field_keys:
+                            tag = f'custom_fields["{name}"]'
+                            value = content
+                        elif f"custom_fields['{name}']" in custom_field_keys:
+                            tag = f"custom_fields['{name}']"
+                            value = content
+                if tag_matches(tag) and value_matches(value):
+                    return True
+            return False
+        return _tag_scan
+
+    def _compile_condition(self, condition):
+        """
+        Compile a single condition into a predicate
+        taking (hostname, lower-cased hostname)
+        """
+        if condition['match_type'] == 'tag':
+            return self._compile_attribute_condition(condition)
+        try:
+            hostname_matches = compile_match(condition['hostname'].lower(),
+                                             condition['hostname_match'].lower(),
+                                             condition['hostname_match_negate'])
+        except (AttributeError, KeyError):
+            # Incomplete condition, the interpreter raises the same as before
+            return lambda hostname, _hostname_lower: \
+                    self._check_hostname_match(condition, hostname)
+        return lambda _hostname, hostname_lower: hostname_matches(hostname_lower)
+
+    def _iter_compiled_conditions(self, prepared_rules):
+        """
+        Compile the conditions of the prepared rules once per rules set.
+        Returns a list parallel to prepared_rules with one list of
+        predicates per rule, parallel to its conditions.
+        """
+        current_key = id(prepared_rules)
+        cache = self._compiled_rules_cache
+        if cache is not None and cache[0] == current_key:
+            return cache[1]
+        compiled = [[self._compile_condition(condition)
+                     for condition in rule['conditions']]
+                    for rule in prepared_rules]
+        self._compiled_rules_cache = (current_key, compiled)
+        return compiled
+
+    def _iter_rule_index(self, prepared_rules):
+        """
+        Build the inverted index of the prepared rules once per rules set.
+
+        Returns (always, by_tag, by_hostname): the positions of rules
+        every host has to evaluate (anyway rules, regex, negated or
+        templated conditions), and the positions of the remaining rules
+        keyed by the tag/value or hostname literal they need.
+        """
+        current_key = id(prepared_rules)
+        cache = self._rule_index_cache
+        if cache is not None and cache[0] == current_key:
+            return cache[1]
+        always = []
+        by_tag = {}
+        by_hostname = {}
+        for idx, rule in enumerate(prepared_rules):
+            keys = rule_index_keys(rule)
+            if keys is None:
+                always.append(idx)
+                continue
+            for key in keys:
+                if key[0] == 'tag':
+                    by_tag.setdefault(key[1], {}).setdefault(key[2], []).append(idx)
+                else:
+                    by_hostname.setdefault(key[1], []).append(idx)
+        index = (always, by_tag, by_hostname)
+        self._rule_index_cache = (current_key, index)
+        return index
+
+    def _candidate_rules(self, prepared_rules, hostname_lower):
+        """
+        Positions of the rules the current host could match,
+        in their original (sort_field) order
+        """
+        always, by_tag, by_hostname = self._iter_rule_index(prepared_rules)
+        if not by_tag and not by_hostname:
+            return always
+        candidates = set(always)
+        candidates.update(by_hostname.get(hostname_lower, ()))
+        attributes = self.attributes
+        for tag, rules_by_value in by_tag.items():
+            if tag in attributes:
+                candidates.update(
+                    rules_by_value.get(str(attributes[tag]).lower(), ()))
+        return sorted(candidates)
+
     # pylint: disable=too-many-branches,too-many-statements
     def check_rules(self, hostname):
         """
@@ -266,7 +476,25 @@ class Rule():
 
         outcomes = {}
         rule_objs, prepared_rules = self._iter_rule_docs()
-        for rule_obj, rule in zip(rule_objs, prepared_rules):
+        hostname_lower = hostname.lower()
+        if debug_advanced:
+            # Interpreter path, it logs every single comparison
+            compiled_rules = [
+                [lambda host, _lower, condition=condition: \
+                        self.handle_match(condition, host)
+                 for condition in rule['conditions']]
+                for rule in prepared_rules]
+        else:
+            compiled_rules = self._iter_compiled_conditions(prepared_rules)
+        if self.debug or debug_advanced:
+            # Debug tables list every rule, including the misses
+            rule_positions = range(len(prepared_rules))
+        else:
+            rule_positions = self._candidate_rules(prepared_rules, hostname_lower)
+        for idx in rule_positions:
+            rule_obj = rule_objs[idx]
+            rule = prepared_rules[idx]
+            predicates = compiled_rules[idx]
             if debug_advanced:
                 logger.debug('##########################')
                 logger.debug('Check Rule: %s', rule_obj.name)
@@ -278,8 +506,8 @@ class Rule():
             no_match_reason = None
             match_reason = None
             if condition_typ == 'any':
-                for condition in conditions:
-                    if self.handle_match(condition, hostname):
+                for condition, predicate in zip(conditions, predicates):
+                    if predicate(hostname, hostname_lower):
                         rule_hit = True
                         no_match_reason = None
                         if self.debug:
@@ -290,8 +518,8 @@ class Rule():
 
             elif condition_typ == 'all':
                 rule_hit = True
-                for condition in conditions:
-                    if not self.handle_match(condition, hostname):
+                for condition, predicate in zip(conditions, predicates):
+                    if not predicate(hostname, hostname_lower):
                         rule_hit = False
                         if self.debug:
                             no_match_reason = dict(condition)
@@ -444,6 +672,28 @@ class Rule():
         return self.check_rules(db_host.hostname)
 
 
+    def rule_version_stamp(self):
+        """
+        Change counters of the rules this engine evaluates.
+        Read once per rules set, a rule edit bumps them (see cache.py).
+        """
+        current_key = id(self.rules)
+        cache = self._version_stamp_cache
+        if cache is not None and cache[0] == current_key:
+            return cache[1]
+        versions = rule_versions()
+        collection = rules_collection(self.rules)
+        stamp = f"{versions.get(ALL_RULES, 0)}.{versions.get(collection, 0)}"
+        self._version_stamp_cache = (current_key, stamp)
+        return stamp
+
+    def cache_stamp(self, hostname, attributes):
+        """
+        Stamp for a cached outcome: changes if the host attributes
+        or the rules of this engine changed
+        """
+        return f"{self.rule_version_stamp()}:{fingerprint(hostname, attributes)}"
+
     def get_outcomes(self, db_host, attributes, persist_cache=True,
                      use_cache=True):
         """
@@ -455,20 +705,23 @@ class Rule():
         instead of the account's project scope) and must not poison the
         export's cache slot — nor return a stale cached result instead of
         producing debug lines.
+
+        Cached outcomes are only used while their stamp still matches,
+        so neither a rule edit nor changed host data needs to clear them.
         """
         cache = self.cache_name or self._default_cache_key
-        if use_cache and cache in db_host.cache:
-            logger.debug("Using Rule Cache for %s", db_host.hostname)
-            return db_host.cache[cache]
+        if use_cache:
+            store = get_cache_store()
+            stamp = self.cache_stamp(db_host.hostname, attributes)
+            cached = store.get(db_host, cache)
+            if cached is not None and cached[0] == stamp:
+                logger.debug("Using Rule Cache for %s", db_host.hostname)
+                return cached[1]
 
         self.attributes = attributes
         self.hostname = db_host.hostname
         self.db_host = db_host
         rules = self.check_rule_match(db_host)
         if use_cache:
-            db_host.cache[cache] = rules
-            if persist_cache:
-                db_host.save()
-            else:
-                setattr(db_host, '_cache_dirty', True)
+            store.set(db_host, cache, stamp, rules, persist=persist_cache)
         return rules
@@ -16,9 +16,9 @@ from flask_admin.form import rules
 from markupsafe import Markup, escape
 from application.views.default import DefaultModelView
 from application.modules.rule.models import filter_actions, rule_types, condition_types
+from application.modules.rule.cache import bump_rule_version
 from application.docu_links import docu_links
 from application.helpers.sates import add_changes
-from application.models.host import Host
 from flask_admin.contrib.mongoengine.filters import BooleanEqualFilter, FilterLike
 
 
@@ -259,19 +259,22 @@ def _render_attribute_outcomes(_view, _context, model, _name):
     return Markup(html)
 
 
-def invalidate_host_rule_caches():
+def invalidate_host_rule_caches(model=None):
     """
-    Drop the per-host rule outcome caches after a rule was changed.
-
-    ``db_host.cache`` is only reset when the host's own labels or inventory
-    change — a rule edit alone never touches it. Exports would keep using
-    the outcomes cached before the edit until every host happens to be
-    re-imported (reported from the field: a corrected downtime rule
-    exported nothing for most hosts). Outcome cache keys are heterogeneous
-    (e.g. 'ExportDowntimes', qualname-based keys), so a prefix-scoped clear
-    is not possible — drop the whole cache, the next run recomputes it.
+    Invalidate the per-host rule outcome caches after a rule was changed.
+
+    Without this, exports would keep using the outcomes cached before the
+    edit until every host happens to be re-imported (reported from the
+    field: a corrected downtime rule exported nothing for most hosts).
+    Cached outcomes carry the version of the rule collection they were
+    built from, so bumping the version of the changed rule's collection
+    turns exactly those stale — no host document has to be touched.
+    Without a model (e.g. a project change) every rule type is affected.
     """
-    Host.objects(cache__ne={}).update(set__cache={})
+    if model is None:
+        bump_rule_version()
+    else:
+        bump_rule_version(model._get_collection_name())  # pylint: disable=protected-access
 
 
 def _render_full_conditions(_view, _context, model, _name):
@@ -469,7 +472,7 @@ class RuleModelView(DefaultModelView):
         Overwrite Actions on Model Change
         """
         add_changes()
-        invalidate_host_rule_caches()
+        invalidate_host_rule_caches(model)
 
         try:
             super().on_model_change(form, model, is_created)
@@ -482,7 +485,7 @@ class RuleModelView(DefaultModelView):
         Overwrite Actions on Model Delete
         """
         add_changes()
-        invalidate_host_rule_caches()
+        invalidate_host_rule_caches(model)
 
         return super().on_model_delete(model)
 
@@ -609,7 +612,7 @@ class FiltereModelView(DefaultModelView):
         Overwrite Actions on Model Change
         """
         add_changes()
-        invalidate_host_rule_caches()
+        invalidate_host_rule_caches(model)
 
         try:
             super().on_model_change(form, model, is_created)
@@ -622,7 +625,7 @@ class FiltereModelView(DefaultModelView):
         Overwrite Actions on Model Delete
         """
         add_changes()
-        invalidate_host_rule_caches()
+        invalidate_host_rule_caches(model)
 
         return super().on_model_delete(model)
 
@@ -46,11 +46,15 @@ class AnsibleInventory(Plugin):
         Return extra Attributes based on
         rules which has existing attributes in condition
         """
-        if db_host.cache.get('ansible',{}).get('outcomes'):
-            return db_host.cache['ansible']['outcomes']
+        stamp = self.actions.cache_stamp(db_host.hostname, attributes)  # pylint: disable=no-member
+        cached = db_host.cache.get('ansible', {})
+        if cached.get('outcomes') and cached.get('stamp') == stamp:
+            return cached['outcomes']
         outcomes = self.actions.get_outcomes(db_host, attributes)  # pylint: disable=no-member
-        db_host.cache.setdefault('ansible', {})
-        db_host.cache['ansible']['outcomes'] = outcomes
+        db_host.cache['ansible'] = {
+            'stamp': stamp,
+            'outcomes': outcomes,
+        }
         db_host.save()
         return outcomes
 
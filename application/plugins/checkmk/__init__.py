@@ -133,7 +133,9 @@ def show_labels():
         print(f"{key}:{value}")
 #.
 #   .-- Command: Export Hosts
-def _inner_export_hosts(account, limit=False, debug=False, dry_run=False, save_requests=False):
+# pylint: disable-next=too-many-arguments,too-many-positional-arguments
+def _inner_export_hosts(account, limit=False, debug=False, dry_run=False, save_requests=False,
+                        full_fetch=False):
     syncer = None
     try:
         from .syncer import SyncCMK2
@@ -142,6 +144,7 @@ def _inner_export_hosts(account, limit=False, debug=False, dry_run=False, save_r
         syncer.dry_run = dry_run
         syncer.debug = debug
         syncer.save_requests = save_requests
+        syncer.full_host_fetch = full_fetch
         if limit:
             syncer.config['limit_by_hostnames'] = limit
 
@@ -172,7 +175,9 @@ def _inner_export_hosts(account, limit=False, debug=False, dry_run=False, save_r
 @click.option("--debug", default=False, is_flag=True)
 @click.option("--dry-run", default=False, is_flag=True)
 @click.option("--save-requests", default='')
-def export_hosts(account, limit, debug, dry_run, save_requests):
+@click.option("--full-fetch", default=False, is_flag=True)
+# pylint: disable-next=too-many-arguments,too-many-positional-arguments
+def export_hosts(account, limit, debug, dry_run, save_requests, full_fetch):
     """
     Export Hosts to Checkmk
 
@@ -182,9 +187,10 @@ def export_hosts(account, limit, debug, dry_run, save_requests):
     Args:
         account (string): Name Account Config
         limit (list): Comma separted list of Hosts
+        full_fetch (bool): Ignore the host snapshot (CMK_HOST_STATE_CACHE)
     """
 
-    _inner_export_hosts(account, limit, debug, dry_run, save_requests)
+    _inner_export_hosts(account, limit, debug, dry_run, save_requests, full_fetch)
 #.
 #   .-- Command: Host Debug
 
@@ -213,12 +219,13 @@ def _debug_extra_engine(title, engine, rules_queryset, db_host, attributes):
         }]
 
 
-def get_host_debug_data(hostname):
+def get_host_debug_data(hostname):  # pylint: disable=too-many-locals
     """
     Returns Debug Data
     """
     from .syncer import SyncCMK2
     from application.models.host import Host
+    from application.modules.rule.cache import get_cache_store
 
     rules = _load_rules()
 
@@ -245,6 +252,7 @@ def get_host_debug_data(hostname):
         # the debug run showed stale cached results for those engines.
         db_host.cache = {}
         db_host.save()
+        get_cache_store().clear(db_host)
     except DoesNotExist:
         print(f"{ColorCodes.FAIL}Host not Found{ColorCodes.ENDC}")
         raise
@@ -7,6 +7,7 @@ from rich.progress import Progress, SpinnerColumn, TimeElapsedColumn, MofNComple
 #from requests.exceptions import ConnectionError
 from application import app
 from application.modules.plugin import Plugin
+from application.helpers.json_stream import iter_json_array
 from application.helpers.plugins import register_cli_group
 
 cli_cmk = register_cli_group(app, 'checkmk', 'checkmk', "Checkmk commands")
@@ -69,6 +70,21 @@ class CMK2(Plugin):
         self._init_complete = True
 
 
+    @staticmethod
+    def chunks(lst, n):
+        """
+        Split a list into smaller chunks of specified size.
+
+        Args:
+            lst (list): List to be chunked
+            n (int): Size of each chunk
+
+        Yields:
+            list: Successive n-sized chunks from the input list
+        """
+        for i in range(0, len(lst), n):
+            yield lst[i:i + n]
+
     def version_at_least(self, major, minor):
         """
         True when the probed Checkmk version is at least ``major.minor``.
@@ -106,10 +122,9 @@ class CMK2(Plugin):
             ) from exc
 
 
-    def request(self, url, method='GET', data=None,  # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals,too-many-branches
-                params=None, additional_header=None, api_version="api/1.0/"):
+    def _api_url_and_headers(self, url, api_version="api/1.0/"):
         """
-        Handle Request to CMK
+        Full URL and the auth headers of an API call
         """
         address = self.config['address']
         username = self.config['username']
@@ -123,6 +138,44 @@ class CMK2(Plugin):
             'Accept': 'application/json',
             'Content-Type': 'application/json',
         }
+        return url, headers
+
+    def stream_collection(self, url):
+        """
+        Yield the objects of a collection endpoint one by one.
+
+        Unlike request(), the response body is parsed while it is
+        downloaded, so the full collection is never in memory at once.
+        """
+        url, headers = self._api_url_and_headers(url)
+        try:
+            response = self.inner_request("GET", url, headers=headers, stream=True)
+        except requests.exceptions.Timeout as exc:
+            raise CmkException(f"Timeout on GET {url}") from exc
+        except ConnectionError as exc:
+            raise CmkException("Can't connect to Checkmk") from exc
+        with response:
+            if response.status_code != 200:
+                try:
+                    response_json = response.json()
+                except requests.exceptions.JSONDecodeError:
+                    response_json = {}
+                message = " ".join(str(x) for x in (response_json.get('title'),
+                                                     response_json.get('detail'))
+                                   if x is not None)
+                raise CmkException(f"HTTP {response.status_code} GET {url}: "
+                                   f"{message or '<no details>'}")
+            try:
+                yield from iter_json_array(response.iter_content(1024 * 1024))
+            except ValueError as exc:
+                raise CmkException(f"Invalid response of GET {url}: {exc}") from exc
+
+    def request(self, url, method='GET', data=None,  # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals,too-many-branches
+                params=None, additional_header=None, api_version="api/1.0/"):
+        """
+        Handle Request to CMK
+        """
+        url, headers = self._api_url_and_headers(url, api_version)
         response = False
         if additional_header:
             headers.update(additional_header)
@@ -235,6 +288,13 @@ class CMK2(Plugin):
                       TimeElapsedColumn()) as progress:
             task1 = progress.add_task("Fetching Hosts", start=False)
             progress.console.print("Waiting for Checkmk Response")
+            if app.config.get('CMK_STREAM_HOSTS'):
+                # Compact every host as it arrives, the total is not known
+                progress.start_task(task1)
+                for host in self.stream_collection(url):
+                    self.checkmk_hosts[host['id']] = self._compact_host_data(host)
+                    progress.update(task1, advance=1)
+                return
             api_hosts = self.request(url, method="GET")
             progress.update(task1, total=len(api_hosts[0]['value']), start=True)
             for host in api_hosts[0]['value']:
@@ -4,14 +4,18 @@ Export Checkmk Rules
 """
 # pylint: disable=too-many-lines
 import ast
+import io
 import json
+import multiprocessing
+from contextlib import redirect_stdout
 import re
 from pprint import pformat
 
 
 from rich.progress import Progress, SpinnerColumn, TimeElapsedColumn, MofNCompleteColumn
+from rich.text import Text
 
-from application import app, logger
+from application import app, logger, init_db
 from application.models.host import Host
 from application.plugins.checkmk.cmk2 import CmkException, CMK2
 from application.helpers.syncer_jinja import render_jinja, get_list
@@ -701,11 +705,71 @@ def analyze_value_differences(expected, actual):
         return '; '.join(differences) if differences else "List order differs"
     return f"Expected: {repr(expected)}, Got: {repr(actual)}"
 
+# The rule sync of the running export, set once per pool worker by
+# _init_rule_worker, so the rule engine stays warm in the worker.
+_worker_rule_sync = None  # pylint: disable=invalid-name
+
+
+def _init_rule_worker(rule_sync):
+    """Pool initializer: own DB connection plus the rule sync of the run"""
+    global _worker_rule_sync  # pylint: disable=global-statement
+    init_db()
+    # The parent reports the dropped conditions once per run
+    # pylint: disable=protected-access
+    rule_sync._defer_condition_warnings = True
+    rule_sync._dropped_condition_warnings = set(rule_sync._dropped_condition_warnings)
+    _worker_rule_sync = rule_sync
+
+
+def _rule_key(value):
+    """
+    Hashable form of a rule which is equal exactly when the rules
+    compare equal, so a set of them finds duplicates without scanning
+    """
+    if isinstance(value, dict):
+        return (dict, frozenset((key, _rule_key(item)) for key, item in value.items()))
+    if isinstance(value, list):
+        return (list, tuple(_rule_key(item) for item in value))
+    if isinstance(value, tuple):
+        return (tuple, tuple(_rule_key(item) for item in value))
+    if isinstance(value, (set, frozenset)):
+        return (frozenset, frozenset(_rule_key(item) for item in value))
+    return value
+
+
+def _calculate_rule_batch(host_ids):
+    """
+    Collect the rules of one batch of hosts inside a pool worker.
+
+    Returns the partial {ruleset: [rule, ...]} of the batch (the hosts
+    are handled in the order of `host_ids`), the log_details and the
+    dropped conditions recorded meanwhile and the printed output, which
+    the parent shows above its progress bar.
+    """
+    rule_sync = _worker_rule_sync
+    rule_sync.rulsets_by_type = {}
+    rule_sync._rule_hashes = {}  # pylint: disable=protected-access
+    rule_sync.log_details = []
+    # log and raw are never read by the rules and can be large
+    db_hosts = {db_host.pk: db_host for db_host
+                in Host.objects(id__in=host_ids).exclude('log', 'raw')}
+    output = io.StringIO()
+    with redirect_stdout(output):
+        for host_id in host_ids:
+            if db_host := db_hosts.get(host_id):
+                rule_sync.calculate_rules_of_db_host(db_host)
+    return (rule_sync.rulsets_by_type, rule_sync.log_details,
+            rule_sync._dropped_condition_warnings,  # pylint: disable=protected-access
+            output.getvalue())
+
+
 class CheckmkRuleSync(CMK2):
     """
     Export Checkmk Rules
     """
     rulsets_by_type = {}
+    # Set in pool workers, see _report_dropped_condition
+    _defer_condition_warnings = False
 
     def __init__(self, account=False):
         super().__init__(account)
@@ -734,6 +798,9 @@ class CheckmkRuleSync(CMK2):
         # (ruleset, condition key) pairs already reported as dropped, so the
         # warning is logged once per run instead of once per host.
         self._dropped_condition_warnings = set()
+        # ruleset name -> (rule list, _rule_key of its rules, indexed
+        # length), so a duplicate is found without scanning rulsets_by_type.
+        self._rule_hashes = {}
 
     @property
     def rule_marker(self):
@@ -752,11 +819,39 @@ class CheckmkRuleSync(CMK2):
             return f"cmdbsyncer_{self.account_id}_{slug}"
         return f"cmdbsyncer_{self.account_id}"
 
-    def build_rule_hash(self, rule_template, conditions):
+    def build_rule_hash(self, rule_template, conditions=None):
+        """
+        Create a hash which can identify the rule.
+        Equal dicts give the same hash, whatever their key order.
+        """
+        return hash(json.dumps([rule_template, conditions],
+                               sort_keys=True, default=repr))
+
+    def _add_rule(self, rule_type, rule):
         """
-        Create a hash which can identify the rule
+        Append `rule` to its ruleset unless an equal rule is already there
         """
-        return hash(str(rule_template)+str(conditions))
+        rules = self.rulsets_by_type.setdefault(rule_type, [])
+        indexed, keys, seen = self._rule_hashes.get(rule_type, (None, None, 0))
+        if indexed is not rules or seen > len(rules):
+            # First rule of the type in this run, or the list was
+            # replaced or shortened elsewhere: index it again.
+            keys, seen = set(), 0
+        try:
+            # Index what was appended elsewhere since the last call
+            for known in rules[seen:]:
+                keys.add(_rule_key(known))
+            rule_key = _rule_key(rule)
+        except TypeError:
+            # Unhashable value somewhere: compare the slow way
+            self._rule_hashes.pop(rule_type, None)
+            if rule not in rules:
+                rules.append(rule)
+            return
+        if rule_key not in keys:
+            keys.add(rule_key)
+            rules.append(rule)
+        self._rule_hashes[rule_type] = (rules, keys, len(rules))
 
     def update_rule(self, rule_id, update_payload):
         """
@@ -870,17 +965,27 @@ class CheckmkRuleSync(CMK2):
         for key in sorted(self.unsupported_condition_keys(ruleset_name)):
             if not condition_tpl.get(key):
                 continue
-            if (ruleset_name, key) not in self._dropped_condition_warnings:
-                self._dropped_condition_warnings.add((ruleset_name, key))
-                self.log_error(
-                    f"Checkmk ignores the '{key}' condition in ruleset "
-                    f"'{ruleset_name}', so it is left out of the exported "
-                    f"rule. Remove it from the Setup Rule.")
+            self._report_dropped_condition(ruleset_name, key)
             if key in base_keys:
                 condition_tpl[key] = []
             else:
                 del condition_tpl[key]
 
+    def _report_dropped_condition(self, ruleset_name, key):
+        """
+        Tell the admin once per run that a condition has no effect.
+        Pool workers only record it, the parent reports their findings.
+        """
+        if (ruleset_name, key) in self._dropped_condition_warnings:
+            return
+        self._dropped_condition_warnings.add((ruleset_name, key))
+        if self._defer_condition_warnings:
+            return
+        self.log_error(
+            f"Checkmk ignores the '{key}' condition in ruleset "
+            f"'{ruleset_name}', so it is left out of the exported "
+            f"rule. Remove it from the Setup Rule.")
+
     def list_used_rulesets(self):
         """
         Yield the name of every ruleset that currently holds at least one
@@ -1196,25 +1301,28 @@ class CheckmkRuleSync(CMK2):
         else:
             db_objects = Host.objects_by_filter(object_filter)
 
-        total = db_objects.count()
+        host_ids = list(db_objects.scalar('id'))
+        batch_size = int(app.config.get('CMK_CALCULATION_BATCH_SIZE', 50))
         with Progress(SpinnerColumn(),
                       MofNCompleteColumn(),
                       *Progress.get_default_columns(),
                       TimeElapsedColumn()) as progress:
-            task1 = progress.add_task("Calculate rules", total=total)
-            object_filter = self.config['settings'].get(self.name, {}).get('filter')
-            for db_host in db_objects:
-                attributes = self.get_attributes(db_host, 'checkmk')
-                if not attributes:
-                    logger.debug("Skipped: %s", db_host.hostname)
-                    progress.advance(task1)
-                    continue
-                # self.actions is injected by the inits.export_rules wiring
-                host_actions = self.actions.get_outcomes(  # pylint: disable=no-member
-                    db_host, attributes['all'])
-                if host_actions:
-                    self.calculate_rules_of_host(host_actions, attributes)
-                progress.advance(task1)
+            task1 = progress.add_task("Calculate rules", total=len(host_ids))
+            batches = list(self.chunks(host_ids, batch_size))
+            if batches:
+                # Read once here, not by every worker
+                self.ruleset_item_types()
+            # Every worker returns the rules of its batch. imap keeps the
+            # batch order, so the merged rulesets come out in host order
+            # like a serial run and the folder_index sort stays stable.
+            with multiprocessing.Pool(initializer=_init_rule_worker,
+                                      initargs=(self,)) as pool:
+                for batch, result in zip(batches,
+                                         pool.imap(_calculate_rule_batch, batches)):
+                    self._merge_rule_batch(result, progress)
+                    progress.advance(task1, len(batch))
+                pool.close()
+                pool.join()
 
         self.calculate_static_rules()
         self.optimize_rules()
@@ -1225,6 +1333,34 @@ class CheckmkRuleSync(CMK2):
         self.sort_rules()
 
 
+    def _merge_rule_batch(self, result, progress):
+        """
+        Take over the rules, log entries and output of one worker batch
+        """
+        rulesets, log_details, dropped_conditions, output = result
+        if output:
+            progress.console.print(Text.from_ansi(output.rstrip('\n')))
+        self.log_details.extend(log_details)
+        for ruleset_name, key in sorted(dropped_conditions):
+            self._report_dropped_condition(ruleset_name, key)
+        for rule_type, rules in rulesets.items():
+            for rule in rules:
+                self._add_rule(rule_type, rule)
+
+    def calculate_rules_of_db_host(self, db_host):
+        """
+        Collect the rules of one database host
+        """
+        attributes = self.get_attributes(db_host, 'checkmk')
+        if not attributes:
+            logger.debug("Skipped: %s", db_host.hostname)
+            return
+        # self.actions is injected by the inits.export_rules wiring
+        host_actions = self.actions.get_outcomes(  # pylint: disable=no-member
+            db_host, attributes['all'])
+        if host_actions:
+            self.calculate_rules_of_host(host_actions, attributes)
+
     def calculate_rules_of_host(self, host_actions, attributes):
         """
         Calculate rules by Attribute of Host
@@ -1247,18 +1383,14 @@ class CheckmkRuleSync(CMK2):
                         )
                         if updated_rule is None:
                             continue
-                        self.rulsets_by_type.setdefault(rule_type, [])
-                        if updated_rule not in self.rulsets_by_type[rule_type]:
-                            self.rulsets_by_type[rule_type].append(updated_rule)
+                        self._add_rule(rule_type, updated_rule)
                 else:
                     updated_rule = self.build_condition_and_update_rule_params(
                         rule_params, attributes
                     )
                     if updated_rule is None:
                         continue
-                    self.rulsets_by_type.setdefault(rule_type, [])
-                    if updated_rule not in self.rulsets_by_type[rule_type]:
-                        self.rulsets_by_type[rule_type].append(updated_rule)
+                    self._add_rule(rule_type, updated_rule)
 
 
 
@@ -4,13 +4,42 @@ Checkmk Downtime Sync
 
 import datetime
 import calendar
+import multiprocessing
 from rich.progress import Progress, SpinnerColumn, TimeElapsedColumn, MofNCompleteColumn
 
+from application import app, init_db
 from application.plugins.checkmk.cmk2 import CmkException, CMK2
 from syncerapi.v1 import Host, cc, render_jinja
 
 _weekdays = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
 
+# The downtime sync of the running export, set once per pool worker
+# by _init_downtime_worker
+_worker_downtime_sync = None  # pylint: disable=invalid-name
+
+
+def _init_downtime_worker(downtime_sync):
+    """Pool initializer: own DB connection plus the sync of the run"""
+    global _worker_downtime_sync  # pylint: disable=global-statement
+    init_db()
+    _worker_downtime_sync = downtime_sync
+
+
+def _calculate_downtime_batch(host_ids):
+    """
+    Calculate the downtimes of a batch of hosts in a pool worker.
+    Returns [(hostname, downtimes, error), ...]
+    """
+    return [_worker_downtime_sync.host_downtimes(db_host) for db_host
+            in Host.objects(id__in=host_ids).exclude('log', 'raw')]
+
+
+def _downtime_key(downtime):
+    """
+    Hashable identity of a downtime, equal where the downtime dicts are
+    """
+    return (downtime['start'], downtime['end'], downtime['comment'], downtime['duration'])
+
 class CheckmkDowntimeSync(CMK2):
     """
     Sync Checkmk Downtimes
@@ -205,56 +234,127 @@ class CheckmkDowntimeSync(CMK2):
                 }
 
 
-    def set_downtime(self, host, downtime):
+    @staticmethod
+    def _downtime_request(downtime, hosts):
         """
-        host: Hostname as in Checkmk
-        start: Downtime start as a datetime object
-        end: Downtime end as a datetime object
+        Request body to set the downtime for the given hosts. More than one
+        host are addressed with a livestatus query, so they need only
+        one request.
         """
-        url = "domain-types/downtime/collections/host"
         data = {
-            "host_name" : host,
-            "downtime_type" : "host",
             "comment" : downtime['comment'],
             "start_time" : downtime['start'].isoformat(timespec='seconds'),
             "end_time" : downtime['end'].isoformat(timespec='seconds'),
         }
         if downtime['duration']:
             data['duration'] = int(downtime['duration'])
+        if len(hosts) == 1:
+            data["host_name"] = hosts[0]
+            data["downtime_type"] = "host"
+        else:
+            data["downtime_type"] = "host_by_query"
+            data["query"] = {
+                "op": "or",
+                "expr": [{"op": "=", "left": "hosts.name", "right": host}
+                         for host in hosts],
+            }
+        return data
+
+    def _post_downtime(self, data):
+        """
+        Send one downtime request, returns the error if it failed.
+        Called from the threads of send_downtimes.
+        """
+        url = "domain-types/downtime/collections/host"
         try:
             self.request(url, method="POST", data=data)
-            self.dt_stats['created'] += 1
-            print(f"\n{cc.OKGREEN} *{cc.ENDC} Set Downtime for "\
-                  f"{data['start_time']} ({data['comment']})")
         except CmkException as error:
-            self.dt_stats['failed'] += 1
+            return error
+        return None
+
+    def _record_result(self, hosts, data, error):
+        """
+        Statistics and output of a sent downtime request
+        """
+        if error is None:
+            self.dt_stats['created'] += len(hosts)
+            target = f" on {len(hosts)} hosts" if len(hosts) > 1 else ""
+            print(f"\n{cc.OKGREEN} *{cc.ENDC} Set Downtime for "\
+                  f"{data['start_time']} ({data['comment']}){target}")
+        else:
+            self.dt_stats['failed'] += len(hosts)
             self.log_details.append(("error", f"Downtime failed {error}"))
             print(f"\n{cc.WARNING} *{cc.ENDC} Downtime failed: "\
                   f"{error}")
 
-    def do_hosts_downtimes(self, hostname, host_actions, attributes, current_downtimes):
+    def set_downtime(self, host, downtime):
         """
-        Set the configured downtimes for one host that are not already
-        present in Checkmk. ``current_downtimes`` is this host's slice of the
-        downtimes ``run()`` read once up front in a single bulk query.
+        host: Hostname as in Checkmk
+        start: Downtime start as a datetime object
+        end: Downtime end as a datetime object
         """
+        data = self._downtime_request(downtime, [host])
+        self._record_result([host], data, self._post_downtime(data))
+
+    def send_downtimes(self, pending):
+        """
+        Create the pending downtimes, {downtime key: (downtime, [hostnames])}.
+
+        Hosts sharing a downtime are sent together, CMK_DOWNTIME_BULK_HOSTS
+        per request, and up to CMK_DOWNTIME_REQUEST_WORKERS requests
+        run at the same time.
+        """
+        bulk_size = int(app.config.get('CMK_DOWNTIME_BULK_HOSTS', 100))
+        jobs = []
+        for downtime, hostnames in pending.values():
+            for hosts in self.chunks(hostnames, max(bulk_size, 1)):
+                jobs.append((hosts, self._downtime_request(downtime, hosts)))
+        if not jobs:
+            return
+        workers = max(int(app.config.get('CMK_DOWNTIME_REQUEST_WORKERS', 8)), 1)
+        for (hosts, data), error, exception in self.map_requests(
+                lambda job: self._post_downtime(job[1]), jobs, workers):
+            self._record_result(hosts, data, error or exception)
+
+    def host_downtimes(self, db_host):
+        """
+        Calculate the configured downtimes of one host.
+        Returns (hostname, downtimes, error)
+        """
+        hostname = db_host.hostname
+        attributes = self.get_attributes(db_host, 'checkmk')
+        if not attributes:
+            return hostname, [], None
+        # pylint: disable-next=no-member
+        host_actions = self.actions.get_outcomes(db_host, attributes['all'])
+        downtimes = []
         try:
-            configured_downtimes = []
-            for _rule_type, rules in host_actions.items():
+            for _rule_type, rules in (host_actions or {}).items():
                 for rule in rules:
-                    configured_downtimes += \
+                    downtimes += \
                             list(self.calculate_configured_downtimes(rule, attributes['all']))
-
-            for downtime in configured_downtimes:
-                if downtime not in current_downtimes:
-                    self.set_downtime(hostname, downtime)
-                else:
-                    self.dt_stats['existing'] += 1
         except Exception as exp:  # pylint: disable=broad-exception-caught
-            self.log_details.append(('error', f'Exception {exp}'))
-            print(f"Exception: {exp}")
+            return hostname, [], str(exp)
+        return hostname, downtimes, None
 
-    def run(self):
+    def missing_downtimes(self, downtimes, current_downtimes):
+        """
+        The downtimes of a host which are not already present in Checkmk.
+        ``current_downtimes`` is this host's slice of the downtimes
+        ``run()`` read once up front in a single bulk query.
+        """
+        present = {_downtime_key(downtime) for downtime in current_downtimes}
+        missing = {}
+        for downtime in downtimes:
+            key = _downtime_key(downtime)
+            if key in present:
+                self.dt_stats['existing'] += 1
+                continue
+            # Two rules can configure the same downtime, set it only once
+            missing.setdefault(key, downtime)
+        return list(missing.values())
+
+    def run(self):  # pylint: disable=too-many-locals
         """
         Export Downtimes
         """
@@ -265,31 +365,36 @@ class CheckmkDowntimeSync(CMK2):
         # per-host reads were what made the export appear to hang.
         current_by_host = self.get_all_cmk_downtimes()
 
-        # Collect Rules
-        total = Host.active_non_template().count()
+        object_filter = self.config['settings'].get(self.name, {}).get('filter')
+        host_ids = list(Host.objects_by_filter(object_filter).scalar('id'))
+        batch_size = int(app.config.get('CMK_CALCULATION_BATCH_SIZE', 50))
+        batches = list(self.chunks(host_ids, batch_size))
+
+        # Downtime key -> (downtime, hostnames missing it)
+        pending = {}
         with Progress(SpinnerColumn(),
                       MofNCompleteColumn(),
                       *Progress.get_default_columns(),
                       TimeElapsedColumn()) as progress:
-            task1 = progress.add_task("Calculating Downtimes", total=total)
-            object_filter = self.config['settings'].get(self.name, {}).get('filter')
-            db_objects = Host.objects_by_filter(object_filter)
-            for db_host in db_objects:
-                hostname = db_host.hostname
-                progress.console.print(f"- Started for {hostname}")
-                attributes = self.get_attributes(db_host, 'checkmk')
-                if not attributes:
-                    progress.advance(task1)
-                    continue
-
-                # pylint: disable-next=no-member
-                host_actions = self.actions.get_outcomes(db_host, attributes['all'])
-                if not host_actions:
-                    progress.advance(task1)
-                    continue
-                self.do_hosts_downtimes(hostname, host_actions, attributes,
-                                        current_by_host.get(hostname, []))
-                progress.advance(task1)
+            task1 = progress.add_task("Calculating Downtimes", total=len(host_ids))
+            with multiprocessing.Pool(initializer=_init_downtime_worker,
+                                      initargs=(self,)) as pool:
+                for batch, results in zip(batches,
+                                          pool.imap(_calculate_downtime_batch, batches)):
+                    for hostname, downtimes, error in results:
+                        if error:
+                            self.log_details.append(('error', f'Exception {error}'))
+                            progress.console.print(f"Exception: {error}")
+                            continue
+                        for downtime in self.missing_downtimes(
+                                downtimes, current_by_host.get(hostname, [])):
+                            pending.setdefault(_downtime_key(downtime),
+                                               (downtime, []))[1].append(hostname)
+                    progress.advance(task1, len(batch))
+                pool.close()
+                pool.join()
+
+        self.send_downtimes(pending)
 
         # Final status line: a fully deduplicated run creates nothing and
         # would otherwise end without any output, which reads like a failure.
@@ -299,41 +404,6 @@ class CheckmkDowntimeSync(CMK2):
         for key, value in self.dt_stats.items():
             self.log_details.append((f'downtimes_{key}', value))
 
-    def run_async(self):
-        """
-        Export Downtimes
-        """
-        #@TODO: Fix Error: AttributeError:
-        # Can't pickle local object 'export_downtimes.<locals>.ExportDowntimes'
-        # Collect Rules
-        #total = Host.objects.count()
-        #with Progress(SpinnerColumn(),
-        #              MofNCompleteColumn(),
-        #              *Progress.get_default_columns(),
-        #              TimeElapsedColumn()) as progress:
-        #    task1 = progress.add_task("Calculating Downtimes", total=total)
-        #    with multiprocessing.Pool() as pool:
-        #        for db_host in Host.objects():
-        #            hostname = db_host.hostname
-        #            progress.console.print(f"- Started for {hostname}")
-        #            attributes = self.get_attributes(db_host, 'checkmk')
-        #            if not attributes:
-        #                progress.advance(task1)
-        #                continue
-
-        #            host_actions = self.actions.get_outcomes(db_host, attributes['all'])
-        #            if not host_actions:
-        #                progress.advance(task1)
-        #                continue
-        #            davor += 1
-        #            pool.apply_async(self.do_hosts_downtimes,
-        #                             args=(hostname, host_actions, attributes),
-        #                             callback=lambda x: progress.advance(task1))
-        #            danach += 1
-
-        #        pool.close()
-        #        pool.join()
-
     def get_all_cmk_downtimes(self):
         """
         Read all host downtimes from Checkmk in one query, grouped by
@@ -4,6 +4,7 @@ Checkmk Groups Export
 from mongoengine import Q
 from mongoengine.errors import DoesNotExist
 
+from application import app
 from application.plugins.checkmk.cmk2 import CMK2, CmkException
 from application.modules.rule.rule import Rule
 from application.plugins.checkmk.models import CheckmkGroupRule
@@ -33,12 +34,10 @@ class CheckmkGroupSync(CMK2):
             new.account = self.config['ref']
             return new
 
-    def parse_attributes(self):
+    def _export_hosts(self):
         """
-        Create dict with list of all possible attributes
+        Hosts the groups are calculated from
         """
-        collection_keys = {}
-        collection_values = {}
         # Default stays host-only (is_object=True documents, e.g. shadow
         # hosts, are excluded). If the account — or a child account — defines
         # an object filter for this export, honor it so the configured
@@ -46,30 +45,109 @@ class CheckmkGroupSync(CMK2):
         # consistent with the rules/tags export.
         object_filter = self.config['settings'].get(self.name, {}).get('filter')
         if object_filter:
-            db_hosts = Host.objects_by_filter(object_filter)
-        else:
-            db_hosts = Host.get_export_hosts()
-        for db_host in db_hosts:
-            if attributes := self.get_attributes(db_host, 'cmk_conf'):
-                for key, value in attributes['all'].items():
-                    key, value = str(key), str(value)
-                    # Add the Keys
-                    collection_keys.setdefault(key, [])
-                    if value not in collection_keys[key]:
-                        collection_keys[key].append(value)
-                    # Add the Values
-                    collection_values.setdefault(value, [])
-                    if key not in collection_values[value]:
-                        collection_values[value].append(key)
+            return Host.objects_by_filter(object_filter)
+        return Host.get_export_hosts()
+
+    @staticmethod
+    def _collect(pairs):
+        """
+        Build the key -> values and value -> keys maps from (key, value)
+        pairs. Dicts serve as ordered sets, so every pair is checked in
+        constant time and the first-seen order is kept.
+        """
+        collection_keys = {}
+        collection_values = {}
+        for key, value in pairs:
+            key, value = str(key), str(value)
+            collection_keys.setdefault(key, {})[value] = None
+            collection_values.setdefault(value, {})[key] = None
+        return ({key: list(values) for key, values in collection_keys.items()},
+                {value: list(keys) for value, keys in collection_values.items()})
+
+    def parse_attributes(self):
+        """
+        Create dict with list of all possible attributes
+        """
+        if app.config.get('CMK_GROUPS_DISTINCT_QUERY'):
+            return self.distinct_attributes()
+
+        def pairs():
+            for db_host in self._export_hosts():
+                if attributes := self.get_attributes(db_host, 'cmk_conf'):
+                    yield from attributes['all'].items()
         # [0] All Values behind Label
         # [1] All Keys which have value
-        return collection_keys, collection_values
+        return self._collect(pairs())
+
+    @staticmethod
+    def _rule_pair_condition():
+        """
+        $filter condition for the (key, value) pairs the enabled group
+        rules can use, None if no rule reads host attributes
+        """
+        keys, prefixes, values = set(), set(), set()
+        for rule in CheckmkGroupRule.objects(enabled=True).only('outcome'):
+            outcome = rule.outcome
+            if outcome.foreach_type not in ('label', 'value'):
+                continue
+            if outcome.foreach.endswith('*'):
+                # Both types match the wildcard against the key
+                prefixes.add(outcome.foreach[:-1])
+            elif outcome.foreach_type == 'label':
+                keys.add(outcome.foreach)
+            else:
+                values.add(outcome.foreach)
+        conditions = [{'$eq': [{'$indexOfCP': ['$$pair.k', prefix]}, 0]}
+                      for prefix in sorted(prefixes)]
+        if keys:
+            conditions.append({'$in': ['$$pair.k', sorted(keys)]})
+        if values:
+            # parse_attributes compares the values as strings
+            conditions.append({'$in': [{'$convert': {'input': '$$pair.v', 'to': 'string',
+                                                     'onError': None, 'onNull': None}},
+                                       sorted(values)]})
+        if not conditions:
+            return None
+        return {'$or': conditions}
+
+    def distinct_attributes(self):
+        """
+        Same result as parse_attributes, computed by MongoDB.
+
+        One aggregation returns the distinct (key, value) pairs of the
+        labels and inventory of all export hosts, no host is loaded.
+        Only the pairs an enabled group rule can use are kept.
+        Custom attributes, rewrites, filters and template labels are not
+        applied, that's why it's opt in with CMK_GROUPS_DISTINCT_QUERY.
+        """
+        condition = self._rule_pair_condition()
+        if condition is None:
+            return {}, {}
+        pipeline = [
+            {'$project': {'_id': 0, 'pairs': {'$filter': {
+                'input': {'$concatArrays': [
+                    {'$objectToArray': {'$ifNull': ['$labels', {}]}},
+                    {'$objectToArray': {'$ifNull': ['$inventory', {}]}},
+                    [{'k': 'SOURCE_ACCOUNT', 'v': {'$ifNull': ['$source_account_name', '']}},
+                     {'k': 'HOSTNAME', 'v': '$hostname'}],
+                ]},
+                'as': 'pair',
+                'cond': condition,
+            }}}},
+            {'$match': {'pairs.0': {'$exists': True}}},
+            {'$unwind': '$pairs'},
+            {'$group': {'_id': {'k': '$pairs.k', 'v': '$pairs.v'}}},
+        ]
+        result = self._export_hosts().aggregate(pipeline, allowDiskUse=True)
+        return self._collect((entry['_id']['k'], entry['_id'].get('v'))
+                             for entry in result)
 
     # pylint: disable=too-many-arguments,too-many-positional-arguments,line-too-long,redefined-outer-name
     def _add_group_entries(self, items, rewrite_name, rewrite_title, outcome, group_type, groups, str_replace, replace_exceptions):
         """
         Hilfsfunktion zum Hinzufügen von Gruppen-Einträgen
         """
+        # groups[group_type] is a dict used as ordered set of (title, name)
         for item in items:
             new_group_title = item
             new_group_name = item
@@ -79,8 +157,8 @@ class CheckmkGroupSync(CMK2):
             if rewrite_title:
                 new_group_title = render_jinja(outcome.rewrite_title, name=item, result=item)
             new_group_title = str_replace(new_group_title, replace_exceptions).strip()
-            if new_group_name and (new_group_title, new_group_name) not in groups[group_type]:
-                groups[group_type].append((new_group_title, new_group_name))
+            if new_group_name:
+                groups[group_type].setdefault((new_group_title, new_group_name))
 
     # pylint: disable=too-many-locals,too-many-branches,too-many-statements
     def export_cmk_groups(self, test_run):
@@ -96,7 +174,7 @@ class CheckmkGroupSync(CMK2):
         for rule in CheckmkGroupRule.objects(enabled=True):
             outcome = rule.outcome
             group_type = outcome.group_name
-            groups.setdefault(group_type, [])
+            groups.setdefault(group_type, {})
             rewrite_name = False
             rewrite_title = False
             if outcome.rewrite:
@@ -152,7 +230,7 @@ class CheckmkGroupSync(CMK2):
                 object_filter = outcome.foreach
                 if object_filter:
                     db_filter &= Q(inventory__syncer_account=object_filter)
-                hostnames = [entry.hostname for entry in Host.objects(db_filter)]
+                hostnames = Host.objects(db_filter).scalar('hostname')
                 self._add_group_entries(
                     hostnames,
                     rewrite_name,
@@ -203,6 +281,7 @@ class CheckmkGroupSync(CMK2):
             },
         }
         for group_type, configured_groups in groups.items():
+            configured_groups = list(configured_groups)
             print(f"{CC.OKBLUE} *{CC.ENDC} Read Current {group_type}")
             url = urls[group_type]['get']
 
@@ -213,7 +292,9 @@ class CheckmkGroupSync(CMK2):
 
             group_cache = self.get_cache_object(group=group_type)
 
-            cached_group_list = group_cache.content.get('list', [])
+            # From Cache we get Lists not tuple
+            cached_groups = {tuple(x) for x in group_cache.content.get('list', [])}
+            cached_names = {x[1] for x in cached_groups}
 
 
 
@@ -227,10 +308,9 @@ class CheckmkGroupSync(CMK2):
                 cmk_title = cmk_group['title']
 
 
-                # From Cache we get Lists not tuple
-                if [cmk_title, cmk_name] in cached_group_list:
+                if (cmk_title, cmk_name) in cached_groups:
                     syncers_groups_in_cmk.append(cmk_name)
-                elif cmk_name in [x[1] for x in cached_group_list]:
+                elif cmk_name in cached_names:
                     syncers_groups_needing_update.append(cmk_name)
                 else:
                     # The Group is not known yet, but maybe we need to controll it
@@ -243,22 +323,23 @@ class CheckmkGroupSync(CMK2):
             print(f"{CC.OKBLUE} *{CC.ENDC} Create {group_type} if needed")
             new_entries = []
             update_entries = []
-            handeled_groups = []
+            in_cmk = set(syncers_groups_in_cmk)
+            needing_update = set(syncers_groups_needing_update)
+            external = set(yet_external_groups_in_cmk)
             for new_group in configured_groups:
-                handeled_groups.append(new_group)
                 alias = new_group[0]
                 name = new_group[1]
-                if name in yet_external_groups_in_cmk:
+                if name in external:
                     continue
                 if "None" in (alias, name):
                     continue
-                if name not in syncers_groups_in_cmk and name not in syncers_groups_needing_update:
+                if name not in in_cmk and name not in needing_update:
                     print(f"{CC.OKBLUE}  *{CC.ENDC} Added {new_group}")
                     new_entries.append({
                         'alias' : alias,
                         'name' : name,
                     })
-                elif name in syncers_groups_needing_update:
+                elif name in needing_update:
                     print(f"{CC.OKBLUE}  *{CC.ENDC} Updated {new_group}")
                     update_entries.append({
                         'name' : name,
@@ -301,8 +382,9 @@ class CheckmkGroupSync(CMK2):
 
             if not test_run:
                 print(f"{CC.OKBLUE} *{CC.ENDC} Delete Groups if needed")
+                configured_names = {x[1] for x in configured_groups}
                 for name in syncers_groups_in_cmk:
-                    if name not in [x[1] for x in handeled_groups]:
+                    if name not in configured_names:
                         # Checkmk is not deleting objects if the still referenced
                         url = f"{urls[group_type]['delete']}{name}"
                         self.request(url, method="DELETE")
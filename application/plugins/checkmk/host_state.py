@@ -0,0 +1,121 @@
+"""
+Persistent Checkmk Host State
+
+The host export needs the current config of every host in Checkmk, and
+fetching it is the most expensive call of a run on big sites. Since the
+hosts are mostly written by the syncer itself, the state of the last run
+is kept per account in the database. Between full fetches only the hosts
+the export changed, and the ones which appeared in or moved between
+folders, are fetched again.
+"""
+import datetime
+import json
+
+from mongoengine.errors import DoesNotExist
+from pymongo import DeleteOne, ReplaceOne
+
+from application import app
+from application.plugins.checkmk.models import CheckmkHostState, CheckmkObjectCache
+
+
+class HostStateCache:
+    """
+    Snapshot of the Checkmk hosts of one account
+    """
+
+    def __init__(self, account_ref):
+        self.account_ref = account_ref
+        self.account = str(account_ref)
+        self._meta = None
+
+    @property
+    def meta(self):
+        """
+        Run bookkeeping, stored in the object cache of the account
+        """
+        if self._meta is None:
+            try:
+                self._meta = CheckmkObjectCache.objects.get(cache_group='host_state',
+                                                            account=self.account_ref)
+            except DoesNotExist:
+                self._meta = CheckmkObjectCache()
+                self._meta.cache_group = 'host_state'
+                self._meta.account = self.account_ref
+                self._meta.content = {}
+        return self._meta
+
+    def full_fetch_reason(self):
+        """
+        Why the snapshot can't be used, None if it can
+        """
+        content = self.meta.content
+        if not content.get('full_fetch'):
+            return "no snapshot yet"
+        if not content.get('complete'):
+            return "last export did not finish"
+        age = datetime.datetime.now() - content['full_fetch']
+        if age.total_seconds() > app.config.get('CMK_HOST_STATE_MAX_AGE', 86400):
+            return "snapshot expired"
+        return None
+
+    def load(self):
+        """
+        Return {hostname: (folder, host data, dirty)}
+        """
+        return {entry['hostname']: (entry.get('folder'), json.loads(entry['data']),
+                                    entry.get('dirty', False))
+                for entry in CheckmkHostState.objects(account=self.account)
+                .as_pymongo().only('hostname', 'folder', 'data', 'dirty')}
+
+    def store(self, hosts, full=False):
+        """
+        Save the given {hostname: host data}. A full fetch replaces the
+        whole snapshot.
+        """
+        operations = []
+        for hostname, data in hosts.items():
+            document = {
+                'account': self.account,
+                'hostname': hostname,
+                'folder': data.get('extensions', {}).get('folder'),
+                'data': json.dumps(data),
+                'dirty': False,
+            }
+            operations.append(ReplaceOne({'account': self.account, 'hostname': hostname},
+                                         document, upsert=True))
+        collection = CheckmkHostState._get_collection()  # pylint: disable=protected-access
+        if full:
+            collection.delete_many({'account': self.account})
+        if operations:
+            collection.bulk_write(operations, ordered=False)
+        if full:
+            self.meta.content['full_fetch'] = datetime.datetime.now()
+            self.meta.save()
+
+    def remove(self, hostnames):
+        """
+        Drop hosts which are gone from Checkmk
+        """
+        if hostnames:
+            # pylint: disable-next=protected-access
+            CheckmkHostState._get_collection().bulk_write(
+                [DeleteOne({'account': self.account, 'hostname': hostname})
+                 for hostname in hostnames], ordered=False)
+
+    def begin_export(self):
+        """
+        Flag the snapshot as possibly outdated until finish_export() ran,
+        so an aborted export is followed by a full fetch
+        """
+        self.meta.content['complete'] = False
+        self.meta.save()
+
+    def finish_export(self, changed_hosts):
+        """
+        Mark the hosts the export wrote to, they are fetched again next time
+        """
+        if changed_hosts:
+            CheckmkHostState.objects(account=self.account,
+                                     hostname__in=list(changed_hosts)).update(set__dirty=True)
+        self.meta.content['complete'] = True
+        self.meta.save()
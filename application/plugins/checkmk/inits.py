@@ -6,6 +6,7 @@ from application.plugins.checkmk.cmk2 import CMK2, CmkException
 from application.modules.debug import ColorCodes
 from application.models.host import Host
 from application.modules.rule.filter import Filter
+from application.modules.rule.cache import get_cache_store
 
 from application.plugins.checkmk.tags import CheckmkTagSync
 from application.plugins.checkmk.cmk_rules import CheckmkRuleSync
@@ -602,6 +603,13 @@ def export_notifications(account, debug=False):
                     details=[('error', str(error_obj))])
 #.
 #   .-- Export Downtimes
+class ExportDowntimes(DefaultRule):
+    """
+    Name overwrite, on module level so the export can be sent to the
+    calculation workers
+    """
+
+
 def export_downtimes(account, debug=False, debug_rules=False):
     """
     Create Rules in Checkmk
@@ -609,10 +617,6 @@ def export_downtimes(account, debug=False, debug_rules=False):
     syncer = None
     try:
         rules = _load_rules()
-        class ExportDowntimes(DefaultRule):
-            """
-            Name overwrite
-            """
         actions = ExportDowntimes()
         actions.rules = CheckmkDowntimeRule.objects(enabled=True)
 
@@ -783,6 +787,17 @@ def sync_folderpools(_account=False, _debug=False):
         else:
             print(" - Is already up to date")
 
+def _release_hosts(hosts, **unset):
+    """
+    Drop the pool lock `unset` and the rule caches of `hosts`,
+    return their number. The outcome caches are stamped with the rules
+    and attributes only, not with the folder or site they hand out.
+    """
+    host_ids = list(hosts.scalar('id'))
+    hosts.update(set__cache={}, **unset)
+    get_cache_store().clear_hosts(host_ids)
+    return len(host_ids)
+
 def reset_folderpool(pool):
     """
     Drop the assignment of a single Folder Pool, return the number of hosts.
@@ -792,9 +807,7 @@ def reset_folderpool(pool):
     in this pool's folder loses the lock and its rule cache (the calculated
     folder is cached in there as well), the seat counter starts at zero.
     """
-    hosts = Host.objects(folder=pool.folder_name)
-    count = hosts.count()
-    hosts.update(unset__folder=1, set__cache={})
+    count = _release_hosts(Host.objects(folder=pool.folder_name), unset__folder=1)
     pool.folder_seats_taken = 0
     pool.save()
     return count
@@ -806,8 +819,8 @@ def reset_folderpools(_account=False, _debug=False):
 
     # Hosts locked to a folder whose pool is gone would keep their lock.
     leftovers = Host.objects(folder__ne=None)
-    print(f"Clearing {leftovers.count()} locks to folders without a pool")
-    leftovers.update(unset__folder=1, set__cache={})
+    print(f"Clearing {_release_hosts(leftovers, unset__folder=1)} "
+          "locks to folders without a pool")
 #.
 #   . Sync Site Pools
 def sync_sitepools(_account=False, _debug=False):
@@ -843,9 +856,9 @@ def reset_sitepool(pool):
     calculated ``site`` attribute lives in there too, so without that the
     next export would hand out the old site again.
     """
-    hosts = Host.objects(pool_site__in=[x.site_id for x in pool.member_sites])
-    count = hosts.count()
-    hosts.update(unset__pool_site=1, set__cache={})
+    count = _release_hosts(
+        Host.objects(pool_site__in=[x.site_id for x in pool.member_sites]),
+        unset__pool_site=1)
     for member in pool.member_sites:
         member.hosts_taken = 0
     pool.save()
@@ -858,8 +871,8 @@ def reset_sitepools(_account=False, _debug=False):
 
     # Hosts on a site that no pool lists anymore would keep their lock.
     leftovers = Host.objects(pool_site__ne=None)
-    print(f"Clearing {leftovers.count()} locks to sites without a pool")
-    leftovers.update(unset__pool_site=1, set__cache={})
+    print(f"Clearing {_release_hosts(leftovers, unset__pool_site=1)} "
+          "locks to sites without a pool")
 
 def pool_sticky_notes(db_host):
     """
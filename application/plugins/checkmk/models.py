@@ -1052,3 +1052,28 @@ class CheckmkObjectCache(db.Document):
     }
 
 #.
+
+#   .-- Host State
+
+class CheckmkHostState(db.Document):
+    """
+    Last known state of a host in Checkmk, per account
+    """
+
+    account = db.StringField(required=True)
+    hostname = db.StringField(required=True)
+    folder = db.StringField()
+    # The compacted host as in CMK2.checkmk_hosts, JSON encoded since
+    # label and attribute keys may contain dots
+    data = db.StringField()
+    # Changed by the export since it was fetched
+    dirty = db.BooleanField(default=False)
+
+    meta = {
+        'strict': False,
+        'indexes': [
+            {'fields': ['account', 'hostname'], 'unique': True},
+        ],
+    }
+
+#.
@@ -54,6 +54,40 @@ def merge_folder_attributes(existing, new):
     return merged
 
 
+# The syncer of the running export, set once per pool worker by
+# _init_calculation_worker. Pickling it once per worker instead of once
+# per host keeps the rule engines (and their caches) warm in the worker.
+_worker_syncer = None  # pylint: disable=invalid-name
+
+
+def _init_calculation_worker(syncer):
+    """Pool initializer: own DB connection plus the syncer of the run"""
+    global _worker_syncer  # pylint: disable=global-statement
+    init_db()
+    _worker_syncer = syncer
+
+
+def _calculate_host_batch(batch):
+    """
+    Calculate one batch of hosts inside a pool worker.
+
+    The worker loads the hosts itself, only their ids cross the pipe.
+    Returns (batch_id, [(hostname, enabled, data, error), ...]).
+    """
+    batch_id, host_ids = batch
+    results = []
+    # log and raw are never read by the rules and can be large
+    for db_host in Host.objects(id__in=host_ids).exclude('log', 'raw'):
+        try:
+            results.append((*_worker_syncer.calculate_host_actions(db_host), None))
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            if _worker_syncer.debug:
+                raise
+            results.append((db_host.hostname, False, None,
+                            f"{type(error).__name__}: {error}"))
+    return batch_id, results
+
+
 # pylint: disable=too-many-instance-attributes,too-many-public-methods
 class SyncCMK2(CMK2):
     """
@@ -107,6 +141,14 @@ class SyncCMK2(CMK2):
         self.num_created = 0
         self.num_updated = 0
         self.num_deleted = 0
+        # Hosts this run wrote to, see CMK_HOST_STATE_CACHE
+        self.changed_hosts = set()
+        self.host_state = None
+        # Ignore the host state snapshot and fetch all hosts
+        self.full_host_fetch = False
+        # Some hosts were never calculated (worker timeout), so the run
+        # must not delete or forget what it did not see
+        self.calculation_incomplete = False
         # Lazy per-run map of Project name -> allows this
         # account (see project_denied_for_account).
         self._project_allows_account = None
@@ -134,26 +176,13 @@ class SyncCMK2(CMK2):
             ('clusters', []),
             ('cluster_updates', []),
             ('disabled_hosts', []),
+            ('changed_hosts', set()),
+            ('host_state', None),
         ):
             if key in state:
                 state[key] = empty
         return state
 
-    @staticmethod
-    def chunks(lst, n):
-        """
-        Split a list into smaller chunks of specified size.
-
-        Args:
-            lst (list): List to be chunked
-            n (int): Size of each chunk
-
-        Yields:
-            list: Successive n-sized chunks from the input list
-        """
-        for i in range(0, len(lst), n):
-            yield lst[i:i + n]
-
 #   .-- Get Host Actions
     def get_host_actions(self, db_host, attributes, persist_cache=True):
         """
@@ -361,6 +390,30 @@ class SyncCMK2(CMK2):
 
         Uses either folder-based or global host fetching depending on
         configuration settings to populate the checkmk_hosts dictionary.
+        With CMK_HOST_STATE_CACHE, the snapshot of the last run is used
+        instead and only refreshed where needed.
+        """
+        if not app.config.get('CMK_HOST_STATE_CACHE'):
+            self._fetch_all_hosts()
+            return
+
+        # The models are only needed with the snapshot
+        # pylint: disable-next=import-outside-toplevel
+        from application.plugins.checkmk.host_state import HostStateCache
+        self.host_state = HostStateCache(self.config['ref'])
+        reason = "requested" if self.full_host_fetch else self.host_state.full_fetch_reason()
+        if not reason and not self._refresh_checkmk_hosts():
+            reason = "too many changes"
+        if reason:
+            print(f"{CC.OKBLUE} -- {CC.ENDC}Fetch all hosts from Checkmk ({reason})")
+            self.checkmk_hosts = {}
+            self._fetch_all_hosts()
+            self.host_state.store(self.checkmk_hosts, full=True)
+        self.host_state.begin_export()
+
+    def _fetch_all_hosts(self):
+        """
+        Full fetch of the hosts
         """
         if app.config['CMK_GET_HOST_BY_FOLDER']:
             # The folder-hosts endpoint
@@ -379,6 +432,66 @@ class SyncCMK2(CMK2):
                 extra_params += "&include_links=false"
             self.fetch_all_checkmk_hosts(extra_params=extra_params)
 
+    def fetch_folder_members(self):
+        """
+        Return {hostname: folder} of all hosts, from the folder list
+        """
+        url = "domain-types/folder_config/collections/all"
+        url += "?parent=/&recursive=true&show_hosts=true"
+        api_folders, _ = self.request(url, method="GET")
+        if not api_folders:
+            raise CmkException("Cant read the folders of Checkmk")
+        members = {}
+        for folder in api_folders['value']:
+            path = folder['extensions']['path']
+            for link in folder.get('members', {}).get('hosts', {}).get('value', []):
+                hostname = link.get('title') or link['href'].rsplit('/', 1)[-1]
+                members[hostname] = path
+        return members
+
+    def _refresh_checkmk_hosts(self):
+        """
+        Load the host snapshot and fetch again only the hosts which
+        are new, moved or were changed by the last export. Returns False
+        if that are too many and a full fetch is cheaper.
+        """
+        known = self.host_state.load()
+        members = self.fetch_folder_members()
+        refetch = [hostname for hostname, folder in members.items()
+                   if hostname not in known or known[hostname][2]
+                   or self._normalize_cmk_folder(known[hostname][0] or '/')
+                   != self._normalize_cmk_folder(folder)]
+        if len(refetch) > app.config.get('CMK_HOST_STATE_MAX_DELTA', 500):
+            return False
+        print(f"{CC.OKBLUE} -- {CC.ENDC}Use the host snapshot, "
+              f"refetch {len(refetch)} of {len(members)} hosts")
+        refetch_set = set(refetch)
+        for hostname in members:
+            if hostname not in refetch_set:
+                self.checkmk_hosts[hostname] = known[hostname][1]
+
+        fetched = {}
+        for hostname in refetch:
+            url = f"objects/host_config/{hostname}?effective_attributes=false"
+            api_host, _headers = self.request(url, method="GET")
+            if not api_host:
+                # Deleted in the meantime
+                continue
+            fetched[hostname] = self._compact_host_data(api_host)
+        self.checkmk_hosts.update(fetched)
+        self.host_state.store(fetched)
+        self.host_state.remove([hostname for hostname in known
+                                if hostname not in members or
+                                (hostname in refetch_set and hostname not in fetched)])
+        return True
+
+    def _finish_host_state(self):
+        """
+        Hosts written by this run are fetched again by the next one
+        """
+        if self.host_state:
+            self.host_state.finish_export(self.changed_hosts)
+
 
     def use_host(self, hostname, source_account_name):
         """
@@ -511,6 +624,8 @@ class SyncCMK2(CMK2):
                                         f"because limit is set to {delete_limit}"))
                 return
 
+        self.changed_hosts.update(delete_list)
+
         if app.config['CMK_BULK_DELETE_HOSTS']:
             url = "/domain-types/host_config/actions/bulk-delete/invoke"
             chunk_size = app.config['CMK_BULK_DELETE_OPERATIONS']
@@ -704,6 +819,7 @@ class SyncCMK2(CMK2):
                 cmk_host = self.checkmk_hosts[hostname]
 
                 if is_cluster and not cmk_host['extensions']['is_cluster']:
+                    self.changed_hosts.add(hostname)
                     url = f"/objects/host_config/{hostname}"
                     try:
                         self.request(url, method="DELETE")
@@ -776,80 +892,100 @@ class SyncCMK2(CMK2):
             return True
         return self.host_folder_in_scope(data[0])
 
-    # pylint: disable-next=too-many-locals
-    def calculate_attributes_and_rules(self):
+    def _calculation_batches(self, progress, task):
         """
-        Calculate host attributes and rules using multiprocessing.
-
-        Processes all database hosts in parallel to determine their attributes
-        and required actions. Uses multiprocessing for performance with large
-        host inventories.
+        Split the hosts to export into batches of ids for the workers.
 
-        Returns:
-            dict: Dictionary mapping hostnames to (actions, attributes) tuples
+        Only the fields needed to filter the hosts are loaded here.
+        Returns the batches as {batch_id: [(id, hostname), ...]} and the
+        project of every host, which Stage B (folder-scope) needs again.
         """
         object_filter = self.config['settings'].get(self.name, {}).get('filter')
-        db_objects = Host.objects_by_filter(object_filter)
-        total = db_objects.count()
+        db_objects = Host.objects_by_filter(object_filter)\
+                .only('hostname', 'source_account_name', 'project')
+        progress.update(task, total=db_objects.count())
+        batch_size = int(app.config.get('CMK_CALCULATION_BATCH_SIZE', 50))
+        batches = {}
+        batch = []
+        host_projects = {}
+        for db_host in db_objects:
+            # project_denied_for_account: the host is assigned to a
+            # Project whose account filter excludes this account —
+            # treat it like any other filtered host (not exported,
+            # cleaned up if it already exists in this Checkmk).
+            if not self.use_host(db_host.hostname, db_host.source_account_name) \
+                    or self.project_denied_for_account(db_host.project):
+                progress.advance(task)
+                continue
+            host_projects[db_host.hostname] = db_host.project
+            batch.append((db_host.pk, db_host.hostname))
+            if len(batch) >= batch_size:
+                batches[len(batches)] = batch
+                batch = []
+        if batch:
+            batches[len(batches)] = batch
+        return batches, host_projects
 
-        with Progress(SpinnerColumn(),
-                      MofNCompleteColumn(),
-                      *Progress.get_default_columns(),
-                      TimeElapsedColumn()) as progress:
-            task1 = progress.add_task("Calculating Hostrules and Attributes", total=total)
-            host_actions = {}
-            disabled_hosts = []
-            # Host's project is needed again in Stage B (folder-scope), but
-            # the pool result only carries the hostname — remember it here.
-            host_projects = {}
-            with multiprocessing.Pool(initializer=init_db) as pool:
-                tasks = []
-                for db_host in db_objects:
-                    # project_denied_for_account: the host is assigned to a
-                    # Project whose account filter excludes this account —
-                    # treat it like any other filtered host (not exported,
-                    # cleaned up if it already exists in this Checkmk).
-                    if not self.use_host(db_host.hostname, db_host.source_account_name) \
-                            or self.project_denied_for_account(db_host.project):
-                        progress.advance(task1)
-                        continue
-                    host_projects[db_host.hostname] = db_host.project
-                    task = pool.apply_async(self.calculate_host_actions, args=(db_host,))
-                    tasks.append((db_host.hostname, task))
+    # pylint: disable-next=too-many-locals
+    def calculate_attributes_and_rules(self, progress):
+        """
+        Calculate host attributes and rules using multiprocessing.
 
-                progress.console.print("Waiting for Calculation to finish")
-                for host_name, task in tasks:
-                    try:
-                        hostname, enabled, data = task.get(timeout=app.config['PROCESS_TIMEOUT'])
-                    except multiprocessing.TimeoutError:
-                        progress.console.print(f"- ERROR: Timeout for {host_name}")
-                    except Exception as error:  # pylint: disable=broad-exception-caught
-                        # Not a timeout: the worker raised. Name the host and
-                        # the real error — a rule with a broken condition used
-                        # to hide behind a "Timeout error" label here.
-                        if self.debug:
-                            raise
-                        progress.console.print(
-                            f"- ERROR in worker for {host_name}: "
-                            f"{type(error).__name__}: {error}")
+        The workers get batches of host ids, load the hosts themselves and
+        keep the rule engines of the run. Results are yielded as soon as a
+        batch is done, so the caller can already sync them to Checkmk
+        while the rest is still calculated.
+
+        Args:
+            progress (Progress): Progress display of the run
+
+        Yields:
+            tuple: (hostname, (actions, attributes)) of every exported host
+        """
+        task1 = progress.add_task("Calculating Hostrules and Attributes", total=None)
+        batches, host_projects = self._calculation_batches(progress, task1)
+        timeout = app.config['PROCESS_TIMEOUT'] \
+                * int(app.config.get('CMK_CALCULATION_BATCH_SIZE', 50))
+        disabled_hosts = []
+        with multiprocessing.Pool(initializer=_init_calculation_worker,
+                                  initargs=(self,)) as pool:
+            results = pool.imap_unordered(_calculate_host_batch,
+                                          [(batch_id, [host_id for host_id, _ in batch])
+                                           for batch_id, batch in batches.items()])
+            while batches:
+                try:
+                    batch_id, batch_results = results.next(timeout=timeout)
+                except multiprocessing.TimeoutError:
+                    # A hanging worker blocks its batch for good, stop
+                    # waiting and report every host still missing.
+                    for batch in batches.values():
+                        for _host_id, host_name in batch:
+                            progress.console.print(f"- ERROR: Timeout for {host_name}")
+                    self.calculation_incomplete = True
+                    pool.terminate()
+                    break
+                batches.pop(batch_id)
+                for hostname, enabled, data, error in batch_results:
+                    progress.advance(task1)
+                    if error:
+                        # Name the host and the real error — a rule with a
+                        # broken condition used to hide behind a "Timeout
+                        # error" label here.
+                        progress.console.print(f"- ERROR in worker for {hostname}: {error}")
+                    elif self._host_result_exported(
+                            enabled, data, host_projects.get(hostname)):
+                        yield hostname, data
                     else:
-                        progress.advance(task1)
-                        if self._host_result_exported(
-                                enabled, data, host_projects.get(hostname)):
-                            host_actions[hostname] = data
-                        else:
-                            disabled_hosts.append(hostname)
-                pool.close()
-                pool.join()
-
-
-                if self.config.get('list_disabled_hosts'):
-                    task2 = progress.add_task("List Disabled Hosts", total=len(disabled_hosts))
-                    self.disabled_hosts = disabled_hosts
-                    for host in disabled_hosts:
-                        progress.advance(task2)
-                        progress.console.print(f"- Disabled-> {host} disabled")
-        return host_actions
+                        disabled_hosts.append(hostname)
+            pool.close()
+            pool.join()
+
+        if self.config.get('list_disabled_hosts'):
+            self.disabled_hosts = disabled_hosts
+            task2 = progress.add_task("List Disabled Hosts", total=len(disabled_hosts))
+            for host in disabled_hosts:
+                progress.advance(task2)
+                progress.console.print(f"- Disabled-> {host} disabled")
 
     def set_status_attribute(self, hostname, is_existing=True):
         """
@@ -902,6 +1038,7 @@ class SyncCMK2(CMK2):
         self.num_created = 0
         self.num_updated = 0
         self.num_deleted = 0
+        self.changed_hosts = set()
 
         self.name=f"Sync Hosts to Account: {self.account_name}"
         self.source="checkmk_host_export"
@@ -912,17 +1049,18 @@ class SyncCMK2(CMK2):
 
         ## Start SYNC of Hosts into CMK
 
-        host_actions = self.calculate_attributes_and_rules()
-
-        total = len(host_actions)
+        # Hosts are synced as their calculation finishes, so the
+        # create/update bulks go out while the workers are still busy.
+        total = 0
         print(f"\n{CC.OKCYAN} -- {CC.ENDC}Start Sync")
         with Progress(SpinnerColumn(),
                       MofNCompleteColumn(),
                       *Progress.get_default_columns(),
                       TimeElapsedColumn()) as progress:
-            task1 = progress.add_task("Handling Checkmk Actions", total=total)
+            task1 = progress.add_task("Handling Checkmk Actions", total=None)
             self.console = progress.console.print
-            for hostname, data in host_actions.items():
+            for hostname, data in self.calculate_attributes_and_rules(progress):
+                total += 1
                 export_details = []
                 progress.console.print(f"* {hostname}")
 
@@ -998,10 +1136,20 @@ class SyncCMK2(CMK2):
             log.log(f"Finished Sync to Checkmk Account: {self.account_name} because LIMIT",
                     source="checkmk_host_export", details=self.log_details)
             print(f"\n{CC.OKCYAN} -- {CC.ENDC}Stop processing in limit mode")
+            self._finish_host_state()
             return
 
         self.handle_clusters()
-        self.cleanup_hosts()
+        if self.calculation_incomplete:
+            # The hosts of the timed out batches are missing from
+            # synced_hosts, the cleanup would delete them from Checkmk.
+            # The host state stays incomplete, so the next run fetches
+            # all hosts again.
+            self.log_error("Calculation of some hosts timed out, "
+                           "skipped the cleanup of hosts in Checkmk")
+        else:
+            self.cleanup_hosts()
+            self._finish_host_state()
 
 
         self.log_details.append(('num_total', str(total)))
@@ -1148,6 +1296,7 @@ class SyncCMK2(CMK2):
             labels (dict): Host labels dictionary
             additional_attributes (dict, optional): Extra host attributes
         """
+        self.changed_hosts.add(hostname)
         body = {
             'host_name' : hostname,
             'folder' : '/' if not folder else folder,
@@ -1192,6 +1341,7 @@ class SyncCMK2(CMK2):
         if not nodes:
             print(f"{CC.OKGREEN} *{CC.ENDC} Cluster {hostname} not created -> No Nodes")
             return
+        self.changed_hosts.add(hostname)
         url = "/domain-types/host_config/collections/clusters"
         body = {
             'host_name' : hostname,
@@ -1250,6 +1400,7 @@ class SyncCMK2(CMK2):
         """
         if sorted(cmk_nodes) != sorted(syncer_nodes):
             print(f"{CC.OKGREEN} *{CC.ENDC} Cluster has new Nodes {syncer_nodes} vs {cmk_nodes}")
+            self.changed_hosts.add(hostname)
             etag = self.get_etag(hostname)
             update_headers = {
                 'if-match': etag
@@ -1339,6 +1490,7 @@ class SyncCMK2(CMK2):
         if current_folder == check_folder:
             return False, True
 
+        self.changed_hosts.add(hostname)
         etag = self.get_etag(hostname, "Move Host")
         update_headers = {'if-match': etag}
         update_url = f"/objects/host_config/{hostname}/actions/move/invoke"
@@ -1526,6 +1678,7 @@ class SyncCMK2(CMK2):
             cmk_host, labels, additional_attributes, remove_attributes)
 
         if update_body:
+            self.changed_hosts.add(hostname)
             self._dispatch_host_update(hostname, update_body, update_reasons, etag)
 
 
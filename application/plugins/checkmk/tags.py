@@ -3,6 +3,7 @@ Checkmk Tag Syncronize
 """
 import ast
 import multiprocessing
+from pymongo import UpdateOne
 from rich.progress import Progress, SpinnerColumn, TimeElapsedColumn, MofNCompleteColumn
 from application import logger, init_db, app
 from application.plugins.checkmk.cmk2 import CMK2
@@ -10,9 +11,48 @@ from application.modules.debug import ColorCodes as CC
 from application.plugins.checkmk.models import CheckmkTagMngmt
 from application.models.host import Host
 from application.helpers.syncer_jinja import render_jinja
+from application.modules.rule.cache import fingerprint
 from application.plugins.checkmk.helpers import cmk_cleanup_tag_id
 
 
+# Set once per pool worker by _init_tag_worker: the tag sync of the run
+# and the groups/expressions of the tag rules, so only host ids have to
+# be sent per task.
+_worker_tag_sync = None  # pylint: disable=invalid-name
+_worker_groups = None  # pylint: disable=invalid-name
+_worker_multiply_expressions = None  # pylint: disable=invalid-name
+
+# Tag caches kept in Host.cache, dropped when the host attributes change
+_TAG_CACHES = ('cmk_tags_multiply_tags', 'cmk_tags_multiply_groups',
+               'cmk_tags_tag_choices')
+
+
+def _init_tag_worker(tag_sync, groups, multiply_expressions):
+    """Pool initializer: own DB connection plus the state of the run"""
+    # pylint: disable=global-statement
+    global _worker_tag_sync, _worker_groups, _worker_multiply_expressions
+    init_db()
+    _worker_tag_sync = tag_sync
+    _worker_groups = groups
+    _worker_multiply_expressions = multiply_expressions
+
+
+def _calculate_tag_batch(host_ids):
+    """
+    Calculate the tag contribution of a batch of hosts in a pool worker.
+    Returns [(host_id, additional_groups, tags, cache_update), ...] in
+    the order of `host_ids`.
+    """
+    db_hosts = {db_host.pk: db_host for db_host
+                in Host.objects(id__in=host_ids).exclude('log', 'raw')}
+    results = []
+    for host_id in host_ids:
+        if db_host := db_hosts.get(host_id):
+            results.append((host_id, *_worker_tag_sync.build_caches(
+                db_host, _worker_groups, _worker_multiply_expressions)))
+    return results
+
+
 class CheckmkTagSync(CMK2):
     """
     Syncronize Checkmk Tags
@@ -22,64 +62,72 @@ class CheckmkTagSync(CMK2):
 
     def build_caches(self, db_host, groups, multiply_expressions):
         """
-        Calculation of rules and Host Tags
+        Calculate the tag contribution of one host.
+
+        Nothing is shared with the other hosts, so hosts can be calculated
+        in any process. Returns (additional_groups, tags, cache_update):
+        the groups multiplied for this host, its tag choices as
+        {group_id: (tag_id, tag_title)} and the update of its tag caches
+        in Host.cache, None if they are current.
         """
         object_attributes = self.get_attributes(db_host, 'checkmk')
+        if not object_attributes:
+            return {}, {}, None
+        cache = dict(db_host.cache)
+        sets = {}
+        unsets = {}
+        # The tag caches are built from the attributes, drop them once
+        # these changed (e.g. because of a rule edit)
+        stamp = fingerprint(object_attributes)
+        if cache.get('cmk_tags_stamp') != stamp:
+            for cache_name in _TAG_CACHES:
+                if cache.pop(cache_name, None) is not None:
+                    unsets[f'cache.{cache_name}'] = 1
+            cache['cmk_tags_stamp'] = stamp
+            sets['cache.cmk_tags_stamp'] = stamp
 
         tags_of_host = {}
         addional_groups = {}
-        do_save = False
         if multiply_expressions:
             cache_name_tags = 'cmk_tags_multiply_tags'
             cache_name_groups = 'cmk_tags_multiply_groups'
-            if cache_name_tags not in db_host.cache or \
-                    cache_name_groups not in db_host.cache:
+            if cache_name_tags not in cache or cache_name_groups not in cache:
                 tags_of_host, addional_groups = \
                             self.check_for_multi_groups(object_attributes,
                                                         groups,
                                                         multiply_expressions)
-                db_host.cache[cache_name_tags] = tags_of_host
-                db_host.cache[cache_name_groups] = addional_groups
-                do_save = True
-
-            tags_of_host = db_host.cache[cache_name_tags]
-            addional_groups = db_host.cache[cache_name_groups]
-            groups.update(addional_groups)
+                cache[cache_name_tags] = tags_of_host
+                cache[cache_name_groups] = addional_groups
+                sets[f'cache.{cache_name_tags}'] = tags_of_host
+                sets[f'cache.{cache_name_groups}'] = addional_groups
 
+            tags_of_host = cache[cache_name_tags]
+            addional_groups = cache[cache_name_groups]
 
         cache_name = 'cmk_tags_tag_choices'
-        if cache_name not in db_host.cache:
+        if cache_name not in cache:
             logger.debug(f" -- Build Tag Cache {cache_name}")
-            hosts_tags = self.get_tags_for_host(db_host, object_attributes,
-                                                      groups, tags_of_host)
-            db_host.cache[cache_name] = hosts_tags
-            do_save = True
-        if do_save:
-            db_host.save()
+            cache[cache_name] = self.get_tags_for_host(
+                db_host, object_attributes, {**groups, **addional_groups}, tags_of_host)
+            sets[f'cache.{cache_name}'] = cache[cache_name]
+
+        update = {}
+        if sets:
+            update['$set'] = sets
+        if unsets := {key: 1 for key in unsets if key not in sets}:
+            update['$unset'] = unsets
+        return addional_groups, cache[cache_name], update or None
 
 
     def calculate_rules(self):
         """
         Calculate needed rules
         """
-        db_objects = CheckmkTagMngmt.objects(enabled=True)
-        total = db_objects.count()
-        with Progress(SpinnerColumn(),
-                      MofNCompleteColumn(),
-                      *Progress.get_default_columns(),
-                      TimeElapsedColumn()) as progress:
-            task1 = progress.add_task("Calculating Needed Rules", total=total)
-            manager = multiprocessing.Manager()
-            base_groups = manager.dict()
-            multiply_expressions = manager.list()
-            with multiprocessing.Pool(initializer=init_db) as pool:
-                for rule in db_objects:
-                    pool.apply_async(self.create_inital_groups,
-                                     args=(rule, base_groups, multiply_expressions),
-                                     callback=lambda x: progress.advance(task1))
-                pool.close()
-                pool.join()
-        return dict(base_groups), list(multiply_expressions)
+        groups = {}
+        multiply_expressions = []
+        for rule in CheckmkTagMngmt.objects(enabled=True):
+            self.create_inital_groups(rule, groups, multiply_expressions)
+        return groups, multiply_expressions
 
 
     def export_tags(self):
@@ -89,50 +137,46 @@ class CheckmkTagSync(CMK2):
         base_groups, multiply_expressions = self.calculate_rules()
 
         object_filter = self.config['settings'].get(self.name, {}).get('filter')
-        db_objects = Host.objects_by_filter(object_filter)
-        total = db_objects.count()
+        host_ids = list(Host.objects_by_filter(object_filter).scalar('id'))
+        batch_size = int(app.config.get('CMK_CALCULATION_BATCH_SIZE', 50))
+        batches = list(self.chunks(host_ids, batch_size))
+
+        groups = dict(base_groups)
+        tags = set()
+        cache_updates = []
         with Progress(SpinnerColumn(),
                       MofNCompleteColumn(),
                       *Progress.get_default_columns(),
                       TimeElapsedColumn()) as progress:
-            manager = multiprocessing.Manager()
-            groups = manager.dict()
-            groups.update(base_groups)
-
-            mlt_expressions = manager.list()
-            mlt_expressions += multiply_expressions
-
-            task1 = progress.add_task("Calculating Caches", total=total)
-            with multiprocessing.Pool(initializer=init_db) as pool:
-                for entry in db_objects:
-                    x = pool.apply_async(self.build_caches,
-                                     args=(entry, groups, mlt_expressions),
-                                     callback=lambda x: progress.advance(task1))
-                    x.get()
+            task1 = progress.add_task("Calculating Hosttags", total=len(host_ids))
+            # The workers calculate every host on its own and return plain
+            # results, merged here in batch order.
+            with multiprocessing.Pool(initializer=_init_tag_worker,
+                                      initargs=(self, base_groups,
+                                                multiply_expressions)) as pool:
+                for batch, results in zip(batches,
+                                          pool.imap(_calculate_tag_batch, batches)):
+                    for host_id, addional_groups, host_tags, update in results:
+                        groups.update(addional_groups)
+                        for group_id, (tag_id, tag_title) in host_tags.items():
+                            tags.add((group_id, tag_id, tag_title))
+                        if update:
+                            cache_updates.append(UpdateOne({'_id': host_id}, update))
+                    progress.advance(task1, len(batch))
                 pool.close()
                 pool.join()
 
-            progress.console.print("Waiting for Calculation to finish")
-            task2 = progress.add_task("Apply Hosttags to objects", total=total)
-            with multiprocessing.Pool(initializer=init_db) as pool:
-                tags = manager.list()
-                for entry in db_objects:
-                    pool.apply_async(self.update_hosts_tags,
-                                     args=(entry, tags),
-                                     callback=lambda x: progress.advance(task2))
-                pool.close()
-                pool.join()
+        if cache_updates:
+            # pylint: disable-next=protected-access
+            Host._get_collection().bulk_write(cache_updates, ordered=False)
 
-            progress.console.print("Waiting for Calculation to finish")
-        groups = dict(groups)
         # Delete Templates
         for group_id, group in list(groups.items()):
             if group.get('is_template'):
                 logger.debug(f"Delete Template {group_id}")
                 del groups[group_id]
 
-        tags = list(set(tags))
-        self.sync_to_checkmk(groups, tags)
+        self.sync_to_checkmk(groups, list(tags))
 
     def update_hosts_multigroups(self, db_host, groups):
         """
@@ -148,25 +192,6 @@ class CheckmkTagSync(CMK2):
             group_data['is_template'] = False
             groups[group_id] = group_data
 
-    def update_hosts_tags(self, db_host, global_tags):
-        """
-        Update the Tags provided by the Host
-        """
-        db_host.reload()
-        cache_name = 'cmk_tags_tag_choices'
-        if cache_name not in db_host.cache:
-            # Not existing Cache normaly can not happen
-            return
-        hosts_tags = db_host.cache[cache_name]
-
-        for group_id, tags in hosts_tags.items():
-            logger.debug(f"Check Group {group_id} with {tags}")
-            tag_id, tag_title = tags
-            tag_tuple = (group_id, tag_id, tag_title)
-            if tag_tuple not in global_tags:
-                logger.debug(f" - Add {tag_tuple}")
-                global_tags.append(tag_tuple)
-
     def create_inital_groups(self, rule, groups, multiply_expressions):
         """
         Create inital group Object
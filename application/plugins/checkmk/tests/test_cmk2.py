@@ -7,6 +7,7 @@ from unittest.mock import Mock, patch, MagicMock
 
 import requests
 
+from application import app
 from application.plugins.checkmk.cmk2 import CmkException, CMK2
 
 
@@ -419,6 +420,26 @@ class TestCMK2FetchHosts(unittest.TestCase):
             {'tag_agent': 'cmk-agent', 'labels': {'a': 'b', 'inherited': 'yes'}},
         )
 
+    @patch('application.plugins.checkmk.cmk2.Progress')
+    def test_fetch_all_checkmk_hosts_streamed(self, mock_progress_cls):
+        mock_progress_cls.return_value.__enter__ = Mock(return_value=MagicMock())
+        mock_progress_cls.return_value.__exit__ = Mock(return_value=False)
+        hosts = [{'id': 'host1', 'extensions': {'folder': '/a', 'unused': 'x'}},
+                 {'id': 'host2', 'extensions': {'folder': '/b'}}]
+
+        with patch.dict(app.config, {'CMK_STREAM_HOSTS': True}), \
+                patch.object(self.cmk, 'request') as mock_request, \
+                patch.object(self.cmk, 'stream_collection',
+                             return_value=iter(hosts)) as mock_stream:
+            self.cmk.fetch_all_checkmk_hosts(extra_params="?effective_attributes=true")
+
+        mock_request.assert_not_called()
+        mock_stream.assert_called_once_with(
+            'domain-types/host_config/collections/all?effective_attributes=true')
+        self.assertEqual(self.cmk.checkmk_hosts['host1']['extensions']['folder'], '/a')
+        self.assertNotIn('unused', self.cmk.checkmk_hosts['host1']['extensions'])
+        self.assertEqual(list(self.cmk.checkmk_hosts), ['host1', 'host2'])
+
     @patch('application.plugins.checkmk.cmk2.multiprocessing')
     @patch('application.plugins.checkmk.cmk2.Progress')
     def test_fetch_checkmk_host_by_folder_collects_plain_results(self, mock_progress_cls, mock_mp):
@@ -449,5 +470,64 @@ class TestCMK2FetchHosts(unittest.TestCase):
         self.assertEqual(mock_pool.apply_async.call_count, 2)
 
 
+class TestCMK2StreamCollection(unittest.TestCase):
+    """Tests for CMK2.stream_collection"""
+
+    def setUp(self):
+        def mock_init(self_param, account=False):
+            self_param.config = {
+                'address': 'https://cmk.example.com',
+                'username': 'automation',
+                'password': 'secret',
+            }
+
+        self.init_patcher = patch.object(CMK2, '__init__', mock_init)
+        self.init_patcher.start()
+        self.cmk = CMK2()
+
+    def tearDown(self):
+        self.init_patcher.stop()
+
+    @staticmethod
+    def _response(status_code, chunks=(), body=None):
+        response = MagicMock()
+        response.status_code = status_code
+        response.iter_content.return_value = iter(chunks)
+        response.json.return_value = body or {}
+        return response
+
+    def test_objects_are_parsed_from_the_chunks(self):
+        response = self._response(200, [b'{"value": [{"id": "a"},', b' {"id": "b"}]}'])
+        with patch.object(self.cmk, 'inner_request', return_value=response) as mock_req:
+            result = list(self.cmk.stream_collection('/domain-types/x/collections/all'))
+
+        self.assertEqual(result, [{'id': 'a'}, {'id': 'b'}])
+        args, kwargs = mock_req.call_args
+        self.assertEqual(args[1], 'https://cmk.example.com/check_mk/api/1.0/'
+                                  'domain-types/x/collections/all')
+        self.assertTrue(kwargs['stream'])
+        self.assertIn('Authorization', kwargs['headers'])
+
+    def test_error_status_raises(self):
+        response = self._response(401, body={'title': 'Unauthorized'})
+        with patch.object(self.cmk, 'inner_request', return_value=response):
+            with self.assertRaises(CmkException) as ctx:
+                list(self.cmk.stream_collection('x'))
+        self.assertIn('401', str(ctx.exception))
+        self.assertIn('Unauthorized', str(ctx.exception))
+
+    def test_truncated_body_raises(self):
+        response = self._response(200, [b'{"value": [{"id": "a"}, {"i'])
+        with patch.object(self.cmk, 'inner_request', return_value=response):
+            with self.assertRaises(CmkException):
+                list(self.cmk.stream_collection('x'))
+
+    def test_timeout_raises_cmk_exception(self):
+        with patch.object(self.cmk, 'inner_request',
+                          side_effect=requests.exceptions.Timeout()):
+            with self.assertRaises(CmkException):
+                list(self.cmk.stream_collection('x'))
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -2,7 +2,7 @@
 Unit tests for checkmk cmk_rules module
 """
 # pylint: disable=missing-function-docstring,protected-access,unused-argument
-# pylint: disable=too-many-lines
+# pylint: disable=too-many-lines,too-many-public-methods
 import unittest
 from unittest.mock import patch, MagicMock
 
@@ -20,11 +20,12 @@ from application.plugins.checkmk.cmk_rules import (
     folder_within_scope,
     cmk_conditions_to_outcome,
     cmk_rule_to_outcome,
+    _rule_key,
     CheckmkRuleSync,
 )
 import application.plugins.checkmk.inits as inits  # noqa: E402  pylint: disable=consider-using-from-import
 from application.plugins.checkmk.helpers import project_allows_account
-from tests import base_mock_init, make_checkmk_rule_sync
+from tests import InProcessPool, base_mock_init, make_checkmk_rule_sync
 
 
 class _FakeMongo:  # pylint: disable=too-few-public-methods
@@ -193,6 +194,56 @@ class TestCheckmkRuleSync(unittest.TestCase):
         h2 = self.sync.build_rule_hash('tpl2', {})
         self.assertNotEqual(h1, h2)
 
+    def test_build_rule_hash_ignores_key_order(self):
+        self.assertEqual(self.sync.build_rule_hash({'a': 1, 'b': 2}),
+                         self.sync.build_rule_hash({'b': 2, 'a': 1}))
+
+    def test_add_rule_drops_duplicates_and_keeps_order(self):
+        self.sync._add_rule('host_groups', {'value': 'g1', 'folder': '/'})
+        self.sync._add_rule('host_groups', {'value': 'g2', 'folder': '/'})
+        self.sync._add_rule('host_groups', {'folder': '/', 'value': 'g1'})
+        self.assertEqual([rule['value'] for rule in
+                          self.sync.rulsets_by_type['host_groups']], ['g1', 'g2'])
+
+    def test_add_rule_sees_a_replaced_ruleset(self):
+        self.sync._add_rule('host_groups', {'value': 'g1'})
+        self.sync.rulsets_by_type['host_groups'] = [{'value': 'g2'}]
+        self.sync._add_rule('host_groups', {'value': 'g2'})
+        self.sync._add_rule('host_groups', {'value': 'g1'})
+        self.assertEqual(self.sync.rulsets_by_type['host_groups'],
+                         [{'value': 'g2'}, {'value': 'g1'}])
+
+    def test_add_rule_compares_like_equality(self):
+        # hash(-1) == hash(-2) in CPython, both rules must stay
+        for rule in ({'value': -1}, {'value': -2}, {'value': (1, 2)},
+                     {'value': [1, 2]}, {'value': [1.0, 2]}):
+            self.sync._add_rule('host_groups', rule)
+        self.assertEqual(self.sync.rulsets_by_type['host_groups'],
+                         [{'value': -1}, {'value': -2}, {'value': (1, 2)},
+                          {'value': [1, 2]}])
+
+    def test_add_rule_indexes_only_new_rules(self):
+        self.sync.rulsets_by_type['host_groups'] = [{'value': 'g1'}, {'value': 'g1'}]
+        self.sync._add_rule('host_groups', {'value': 'g2'})
+        self.sync.rulsets_by_type['host_groups'].append({'value': 'g3'})
+        with patch('application.plugins.checkmk.cmk_rules._rule_key',
+                   wraps=_rule_key) as rule_key:
+            self.sync._add_rule('host_groups', {'value': 'g3'})
+            self.sync._add_rule('host_groups', {'value': 'g1'})
+        # g3 appended elsewhere, then the two new rules
+        self.assertEqual([call.args[0] for call in rule_key.call_args_list
+                          if isinstance(call.args[0], dict)],
+                         [{'value': 'g3'}, {'value': 'g3'}, {'value': 'g1'}])
+        self.assertEqual([rule['value'] for rule in
+                          self.sync.rulsets_by_type['host_groups']],
+                         ['g1', 'g1', 'g2', 'g3'])
+
+    def test_add_rule_with_unhashable_values(self):
+        self.sync._add_rule('host_groups', {'value': bytearray(b'a')})
+        self.sync._add_rule('host_groups', {'value': bytearray(b'a')})
+        self.sync._add_rule('host_groups', {'value': 'g1'})
+        self.assertEqual(len(self.sync.rulsets_by_type['host_groups']), 2)
+
     def test_rule_marker_global(self):
         # Without a project the marker keeps its historical, account-scoped
         # shape so the global export stays backwards compatible.
@@ -1463,5 +1514,78 @@ class TestExportDcdRulesProjectFilter(unittest.TestCase):
             enabled=True, static_rule=True, project__in=[None, '', 'proj_a'])
 
 
+class TestExportCmkRulesPool(unittest.TestCase):
+    """The per-host rule calculation runs in batches in a worker pool."""
+
+    def setUp(self):
+        self.sync = make_checkmk_rule_sync()
+        self.sync.config = {'settings': {}}
+        self.sync.actions = MagicMock()
+        self.hosts = {name: SimpleNamespace(pk=f'id-{name}', hostname=name)
+                      for name in ('h1', 'h2', 'h3')}
+
+    def _objects(self, id__in):
+        query = MagicMock()
+        # MongoDB returns the batch in its own order
+        query.exclude.return_value = [self.hosts[host_id[3:]]
+                                      for host_id in reversed(id__in)]
+        return query
+
+    @staticmethod
+    def _rules_of_host(rule_sync, _host_actions, attributes):
+        rule_sync._add_rule('host_groups', {'value': attributes['all']['HOSTNAME']})
+        rule_sync._add_rule('host_groups', {'value': 'all'})
+
+    def _export(self, rules_of_host, progress=None):
+        host_query = MagicMock()
+        host_query.scalar.return_value = ['id-h1', 'id-h2', 'id-h3']
+        steps = ('calculate_static_rules', 'optimize_rules', '_sort_rulsets_by_intent',
+                 'clean_rules', 'clean_orphaned_rules', 'create_rules', 'sort_rules')
+        with patch('application.plugins.checkmk.cmk_rules.Host') as mock_host, \
+                patch('application.plugins.checkmk.cmk_rules.multiprocessing.Pool',
+                      InProcessPool), \
+                patch('application.plugins.checkmk.cmk_rules.Progress',
+                      progress or _FakeProgress()), \
+                patch('application.plugins.checkmk.cmk_rules.app') as mock_app, \
+                patch.object(CheckmkRuleSync, 'get_attributes',
+                             lambda _self, host, _name: {'all': {'HOSTNAME': host.hostname}}), \
+                patch.object(CheckmkRuleSync, 'calculate_rules_of_host', rules_of_host), \
+                patch.multiple(self.sync, **{step: MagicMock() for step in steps}):
+            mock_app.config = {'CMK_CALCULATION_BATCH_SIZE': 2}
+            mock_host.active_non_template.return_value = host_query
+            mock_host.objects.side_effect = self._objects
+            self.sync.export_cmk_rules()
+
+    def test_batches_are_merged_in_host_order_without_duplicates(self):
+        self.sync._ruleset_item_types = {}
+        self._export(self._rules_of_host)
+
+        self.assertEqual(self.sync.rulsets_by_type['host_groups'], [
+            {'value': 'h1'}, {'value': 'all'}, {'value': 'h2'}, {'value': 'h3'}])
+
+    def test_worker_logs_reach_the_run_log_once(self):
+        def rules_of_host(rule_sync, _host_actions, attributes):
+            hostname = attributes['all']['HOSTNAME']
+            rule_sync.log_error(f"label of {hostname}")
+            condition = {'service_description': ['x']}
+            rule_sync.drop_unsupported_conditions('host_groups', condition, ())
+
+        progress = MagicMock()
+        progress.return_value.__enter__.return_value = progress
+        with patch.object(self.sync, 'request', return_value=({'value': [
+                {'id': 'host_groups', 'extensions': {'item_type': None}}]}, {})) as request:
+            self._export(rules_of_host, progress)
+
+        errors = [message for level, message in self.sync.log_details if level == 'ERROR']
+        # Reported after the first batch, not again for the second
+        self.assertEqual([error[:30] for error in errors], [
+            'label of h1', 'label of h2', "Checkmk ignores the 'service_d", 'label of h3'])
+        # The ruleset list is read once by the parent
+        self.assertEqual(request.call_count, 2)
+        printed = [str(call.args[0]) for call in progress.console.print.call_args_list]
+        self.assertEqual(len(printed), 2)
+        self.assertIn('label of h1', printed[0])
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -4,11 +4,13 @@ Unit tests for checkmk downtimes module
 # pylint: disable=missing-function-docstring,protected-access,unused-argument
 import datetime
 import unittest
-from unittest.mock import patch
+from unittest.mock import MagicMock, Mock, patch
 
+from application import app
+from application.plugins.checkmk import downtimes
 from application.plugins.checkmk.cmk2 import CmkException
 from application.plugins.checkmk.downtimes import CheckmkDowntimeSync
-from tests import base_mock_init
+from tests import InProcessPool, base_mock_init
 
 
 class TestCheckMkDowntimeSync(unittest.TestCase):
@@ -117,13 +119,27 @@ class TestCheckMkDowntimeSync(unittest.TestCase):
         self.assertEqual(self.sync.log_details[0][0], 'error')
         self.assertEqual(self.sync.dt_stats['failed'], 1)
 
-    def test_do_hosts_downtimes_exception_logged(self):
-        with patch.object(self.sync, 'calculate_configured_downtimes',
-                          side_effect=Exception("boom")), \
-             patch('builtins.print'):
-            self.sync.do_hosts_downtimes('host1', {'rule': [{}]}, {'all': {}}, [])
-
-        self.assertEqual(self.sync.log_details[0][0], 'error')
+    def test_host_downtimes_exception_returned(self):
+        db_host = Mock(hostname='host1')
+        self.sync.actions.get_outcomes.return_value = {'rule': [{}]}
+        with patch.object(self.sync, 'get_attributes', return_value={'all': {}}), \
+             patch.object(self.sync, 'calculate_configured_downtimes',
+                          side_effect=Exception("boom")):
+            self.assertEqual(self.sync.host_downtimes(db_host), ('host1', [], 'boom'))
+
+    def test_host_downtimes_of_all_rules(self):
+        db_host = Mock(hostname='host1')
+        self.sync.actions.get_outcomes.return_value = {'rule': [{'a': 1}, {'b': 2}]}
+        with patch.object(self.sync, 'get_attributes', return_value={'all': {}}), \
+             patch.object(self.sync, 'calculate_configured_downtimes',
+                          side_effect=[['dt1'], ['dt2']]):
+            self.assertEqual(self.sync.host_downtimes(db_host),
+                             ('host1', ['dt1', 'dt2'], None))
+
+    def test_host_downtimes_without_attributes(self):
+        with patch.object(self.sync, 'get_attributes', return_value=False):
+            self.assertEqual(self.sync.host_downtimes(Mock(hostname='host1')),
+                             ('host1', [], None))
 
     def test_get_all_cmk_downtimes_groups_by_host_in_one_request(self):
         # Bulk read returns downtimes for several hosts in a single call;
@@ -156,28 +172,90 @@ class TestCheckMkDowntimeSync(unittest.TestCase):
         self.assertEqual(len(by_host['h2']), 1)
         self.assertIsInstance(by_host['h1'][0]['start'], datetime.datetime)
 
-    def test_do_hosts_downtimes_uses_prefetched_and_skips_existing(self):
-        existing = {
-            'comment': 'exists',
-            'start': datetime.datetime(2025, 1, 1, 10, 0, tzinfo=datetime.timezone.utc),
-            'end': datetime.datetime(2025, 1, 1, 12, 0, tzinfo=datetime.timezone.utc),
-            'duration': False,
+    def test_missing_downtimes_skips_existing_and_duplicates(self):
+        existing = _downtime('exists', 1)
+        fresh = _downtime('new', 2)
+        # Checkmk reports no duration as 0, the rules as False
+        current = [dict(existing, duration=0)]
+
+        missing = self.sync.missing_downtimes([existing, fresh, dict(fresh)], current)
+
+        self.assertEqual(missing, [fresh])
+        # the skipped downtime is counted for the final status line
+        self.assertEqual(self.sync.dt_stats['existing'], 1)
+
+    def test_send_downtimes_bulks_hosts_sharing_a_downtime(self):
+        shared = _downtime('patch', 1)
+        single = _downtime('other', 2)
+        pending = {
+            'a': (shared, ['h1', 'h2', 'h3']),
+            'b': (single, ['h4']),
         }
-        fresh = dict(existing, comment='new',
-                     start=datetime.datetime(2025, 2, 1, 10, 0, tzinfo=datetime.timezone.utc),
-                     end=datetime.datetime(2025, 2, 1, 12, 0, tzinfo=datetime.timezone.utc))
+        with patch.dict(app.config, {'CMK_DOWNTIME_BULK_HOSTS': 2,
+                                     'CMK_DOWNTIME_REQUEST_WORKERS': 4}), \
+             patch.object(self.sync, 'request', return_value=({}, {})) as mock_req, \
+             patch('builtins.print'):
+            self.sync.send_downtimes(pending)
+
+        bodies = [call.kwargs['data'] for call in mock_req.call_args_list]
+        self.assertEqual(len(bodies), 3)
+        by_query = [body for body in bodies if body['downtime_type'] == 'host_by_query']
+        self.assertEqual(len(by_query), 1)
+        self.assertEqual([expr['right'] for expr in by_query[0]['query']['expr']],
+                         ['h1', 'h2'])
+        self.assertEqual(sorted(body['host_name'] for body in bodies
+                                if body['downtime_type'] == 'host'), ['h3', 'h4'])
+        self.assertEqual(self.sync.dt_stats['created'], 4)
+
+    def test_send_downtimes_counts_failed_hosts(self):
+        pending = {'a': (_downtime('patch', 1), ['h1', 'h2'])}
+        with patch.object(self.sync, 'request', side_effect=CmkException("fail")), \
+             patch('builtins.print'):
+            self.sync.send_downtimes(pending)
+        self.assertEqual(self.sync.dt_stats['failed'], 2)
+        self.assertEqual(self.sync.log_details[0][0], 'error')
 
-        with patch.object(self.sync, 'calculate_configured_downtimes',
-                          return_value=[existing, fresh]), \
-             patch.object(self.sync, 'set_downtime') as mock_set, \
+    def test_run_calculates_in_workers_and_sends_once(self):
+        shared = _downtime('patch', 1)
+        present = _downtime('present', 2)
+        results = {
+            'id1': ('h1', [shared, present], None),
+            'id2': ('h2', [shared], None),
+            'id3': ('h3', [], 'broken rule'),
+        }
+        mock_host = Mock()
+        mock_host.objects_by_filter.return_value.scalar.return_value = ['id1', 'id2', 'id3']
+        mock_host.objects.side_effect = lambda id__in: Mock(
+            exclude=lambda *fields: [Mock(pk=host_id) for host_id in id__in])
+
+        def host_downtimes(db_host):
+            return results[db_host.pk]
+
+        with patch.object(downtimes, 'Host', mock_host), \
+             patch.object(downtimes, 'Progress', MagicMock()), \
+             patch.object(downtimes, 'init_db'), \
+             patch.object(downtimes.multiprocessing, 'Pool', InProcessPool), \
+             patch.object(self.sync, 'get_all_cmk_downtimes',
+                          return_value={'h1': [present]}), \
+             patch.object(self.sync, 'host_downtimes', side_effect=host_downtimes), \
+             patch.object(self.sync, 'send_downtimes') as mock_send, \
              patch('builtins.print'):
-            # only the downtime that is not already present gets created
-            self.sync.do_hosts_downtimes('h1', {'rule': [{}]}, {'all': {}},
-                                         [existing])
+            self.sync.run()
 
-        mock_set.assert_called_once_with('h1', fresh)
-        # the skipped downtime is counted for the final status line
+        mock_send.assert_called_once()
+        self.assertEqual(list(mock_send.call_args.args[0].values()),
+                         [(shared, ['h1', 'h2'])])
         self.assertEqual(self.sync.dt_stats['existing'], 1)
+        self.assertIn(('error', 'Exception broken rule'), self.sync.log_details)
+
+
+def _downtime(comment, day):
+    return {
+        'comment': comment,
+        'start': datetime.datetime(2025, 1, day, 10, 0, tzinfo=datetime.timezone.utc),
+        'end': datetime.datetime(2025, 1, day, 12, 0, tzinfo=datetime.timezone.utc),
+        'duration': False,
+    }
 
 
 if __name__ == '__main__':
@@ -6,10 +6,15 @@ import unittest
 from unittest.mock import Mock, patch
 
 from mongoengine.errors import DoesNotExist
+from application import app
 from application.plugins.checkmk.groups import CheckmkGroupSync
 from tests import base_mock_init
 
 
+def _group_rule(foreach_type, foreach):
+    return Mock(outcome=Mock(foreach_type=foreach_type, foreach=foreach))
+
+
 class TestCheckmkGroupSync(unittest.TestCase):
     """Tests for CheckmkGroupSync"""
 
@@ -45,7 +50,7 @@ class TestCheckmkGroupSync(unittest.TestCase):
         self.assertEqual(result.account, 'account_ref')
 
     def test_add_group_entries_basic(self):
-        groups = {'contact_groups': []}
+        groups = {'contact_groups': {}}
         outcome = Mock()
         outcome.rewrite = None
         outcome.rewrite_title = None
@@ -69,7 +74,7 @@ class TestCheckmkGroupSync(unittest.TestCase):
     def test_add_group_entries_with_rewrite(self, mock_render):
         mock_render.side_effect = lambda tpl, **kw: f"rewritten_{kw['name']}"
 
-        groups = {'host_groups': []}
+        groups = {'host_groups': {}}
         outcome = Mock()
         outcome.rewrite = 'tpl_name'
         outcome.rewrite_title = 'tpl_title'
@@ -86,12 +91,12 @@ class TestCheckmkGroupSync(unittest.TestCase):
         )
 
         self.assertEqual(len(groups['host_groups']), 1)
-        title, name = groups['host_groups'][0]
+        title, name = list(groups['host_groups'])[0]
         self.assertEqual(name, 'rewritten_item1')
         self.assertEqual(title, 'rewritten_item1')
 
     def test_add_group_entries_no_duplicates(self):
-        groups = {'contact_groups': [('g1', 'g1')]}
+        groups = {'contact_groups': {('g1', 'g1'): None}}
         outcome = Mock()
 
         self.sync._add_group_entries(
@@ -108,7 +113,7 @@ class TestCheckmkGroupSync(unittest.TestCase):
         self.assertEqual(len(groups['contact_groups']), 1)
 
     def test_add_group_entries_empty_name_skipped(self):
-        groups = {'contact_groups': []}
+        groups = {'contact_groups': {}}
         outcome = Mock()
 
         self.sync._add_group_entries(
@@ -182,6 +187,93 @@ class TestCheckmkGroupSync(unittest.TestCase):
             ['host', 'shadow_host'])
         mock_host.get_export_hosts.assert_not_called()
 
+    @patch('application.plugins.checkmk.groups.Host')
+    def test_parse_attributes_keeps_first_seen_order(self, mock_host):
+        mock_host.get_export_hosts.return_value = [Mock(), Mock()]
+
+        with patch.object(self.sync, 'get_attributes') as mock_get:
+            mock_get.side_effect = [
+                {'all': {'os': 'linux', 'env': 'prod'}},
+                {'all': {'os': 'windows', 'env': 'prod', 'tier': 1}},
+            ]
+            keys, values = self.sync.parse_attributes()
+
+        self.assertEqual(keys, {'os': ['linux', 'windows'], 'env': ['prod'],
+                                'tier': ['1']})
+        self.assertEqual(values, {'linux': ['os'], 'windows': ['os'],
+                                  'prod': ['env'], '1': ['tier']})
+
+    @patch('application.plugins.checkmk.groups.CheckmkGroupRule')
+    @patch('application.plugins.checkmk.groups.Host')
+    def test_parse_attributes_distinct_query(self, mock_host, mock_rule):
+        """With CMK_GROUPS_DISTINCT_QUERY MongoDB returns the pairs."""
+        mock_rule.objects.return_value.only.return_value = [
+            _group_rule('label', 'os'), _group_rule('label', 'cpus'),
+            _group_rule('label', 'empty')]
+        mock_host.get_export_hosts.return_value.aggregate.return_value = [
+            {'_id': {'k': 'os', 'v': 'linux'}},
+            {'_id': {'k': 'os', 'v': 'windows'}},
+            {'_id': {'k': 'cpus', 'v': 4}},
+            {'_id': {'k': 'empty'}},
+        ]
+
+        with patch.dict(app.config, {'CMK_GROUPS_DISTINCT_QUERY': True}), \
+                patch.object(self.sync, 'get_attributes') as mock_get:
+            keys, values = self.sync.parse_attributes()
+
+        mock_get.assert_not_called()
+        pipeline = mock_host.get_export_hosts.return_value.aggregate.call_args
+        self.assertEqual(pipeline.kwargs, {'allowDiskUse': True})
+        self.assertEqual(keys, {'os': ['linux', 'windows'], 'cpus': ['4'],
+                                'empty': ['None']})
+        self.assertEqual(values['4'], ['cpus'])
+
+    @patch('application.plugins.checkmk.groups.CheckmkGroupRule')
+    @patch('application.plugins.checkmk.groups.Host')
+    def test_distinct_query_keeps_only_rule_pairs(self, mock_host, mock_rule):
+        """Only the pairs the group rules read are grouped by MongoDB."""
+        mock_rule.objects.return_value.only.return_value = [
+            _group_rule('label', 'os'), _group_rule('value', 'prod'),
+            _group_rule('label', 'team_*'), _group_rule('object', '')]
+        aggregate = mock_host.get_export_hosts.return_value.aggregate
+        aggregate.return_value = []
+
+        self.sync.distinct_attributes()
+
+        mock_rule.objects.assert_called_once_with(enabled=True)
+        pipeline = aggregate.call_args.args[0]
+        pair_filter = pipeline[0]['$project']['pairs']['$filter']
+        conditions = pair_filter['cond']['$or']
+        self.assertIn({'$eq': [{'$indexOfCP': ['$$pair.k', 'team_']}, 0]}, conditions)
+        self.assertIn({'$in': ['$$pair.k', ['os']]}, conditions)
+        self.assertEqual(conditions[-1]['$in'][1], ['prod'])
+        self.assertEqual(pipeline[1], {'$match': {'pairs.0': {'$exists': True}}})
+        self.assertEqual(pipeline[2], {'$unwind': '$pairs'})
+
+    @patch('application.plugins.checkmk.groups.CheckmkGroupRule')
+    @patch('application.plugins.checkmk.groups.Host')
+    def test_distinct_query_without_attribute_rules(self, mock_host, mock_rule):
+        """Object rules need no host attributes, nothing is aggregated."""
+        mock_rule.objects.return_value.only.return_value = [_group_rule('object', '')]
+
+        self.assertEqual(self.sync.distinct_attributes(), ({}, {}))
+        mock_host.get_export_hosts.return_value.aggregate.assert_not_called()
+
+    def test_add_group_entries_keeps_order(self):
+        groups = {'host_groups': {}}
+        self.sync._add_group_entries(
+            items=['b', 'a', 'b', 'c'],
+            rewrite_name=False,
+            rewrite_title=False,
+            outcome=Mock(),
+            group_type='host_groups',
+            groups=groups,
+            str_replace=lambda x, _y: x,
+            replace_exceptions=[],
+        )
+        self.assertEqual(list(groups['host_groups']),
+                         [('b', 'b'), ('a', 'a'), ('c', 'c')])
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2)
@@ -0,0 +1,96 @@
+"""
+Unit tests for the persistent Checkmk host state
+"""
+# pylint: disable=missing-function-docstring,protected-access
+import datetime
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+from mongoengine.errors import DoesNotExist
+from pymongo import DeleteOne, ReplaceOne
+
+from application.plugins.checkmk import host_state
+from application.plugins.checkmk.host_state import HostStateCache
+
+
+class TestHostStateCache(unittest.TestCase):
+    """Tests for HostStateCache"""
+
+    def setUp(self):
+        self.meta = MagicMock()
+        self.meta.content = {}
+        patches = (
+            patch.object(host_state, 'CheckmkObjectCache'),
+            patch.object(host_state, 'CheckmkHostState'),
+            patch.dict(host_state.app.config, {'CMK_HOST_STATE_MAX_AGE': 3600}),
+        )
+        self.cache_model, self.state_model, _ = [item.start() for item in patches]
+        for item in patches:
+            self.addCleanup(item.stop)
+        self.cache_model.objects.get.return_value = self.meta
+        self.collection = self.state_model._get_collection.return_value
+        self.state = HostStateCache('account_ref')
+
+    def test_full_fetch_reason(self):
+        self.assertEqual(self.state.full_fetch_reason(), "no snapshot yet")
+        self.meta.content = {'full_fetch': datetime.datetime.now(), 'complete': False}
+        self.assertEqual(self.state.full_fetch_reason(), "last export did not finish")
+        self.meta.content['complete'] = True
+        self.assertIsNone(self.state.full_fetch_reason())
+        self.meta.content['full_fetch'] -= datetime.timedelta(hours=2)
+        self.assertEqual(self.state.full_fetch_reason(), "snapshot expired")
+
+    def test_missing_meta_is_created(self):
+        self.cache_model.objects.get.side_effect = DoesNotExist
+        self.assertEqual(self.state.full_fetch_reason(), "no snapshot yet")
+        self.assertEqual(self.state.meta.cache_group, 'host_state')
+
+    def test_load(self):
+        objects = self.state_model.objects.return_value.as_pymongo.return_value
+        objects.only.return_value = [
+            {'hostname': 'host1', 'folder': '/a',
+             'data': json.dumps({'extensions': {'attributes': {'a.b': 1}}}), 'dirty': True},
+        ]
+        self.assertEqual(self.state.load(), {
+            'host1': ('/a', {'extensions': {'attributes': {'a.b': 1}}}, True)})
+        self.state_model.objects.assert_called_once_with(account='account_ref')
+
+    def test_full_store_replaces_the_snapshot(self):
+        data = {'extensions': {'folder': '/a'}}
+        self.state.store({'host1': data}, full=True)
+
+        self.collection.delete_many.assert_called_once_with({'account': 'account_ref'})
+        operations = self.collection.bulk_write.call_args.args[0]
+        self.assertEqual(operations, [ReplaceOne(
+            {'account': 'account_ref', 'hostname': 'host1'},
+            {'account': 'account_ref', 'hostname': 'host1', 'folder': '/a',
+             'data': json.dumps(data), 'dirty': False},
+            upsert=True)])
+        self.assertIn('full_fetch', self.meta.content)
+        self.meta.save.assert_called_once()
+
+    def test_partial_store_keeps_the_other_hosts(self):
+        self.state.store({'host1': {}})
+        self.collection.delete_many.assert_not_called()
+        self.meta.save.assert_not_called()
+
+    def test_remove(self):
+        self.state.remove([])
+        self.collection.bulk_write.assert_not_called()
+        self.state.remove(['host1'])
+        self.collection.bulk_write.assert_called_once_with(
+            [DeleteOne({'account': 'account_ref', 'hostname': 'host1'})], ordered=False)
+
+    def test_export_bookkeeping(self):
+        self.state.begin_export()
+        self.assertFalse(self.meta.content['complete'])
+        self.state.finish_export({'host1'})
+        self.state_model.objects.assert_called_once_with(
+            account='account_ref', hostname__in=['host1'])
+        self.state_model.objects.return_value.update.assert_called_once_with(set__dirty=True)
+        self.assertTrue(self.meta.content['complete'])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
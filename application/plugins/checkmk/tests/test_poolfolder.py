@@ -114,12 +114,13 @@ class TestRemoveSeat(unittest.TestCase):
 class TestResetFolderPool(unittest.TestCase):
     """Tests for reset_folderpool (single pool)"""
 
+    @patch('application.plugins.checkmk.inits.get_cache_store')
     @patch('application.plugins.checkmk.inits.Host')
-    def test_clears_own_hosts_counter_and_cache(self, mock_host):
+    def test_clears_own_hosts_counter_and_cache(self, mock_host, mock_store):
         folder = Mock()
         folder.folder_name = '/pool1'
         folder.folder_seats_taken = 7
-        mock_host.objects.return_value.count.return_value = 3
+        mock_host.objects.return_value.scalar.return_value = [f"id{n}" for n in range(3)]
 
         self.assertEqual(reset_folderpool(folder), 3)
 
@@ -127,7 +128,9 @@ class TestResetFolderPool(unittest.TestCase):
         # lock — the cached outcome carries the old folder otherwise.
         mock_host.objects.assert_called_once_with(folder='/pool1')
         mock_host.objects.return_value.update.assert_called_once_with(
-            unset__folder=1, set__cache={})
+            set__cache={}, unset__folder=1)
+        mock_store.return_value.clear_hosts.assert_called_once_with(
+            [f"id{n}" for n in range(3)])
         self.assertEqual(folder.folder_seats_taken, 0)
         folder.save.assert_called_once()
 
@@ -151,7 +154,7 @@ class TestResetFolderPools(unittest.TestCase):
         # Hosts locked to a folder whose pool is gone are released too.
         mock_host.objects.assert_any_call(folder__ne=None)
         mock_host.objects.return_value.update.assert_called_once_with(
-            unset__folder=1, set__cache={})
+            set__cache={}, unset__folder=1)
 
 
 if __name__ == '__main__':
@@ -6,6 +6,8 @@ import unittest
 from unittest.mock import Mock, patch
 
 from mongoengine.errors import DoesNotExist
+from application.modules.rule.cache import CollectionCacheStore
+from application.modules.rule.rule import Rule
 from application.plugins.checkmk.rules import CheckmkRule
 from application.plugins.checkmk.inits import (
     reset_sitepool,
@@ -177,12 +179,13 @@ class TestPoolStickyNotes(unittest.TestCase):
 class TestResetSitePool(unittest.TestCase):
     """Tests for reset_sitepool (single pool)"""
 
+    @patch('application.plugins.checkmk.inits.get_cache_store')
     @patch('application.plugins.checkmk.inits.Host')
-    def test_clears_own_hosts_counters_and_cache(self, mock_host):
+    def test_clears_own_hosts_counters_and_cache(self, mock_host, mock_store):
         pool = Mock()
         pool.name = 'berlin'
         pool.member_sites = [_member('berlin_1', 5), _member('berlin_2', 3)]
-        mock_host.objects.return_value.count.return_value = 8
+        mock_host.objects.return_value.scalar.return_value = [f"id{n}" for n in range(8)]
 
         self.assertEqual(reset_sitepool(pool), 8)
 
@@ -191,12 +194,45 @@ class TestResetSitePool(unittest.TestCase):
         mock_host.objects.assert_called_once_with(
             pool_site__in=['berlin_1', 'berlin_2'])
         mock_host.objects.return_value.update.assert_called_once_with(
-            unset__pool_site=1, set__cache={})
+            set__cache={}, unset__pool_site=1)
+        mock_store.return_value.clear_hosts.assert_called_once_with(
+            [f"id{n}" for n in range(8)])
         for member in pool.member_sites:
             self.assertEqual(member.hosts_taken, 0)
         pool.save.assert_called_once()
 
 
+class TestResetSitePoolCache(unittest.TestCase):
+    """A reset drops the cached outcome, whose stamp does not cover the site"""
+
+    def test_outcomes_are_calculated_again_after_a_reset(self):
+        collection = Mock()
+        collection.find.return_value = []
+        store = CollectionCacheStore()
+        engine = Rule()
+        engine.check_rule_match = Mock(side_effect=[
+            {'custom_attributes': {'site': 'berlin_1'}},
+            {'custom_attributes': {'site': 'berlin_2'}},
+        ])
+        db_host = Mock(pk='id1', hostname='srv1')
+        pool = Mock(member_sites=[_member('berlin_1', 1)])
+        with patch.object(CollectionCacheStore, '_collection', return_value=collection), \
+                patch('application.modules.rule.rule.get_cache_store', return_value=store), \
+                patch('application.modules.rule.rule.rule_versions', return_value={}), \
+                patch('application.plugins.checkmk.inits.get_cache_store',
+                      return_value=store), \
+                patch('application.plugins.checkmk.inits.Host') as mock_host:
+            mock_host.objects.return_value.scalar.return_value = ['id1']
+            engine.get_outcomes(db_host, {})
+            self.assertEqual(engine.get_outcomes(db_host, {}),
+                             {'custom_attributes': {'site': 'berlin_1'}})
+            reset_sitepool(pool)
+            self.assertEqual(engine.get_outcomes(db_host, {}),
+                             {'custom_attributes': {'site': 'berlin_2'}})
+            store._pending = {}
+        collection.delete_many.assert_called_once_with({'host_id': {'$in': ['id1']}})
+
+
 class TestResetSitePools(unittest.TestCase):
     """Tests for reset_sitepools (all pools)"""
 
@@ -216,7 +252,7 @@ class TestResetSitePools(unittest.TestCase):
         # Hosts on a site no pool lists anymore are released too.
         mock_host.objects.assert_any_call(pool_site__ne=None)
         mock_host.objects.return_value.update.assert_called_once_with(
-            unset__pool_site=1, set__cache={})
+            set__cache={}, unset__pool_site=1)
 
 
 if __name__ == '__main__':
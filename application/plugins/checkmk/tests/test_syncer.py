@@ -6,6 +6,7 @@ Unit tests for the SyncCMK2 class
 import unittest
 from unittest.mock import Mock, patch, call
 
+from application.plugins.checkmk import syncer as syncer_module
 from application.plugins.checkmk.syncer import SyncCMK2, merge_folder_attributes
 from application.plugins.checkmk.cmk2 import CmkException
 
@@ -156,6 +157,123 @@ class TestSyncCMK2(unittest.TestCase):
             mock_fetch_all.assert_called_once_with(
                 extra_params='?effective_attributes=false&include_links=false')
 
+    def _host_state(self, known, reason=None):
+        state = Mock()
+        state.full_fetch_reason.return_value = reason
+        state.load.return_value = known
+        return state
+
+    @patch('application.plugins.checkmk.syncer.app')
+    def test_fetch_checkmk_hosts_host_state_full_fetch(self, mock_app):
+        """Without a usable snapshot all hosts are fetched and stored"""
+        mock_app.config = {**self.mock_app_config, 'CMK_HOST_STATE_CACHE': True}
+        self.syncer.config = {'ref': 'account_ref'}
+        state = self._host_state({}, reason="no snapshot yet")
+
+        def fetch_all(extra_params):
+            self.syncer.checkmk_hosts['host1'] = {'extensions': {'folder': '/'}}
+
+        with patch('application.plugins.checkmk.host_state.HostStateCache',
+                   return_value=state), \
+                patch.object(self.syncer, 'fetch_all_checkmk_hosts',
+                             side_effect=fetch_all), \
+                patch.object(self.syncer, 'fetch_folder_members') as mock_members:
+            self.syncer.fetch_checkmk_hosts()
+
+        mock_members.assert_not_called()
+        state.store.assert_called_once_with(
+            {'host1': {'extensions': {'folder': '/'}}}, full=True)
+        state.begin_export.assert_called_once()
+
+    @patch('application.plugins.checkmk.syncer.app')
+    def test_fetch_checkmk_hosts_host_state_delta(self, mock_app):
+        """Only new, moved and dirty hosts are fetched again"""
+        mock_app.config = {**self.mock_app_config, 'CMK_HOST_STATE_CACHE': True}
+        self.syncer.config = {'ref': 'account_ref'}
+        state = self._host_state({
+            'same': ('/a', {'extensions': {'folder': '/a', 'v': 'old'}}, False),
+            'dirty': ('/a', {'extensions': {'folder': '/a'}}, True),
+            'moved': ('/a', {'extensions': {'folder': '/a'}}, False),
+            'gone': ('/a', {'extensions': {'folder': '/a'}}, False),
+        })
+        members = {'same': '/a', 'dirty': '/a', 'moved': '/b', 'new': '/a'}
+
+        def request(url, method):
+            hostname = url.split('/')[2].split('?')[0]
+            return ({'id': hostname, 'extensions': {'folder': members[hostname]}},
+                    {'ETag': f'"{hostname}"'})
+
+        with patch('application.plugins.checkmk.host_state.HostStateCache',
+                   return_value=state), \
+                patch.object(self.syncer, 'fetch_folder_members', return_value=members), \
+                patch.object(self.syncer, 'request', side_effect=request) as mock_request, \
+                patch.object(self.syncer, 'fetch_all_checkmk_hosts') as mock_fetch_all:
+            self.syncer.fetch_checkmk_hosts()
+
+        mock_fetch_all.assert_not_called()
+        self.assertEqual(mock_request.call_count, 3)
+        self.assertEqual(sorted(self.syncer.checkmk_hosts), ['dirty', 'moved', 'new', 'same'])
+        self.assertEqual(self.syncer.checkmk_hosts['same']['extensions']['v'], 'old')
+        self.assertEqual(self.syncer.checkmk_hosts['moved']['extensions']['folder'], '/b')
+        state.store.assert_called_once()
+        self.assertEqual(sorted(state.store.call_args.args[0]), ['dirty', 'moved', 'new'])
+        state.remove.assert_called_once_with(['gone'])
+
+    @patch('application.plugins.checkmk.syncer.app')
+    def test_fetch_checkmk_hosts_host_state_too_many_changes(self, mock_app):
+        """A large delta falls back to the full fetch"""
+        mock_app.config = {**self.mock_app_config, 'CMK_HOST_STATE_CACHE': True,
+                           'CMK_HOST_STATE_MAX_DELTA': 1}
+        self.syncer.config = {'ref': 'account_ref'}
+        state = self._host_state({})
+
+        with patch('application.plugins.checkmk.host_state.HostStateCache',
+                   return_value=state), \
+                patch.object(self.syncer, 'fetch_folder_members',
+                             return_value={'a': '/', 'b': '/'}), \
+                patch.object(self.syncer, 'request') as mock_request, \
+                patch.object(self.syncer, 'fetch_all_checkmk_hosts') as mock_fetch_all:
+            self.syncer.fetch_checkmk_hosts()
+
+        mock_request.assert_not_called()
+        mock_fetch_all.assert_called_once()
+        self.assertTrue(state.store.call_args.kwargs['full'])
+
+    @patch('application.plugins.checkmk.syncer.app')
+    def test_fetch_checkmk_hosts_host_state_forced(self, mock_app):
+        """--full-fetch ignores a valid snapshot"""
+        mock_app.config = {**self.mock_app_config, 'CMK_HOST_STATE_CACHE': True}
+        self.syncer.config = {'ref': 'account_ref'}
+        self.syncer.full_host_fetch = True
+        state = self._host_state({})
+
+        with patch('application.plugins.checkmk.host_state.HostStateCache',
+                   return_value=state), \
+                patch.object(self.syncer, 'fetch_folder_members') as mock_members, \
+                patch.object(self.syncer, 'fetch_all_checkmk_hosts') as mock_fetch_all:
+            self.syncer.fetch_checkmk_hosts()
+
+        mock_members.assert_not_called()
+        mock_fetch_all.assert_called_once()
+
+    def test_fetch_folder_members(self):
+        folders = {'value': [
+            {'extensions': {'path': '/'}, 'members': {'hosts': {'value': [
+                {'title': 'host1', 'href': 'x/objects/host_config/host1'}]}}},
+            {'extensions': {'path': '/linux'}, 'members': {'hosts': {'value': [
+                {'href': 'x/objects/host_config/host2'}]}}},
+            {'extensions': {'path': '/empty'}},
+        ]}
+        with patch.object(self.syncer, 'request', return_value=(folders, {})):
+            self.assertEqual(self.syncer.fetch_folder_members(),
+                             {'host1': '/', 'host2': '/linux'})
+
+    def test_written_hosts_are_marked_in_the_host_state(self):
+        self.syncer.host_state = Mock()
+        self.syncer.changed_hosts = {'host1'}
+        self.syncer._finish_host_state()
+        self.syncer.host_state.finish_export.assert_called_once_with({'host1'})
+
     def test_use_host_limit_by_hostnames(self):
         """Test use_host with hostname limits"""
         self.syncer.config = {'limit_by_hostnames': 'host1, host2, host3'}
@@ -713,45 +831,95 @@ class TestSyncCMK2(unittest.TestCase):
             # Should not make any API calls since no changes
             mock_request.assert_not_called()
 
-    @patch('application.plugins.checkmk.syncer.multiprocessing')
-    @patch('application.plugins.checkmk.syncer.Host')
-    @patch('application.plugins.checkmk.syncer.Progress')
-    def test_calculate_attributes_and_rules(self, mock_progress, mock_host, mock_mp):
-        """Test calculate_attributes_and_rules method"""
-        # Mock database query with proper queryset behavior
+    def _calculation_setup(self, mock_host, mock_mp, hostnames):
+        """Host query with `hostnames`, a pool whose results the test sets"""
+        db_hosts = [Mock(pk=f'id-{name}', hostname=name, project=None)
+                    for name in hostnames]
         mock_db_objects = Mock()
-        mock_db_objects.count.return_value = 2
-        mock_db_objects.__iter__ = Mock(
-            return_value=iter([Mock(hostname='host1'), Mock(hostname='host2')]))
+        mock_db_objects.only.return_value = mock_db_objects
+        mock_db_objects.count.return_value = len(db_hosts)
+        mock_db_objects.__iter__ = Mock(return_value=iter(db_hosts))
         mock_host.objects_by_filter.return_value = mock_db_objects
-
+        mock_mp.TimeoutError = TimeoutError
         mock_pool = Mock()
         mock_mp.Pool.return_value.__enter__.return_value = mock_pool
-        mock_progress_ctx = mock_progress.return_value.__enter__.return_value
-        mock_progress_ctx.add_task.side_effect = ['task1', 'task2']
-
-        task_host1 = Mock()
-        task_host1.get.return_value = (
-            'host1',
-            True,
-            ({'action1': 'value1'}, {'all': {}, 'filtered': {}}),
-        )
-        task_host2 = Mock()
-        task_host2.get.return_value = ('host2', False, None)
-        mock_pool.apply_async.side_effect = [task_host1, task_host2]
+        self.syncer.config = {'settings': {}, 'list_disabled_hosts': True}
+        self.mock_app_config['CMK_CALCULATION_BATCH_SIZE'] = 2
+        return mock_pool
+
+    @patch('application.plugins.checkmk.syncer.app')
+    @patch('application.plugins.checkmk.syncer.multiprocessing')
+    @patch('application.plugins.checkmk.syncer.Host')
+    def test_calculate_attributes_and_rules(self, mock_host, mock_mp, mock_app):
+        """Hosts go to the workers as id batches, results stream back"""
+        mock_app.config = self.mock_app_config
+        mock_pool = self._calculation_setup(mock_host, mock_mp,
+                                            ['host1', 'host2', 'host3'])
+        mock_pool.imap_unordered.return_value.next.side_effect = [
+            (1, [('host3', True, ({'a': 3}, {'all': {}, 'filtered': {}}), None)]),
+            (0, [('host1', True, ({'a': 1}, {'all': {}, 'filtered': {}}), None),
+                 ('host2', False, None, None)]),
+        ]
 
-        # Mock use_host to return True
         with patch.object(self.syncer, 'use_host', return_value=True):
-            self.syncer.config = {'settings': {}, 'list_disabled_hosts': True}
+            result = list(self.syncer.calculate_attributes_and_rules(Mock()))
+
+        self.assertEqual(result, [
+            ('host3', ({'a': 3}, {'all': {}, 'filtered': {}})),
+            ('host1', ({'a': 1}, {'all': {}, 'filtered': {}})),
+        ])
+        self.assertEqual(self.syncer.disabled_hosts, ['host2'])
+        function, batches = mock_pool.imap_unordered.call_args.args
+        self.assertIs(function, syncer_module._calculate_host_batch)
+        self.assertEqual(batches, [(0, ['id-host1', 'id-host2']), (1, ['id-host3'])])
+        mock_mp.Pool.assert_called_once_with(
+            initializer=syncer_module._init_calculation_worker,
+            initargs=(self.syncer,))
 
-            result = self.syncer.calculate_attributes_and_rules()
+    @patch('application.plugins.checkmk.syncer.app')
+    @patch('application.plugins.checkmk.syncer.multiprocessing')
+    @patch('application.plugins.checkmk.syncer.Host')
+    def test_calculation_timeout_reports_missing_hosts(self, mock_host, mock_mp,
+                                                       mock_app):
+        """A hanging batch stops the wait and names every host not calculated"""
+        mock_app.config = self.mock_app_config
+        mock_pool = self._calculation_setup(mock_host, mock_mp,
+                                            ['host1', 'host2', 'host3'])
+        mock_pool.imap_unordered.return_value.next.side_effect = [
+            (1, [('host3', True, ({}, {'all': {}, 'filtered': {}}), None)]),
+            TimeoutError(),
+        ]
+        progress = Mock()
 
-            self.assertEqual(
-                result,
-                {'host1': ({'action1': 'value1'}, {'all': {}, 'filtered': {}})},
-            )
-            self.assertEqual(self.syncer.disabled_hosts, ['host2'])
-            self.assertEqual(mock_pool.apply_async.call_count, 2)
+        with patch.object(self.syncer, 'use_host', return_value=True):
+            result = list(self.syncer.calculate_attributes_and_rules(progress))
+
+        self.assertEqual([hostname for hostname, _data in result], ['host3'])
+        mock_pool.terminate.assert_called_once()
+        printed = [c.args[0] for c in progress.console.print.call_args_list]
+        self.assertIn("- ERROR: Timeout for host1", printed)
+        self.assertIn("- ERROR: Timeout for host2", printed)
+        self.assertTrue(self.syncer.calculation_incomplete)
+
+    @patch('application.plugins.checkmk.syncer.Host')
+    def test_calculate_host_batch_reports_failing_hosts(self, mock_host):
+        """One broken host does not cost the other hosts of its batch"""
+        good, bad = Mock(hostname='good'), Mock(hostname='bad')
+        mock_host.objects.return_value.exclude.return_value = [bad, good]
+        self.syncer.debug = False
+
+        def calculate(db_host):
+            if db_host is bad:
+                raise KeyError('x')
+            return db_host.hostname, True, ({}, {})
+
+        with patch.object(self.syncer, 'calculate_host_actions', side_effect=calculate), \
+                patch.object(syncer_module, '_worker_syncer', self.syncer):
+            result = syncer_module._calculate_host_batch((4, ['id1', 'id2']))
+
+        mock_host.objects.assert_called_once_with(id__in=['id1', 'id2'])
+        self.assertEqual(result, (4, [('bad', False, None, "KeyError: 'x'"),
+                                      ('good', True, ({}, {}), None)]))
 
     @patch('application.plugins.checkmk.syncer.Progress')
     @patch('application.plugins.checkmk.syncer.print')
@@ -799,6 +967,33 @@ class TestSyncCMK2(unittest.TestCase):
             mock_clusters.assert_not_called()
             mock_cleanup.assert_not_called()
 
+    @patch('application.plugins.checkmk.syncer.Progress')
+    @patch('application.plugins.checkmk.syncer.print')
+    @patch('application.plugins.checkmk.syncer.log')
+    def test_run_keeps_hosts_after_calculation_timeout(self, mock_log, mock_print,
+                                                       mock_progress):
+        """Hosts of a timed out batch are not synced, but must not be deleted"""
+        self.syncer.host_state = Mock()
+
+        def calculate(_progress):
+            self.syncer.calculation_incomplete = True
+            return {}
+
+        with patch.object(self.syncer, 'fetch_checkmk_folders'), \
+             patch.object(self.syncer, 'fetch_checkmk_hosts'), \
+             patch.object(self.syncer, 'calculate_attributes_and_rules',
+                          side_effect=calculate), \
+             patch.object(self.syncer, 'handle_clusters'), \
+             patch.object(self.syncer, 'cleanup_hosts') as mock_cleanup, \
+             patch.object(self.syncer, 'handle_folders'):
+
+            self.syncer.run()
+
+        mock_cleanup.assert_not_called()
+        # The snapshot stays incomplete -> the next run fetches all hosts
+        self.syncer.host_state.finish_export.assert_not_called()
+        self.assertIn('ERROR', [entry[0] for entry in self.syncer.log_details])
+
 
 class TestSyncCMK2UpdateHost(unittest.TestCase):
     """Tests for the refactored update_host and its helpers."""
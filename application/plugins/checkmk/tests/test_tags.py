@@ -5,8 +5,11 @@ Unit tests for checkmk tags module
 import unittest
 from unittest.mock import Mock, patch
 
+from pymongo import UpdateOne
+
+from application.plugins.checkmk import tags as tags_module
 from application.plugins.checkmk.tags import CheckmkTagSync
-from tests import base_mock_init
+from tests import InProcessPool, base_mock_init
 
 
 class TestCheckmkTagSync(unittest.TestCase):
@@ -128,40 +131,6 @@ class TestCheckmkTagSync(unittest.TestCase):
         self.assertEqual(len(checkmk_ids['grp1']), 1)
         self.assertIn('grp2', checkmk_ids)
 
-    def test_update_hosts_tags(self):
-        db_host = Mock()
-        db_host.cache = {
-            'cmk_tags_tag_choices': {
-                'grp1': ('tag_id', 'Tag Title'),
-            }
-        }
-        global_tags = []
-
-        self.sync.update_hosts_tags(db_host, global_tags)
-
-        self.assertEqual(len(global_tags), 1)
-        self.assertEqual(global_tags[0], ('grp1', 'tag_id', 'Tag Title'))
-
-    def test_update_hosts_tags_no_cache(self):
-        db_host = Mock()
-        db_host.cache = {}
-        global_tags = []
-
-        self.sync.update_hosts_tags(db_host, global_tags)
-        self.assertEqual(len(global_tags), 0)
-
-    def test_update_hosts_tags_no_duplicates(self):
-        db_host = Mock()
-        db_host.cache = {
-            'cmk_tags_tag_choices': {
-                'grp1': ('tag_id', 'Tag Title'),
-            }
-        }
-        global_tags = [('grp1', 'tag_id', 'Tag Title')]
-
-        self.sync.update_hosts_tags(db_host, global_tags)
-        self.assertEqual(len(global_tags), 1)
-
     def test_update_hosts_multigroups_no_cache(self):
         db_host = Mock()
         db_host.cache = {}
@@ -277,5 +246,124 @@ class TestTagIdFieldSwitch(unittest.TestCase):
         self.assertEqual(tags, [{'id': 'v1', 'title': 'Val1'}])
 
 
+class TestBuildCaches(unittest.TestCase):
+    """The tag contribution of a host is calculated without shared state."""
+
+    def setUp(self):
+        def mock_init(self_param, account=False):
+            base_mock_init(self_param, groups={})
+
+        self.init_patcher = patch(
+            'application.plugins.checkmk.tags.CMK2.__init__', mock_init)
+        self.init_patcher.start()
+        self.sync = CheckmkTagSync()
+        self.attributes = {'all': {'HOSTNAME': 'host1'}}
+        self.sync.get_attributes = Mock(return_value=self.attributes)
+
+    def tearDown(self):
+        self.init_patcher.stop()
+
+    def test_new_caches_are_returned_as_update(self):
+        db_host = Mock(cache={})
+        with patch.object(self.sync, 'get_tags_for_host',
+                          return_value={'grp1': ('t1', 'T1')}):
+            groups, tags, update = self.sync.build_caches(db_host, {}, [])
+
+        stamp = tags_module.fingerprint(self.attributes)
+        self.assertEqual((groups, tags), ({}, {'grp1': ('t1', 'T1')}))
+        self.assertEqual(update, {'$set': {
+            'cache.cmk_tags_stamp': stamp,
+            'cache.cmk_tags_tag_choices': {'grp1': ('t1', 'T1')},
+        }})
+        db_host.save.assert_not_called()
+
+    def test_current_caches_need_no_write(self):
+        db_host = Mock(cache={
+            'cmk_tags_stamp': tags_module.fingerprint(self.attributes),
+            'cmk_tags_tag_choices': {'grp1': ['t1', 'T1']},
+        })
+        with patch.object(self.sync, 'get_tags_for_host') as get_tags:
+            _groups, tags, update = self.sync.build_caches(db_host, {}, [])
+        get_tags.assert_not_called()
+        self.assertEqual(tags, {'grp1': ['t1', 'T1']})
+        self.assertIsNone(update)
+
+    def test_stale_multiply_caches_are_unset(self):
+        db_host = Mock(cache={
+            'cmk_tags_stamp': 'old',
+            'cmk_tags_multiply_tags': {},
+            'cmk_tags_tag_choices': {},
+        })
+        with patch.object(self.sync, 'get_tags_for_host', return_value={}):
+            _groups, _tags, update = self.sync.build_caches(db_host, {}, [])
+        self.assertEqual(update, {
+            '$set': {'cache.cmk_tags_stamp': tags_module.fingerprint(self.attributes),
+                     'cache.cmk_tags_tag_choices': {}},
+            '$unset': {'cache.cmk_tags_multiply_tags': 1},
+        })
+
+    def test_multiplied_groups_are_used_for_the_host(self):
+        db_host = Mock(cache={})
+        extra = {'grp_a': {'rw_id': 'a', 'rw_title': 'A'}}
+        with patch.object(self.sync, 'check_for_multi_groups',
+                          return_value=({'grp_a': ('a', 'A')}, extra)), \
+                patch.object(self.sync, 'get_tags_for_host',
+                             return_value={'grp_a': ('a', 'A')}) as get_tags:
+            groups, _tags, _update = self.sync.build_caches(
+                db_host, {'grp': {'is_template': True}}, [('grp', '{{ x }}')])
+        self.assertEqual(groups, extra)
+        self.assertIn('grp_a', get_tags.call_args.args[2])
+
+
+class TestExportTags(unittest.TestCase):
+    """Worker results are merged once and the caches written in one bulk."""
+
+    def setUp(self):
+        def mock_init(self_param, account=False):
+            base_mock_init(self_param, groups={})
+
+        self.init_patcher = patch(
+            'application.plugins.checkmk.tags.CMK2.__init__', mock_init)
+        self.init_patcher.start()
+        self.sync = CheckmkTagSync()
+        self.addCleanup(self.init_patcher.stop)
+
+    def test_results_are_merged_and_caches_written_in_bulk(self):
+        hosts = [Mock(pk=f'id{number}') for number in range(3)]
+        results = {
+            'id0': ({}, {'grp': ('t1', 'T1')}, {'$set': {'cache.x': 1}}),
+            'id1': ({'grp_b': {'title': 'B'}}, {'grp': ('t1', 'T1')}, None),
+            'id2': ({}, {'grp': ('t2', 'T2')}, {'$set': {'cache.x': 2}}),
+        }
+        base_groups = {'grp': {'title': 'G'}, 'tpl': {'is_template': True}}
+        with patch('application.plugins.checkmk.tags.Host') as mock_host, \
+                patch('application.plugins.checkmk.tags.multiprocessing.Pool',
+                      InProcessPool), \
+                patch('application.plugins.checkmk.tags.Progress'), \
+                patch('application.plugins.checkmk.tags.app') as mock_app, \
+                patch('application.plugins.checkmk.tags.init_db'), \
+                patch.object(self.sync, 'calculate_rules',
+                             return_value=(base_groups, [])), \
+                patch.object(self.sync, 'build_caches',
+                             side_effect=lambda host, *_: results[host.pk]), \
+                patch.object(self.sync, 'sync_to_checkmk') as sync_to_checkmk:
+            mock_app.config = {'CMK_CALCULATION_BATCH_SIZE': 2}
+            mock_host.objects_by_filter.return_value.scalar.return_value = \
+                    [host.pk for host in hosts]
+            mock_host.objects.side_effect = lambda id__in: Mock(
+                exclude=Mock(return_value=[h for h in hosts if h.pk in id__in]))
+            self.sync.config = {'settings': {}}
+            self.sync.export_tags()
+
+        groups, tags = sync_to_checkmk.call_args.args
+        self.assertEqual(groups, {'grp': {'title': 'G'}, 'grp_b': {'title': 'B'}})
+        self.assertCountEqual(tags, [('grp', 't1', 'T1'), ('grp', 't2', 'T2')])
+        operations = mock_host._get_collection.return_value.bulk_write.call_args.args[0]
+        self.assertEqual(operations, [
+            UpdateOne({'_id': 'id0'}, {'$set': {'cache.x': 1}}),
+            UpdateOne({'_id': 'id2'}, {'$set': {'cache.x': 2}}),
+        ])
+
+
 if __name__ == '__main__':
     unittest.main(verbosity=2)
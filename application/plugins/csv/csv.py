@@ -49,9 +49,15 @@ class CSV(Plugin):
         print(f"{ColorCodes.OKBLUE}Started {ColorCodes.ENDC}"
               f"{ColorCodes.UNDERLINE}{filename}{ColorCodes.ENDC}")
         num_rows = 0
-        num_saved = 0
         num_errors = 0
-        with open(csv_path, newline='', encoding=encoding) as csvfile:
+
+        def _report(hostname, do_save):
+            print(f" {ColorCodes.OKGREEN}** {ColorCodes.ENDC} "
+                  f"Update {hostname} Saved: {do_save}")
+
+        with open(csv_path, newline='', encoding=encoding) as csvfile, \
+                Host.import_session(self.config, import_id,
+                                    on_result=_report) as session:
             reader = csv.DictReader(csvfile, delimiter=delimiter)
             for row in reader:
                 num_rows += 1
@@ -65,23 +71,19 @@ class CSV(Plugin):
                         hostname = Host.rewrite_hostname(
                             hostname, self.config['rewrite_hostname'], row
                         )
-                    host_obj = Host.get_host(hostname)
                     del row[hostname_field]
-                    host_obj.update_host(row)
-                    do_save = host_obj.set_account(
-                        account_dict=self.config, import_id=import_id
-                    )
-                    if do_save:
-                        host_obj.save()
-                        num_saved += 1
-                    print(f" {ColorCodes.OKGREEN}** {ColorCodes.ENDC} "
-                          f"Update {hostname} Saved: {do_save}")
+                    session.add(hostname, row)
                 except Exception as error:  # pylint: disable=broad-exception-caught
                     num_errors += 1
                     self.log_details.append(
                         (f'import_error {hostname or f"row {num_rows}"}', str(error))
                     )
                     print(f"Error: {error}")
+        num_saved = session.num_saved
+        for hostname, error in session.errors:
+            num_errors += 1
+            self.log_details.append((f'import_error {hostname}', error))
+            print(f"Error: {error}")
 
         num_deleted = 0
         if extra_filter := self.config.get('delete_host_if_not_found_on_import'):
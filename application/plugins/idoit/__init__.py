@@ -6,6 +6,7 @@ import click
 from mongoengine.errors import DoesNotExist
 
 from application import app
+from application.modules.rule.cache import get_cache_store
 from application.modules.rule.rewrite import Rewrite
 from application.modules.debug import ColorCodes, attribute_table
 from application.models.host import Host
@@ -111,6 +112,7 @@ def get_idoit_debug_data(hostname):
         if key.lower().startswith('idoit'):
             del db_host.cache[key]
     db_host.save()
+    get_cache_store().clear(db_host, 'idoit')
 
     attributes = syncer.get_attributes(db_host, 'idoit')
     extra_attributes = {}
@@ -155,6 +157,7 @@ def idoit_host_debug(hostname):
             if key.lower().startswith('idoit'):
                 del db_host.cache[key]
         db_host.save()
+        get_cache_store().clear(db_host, 'idoit')
     except DoesNotExist:
         print(f"{ColorCodes.FAIL}Host not Found{ColorCodes.ENDC}")
         return
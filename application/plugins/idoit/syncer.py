@@ -5,7 +5,7 @@ import requests
 from requests.auth import HTTPBasicAuth
 
 from application.models.host import Host
-from application import log, logger
+from application import app, log, logger
 from application.modules.debug import ColorCodes as CC
 from application.modules.plugin import Plugin
 
@@ -73,84 +73,147 @@ class SyncIdoit(Plugin):
 
 #.
 #   .-- Get object categories
-    # pylint: disable-next=too-many-locals,too-many-branches,too-many-nested-blocks
-    def get_object_categories(self, obj_id):
+    def _category_names(self):
         """
-        Get all needed categories for an object in i-doit
+        Categories configured on the account
         """
-
         object_categories = self.config.get("object_categories", "")
-        object_categories = [x.strip() for x in object_categories.split(",")]
-
-        for category in object_categories:  # pylint: disable=too-many-nested-blocks
-            json_data = {
-                "id": 1,
-                "version": "2.0",
-                "method": "cmdb.category.read",
-                "params": {
-                    "apikey": self.config["api_token"],
-                    "language": self.config["language"],
-                    "category": category,
-                    "objID": obj_id,
-                },
-            }
+        return [x.strip() for x in object_categories.split(",")]
 
-            response = self.request(json_data)
+    def _category_request(self, obj_id, category):
+        """
+        JSON-RPC call to read one category of an object. The id maps
+        the answer of a batch back to object and category.
+        """
+        return {
+            "id": f"{obj_id}|{category}",
+            "version": "2.0",
+            "method": "cmdb.category.read",
+            "params": {
+                "apikey": self.config["api_token"],
+                "language": self.config["language"],
+                "category": category,
+                "objID": obj_id,
+            },
+        }
 
-            if "result" not in response:
-                continue
+    # pylint: disable-next=too-many-branches
+    def _parse_category(self, obj_id, category, response):
+        """
+        Flatten the result of a category read into the category cache
+        """
+        cache_name = f"{obj_id}__{category}"
+        name = category.split("_")[-1].lower()
 
-            if not response["result"]:
-                continue
+        if len(response) == 1:
+            counter = ""
+        else:
+            counter = "_1"
 
-            response = response["result"]
-            cache_name = f"{obj_id}__{category}"
-            name = category.split("_")[-1].lower()
+        for item in response:
+            data = {}
 
-            if len(response) == 1:
-                counter = ""
-            else:
-                counter = "_1"
+            for key, values in item.items():
 
-            for item in response:
-                data = {}
+                if isinstance(values, dict):
 
-                for key, values in item.items():
+                    for item, value in values.items():
+                        data[f"{name}{counter}_{key}_{item}"] = value
 
-                    if isinstance(values, dict):
+                elif isinstance(values, list):
 
-                        for item, value in values.items():
-                            data[f"{name}{counter}_{key}_{item}"] = value
+                    if len(values) == 1:
+                        item_counter = ""
 
-                    elif isinstance(values, list):
+                    else:
+                        item_counter = "_1"
 
-                        if len(values) == 1:
-                            item_counter = ""
+                    for entry in values:
 
-                        else:
-                            item_counter = "_1"
+                        for item, value in entry.items():
+                            data[f"{name}{counter}_{key}_{item}{item_counter}"] = value
 
-                        for entry in values:
+                        if item_counter:
+                            item_counter = f"_{int(item_counter[-1]) +1}"
 
-                            for item, value in entry.items():
-                                data[f"{name}{counter}_{key}_{item}{item_counter}"] = value
+                else:
+                    data[f"{name}{counter}_{key}"] = values
 
-                            if item_counter:
-                                item_counter = f"_{int(item_counter[-1]) +1}"
+            if counter:
+                counter = f"_{int(counter[-1]) + 1}"
 
-                    else:
-                        data[f"{name}{counter}_{key}"] = values
+            if cache_name not in self.category_cache:
+                self.category_cache[cache_name] = data
 
-                if counter:
-                    counter = f"_{int(counter[-1]) + 1}"
+            else:
+                self.category_cache[cache_name].update(data)
 
-                if cache_name not in self.category_cache:
-                    self.category_cache[cache_name] = data
+        return {cache_name: self.category_cache[cache_name]}
 
-                else:
-                    self.category_cache[cache_name].update(data)
+    def get_object_categories(self, obj_id):
+        """
+        Get all needed categories for an object in i-doit
+        """
+
+        for category in self._category_names():
+            response = self.request(self._category_request(obj_id, category))
+
+            if "result" not in response:
+                continue
+
+            if not response["result"]:
+                continue
 
-            yield {cache_name: self.category_cache[cache_name]}
+            yield self._parse_category(obj_id, category, response["result"])
+
+    def _read_batch(self, calls):
+        """
+        Send one JSON-RPC batch, returns {call id: answer}
+        """
+        response = self.request(calls)
+        if not isinstance(response, list):
+            error = response.get("error", {}).get("message") if response else None
+            raise ValueError(error or "no valid batch response")
+        return {answer.get("id"): answer for answer in response if isinstance(answer, dict)}
+
+    def get_objects_categories(self, obj_ids):  # pylint: disable=too-many-locals
+        """
+        Read the configured categories of all `obj_ids` with JSON-RPC
+        batches of IDOIT_BATCH_SIZE calls, sent in parallel.
+        Returns {obj_id: [category result]} in the order of the
+        categories. Failed calls are logged for their object.
+        """
+        categories = self._category_names()
+        calls = [self._category_request(obj_id, category)
+                 for obj_id in obj_ids for category in categories]
+        size = max(int(app.config.get("IDOIT_BATCH_SIZE", 50)), 1)
+        batches = [calls[start:start+size] for start in range(0, len(calls), size)]
+
+        answers = {}
+        for batch, result, error in self.map_requests(self._read_batch, batches):
+            if isinstance(error, IdoitAuthError):
+                raise error
+            if error:
+                for call in batch:
+                    answers[call["id"]] = {"error": {"message": str(error)}}
+            else:
+                answers.update(result)
+
+        results = {}
+        for call in calls:
+            obj_id, category = call["params"]["objID"], call["params"]["category"]
+            answer = answers.get(call["id"], {"error": {"message": "missing in batch response"}})
+            if "error" in answer:
+                message = answer["error"]
+                if isinstance(message, dict):
+                    message = message.get("message")
+                self.log_details.append((f"import_error {obj_id}", f"{category}: {message}"))
+                logger.debug("Category %s of %s failed: %s", category, obj_id, message)
+                continue
+            if answer.get("result"):
+                results.setdefault(obj_id, []).append(
+                    self._parse_category(obj_id, category, answer["result"]))
+        return results
 
 #.
 #   .-- Get objects
@@ -173,7 +236,7 @@ class SyncIdoit(Plugin):
             "id": 1
         }
 
-        servers = {}
+        matching = []
         for server in self.request(json_data)["result"]:
             states = self.config.get("filter_cmdb_status", "")
 
@@ -184,15 +247,21 @@ class SyncIdoit(Plugin):
 
             if server["cmdb_status"] not in map(int, states):
                 continue
+            matching.append(server)
 
+        categories = {}
+        if get_categories and matching:
+            categories = self.get_objects_categories([server["id"] for server in matching])
+
+        servers = {}
+        for server in matching:
             title = server["title"]
 
-            if get_categories:
-                for result in self.get_object_categories(server["id"]):
+            for result in categories.get(server["id"], []):
 
-                    for values in result.values():
-                        for name, value in values.items():
-                            server[name] = value
+                for values in result.values():
+                    for name, value in values.items():
+                        server[name] = value
 
             if True == self.config["filter_monitoring_status"]:
                 if "monitoring_active_value" in server and "1" == server["monitoring_active_value"]:
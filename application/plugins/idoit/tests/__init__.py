@@ -0,0 +1,3 @@
+# pylint: disable=unused-import
+"""Bootstrap test stubs before any test in this package runs."""
+import tests  # noqa: F401 — triggers MongoDB stub + real idoit module loading
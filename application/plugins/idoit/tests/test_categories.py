@@ -0,0 +1,85 @@
+"""
+Unit tests for the batched i-doit category reads
+"""
+# pylint: disable=missing-function-docstring,protected-access
+import unittest
+from unittest.mock import patch
+
+from application import app
+from application.plugins.idoit.syncer import IdoitAuthError, SyncIdoit
+
+
+class TestObjectCategories(unittest.TestCase):
+    """get_objects_categories batches the category reads."""
+
+    def setUp(self):
+        self.syncer = SyncIdoit.__new__(SyncIdoit)
+        self.syncer.config = {'api_token': 'token', 'language': 'en',
+                              'object_categories': 'C__CATG__IP, C__CATG__CPU'}
+        self.syncer.category_cache = {}
+        self.syncer.log_details = []
+        self.batches = []
+
+    def _answer(self, calls):
+        self.batches.append([call['id'] for call in calls])
+        answers = []
+        for call in calls:
+            params = call['params']
+            if params['objID'] == 2 and params['category'] == 'C__CATG__CPU':
+                answers.append({'id': call['id'], 'jsonrpc': '2.0',
+                                'error': {'code': -32099, 'message': 'no right'}})
+            else:
+                answers.append({'id': call['id'], 'jsonrpc': '2.0', 'result': [
+                    {'title': f"{params['category']}-{params['objID']}"}]})
+        return list(reversed(answers))
+
+    def test_calls_are_batched_and_mapped_back(self):
+        with patch.object(self.syncer, 'request', side_effect=self._answer), \
+             patch.dict(app.config, {'IDOIT_BATCH_SIZE': 3}):
+            results = self.syncer.get_objects_categories([1, 2])
+
+        self.assertEqual(self.batches, [['1|C__CATG__IP', '1|C__CATG__CPU', '2|C__CATG__IP'],
+                                        ['2|C__CATG__CPU']])
+        self.assertEqual(results[1], [
+            {'1__C__CATG__IP': {'ip_title': 'C__CATG__IP-1'}},
+            {'1__C__CATG__CPU': {'cpu_title': 'C__CATG__CPU-1'}},
+        ])
+        self.assertEqual(results[2], [{'2__C__CATG__IP': {'ip_title': 'C__CATG__IP-2'}}])
+        self.assertEqual(self.syncer.log_details,
+                         [('import_error 2', 'C__CATG__CPU: no right')])
+
+    def test_failed_batch_is_reported_per_object(self):
+        with patch.object(self.syncer, 'request', return_value={}), \
+             patch.dict(app.config, {'IDOIT_BATCH_SIZE': 10}):
+            results = self.syncer.get_objects_categories([1, 2])
+
+        self.assertEqual(results, {})
+        self.assertEqual([detail[0] for detail in self.syncer.log_details],
+                         ['import_error 1', 'import_error 1',
+                          'import_error 2', 'import_error 2'])
+
+    def test_auth_error_is_not_swallowed(self):
+        with patch.object(self.syncer, 'request', side_effect=IdoitAuthError('login')):
+            with self.assertRaises(IdoitAuthError):
+                self.syncer.get_objects_categories([1])
+
+    def test_get_objects_merges_the_categories(self):
+        self.syncer.config.update({'filter_cmdb_status': '6', 'filter_monitoring_status': False})
+        objects = {'result': [{'id': 1, 'title': 'srv1', 'cmdb_status': 6},
+                              {'id': 2, 'title': 'srv2', 'cmdb_status': 7}]}
+
+        def request(data):
+            if isinstance(data, list):
+                return self._answer(data)
+            return objects
+
+        with patch.object(self.syncer, 'request', side_effect=request):
+            servers = dict(self.syncer.get_objects(get_categories=True))
+
+        self.assertEqual(list(servers), ['srv1'])
+        self.assertEqual(servers['srv1']['cpu_title'], 'C__CATG__CPU-1')
+        self.assertEqual(self.batches, [['1|C__CATG__IP', '1|C__CATG__CPU']])
+
+
+if __name__ == '__main__':
+    unittest.main()
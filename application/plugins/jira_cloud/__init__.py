@@ -5,6 +5,7 @@ from mongoengine.errors import DoesNotExist
 from application.plugins.jira import jira_cli
 from application.models.host import Host
 from application.modules.plugin import Plugin
+from application.modules.rule.cache import get_cache_store
 from application.modules.rule.filter import Filter
 from application.modules.rule.rewrite import Rewrite
 
@@ -41,12 +42,13 @@ def cmd_import_jira(account, debug):
 @click.argument("account")
 @click.option("--debug", is_flag=True)
 @click.option("--dry-run", is_flag=True)
-def cmd_export_jira(account, debug, dry_run):
+@click.option("--full", is_flag=True)
+def cmd_export_jira(account, debug, dry_run, full):
     """
     Export Hosts/Fields to a Jira Cloud Assets Instance
     """
     try:
-        export_jira_cloud(account, debug, dry_run)
+        export_jira_cloud(account, debug, dry_run, full)
     except Exception as error:  # pylint: disable=broad-exception-caught
         if debug:
             raise
@@ -107,6 +109,7 @@ def get_jira_cloud_debug_data(hostname):
         if key.lower().startswith('jira_cloud'):
             del db_host.cache[key]
     db_host.save()
+    get_cache_store().clear(db_host, 'jira_cloud')
 
     attributes = plugin.get_attributes(db_host, 'jira_cloud_export')
     outcomes = {}
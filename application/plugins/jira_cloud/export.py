@@ -1,21 +1,29 @@
 """
 Export host attributes to Jira Cloud Assets objects.
 
-Every enabled JiraExportRule is loaded into a single rule engine, every
-referenced object type's existing objects are bulk-fetched once via AQL,
-and hosts are iterated exactly once.  Per host the engine merges all
-matching rules' outcomes; we then walk the resulting per-type field
-bundles, diff against the cached existing values and only PUT/POST when
-something actually changed.
+Every enabled JiraExportRule is loaded into a single rule engine and
+hosts are iterated exactly once.  Per host the engine merges all
+matching rules' outcomes into per-type field bundles.  A bundle which
+hashes the same as the one the last export wrote is skipped; the others
+are diffed against their existing objects, fetched via AQL, and only
+PUT/POST when something actually changed.  The writes run in parallel.
+
+Every JIRA_EXPORT_FULL_SYNC_INTERVAL seconds (or with ``--full``) all
+hosts are compared with Jira again, which also repairs objects changed
+in Jira by hand.
 
 The lookup attribute is always "Name" — Jira Assets' default label
 attribute on every object type.
 """
 # pylint: disable=too-many-locals,too-many-branches,too-many-nested-blocks
-# pylint: disable=too-many-statements
+# pylint: disable=too-many-statements,too-many-instance-attributes
+import datetime
+import hashlib
 import json
 from collections import defaultdict
 
+from pymongo import ReplaceOne
+
 from rich.progress import Progress, SpinnerColumn, MofNCompleteColumn, TimeElapsedColumn
 from rich.text import Text
 
@@ -24,7 +32,7 @@ from syncerapi.v1 import (
     cc,
 )
 
-from application import logger
+from application import app, logger
 from application.modules.rule.filter import Filter
 from application.modules.rule.rewrite import Rewrite
 from application.plugins.jira_cloud.jira_cloud import JiraCloud
@@ -32,12 +40,21 @@ from application.plugins.jira_cloud.models import (
     JiraCloudFilterRule,
     JiraCloudRewriteAttributeRule,
     JiraExportRule,
+    JiraExportState,
     JiraSchemaCache,
 )
 from application.plugins.jira_cloud.rules import JiraExportAttributeRule
 
 
 LOOKUP_ATTRIBUTE_NAME = "Name"
+# Objects looked up by name with one AQL query
+_AQL_NAMES_PER_QUERY = 100
+
+
+def _aql_string(value):
+    """Quote a value for an AQL query."""
+    escaped = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{escaped}"'
 
 
 class JiraCloudExport(JiraCloud):
@@ -51,6 +68,12 @@ class JiraCloudExport(JiraCloud):
         self._schema_cache = None
         # type_id -> (type_entry, name_to_id, lookup_attr_id, existing_map)
         self._type_state = {}
+        # (hostname, type_id) -> (object_id, payload hash) of the last export
+        self._known = {}
+        # type_id -> [(hostname, {attr_id: value}, payload hash)] to compare
+        self._pending = defaultdict(list)
+        # Compare every host with Jira, see _full_export_due()
+        self.full_export = False
 
         # When the account's `update_only` setting is on, only existing
         # objects are updated — hosts without a matching Jira object are
@@ -102,10 +125,11 @@ class JiraCloudExport(JiraCloud):
             ],
         }
 
-    def _existing_objects(self, type_name, lookup_attr_id):
+    def _existing_objects(self, type_name, lookup_attr_id, names=None):
         """
         Map ``{lookup_value: (object_id, {attr_id: current_value})}`` for
-        every existing object of the target type.
+        every existing object of the target type, or only for the ones
+        whose lookup attribute is in `names`.
 
         The AQL response carries attributes only by id (no name), so the
         caller resolves the lookup attribute's id from the schema cache
@@ -113,6 +137,9 @@ class JiraCloudExport(JiraCloud):
         """
         existing = {}
         ql = f'objectType = "{type_name}"'
+        if names:
+            quoted = ', '.join(_aql_string(name) for name in names)
+            ql += f' AND "{LOOKUP_ATTRIBUTE_NAME}" IN ({quoted})'
         for obj in self._iter_aql_objects(ql):
             current_attrs = {}
             lookup_value = None
@@ -153,15 +180,82 @@ class JiraCloudExport(JiraCloud):
             return None
         lookup_attr_id = name_to_id[LOOKUP_ATTRIBUTE_NAME]
 
+        state = (type_entry, name_to_id, lookup_attr_id, {})
+        self._type_state[object_type_id] = state
+        return state
+
+    def _load_existing(self, object_type_id, names=None):
+        """
+        Fetch the existing objects of a prepared type: all of them, or
+        the ones named in `names` if they are no more than
+        JIRA_EXPORT_LOOKUP_LIMIT.
+        """
+        type_entry, _name_to_id, lookup_attr_id, existing = \
+            self._type_state[object_type_id]
         print(f"{cc.OKGREEN} -- {cc.ENDC}Preparing "
               f"{type_entry.schema_name} / {type_entry.name} "
               f"(type id {object_type_id})")
-        existing = self._existing_objects(type_entry.name, lookup_attr_id)
+        limit = int(app.config.get('JIRA_EXPORT_LOOKUP_LIMIT', 1000))
+        if names is None or len(names) > limit:
+            existing.update(self._existing_objects(type_entry.name, lookup_attr_id))
+        else:
+            names = sorted(names)
+            for start in range(0, len(names), _AQL_NAMES_PER_QUERY):
+                existing.update(self._existing_objects(
+                    type_entry.name, lookup_attr_id,
+                    names[start:start + _AQL_NAMES_PER_QUERY]))
         print(f"{cc.OKGREEN}  + {cc.ENDC}{len(existing)} existing object(s) loaded")
 
-        state = (type_entry, name_to_id, lookup_attr_id, existing)
-        self._type_state[object_type_id] = state
-        return state
+    @staticmethod
+    def payload_hash(object_type_id, attr_values):
+        """
+        Hash of the attributes a host should have on its object
+        """
+        data = json.dumps({str(attr_id): str(value)
+                           for attr_id, value in attr_values.items()}, sort_keys=True)
+        return hashlib.sha256(f"{object_type_id}|{data}".encode('utf-8')).hexdigest()
+
+    def _full_export_due(self):
+        """
+        Compare every host with Jira: requested, never done since the
+        last schema sync, or older than JIRA_EXPORT_FULL_SYNC_INTERVAL
+        """
+        if self.full_export:
+            return True
+        last = self._load_schema().last_full_export
+        if not last:
+            return True
+        max_age = app.config.get('JIRA_EXPORT_FULL_SYNC_INTERVAL', 86400)
+        return (datetime.datetime.now() - last).total_seconds() > max_age
+
+    def _load_hashes(self):
+        """
+        Return {(hostname, type_id): (object_id, payload hash)}
+        """
+        return {(entry['hostname'], entry['object_type_id']):
+                (entry.get('object_id'), entry.get('payload_hash'))
+                for entry in JiraExportState.objects(account=self.account_name)
+                .as_pymongo().only('hostname', 'object_type_id', 'object_id',
+                                   'payload_hash')}
+
+    def _store_hashes(self, written, full):
+        """
+        Save the given {(hostname, type_id): (object_id, payload hash)}.
+        A full export replaces all hashes of the account.
+        """
+        operations = [
+            ReplaceOne({'account': self.account_name, 'hostname': hostname,
+                        'object_type_id': type_id},
+                       {'account': self.account_name, 'hostname': hostname,
+                        'object_type_id': type_id, 'object_id': object_id,
+                        'payload_hash': digest}, upsert=True)
+            for (hostname, type_id), (object_id, digest) in written.items()
+        ]
+        collection = JiraExportState._get_collection()  # pylint: disable=protected-access
+        if full:
+            collection.delete_many({'account': self.account_name})
+        if operations:
+            collection.bulk_write(operations, ordered=False)
 
     @staticmethod
     def _write_error(resp):
@@ -188,7 +282,7 @@ class JiraCloudExport(JiraCloud):
     def _put_object(self, object_id, object_type_id, attr_values):
         """Update an existing Jira Assets object; return any write error."""
         payload = self._build_payload(object_type_id, attr_values)
-        resp = self.inner_request(
+        resp = self.rate_limited_request(
             method="PUT",
             url=f"{self.base_url}/v1/object/{object_id}",
             headers=self.headers, auth=self.auth,
@@ -197,15 +291,29 @@ class JiraCloudExport(JiraCloud):
         return self._write_error(resp)
 
     def _post_object(self, object_type_id, attr_values):
-        """Create a new Jira Assets object; return any write error."""
+        """
+        Create a new Jira Assets object; return (write error, object id)
+        """
         payload = self._build_payload(object_type_id, attr_values)
-        resp = self.inner_request(
+        resp = self.rate_limited_request(
             method="POST",
             url=f"{self.base_url}/v1/object/create",
             headers=self.headers, auth=self.auth,
             data=json.dumps(payload),
         )
-        return self._write_error(resp)
+        if error := self._write_error(resp):
+            return error, None
+        object_id = (resp.json() or {}).get('id')
+        return None, str(object_id) if object_id else None
+
+    def _send_write(self, job):
+        """
+        Send one planned write; return (write error, object id)
+        """
+        _hostname, type_id, object_id, attr_values, _digest = job
+        if object_id:
+            return self._put_object(object_id, type_id, attr_values), object_id
+        return self._post_object(type_id, attr_values)
 
     def export_objects(self):
         """Single-pass export: prepare types, iterate hosts once."""
@@ -232,6 +340,13 @@ class JiraCloudExport(JiraCloud):
                   f"nothing to do")
             return
 
+        started = datetime.datetime.now()
+        full = self._full_export_due()
+        if full:
+            print(f"{cc.OKGREEN} == {cc.ENDC}Full export: every host is "
+                  f"compared with Jira")
+        else:
+            self._known = self._load_hashes()
         for type_id in all_type_ids:
             self._prepare_type(type_id)
 
@@ -272,6 +387,29 @@ class JiraCloudExport(JiraCloud):
                     self.log_details.append(
                         (f'export_error {db_host.hostname}', str(error)))
 
+        jobs, written = self._plan_writes(counts, full)
+        if jobs:
+            with Progress(SpinnerColumn(), MofNCompleteColumn(),
+                          *Progress.get_default_columns(),
+                          TimeElapsedColumn()) as progress:
+                def write_console(message):
+                    progress.console.print(Text.from_ansi(message))
+                task = progress.add_task("Jira Cloud writes", total=len(jobs))
+                for job, result, error in self.map_requests(self._send_write, jobs):
+                    progress.advance(task)
+                    if error:
+                        if self.debug:
+                            raise error
+                        logger.error("Write failed for %s: %s", job[0], error)
+                        result = (str(error), None)
+                    self._report_write(job, result, counts, written, write_console)
+
+        if not self.dry_run:
+            self._store_hashes(written, full)
+            if full:
+                JiraSchemaCache.objects(account=self.account_name).update(
+                    set__last_full_export=started)
+
         for type_id in all_type_ids:
             c = counts[type_id]
             summary = (f"updated={c['updated']} created={c['created']} "
@@ -284,7 +422,10 @@ class JiraCloudExport(JiraCloud):
 
     # pylint: disable-next=too-many-arguments,too-many-positional-arguments
     def _process_host(self, db_host, rule_engine, cache_key, counts, console):
-        """Apply every matching rule to one host."""
+        """
+        Apply every matching rule to one host and queue the object types
+        whose attributes changed since the last export
+        """
         attrs = self.get_attributes(db_host, cache_key)
         if not attrs:
             return
@@ -300,7 +441,7 @@ class JiraCloudExport(JiraCloud):
             if not state:
                 counts[type_id]["skipped"] += 1
                 continue
-            _entry, name_to_id, lookup_attr_id, existing = state
+            _entry, name_to_id, _lookup_attr_id, _existing = state
 
             target_attrs = {}
             unknown = []
@@ -317,66 +458,95 @@ class JiraCloudExport(JiraCloud):
                 counts[type_id]["skipped"] += 1
                 continue
 
-            if lookup_value in existing:
-                obj_id, current = existing[lookup_value]
-                changed = {a: v for a, v in target_attrs.items()
-                           if str(current.get(a, '')) != str(v)}
-                if not changed:
-                    counts[type_id]["unchanged"] += 1
-                    continue
-                if self.debug:
-                    id_to_name = {i: n for n, i in name_to_id.items()}
-                    for attr_id, new_value in changed.items():
-                        old_value = current.get(attr_id, '<unset>')
-                        console(f"{cc.OKBLUE}     · {cc.ENDC}"
-                                f"{db_host.hostname} [type {type_id}] "
-                                f"{id_to_name.get(attr_id, attr_id)}: "
-                                f"{old_value!r} -> {new_value!r}")
-                error = self._put_object(obj_id, type_id, changed)
-                if error:
-                    console(f"{cc.FAIL}   ✗ {cc.ENDC}"
-                            f"{db_host.hostname} [type {type_id}] update "
-                            f"rejected by Jira: {error}")
-                    # 'error' in the key flags the whole run as errored in
-                    # the web log so the rejection is visible there and
-                    # error-only notifications fire.
-                    self.log_details.append(
-                        (f'export_error {db_host.hostname} [type {type_id}]',
-                         f'update rejected: {error}'))
-                    counts[type_id]["failed"] += 1
-                    continue
-                verb = "would update" if self.dry_run else "updated"
-                console(f"{cc.OKGREEN}   ↻ {cc.ENDC}"
-                        f"{db_host.hostname} [type {type_id}] {verb} "
-                        f"({len(changed)} field(s))")
-                counts[type_id]["updated"] += 1
-            elif self.update_only:
-                console(f"{cc.WARNING}   ⊘ {cc.ENDC}"
-                        f"{db_host.hostname} [type {type_id}] "
-                        f"(no existing object, skipped — update-only)")
-                counts[type_id]["skipped"] += 1
-            else:
-                if lookup_attr_id not in target_attrs:
-                    target_attrs[lookup_attr_id] = lookup_value
-                error = self._post_object(type_id, target_attrs)
-                if error:
-                    console(f"{cc.FAIL}   ✗ {cc.ENDC}"
-                            f"{db_host.hostname} [type {type_id}] create "
-                            f"rejected by Jira: {error}")
-                    self.log_details.append(
-                        (f'export_error {db_host.hostname} [type {type_id}]',
-                         f'create rejected: {error}'))
-                    counts[type_id]["failed"] += 1
-                    continue
-                verb = "would create" if self.dry_run else "created"
-                console(f"{cc.OKBLUE}   + {cc.ENDC}"
-                        f"{db_host.hostname} [type {type_id}] ({verb})")
-                counts[type_id]["created"] += 1
+            digest = self.payload_hash(type_id, target_attrs)
+            known = self._known.get((lookup_value, type_id))
+            if known and known[0] and known[1] == digest:
+                counts[type_id]["unchanged"] += 1
+                continue
+            self._pending[type_id].append((lookup_value, target_attrs, digest))
 
+    def _plan_writes(self, counts, full):
+        """
+        Diff the queued hosts against their existing objects.
 
-def export_jira_cloud(account, debug=False, dry_run=False):
+        Returns the writes to send as (hostname, type_id, object_id or
+        None to create, {attr_id: value}, payload hash), and the
+        {(hostname, type_id): (object_id, payload hash)} of the hosts
+        which are already up to date.
+        """
+        jobs = []
+        written = {}
+        for type_id, entries in self._pending.items():
+            _entry, name_to_id, lookup_attr_id, existing = self._type_state[type_id]
+            self._load_existing(type_id, None if full else
+                                {hostname for hostname, _attrs, _digest in entries})
+            for hostname, target_attrs, digest in entries:
+                if hostname in existing:
+                    obj_id, current = existing[hostname]
+                    changed = {a: v for a, v in target_attrs.items()
+                               if str(current.get(a, '')) != str(v)}
+                    if not changed:
+                        counts[type_id]["unchanged"] += 1
+                        written[(hostname, type_id)] = (obj_id, digest)
+                        continue
+                    if self.debug:
+                        id_to_name = {i: n for n, i in name_to_id.items()}
+                        for attr_id, new_value in changed.items():
+                            old_value = current.get(attr_id, '<unset>')
+                            print(f"{cc.OKBLUE}     · {cc.ENDC}"
+                                  f"{hostname} [type {type_id}] "
+                                  f"{id_to_name.get(attr_id, attr_id)}: "
+                                  f"{old_value!r} -> {new_value!r}")
+                    jobs.append((hostname, type_id, obj_id, changed, digest))
+                elif self.update_only:
+                    print(f"{cc.WARNING}   ⊘ {cc.ENDC}"
+                          f"{hostname} [type {type_id}] "
+                          f"(no existing object, skipped — update-only)")
+                    counts[type_id]["skipped"] += 1
+                else:
+                    create_attrs = dict(target_attrs)
+                    if lookup_attr_id not in create_attrs:
+                        create_attrs[lookup_attr_id] = hostname
+                    jobs.append((hostname, type_id, None, create_attrs, digest))
+        self._pending.clear()
+        return jobs, written
+
+    # pylint: disable-next=too-many-arguments,too-many-positional-arguments
+    def _report_write(self, job, result, counts, written, console):
+        """Count and log the outcome of one write."""
+        hostname, type_id, obj_id, attr_values, digest = job
+        error, new_id = result
+        action = "update" if obj_id else "create"
+        if error:
+            console(f"{cc.FAIL}   ✗ {cc.ENDC}"
+                    f"{hostname} [type {type_id}] {action} "
+                    f"rejected by Jira: {error}")
+            # 'error' in the key flags the whole run as errored in
+            # the web log so the rejection is visible there and
+            # error-only notifications fire.
+            self.log_details.append(
+                (f'export_error {hostname} [type {type_id}]',
+                 f'{action} rejected: {error}'))
+            counts[type_id]["failed"] += 1
+            return
+        if obj_id:
+            verb = "would update" if self.dry_run else "updated"
+            console(f"{cc.OKGREEN}   ↻ {cc.ENDC}"
+                    f"{hostname} [type {type_id}] {verb} "
+                    f"({len(attr_values)} field(s))")
+            counts[type_id]["updated"] += 1
+        else:
+            verb = "would create" if self.dry_run else "created"
+            console(f"{cc.OKBLUE}   + {cc.ENDC}"
+                    f"{hostname} [type {type_id}] ({verb})")
+            counts[type_id]["created"] += 1
+        written[(hostname, type_id)] = (new_id, digest)
+
+
+def export_jira_cloud(account, debug=False, dry_run=False, full=False):
     """Entry point for CLI / cronjob."""
     syncer = JiraCloudExport(account)
     syncer.debug = debug
     syncer.dry_run = dry_run
+    syncer.full_export = full
     syncer.export_objects()
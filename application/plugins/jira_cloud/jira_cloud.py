@@ -2,14 +2,23 @@
 Import Jira Data
 """
 import json
+import threading
+import time
 
 from syncerapi.v1 import (
     cc,
     Host,
 )
 
+from application import app
 from application.modules.plugin import Plugin
 
+# Jira answers 429 with Retry-After when a workspace sends too many
+# requests. The pause applies to all threads writing to the workspace,
+# kept on module level so the plugin stays picklable.
+_RETRY_LOCK = threading.Lock()
+_RETRY_AT = {}
+
 
 class JiraCloud(Plugin):
     """
@@ -88,6 +97,40 @@ class JiraCloud(Plugin):
             return user.get('displayName')
         return None
 
+    def _retry_after(self, resp):
+        """
+        Seconds to wait after a 429, from the Retry-After header
+        """
+        try:
+            return max(float(resp.headers.get('Retry-After')), 0.0)
+        except (TypeError, ValueError):
+            return float(app.config['HTTP_REPEAT_TIMEOUT'])
+
+    def rate_limited_request(self, method, url, **kwargs):
+        """
+        inner_request() for writes, repeated after the time Jira asks
+        for when it answers 429 Too Many Requests, up to
+        JIRA_RATE_LIMIT_RETRIES times. A rejected request was not
+        applied, so it is safe to send again. Other threads writing to
+        the same workspace wait as well.
+        """
+        retries = int(app.config.get('JIRA_RATE_LIMIT_RETRIES', 5))
+        for attempt in range(retries + 1):
+            with _RETRY_LOCK:
+                pause = _RETRY_AT.get(self.base_url, 0.0) - time.monotonic()
+            if pause > 0:
+                time.sleep(pause)
+            resp = self.inner_request(method=method, url=url, **kwargs)
+            if getattr(resp, 'status_code', None) != 429 or attempt == retries:
+                return resp
+            wait = self._retry_after(resp)
+            with _RETRY_LOCK:
+                _RETRY_AT[self.base_url] = max(_RETRY_AT.get(self.base_url, 0.0),
+                                               time.monotonic() + wait)
+            print(f"{cc.WARNING} -- {cc.ENDC}Jira rate limit reached, "
+                  f"waiting {wait:.0f}s")
+        return resp
+
     def _iter_aql_objects(self, ql_query):
         """Yield every object for ``ql_query``, following AQL pagination."""
         url = f"{self.base_url}/v1/object/aql"
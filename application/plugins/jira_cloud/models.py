@@ -154,6 +154,28 @@ class JiraSchemaCache(db.Document):
     updated = db.DateTimeField()
     object_types = db.ListField(
         field=db.EmbeddedDocumentField(document_type='JiraSchemaObjectType'))
+    # Start of the last export which compared every host with Jira,
+    # reset by a schema sync
+    last_full_export = db.DateTimeField()
     meta = {
         'strict': False,
     }
+
+
+class JiraExportState(db.Document):
+    """
+    Hash of the attributes the export last wrote to (or found on) the
+    Jira object of a host, per object type. Hosts whose attributes hash
+    the same are not compared with Jira again until the next full export.
+    """
+    account = db.StringField(required=True)
+    hostname = db.StringField(required=True)
+    object_type_id = db.IntField(required=True)
+    object_id = db.StringField()
+    payload_hash = db.StringField()
+    meta = {
+        'strict': False,
+        'indexes': [
+            {'fields': ['account', 'hostname', 'object_type_id'], 'unique': True},
+        ],
+    }
@@ -76,6 +76,8 @@ class JiraSchemaSync(JiraCloud):
             cache = JiraSchemaCache(account=self.account_name)
         cache.updated = datetime.now()
         cache.object_types = object_types
+        # Attribute ids may have changed, compare every host next export
+        cache.last_full_export = None
         cache.save()
         print(f"{cc.OKGREEN} -- {cc.ENDC}Cached "
               f"{len(object_types)} object type(s) for '{self.account_name}'")
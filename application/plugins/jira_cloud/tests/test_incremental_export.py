@@ -0,0 +1,159 @@
+"""
+Unit tests for the incremental Jira Cloud export
+"""
+# pylint: disable=missing-function-docstring,protected-access
+import datetime
+import unittest
+from collections import defaultdict
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from application import app
+from application.plugins.jira_cloud import export as export_module
+from application.plugins.jira_cloud import jira_cloud as jira_module
+from application.plugins.jira_cloud.export import JiraCloudExport
+
+_TYPE = SimpleNamespace(name='Server', schema_name='IT', object_type_id=5)
+
+
+def _counts():
+    return defaultdict(lambda: {"updated": 0, "created": 0, "unchanged": 0,
+                                "skipped": 0, "failed": 0})
+
+
+def _jira_object(object_id, name, os_name):
+    return {'id': object_id, 'attributes': [
+        {'objectTypeAttributeId': 1, 'objectAttributeValues': [{'value': name}]},
+        {'objectTypeAttributeId': 2, 'objectAttributeValues': [{'value': os_name}]},
+    ]}
+
+
+class _ExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.syncer = JiraCloudExport.__new__(JiraCloudExport)
+        self.syncer.config = {'name': 'jira'}
+        self.syncer.account_name = 'jira'
+        self.syncer.base_url = 'https://api.atlassian.com/jsm/assets/workspace/w1'
+        self.syncer.headers = {}
+        self.syncer.auth = ('u', 'p')
+        self.syncer.debug = False
+        self.syncer.dry_run = False
+        self.syncer.update_only = False
+        self.syncer.log_details = []
+        self.syncer._type_state = {5: (_TYPE, {'Name': 1, 'OS': 2}, 1, {})}
+        self.syncer._known = {}
+        self.syncer._pending = defaultdict(list)
+        self.syncer.full_export = False
+
+
+class TestChangedHosts(_ExportTest):
+    """Only hosts whose attributes changed are compared with Jira."""
+
+    def _process(self, hostname, os_name, counts):
+        engine = MagicMock()
+        engine.get_outcomes.return_value = {'fields_by_type': {'5': {'OS': os_name}}}
+        with patch.object(self.syncer, 'get_attributes', return_value={'all': {}}):
+            self.syncer._process_host(SimpleNamespace(hostname=hostname), engine,
+                                      'jira_cloud_export', counts, print)
+
+    def test_unchanged_hash_is_skipped(self):
+        digest = JiraCloudExport.payload_hash(5, {2: 'Linux'})
+        self.syncer._known = {('srv1', 5): ('101', digest)}
+        counts = _counts()
+
+        self._process('srv1', 'Linux', counts)
+        self._process('srv2', 'Linux', counts)
+
+        self.assertEqual(counts[5]['unchanged'], 1)
+        self.assertEqual([entry[0] for entry in self.syncer._pending[5]], ['srv2'])
+
+    def test_changed_hosts_are_looked_up_by_name(self):
+        self.syncer._pending[5] = [
+            ('srv1', {2: 'Linux'}, 'h1'),
+            ('srv2', {2: 'Windows'}, 'h2'),
+            ('srv"3', {2: 'BSD'}, 'h3'),
+        ]
+        queries = []
+
+        def _aql(query):
+            queries.append(query)
+            return [_jira_object('101', 'srv1', 'Linux'), _jira_object('102', 'srv2', 'Linux')]
+
+        counts = _counts()
+        with patch.object(self.syncer, '_iter_aql_objects', side_effect=_aql):
+            jobs, written = self.syncer._plan_writes(counts, full=False)
+
+        self.assertEqual(queries, [
+            'objectType = "Server" AND "Name" IN ("srv\\"3", "srv1", "srv2")'])
+        self.assertEqual(written, {('srv1', 5): ('101', 'h1')})
+        self.assertEqual(jobs, [('srv2', 5, '102', {2: 'Windows'}, 'h2'),
+                                ('srv"3', 5, None, {2: 'BSD', 1: 'srv"3'}, 'h3')])
+        self.assertEqual(counts[5]['unchanged'], 1)
+
+    def test_many_changes_load_the_whole_type(self):
+        self.syncer._pending[5] = [(f"srv{number}", {2: 'Linux'}, 'h')
+                                   for number in range(3)]
+        with patch.object(self.syncer, '_iter_aql_objects', return_value=[]) as aql, \
+                patch.dict(app.config, {'JIRA_EXPORT_LOOKUP_LIMIT': 2}):
+            self.syncer._plan_writes(_counts(), full=False)
+        aql.assert_called_once_with('objectType = "Server"')
+
+
+class TestWrites(_ExportTest):
+    """Writes run in parallel and respect the rate limit."""
+
+    def test_rate_limited_write_is_repeated(self):
+        answers = [SimpleNamespace(status_code=429, headers={'Retry-After': '7'}),
+                   SimpleNamespace(status_code=201, headers={},
+                                   json=lambda: {'id': 301})]
+        with patch.object(self.syncer, 'inner_request', side_effect=answers) as request, \
+                patch.object(jira_module.time, 'sleep') as sleep:
+            error, object_id = self.syncer._post_object(5, {1: 'srv1'})
+
+        self.assertEqual((error, object_id), (None, '301'))
+        self.assertEqual(request.call_count, 2)
+        self.assertAlmostEqual(sleep.call_args.args[0], 7, delta=1)
+        jira_module._RETRY_AT.clear()
+
+    def test_export_stores_the_written_hashes(self):
+        rule = SimpleNamespace(outcomes=[SimpleNamespace(object_type_id=5)])
+        rules = MagicMock()
+        rules.objects.return_value.order_by.return_value = [rule]
+        hosts = MagicMock()
+        hosts.count.return_value = 2
+        hosts.__iter__.return_value = iter([SimpleNamespace(hostname='srv1'),
+                                            SimpleNamespace(hostname='srv2')])
+        engine = MagicMock()
+        engine.return_value.get_outcomes.side_effect = lambda host, _attrs: {
+            'fields_by_type': {'5': {'OS': f"os-{host.hostname}"}}}
+        schema = SimpleNamespace(last_full_export=datetime.datetime.now(), object_types=[_TYPE])
+        state = MagicMock()
+        state.objects.return_value.as_pymongo.return_value.only.return_value = []
+
+        with patch.object(export_module, 'Progress'), \
+                patch.object(export_module, 'JiraExportRule', rules), \
+                patch.object(export_module.Host, 'objects_by_filter', create=True,
+                             return_value=hosts), \
+                patch.object(export_module, 'JiraExportAttributeRule', engine), \
+                patch.object(export_module, 'JiraExportState', state), \
+                patch.object(self.syncer, '_load_schema', return_value=schema), \
+                patch.object(self.syncer, 'get_attributes', return_value={'all': {}}), \
+                patch.object(self.syncer, '_iter_aql_objects',
+                             return_value=[_jira_object('101', 'srv1', 'old')]), \
+                patch.object(self.syncer, '_put_object', return_value=None) as put, \
+                patch.object(self.syncer, '_post_object', return_value=(None, '102')):
+            self.syncer.export_objects()
+
+        put.assert_called_once_with('101', 5, {2: 'os-srv1'})
+        operations = state._get_collection.return_value.bulk_write.call_args.args[0]
+        self.assertEqual(sorted((op._doc['hostname'], op._doc['object_id'])
+                                for op in operations),
+                         [('srv1', '101'), ('srv2', '102')])
+        state._get_collection.return_value.delete_many.assert_not_called()
+        self.assertIn(('type 5', 'updated=1 created=1 unchanged=0 skipped=0 failed=0'),
+                      self.syncer.log_details)
+
+
+if __name__ == '__main__':
+    unittest.main()
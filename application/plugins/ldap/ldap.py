@@ -152,13 +152,16 @@ def ldap_import(account, debug=False):
     """
     config = get_account_by_name(account)
     config['debug'] = debug
-    for hostname, labels in _inner_import(config):
+
+    def _report(hostname, do_save):
         print(f" {ColorCodes.OKGREEN}** {ColorCodes.ENDC} Update {hostname}")
-        host_obj = Host.get_host(hostname)
-        do_save = host_obj.set_account(account_dict=config)
-        host_obj.update_host(labels)
         if do_save:
             print(f" {ColorCodes.OKGREEN} * {ColorCodes.ENDC} Updated Labels")
-            host_obj.save()
         else:
             print(f" {ColorCodes.WARNING} * {ColorCodes.ENDC} Managed by diffrent master")
+
+    with Host.import_session(config, on_result=_report) as session:
+        for hostname, labels in _inner_import(config):
+            session.add(hostname, labels)
+    for hostname, error in session.errors:
+        print(f" {ColorCodes.FAIL}Error: {hostname}: {error}{ColorCodes.ENDC}")
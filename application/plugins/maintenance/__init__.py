@@ -17,6 +17,7 @@ from application import app, logger, log
 from application._version import __version__ as _SYNCER_VERSION
 from application.models.host import Host
 from application.modules.debug import ColorCodes as CC
+from application.modules.rule.cache import HostRuleCache, get_cache_store
 from application.plugins.checkmk.poolfolder import remove_seat
 from application.models.account import Account
 from application.models.user import User
@@ -24,6 +25,7 @@ from application.plugins.checkmk.models import CheckmkFolderPool
 from application.models.config import Config
 from application.helpers.cron import register_cronjob
 from application.helpers.stale_indexes import drop_stale_indexes
+from application.helpers.query_plans import explain_hot_queries
 from application.helpers.get_account import get_account_by_name
 from application.helpers.retention import sync_all
 from application.helpers.plugins import register_cli_group
@@ -217,6 +219,29 @@ def _purge_orphaned_field_approvals():
     )
 
 
+def _purge_orphaned_rule_caches():
+    """
+    Delete rule cache entries whose host no longer exists.
+
+    ``HostRuleCache`` stores the host id as a plain ObjectId, so entries
+    of hosts deleted by earlier versions (or while the cache was still
+    being written) are not reached by the queryset cleanup.
+
+    Returns the number of entries removed.
+    """
+    host_ids = set(HostRuleCache.objects.distinct('host_id'))
+    if not host_ids:
+        return 0
+    alive = set(Host.objects(id__in=list(host_ids)).distinct('id'))
+    orphans = host_ids - alive
+    if not orphans:
+        return 0
+    print(f"{CC.UNDERLINE}Remove rule caches without a host{CC.ENDC}")
+    print(f"{CC.WARNING}  ** {CC.ENDC}{len(orphans)} deleted host(s) "
+          f"still cached")
+    return HostRuleCache.objects(host_id__in=list(orphans)).delete()
+
+
 def _purge_dangling_relations():
     """
     Drop relation edges that point at a host which no longer exists.
@@ -314,6 +339,7 @@ def maintenance(account):
 
     details.append(('field_approvals_closed', _purge_orphaned_field_approvals()))
     details.append(('dangling_relations_removed', _purge_dangling_relations()))
+    details.append(('rule_caches_removed', _purge_orphaned_rule_caches()))
 
     _log_maintenance_run(account, details, {
         'delete_hosts_after_days': days,
@@ -407,6 +433,7 @@ def clear_host_caches(cache_name=""):
     (case-insensitive) are removed. Otherwise the full cache is reset.
     Uses atomic updates to bypass full-document validation.
     """
+    get_cache_store().clear_all(cache_name)
     if not cache_name:
         Host.objects(cache__ne={}).update(set__cache={})
         return
@@ -684,6 +711,30 @@ def show_accounts():
         print(f"- Name: {account.name}, Type: {account.type}, Address: {account.address}")
 
 
+#.
+#   .-- Command: Explain Queries
+@_cli_sys.command('explain_queries')
+def explain_queries():
+    """
+    Show the plan MongoDB picks for the hot queries and flag
+    every one which has to scan the whole collection
+    """
+    collscans = 0
+    for name, stages, error in explain_hot_queries():
+        if error:
+            print(f"{CC.WARNING}  ?? {CC.ENDC}{name}: {error}")
+            continue
+        plan = " <- ".join(stages)
+        if 'COLLSCAN' in stages:
+            collscans += 1
+            print(f"{CC.FAIL}  !! {CC.ENDC}{name}: {plan}")
+        else:
+            print(f"{CC.OKGREEN}  ok {CC.ENDC}{name}: {plan}")
+    if collscans:
+        print(f"{CC.FAIL}{collscans} queries scan the whole collection, "
+              f"run 'sys self_configure' to create missing indexes{CC.ENDC}")
+
+
 #.
 #   .-- Command: Create User
 @_cli_sys.command('create_user')
@@ -887,6 +938,11 @@ def self_configure():
     for name, days, action in sync_all():
         print(f" -> {name}: TTL index {action} ({days} days)")
 
+    # Building the new Host indexes takes a while on a big collection,
+    # better here than on the first request after the update.
+    print("Create the indexes of the Host collection")
+    Host.ensure_indexes()
+
     print("Drop indexes the models no longer declare")
     for dropped in drop_stale_indexes():
         print(f" -> dropped {dropped}")
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 """Import Mysql Data"""
-from application import logger
+from application import app, logger
 from application.models.host import Host
 from application.helpers.get_account import get_account_by_name
 from application.modules.debug import ColorCodes
@@ -8,6 +8,8 @@ from application.helpers.inventory import run_inventory
 from application.helpers.sql import (
     build_select_query,
     custom_query_allow_ddl,
+    fetch_size,
+    iter_rows,
     validate_custom_query,
 )
 try:
@@ -15,15 +17,14 @@ try:
 except ImportError:
     pass
 
-def mysql_import(account):
-    """
-    Mysql Import
+def _query_rows(config):
     """
-    config = get_account_by_name(account)
-
-    print(f"{ColorCodes.OKCYAN}Started {ColorCodes.ENDC} with account "\
-          f"{ColorCodes.UNDERLINE}{config['name']}{ColorCodes.ENDC}")
+    Run the configured query and yield the rows as they arrive.
 
+    The plain query runs on an unbuffered cursor and is fetched in
+    chunks of SQL_FETCH_SIZE rows (account field fetch_size), so the
+    result set is never held as a whole.
+    """
     mydb = mysql.connector.connect(
       host=config["address"],
       user=config["username"],
@@ -37,41 +38,61 @@ def mysql_import(account):
     else:
         query = build_select_query(config['fields'], config['table'])
     logger.debug(query)
-    if allow_ddl:
-        # Multi-statement (CREATE …; SELECT …) needs multi=True on
-        # mysql.connector. Consume every result set and keep the last
-        # one that yields rows for the importer to iterate.
-        results = list(mycursor.execute(query, multi=True))
-        all_hosts = []
-        for stmt_result in results:
-            if stmt_result.with_rows:
-                all_hosts = stmt_result.fetchall()
-        mydb.commit()
-    else:
-        mycursor.execute(query)
-        all_hosts = mycursor.fetchall()
+    try:
+        if allow_ddl:
+            # Multi-statement (CREATE …; SELECT …) needs multi=True on
+            # mysql.connector. Consume every result set and keep the last
+            # one that yields rows for the importer to iterate. The
+            # buffered cursor already holds them.
+            result = None
+            for stmt_result in mycursor.execute(query, multi=True):
+                if stmt_result.with_rows:
+                    result = stmt_result
+            mydb.commit()
+            if result is not None:
+                yield from result.fetchall()
+        else:
+            mycursor.execute(query)
+            size = fetch_size(config, app.config.get('SQL_FETCH_SIZE', 1000))
+            yield from iter_rows(mycursor, size)
+    finally:
+        mydb.close()
+
+
+def mysql_import(account):
+    """
+    Mysql Import
+    """
+    config = get_account_by_name(account)
+
+    print(f"{ColorCodes.OKCYAN}Started {ColorCodes.ENDC} with account "\
+          f"{ColorCodes.UNDERLINE}{config['name']}{ColorCodes.ENDC}")
+
+    rows = _query_rows(config)
     field_names = config['fields'].split(',')
-    for line in all_hosts:
-        labels = dict(zip(field_names, line))
-        if not labels[config['hostname_field']]:
-            continue
-        hostname = labels[config['hostname_field']].strip()
-        if 'rewrite_hostname' in config and config['rewrite_hostname']:
-            hostname = Host.rewrite_hostname(hostname, config['rewrite_hostname'], labels)
-        if not hostname:
-            continue
-        print(f" {ColorCodes.OKGREEN}* {ColorCodes.ENDC} Check {hostname}")
-        del labels[config['hostname_field']]
 
-        host_obj = Host.get_host(hostname)
-        host_obj.update_host(labels)
-        do_save = host_obj.set_account(account_dict=config)
+    def _report(hostname, do_save):
+        print(f" {ColorCodes.OKGREEN}* {ColorCodes.ENDC} Check {hostname}")
         if do_save:
             print(f" {ColorCodes.OKBLUE} * {ColorCodes.ENDC} Updated Labels")
-            host_obj.save()
         else:
             print(f" {ColorCodes.WARNING} * {ColorCodes.ENDC} Managed by diffrent master")
 
+    with Host.import_session(config, on_result=_report) as session:
+        for line in rows:
+            labels = dict(zip(field_names, line))
+            if not labels[config['hostname_field']]:
+                continue
+            hostname = labels[config['hostname_field']].strip()
+            if 'rewrite_hostname' in config and config['rewrite_hostname']:
+                hostname = Host.rewrite_hostname(hostname, config['rewrite_hostname'], labels)
+            if not hostname:
+                continue
+            del labels[config['hostname_field']]
+            session.add(hostname, labels)
+    for hostname, error in session.errors:
+        print(f" {ColorCodes.FAIL}Error: {hostname}: {error}{ColorCodes.ENDC}")
+
 def mysql_inventorize(account):
     """
     Inventorize Hosts
@@ -81,43 +102,25 @@ def mysql_inventorize(account):
           f"{ColorCodes.UNDERLINE}{config['name']}{ColorCodes.ENDC}")
 
 
-    mydb = mysql.connector.connect(
-      host=config["address"],
-      user=config["username"],
-      password=config["password"],
-      database=config["database"]
-    )
-    allow_ddl = custom_query_allow_ddl(config)
-    mycursor = mydb.cursor() if not allow_ddl else mydb.cursor(buffered=True)
-    if "custom_query" in config and config['custom_query']:
-        query = validate_custom_query(config['custom_query'], allow_ddl=allow_ddl)
-    else:
-        query = build_select_query(config['fields'], config['table'])
-    if allow_ddl:
-        rows = []
-        for stmt_result in mycursor.execute(query, multi=True):
-            if stmt_result.with_rows:
-                rows = stmt_result.fetchall()
-        mydb.commit()
-    else:
-        mycursor.execute(query)
-        rows = mycursor.fetchall()
+    rows = _query_rows(config)
     field_names = config['fields'].split(',')
 
-    objects = []
     rewrite = config.get('rewrite_hostname')
-    for line in rows:
-        labels = dict(zip(field_names, line))
-        if not labels[config['hostname_field']]:
-            continue
-        hostname = labels[config['hostname_field']].strip()
-        if not hostname:
-            continue
-        del labels[config['hostname_field']]
-        # Mirror the import path so inventory writes land on the same
-        # host key as the matching importer.
-        if rewrite:
-            hostname = Host.rewrite_hostname(hostname, rewrite, labels)
 
-        objects.append((hostname, labels))
-    run_inventory(config, objects)
+    def _objects():
+        for line in rows:
+            labels = dict(zip(field_names, line))
+            if not labels[config['hostname_field']]:
+                continue
+            hostname = labels[config['hostname_field']].strip()
+            if not hostname:
+                continue
+            del labels[config['hostname_field']]
+            # Mirror the import path so inventory writes land on the same
+            # host key as the matching importer.
+            if rewrite:
+                hostname = Host.rewrite_hostname(hostname, rewrite, labels)
+
+            yield hostname, labels
+
+    run_inventory(config, _objects())
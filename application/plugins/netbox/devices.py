@@ -87,13 +87,22 @@ class SyncDevices(SyncNetbox):
     def export_hosts(self):
         """
         Update Devices Table in Netbox
+
+        The current devices are loaded once, creates and updates are
+        sent in bulk after all hosts are calculated.
         """
         current_netbox_devices = self.nb.dcim.devices
 
         object_filter = self.config['settings'].get(self.name, {}).get('filter')
         db_objects = Host.objects_by_filter(object_filter)
         total = db_objects.count()
-        found_hosts = []
+        devices = {device.name: device for device in current_netbox_devices.all()}
+        found_hosts = set()
+        creates = {}
+        updates = {}
+        # Hosts of the devices to create, they get the device id once it exists
+        created_hosts = {}
+        attr_name = f"{self.config['name']}_device_id"
         with Progress(SpinnerColumn(),
                       MofNCompleteColumn(),
                       *Progress.get_default_columns(),
@@ -121,24 +130,22 @@ class SyncDevices(SyncNetbox):
                     custom_rules = self.get_ip_id(custom_rules, all_attributes, 'primary_ip6')
 
 
-                    if device := current_netbox_devices.get(name=hostname):
+                    if device := devices.get(hostname):
                         # Update
                         if update_keys := self.get_update_keys(device, custom_rules,
                                                                ['primary_ip4', 'primary_ip6']):
                             self.console(f" * Update Device {hostname}: {update_keys}")
-                            device.update(update_keys)
+                            updates[hostname] = {'id': device.id, **update_keys}
                         else:
                             self.console(f" * Already up to date {hostname}")
+                            found_hosts.add(hostname)
                     else:
                         ### Create
                         self.console(f" * Create Device {hostname}")
                         payload = self.get_update_keys(False, custom_rules)
                         payload['name'] = hostname
-                        device = self.nb.dcim.devices.create(payload)
-                    # Mark as successfully synced only after create/update
-                    # returned without raising, so cleanup decommissions
-                    # devices whose API call failed.
-                    found_hosts.append(hostname)
+                        creates[hostname] = payload
+                        created_hosts[hostname] = db_host
 
                 except Exception as error:  # pylint: disable=broad-exception-caught
                     if self.debug:
@@ -148,17 +155,29 @@ class SyncDevices(SyncNetbox):
                 progress.advance(task1)
 
                 if device:
-                    attr_name = f"{self.config['name']}_device_id"
                     db_host.set_inventory_attribute(attr_name, device.id)
 
+            # Mark as successfully synced only after create/update
+            # returned without error, so cleanup decommissions
+            # devices whose API call failed.
+            found_hosts.update(self.bulk_write(current_netbox_devices, 'update',
+                                               list(updates.items())))
+            created = self.bulk_write(current_netbox_devices, 'create', list(creates.items()))
+            for hostname, device in created.items():
+                found_hosts.add(hostname)
+                created_hosts[hostname].set_inventory_attribute(attr_name, device.id)
+
             task2 = progress.add_task("Cleanup netbox", total=None)
+            decommission = []
             for device in current_netbox_devices.filter(cf_cmdbsyncer_id=str(self.account_id)):
                 if str(device.status) == 'Decommissioning':
                     continue
                 if device.name not in found_hosts:
                     self.console(f"* Set Inactive for {device.name}")
-                    device.update({"status": 'decommissioning'})
+                    decommission.append((device.name, {'id': device.id,
+                                                       'status': 'decommissioning'}))
                     progress.advance(task2)
+            self.bulk_write(current_netbox_devices, 'update', decommission)
 #.
 #   .--- Import Devices
     def import_hosts(self):
@@ -14,11 +14,65 @@ try:
 except ImportError:
     logger.info("Info: Netbox Plugin was not able to load required modules")
 
+
+class ReferenceResolver:
+    """
+    IDs of the objects other objects refer to (sites, roles, platforms...).
+    Every type is fetched once, with brief records, on its first lookup.
+    Objects the export creates are added, so the resolver stays current
+    for the rest of the run.
+    """
+
+    def __init__(self):
+        self._by_slug = {}
+        self._by_name = {}
+        self._ids = {}
+
+    def _load(self, obj_type, endpoint):
+        self._by_slug[obj_type] = {}
+        self._by_name[obj_type] = {}
+        for record in endpoint.filter(brief=1):
+            self._index(obj_type, record)
+
+    def _index(self, obj_type, record):
+        if slug := getattr(record, 'slug', None):
+            self._by_slug[obj_type].setdefault(slug, record.id)
+        if name := getattr(record, 'name', None):
+            self._by_name[obj_type].setdefault(str(name), record.id)
+
+    def lookup(self, obj_type, endpoint, name_field, value, slug=None):  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        """
+        ID of the object of `obj_type` with `value` in `name_field`,
+        or with `slug`. None if there is none.
+        """
+        if name_field == 'id':
+            # References by ID are only checked for existence
+            known = self._ids.setdefault(obj_type, set())
+            if value not in known:
+                if not endpoint.get(id=value):
+                    return None
+                known.add(value)
+            return value
+        if obj_type not in self._by_name:
+            self._load(obj_type, endpoint)
+        if slug and slug in self._by_slug[obj_type]:
+            return self._by_slug[obj_type][slug]
+        return self._by_name[obj_type].get(str(value))
+
+    def add(self, obj_type, record):
+        """
+        Register an object the export created
+        """
+        if obj_type in self._by_name:
+            self._index(obj_type, record)
+
+
 class SyncNetbox(Plugin):
     """
     Netbox Base Class
     """
     set_syncer_id = False
+    references = None
 
 #   . -- Init
     def __init__(self, account):
@@ -30,6 +84,8 @@ class SyncNetbox(Plugin):
             # Not needed in Debug_host Mode
             self.nb = pynetbox.api(self.config['address'], token=self.config['password'])
             self.nb.http_session.verify = self.verify
+            if app.config.get('NETBOX_PREFETCH_REFERENCES', True):
+                self.references = ReferenceResolver()
 #.
 #   . -- Helpers
     @staticmethod
@@ -92,9 +148,17 @@ class SyncNetbox(Plugin):
             if sub_obj['has_slug']:
                 logger.debug("B2) Field has slug")
                 create_obj['slug'] = self.get_slug(field_value)
-            if current := self.get_nested_attr(self.nb, obj_type).get(**create_obj):
-                logger.debug(f"B3) Found current ID value  {current.id}")
-                outer_id = current.id
+            endpoint = self.get_nested_attr(self.nb, obj_type)
+            if self.references:
+                current_id = self.references.lookup(obj_type, endpoint, name_field, field_value,
+                                                     create_obj.get('slug'))
+            elif current := endpoint.get(**create_obj):
+                current_id = current.id
+            else:
+                current_id = None
+            if current_id is not None:
+                logger.debug(f"B3) Found current ID value  {current_id}")
+                outer_id = current_id
             elif name_field != 'id':
                 # ID Fields mean reference, they are not created if not existing
                 logger.debug(f"B4) Need to create a new id, did not find {create_obj}")
@@ -102,7 +166,9 @@ class SyncNetbox(Plugin):
                     for extra_field in extra_fields:
                         create_obj[extra_field] = \
                                 self.get_name_or_id(extra_field, field_value, config)
-                new_obj = self.get_nested_attr(self.nb, obj_type).create(create_obj)
+                new_obj = endpoint.create(create_obj)
+                if self.references:
+                    self.references.add(obj_type, new_obj)
                 logger.debug(f"B4b) New id is {new_obj.id}")
                 outer_id = new_obj.id
             else:
@@ -299,22 +365,49 @@ class SyncNetbox(Plugin):
             value = new_list
         return value
 
-    def _handle_config(self, what, cfg, current_objects, name_field, progress, task):
+    def bulk_write(self, endpoint, method, entries):
+        """
+        Send `entries`, [(label, payload)], through the bulk `method`
+        ('create' or 'update') of `endpoint`, NETBOX_BULK_SIZE objects per
+        request. Returns {label: record} of the written objects.
+
+        Netbox rolls back a failing request as a whole, so the objects of
+        a failed chunk are sent one by one again, and every error is
+        reported for the object it belongs to.
+        """
+        written = {}
+        size = max(int(app.config.get('NETBOX_BULK_SIZE', 100)), 1)
+        for start in range(0, len(entries), size):
+            chunk = entries[start:start+size]
+            try:
+                records = getattr(endpoint, method)([payload for _, payload in chunk])
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                if self.debug:
+                    raise
+                if len(chunk) > 1:
+                    for entry in chunk:
+                        written.update(self.bulk_write(endpoint, method, [entry]))
+                    continue
+                label = chunk[0][0]
+                self.log_details.append((f'export_error {label}', str(error)))
+                self.console(f" Error in process: {label}: {error}")
+                continue
+            written.update(zip([label for label, _ in chunk], records))
+        return written
+
+    def _plan_config(self, what, cfg, current_objects, name_field, changes):
         """
-        Handle Single Entry of cfg
+        Handle Single Entry of cfg: add it to the creates or the updates
+        of `changes`. Entries for the same object are merged.
         """
         object_name = cfg['fields'][name_field]['value']
         if not object_name:
-            progress.advance(task)
             return
-        query = {
-            name_field:  object_name,
-        }
-        logger.debug(f"Filter Query: {query}")
-        if current_object := current_objects.get(**query):
+        creates, updates = changes
+        if current_object := current_objects.get(str(object_name)):
             if payload := self.get_update_keys(current_object, cfg):
                 self.console(f"* Update {what}: {object_name} {payload}")
-                current_object.update(payload)
+                updates.setdefault(str(object_name), {'id': current_object.id}).update(payload)
             else:
                 self.console(f"* {what} {object_name} already up to date")
         else:
@@ -322,19 +415,23 @@ class SyncNetbox(Plugin):
             self.console(f"* Create {what} {object_name}")
             payload = self.get_update_keys(False, cfg)
             logger.debug(f"Create Payload: {payload}")
-            current_object = current_objects.create(payload)
+            creates.setdefault(str(object_name), {}).update(payload)
 
-    def sync_generic(self, what, current_objects,
+    def sync_generic(self, what, endpoint,
                      name_field, list_mode=False, prevent_duplicates=False):
         """
         Generic Sync Function
         for Modules without special Need
+
+        The current objects are loaded once, the changes are collected
+        for all hosts and then sent in bulk.
         """
 
         object_filter = self.config['settings'].get(self.name, {}).get('filter')
         db_objects = Host.objects_by_filter(object_filter)
-        total = db_objects.count()
-        duplicate_list = []
+        current_objects = {str(getattr(obj, name_field)): obj for obj in endpoint.all()}
+        seen = set()
+        changes = ({}, {})
         with Progress(SpinnerColumn(),
                       MofNCompleteColumn(),
                       *Progress.get_default_columns(),
@@ -359,26 +456,13 @@ class SyncNetbox(Plugin):
                         progress.advance(task1)
                         continue
 
-                    if list_mode:
-                        for sub_cfg in cfg[list_mode]:
-                            if prevent_duplicates:
-                                seach_field = sub_cfg['fields'][prevent_duplicates]['value']
-                                if seach_field in duplicate_list:
-                                    progress.advance(task1)
-                                    continue
-                                duplicate_list.append(seach_field)
-                            self._handle_config(what, sub_cfg, current_objects,
-                                                name_field, progress, task1)
-                    else:
+                    for sub_cfg in cfg[list_mode] if list_mode else [cfg]:
                         if prevent_duplicates:
-                            seach_field = cfg['fields'][prevent_duplicates]['value']
-                            if seach_field in duplicate_list:
-                                progress.advance(task1)
+                            search_field = sub_cfg['fields'][prevent_duplicates]['value']
+                            if search_field in seen:
                                 continue
-                            duplicate_list.append(seach_field)
-                        self._handle_config(what, cfg, current_objects, name_field, progress, task1)
-
-
+                            seen.add(search_field)
+                        self._plan_config(what, sub_cfg, current_objects, name_field, changes)
 
                 except Exception as error:
                     if self.debug:
@@ -387,3 +471,7 @@ class SyncNetbox(Plugin):
                     print(f" Error in process: {error}")
 
                 progress.advance(task1)
+
+            creates, updates = changes
+            self.bulk_write(endpoint, 'create', list(creates.items()))
+            self.bulk_write(endpoint, 'update', list(updates.items()))
@@ -0,0 +1,145 @@
+"""
+Unit tests for the bulk writes of the Netbox exports
+"""
+# pylint: disable=missing-function-docstring
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from application import app
+from application.plugins.netbox import netbox as netbox_module
+from application.plugins.netbox import devices as devices_module
+from application.plugins.netbox.netbox import SyncNetbox
+from application.plugins.netbox.devices import SyncDevices
+
+
+def _syncer(cls=SyncNetbox):
+    syncer = cls.__new__(cls)
+    syncer.nb = MagicMock()
+    syncer.config = {'name': 'nb', 'settings': {}}
+    syncer.account_id = 'account-id'
+    syncer.log_details = []
+    syncer.debug = False
+    syncer.console = MagicMock()
+    return syncer
+
+
+def _db_host(hostname):
+    return MagicMock(hostname=hostname)
+
+
+class TestBulkWrite(unittest.TestCase):
+    """Chunking and the per object fallback."""
+
+    def test_entries_are_sent_in_chunks(self):
+        syncer = _syncer()
+        endpoint = MagicMock()
+        endpoint.create.side_effect = lambda payloads: [
+            SimpleNamespace(id=payload['name']) for payload in payloads]
+        entries = [(name, {'name': name}) for name in 'abcde']
+
+        with patch.dict(app.config, {'NETBOX_BULK_SIZE': 2}):
+            written = syncer.bulk_write(endpoint, 'create', entries)
+
+        self.assertEqual(endpoint.create.call_count, 3)
+        self.assertEqual({label: record.id for label, record in written.items()},
+                         {name: name for name in 'abcde'})
+
+    def test_failed_chunk_is_retried_per_object(self):
+        syncer = _syncer()
+        endpoint = MagicMock()
+
+        def create(payloads):
+            if any(payload['name'] == 'bad' for payload in payloads):
+                raise ValueError('name invalid')
+            return [SimpleNamespace(id=1) for _ in payloads]
+        endpoint.create.side_effect = create
+
+        with patch.dict(app.config, {'NETBOX_BULK_SIZE': 10}):
+            written = syncer.bulk_write(endpoint, 'create', [
+                ('good', {'name': 'good'}), ('bad', {'name': 'bad'})])
+
+        self.assertEqual(list(written), ['good'])
+        self.assertEqual(syncer.log_details, [('export_error bad', 'name invalid')])
+
+
+class TestSyncGeneric(unittest.TestCase):
+    """sync_generic loads the current objects once and writes in bulk."""
+
+    def setUp(self):
+        self.syncer = _syncer()
+        self.syncer.get_attributes = lambda db_host, _name: {'all': {}}
+        self.configs = {
+            'a': {'fields': {'name': {'value': 'known'}, 'site': {'value': 'x'}}},
+            'b': {'fields': {'name': {'value': 'new'}, 'site': {'value': 'y'}}},
+            'c': {'fields': {'name': {'value': 'new'}, 'site': {'value': 'y'}}},
+        }
+        self.syncer.get_host_data = lambda db_host, _attrs: self.configs[db_host.hostname]
+        self.syncer.get_update_keys = lambda current, cfg: {
+            key: field['value'] for key, field in cfg['fields'].items()}
+        patches = (
+            patch.object(netbox_module, 'Host'),
+            patch.object(netbox_module, 'Progress'),
+        )
+        for item in patches:
+            item.start()
+            self.addCleanup(item.stop)
+        netbox_module.Host.objects_by_filter.return_value = [
+            _db_host('a'), _db_host('b'), _db_host('c')]
+
+    def test_changes_are_sent_in_bulk(self):
+        endpoint = MagicMock()
+        endpoint.all.return_value = [SimpleNamespace(id=4, name='known')]
+        endpoint.create.return_value = [SimpleNamespace(id=5)]
+        endpoint.update.return_value = [SimpleNamespace(id=4)]
+
+        self.syncer.sync_generic('Contact', endpoint, 'name', prevent_duplicates='name')
+
+        endpoint.get.assert_not_called()
+        endpoint.create.assert_called_once_with([{'name': 'new', 'site': 'y'}])
+        endpoint.update.assert_called_once_with([{'id': 4, 'name': 'known', 'site': 'x'}])
+
+
+class TestExportDevices(unittest.TestCase):
+    """Devices are created, updated and decommissioned in bulk."""
+
+    def test_export_hosts(self):
+        syncer = _syncer(SyncDevices)
+        hosts = {name: _db_host(name) for name in ('old', 'new', 'broken')}
+        syncer.get_attributes = lambda db_host, _name: {'all': {}}
+        syncer.get_host_data = lambda db_host, _attrs: {'fields': {}}
+        syncer.get_ip_id = lambda rules, _attrs, _mode: rules
+        syncer.get_update_keys = lambda current, cfg, _ids=None: {'status': 'active'}
+        devices = syncer.nb.dcim.devices
+        devices.all.return_value = [SimpleNamespace(id=1, name='old'),
+                                    SimpleNamespace(id=2, name='broken')]
+        devices.filter.return_value = [
+            SimpleNamespace(id=2, name='broken', status='Active'),
+            SimpleNamespace(id=3, name='gone', status='Active')]
+        devices.create.return_value = [SimpleNamespace(id=9)]
+
+        def update(payloads):
+            if {'id': 2, 'status': 'active'} in payloads:
+                raise ValueError('invalid')
+            return payloads
+        devices.update.side_effect = update
+
+        with patch.object(devices_module, 'Host') as host_model, \
+             patch.object(devices_module, 'Progress'), \
+             patch.dict(app.config, {'NETBOX_BULK_SIZE': 10}):
+            host_model.objects_by_filter.return_value.__iter__.return_value = \
+                    list(hosts.values())
+            syncer.export_hosts()
+
+        devices.get.assert_not_called()
+        devices.create.assert_called_once_with([{'status': 'active', 'name': 'new'}])
+        hosts['new'].set_inventory_attribute.assert_called_once_with('nb_device_id', 9)
+        # 'broken' failed to update, so it is decommissioned with 'gone'
+        self.assertEqual(devices.update.call_args_list[-1].args[0], [
+            {'id': 2, 'status': 'decommissioning'},
+            {'id': 3, 'status': 'decommissioning'}])
+        self.assertIn(('export_error broken', 'invalid'), syncer.log_details)
+
+
+if __name__ == '__main__':
+    unittest.main()
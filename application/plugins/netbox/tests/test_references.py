@@ -0,0 +1,98 @@
+"""
+Unit tests for the prefetched Netbox reference lookups
+"""
+# pylint: disable=missing-function-docstring
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from application.plugins.netbox.netbox import ReferenceResolver, SyncNetbox
+
+
+def _endpoint(*records):
+    endpoint = MagicMock()
+    endpoint.filter.return_value = [SimpleNamespace(**record) for record in records]
+    return endpoint
+
+
+class TestReferenceResolver(unittest.TestCase):
+    """Lookups are served from one brief fetch per object type."""
+
+    def test_type_is_fetched_once(self):
+        endpoint = _endpoint({'id': 1, 'name': 'Berlin', 'slug': 'berlin'},
+                             {'id': 2, 'name': 'Munich', 'slug': 'munich'})
+        resolver = ReferenceResolver()
+
+        self.assertEqual(resolver.lookup('dcim.sites', endpoint, 'name', 'Berlin', 'berlin'), 1)
+        self.assertEqual(resolver.lookup('dcim.sites', endpoint, 'name', 'Munich', 'munich'), 2)
+        self.assertIsNone(resolver.lookup('dcim.sites', endpoint, 'name', 'Rome', 'rome'))
+
+        endpoint.filter.assert_called_once_with(brief=1)
+        endpoint.get.assert_not_called()
+
+    def test_slug_matches_records_without_name(self):
+        # Device types have a model, no name
+        endpoint = _endpoint({'id': 7, 'model': 'DL360', 'slug': 'dl360'})
+        resolver = ReferenceResolver()
+        self.assertEqual(
+            resolver.lookup('dcim.device-types', endpoint, 'name', 'DL360', 'dl360'), 7)
+
+    def test_created_objects_are_found(self):
+        endpoint = _endpoint()
+        resolver = ReferenceResolver()
+        self.assertIsNone(resolver.lookup('ipam.vrfs', endpoint, 'name', 'prod'))
+
+        resolver.add('ipam.vrfs', SimpleNamespace(id=3, name='prod'))
+
+        self.assertEqual(resolver.lookup('ipam.vrfs', endpoint, 'name', 'prod'), 3)
+        endpoint.filter.assert_called_once()
+
+    def test_id_references_are_checked_once(self):
+        endpoint = MagicMock()
+        resolver = ReferenceResolver()
+        self.assertEqual(resolver.lookup('ipam.ip-addresses', endpoint, 'id', 12), 12)
+        self.assertEqual(resolver.lookup('ipam.ip-addresses', endpoint, 'id', 12), 12)
+        endpoint.get.assert_called_once_with(id=12)
+        endpoint.filter.assert_not_called()
+
+        endpoint.get.return_value = None
+        self.assertIsNone(resolver.lookup('ipam.ip-addresses', endpoint, 'id', 13))
+
+
+class TestGetNameOrId(unittest.TestCase):
+    """SyncNetbox.get_name_or_id with the resolver."""
+
+    def setUp(self):
+        self.syncer = SyncNetbox.__new__(SyncNetbox)
+        self.syncer.nb = MagicMock()
+        self.syncer.references = ReferenceResolver()
+        self.syncer.get_field_config = lambda: {
+            'site': {'type': 'dcim.sites', 'has_slug': True},
+        }
+        self.sites = self.syncer.nb.dcim.sites
+        self.sites.filter.return_value = [SimpleNamespace(id=1, name='Berlin',
+                                                          slug='berlin')]
+
+    def test_existing_reference_needs_no_request(self):
+        for _ in range(3):
+            self.assertEqual(self.syncer.get_name_or_id('site', 'Berlin', {}), 1)
+        self.sites.filter.assert_called_once()
+        self.sites.get.assert_not_called()
+        self.sites.create.assert_not_called()
+
+    def test_missing_reference_is_created_once(self):
+        self.sites.create.return_value = SimpleNamespace(id=5, name='Rome', slug='rome')
+        for _ in range(2):
+            self.assertEqual(self.syncer.get_name_or_id('site', 'Rome', {}), 5)
+        self.sites.create.assert_called_once_with({'name': 'Rome', 'slug': 'rome'})
+
+    def test_without_resolver_every_lookup_asks_netbox(self):
+        self.syncer.references = None
+        self.sites.get.return_value = SimpleNamespace(id=1)
+        self.syncer.get_name_or_id('site', 'Berlin', {})
+        self.syncer.get_name_or_id('site', 'Berlin', {})
+        self.assertEqual(self.sites.get.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
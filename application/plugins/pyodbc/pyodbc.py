@@ -16,6 +16,8 @@ from syncerapi.v1.inventory import run_inventory
 from application.helpers.sql import (
     build_select_query,
     custom_query_allow_ddl,
+    fetch_size,
+    iter_rows,
     validate_custom_query,
 )
 
@@ -87,13 +89,17 @@ class ODBC(Plugin):
                 # reach the one that actually has columns.
                 while cursor.description is None and cursor.nextset():
                     pass
-            rows = cursor.fetchall()
-            logger.debug("Fetch Executed: %s", cursor.description)
+            logger.debug("Fetching rows: %s", cursor.description)
             columns = [column[0] for column in cursor.description]
-            # Commit *after* fetch — on unixODBC a commit between
-            # execute() and fetchall() invalidates the open cursor and
-            # the next fetch raises HY010 Function sequence error.
+            size = fetch_size(self.config, app_config.get('SQL_FETCH_SIZE', 1000))
+            rows = iter_rows(cursor, size)
             if allow_ddl:
+                # Commit *after* fetch — on unixODBC a commit between
+                # execute() and the last fetch invalidates the open cursor
+                # and the next fetch raises HY010 Function sequence error.
+                # The bootstrap tables are small, read them before the
+                # commit; plain queries stream chunk by chunk.
+                rows = list(rows)
                 cursor.close()
                 cnxn.commit()
             for row in rows:
@@ -105,6 +111,7 @@ class ODBC(Plugin):
                 found_hosts += 1
                 yield hostname, labels
             self.log_details.append(("found_hosts", found_hosts))
+            cnxn.close()
         except NameError as error:
             print(f"EXCEPTION: Missing requirements, pypyodbc or sqlserverport ({error})")
 
@@ -112,30 +119,34 @@ class ODBC(Plugin):
         """
         ODBC Import
         """
-        for hostname, labels in self._innter_sql():
-            if 'rewrite_hostname' in self.config and self.config['rewrite_hostname']:
-                hostname = Host.rewrite_hostname(hostname,
-                                                 self.config['rewrite_hostname'], labels)
+        def _report(hostname, do_save):
             print(f" {cc.OKGREEN}* {cc.ENDC} Check {hostname}")
-            del labels[self.config['hostname_field']]
-            host_obj = Host.get_host(hostname)
-            host_obj.update_host(labels)
-            do_save=host_obj.set_account(account_dict=self.config)
-            if do_save:
-                host_obj.save()
-            else:
+            if not do_save:
                 print(f" {cc.WARNING} * {cc.ENDC} Managed by diffrent master")
 
+        with Host.import_session(self.config, on_result=_report) as session:
+            for hostname, labels in self._innter_sql():
+                if 'rewrite_hostname' in self.config and self.config['rewrite_hostname']:
+                    hostname = Host.rewrite_hostname(hostname,
+                                                     self.config['rewrite_hostname'], labels)
+                del labels[self.config['hostname_field']]
+                session.add(hostname, labels)
+        for hostname, error in session.errors:
+            self.log_details.append((f'import_error {hostname}', error))
+            print(f" {cc.FAIL}Error: {hostname}: {error}{cc.ENDC}")
+
     def sql_inventorize(self):
         """
         ODBC Inventorize
         """
         rewrite = self.config.get('rewrite_hostname')
-        entries = []
-        for hostname, labels in self._innter_sql():
-            # Mirror the import path so inventory writes land on the
-            # same host key as the matching importer.
-            if rewrite:
-                hostname = Host.rewrite_hostname(hostname, rewrite, labels)
-            entries.append((hostname, labels))
-        run_inventory(self.config, entries)
+
+        def _entries():
+            for hostname, labels in self._innter_sql():
+                # Mirror the import path so inventory writes land on the
+                # same host key as the matching importer.
+                if rewrite:
+                    hostname = Host.rewrite_hostname(hostname, rewrite, labels)
+                yield hostname, labels
+
+        run_inventory(self.config, _entries())
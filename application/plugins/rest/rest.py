@@ -13,6 +13,7 @@ from application.models.host import Host
 from application.modules.plugin import Plugin, ResponseDataException
 from application.modules.debug import ColorCodes
 from application.helpers.inventory import run_inventory
+from application.helpers.pagination import iter_pages, pagination_style
 
 
 class RestImport(Plugin):
@@ -24,6 +25,30 @@ class RestImport(Plugin):
     def get_by_http(self):
         """
         Get Json Data by HTTP
+
+        With pagination configured on the account, the records are
+        returned as a generator which loads the pages while the import
+        consumes them.
+        """
+        request = self._request_params()
+        if pagination_style(self.config):
+            return self._paged_records(request)
+        return self._decode(self.inner_request(**request))
+
+    def _paged_records(self, request):
+        for page in iter_pages(self, request, self._decode, self.records):
+            yield from page
+
+    @staticmethod
+    def _decode(response):
+        try:
+            return response.json()
+        except JSONDecodeError as error:
+            raise ResponseDataException(f"{response.text}\n Response is no valid JSON!") from error
+
+    def _request_params(self):
+        """
+        Keyword arguments of inner_request for the configured API
         """
         headers = {}
         auth = None
@@ -57,12 +82,7 @@ class RestImport(Plugin):
             params['auth'] = auth
         if cert:
             params['cert'] = cert
-
-        response = self.inner_request(**params)
-        try:
-            return response.json()
-        except JSONDecodeError as error:
-            raise ResponseDataException(f"{response.text}\n Response is no valid JSON!") from error
+        return params
 
     def get_from_file(self):
         """
@@ -74,49 +94,57 @@ class RestImport(Plugin):
             return data
         return []
 
+    def records(self, data):
+        """
+        The list of records in a response body. Records coming from
+        get_by_http() in pages are passed through.
+        """
+        if self.config.get('data_key') and isinstance(data, dict):
+            return data[self.config['data_key']]
+        return data
+
     def import_hosts(self, data):
         """
         Import Hosts
         """
-        if self.config.get('data_key'):
-            data = data[self.config['data_key']]
-
-        for entry in data:
-            hostname = entry[self.config['hostname_field']]
-            if not hostname:
-                continue
-            del entry[self.config['hostname_field']]
-            if 'rewrite_hostname' in self.config and self.config['rewrite_hostname']:
-                hostname = Host.rewrite_hostname(hostname, self.config['rewrite_hostname'], entry)
+        data = self.records(data)
 
+        def _report(hostname, _do_save):
             print(f" {ColorCodes.OKGREEN}** {ColorCodes.ENDC} Update {hostname}")
-            host_obj = Host.get_host(hostname)
-            host_obj.update_host(entry)
 
-            do_save = host_obj.set_account(account_dict=self.config)
-
-            if do_save:
-                host_obj.save()
+        with Host.import_session(self.config, on_result=_report) as session:
+            for entry in data:
+                hostname = entry[self.config['hostname_field']]
+                if not hostname:
+                    continue
+                del entry[self.config['hostname_field']]
+                if 'rewrite_hostname' in self.config and self.config['rewrite_hostname']:
+                    hostname = Host.rewrite_hostname(hostname,
+                                                     self.config['rewrite_hostname'], entry)
+                session.add(hostname, entry)
+        for hostname, error in session.errors:
+            self.log_details.append((f'import_error {hostname}', error))
+            print(f" {ColorCodes.FAIL}Error: {hostname}: {error}{ColorCodes.ENDC}")
 
     def inventorize_objects(self, data):
         """
         Inventorize Hosts
         """
-        if self.config.get('data_key'):
-            data = data[self.config['data_key']]
+        data = self.records(data)
         hostname_field = self.config['hostname_field']
         rewrite = self.config.get('rewrite_hostname')
-        entries = []
-        for entry in data:
-            hostname = entry.get(hostname_field)
-            if not hostname:
-                continue
-            # Mirror the import path so inventory writes land on the
-            # same host key as the matching importer.
-            if rewrite:
-                hostname = Host.rewrite_hostname(hostname, rewrite, entry)
-            entries.append((hostname, entry))
-        run_inventory(self.config, entries)
+
+        def entries():
+            for entry in data:
+                hostname = entry.get(hostname_field)
+                if not hostname:
+                    continue
+                # Mirror the import path so inventory writes land on the
+                # same host key as the matching importer.
+                if rewrite:
+                    hostname = Host.rewrite_hostname(hostname, rewrite, entry)
+                yield hostname, entry
+        run_inventory(self.config, entries())
 
 
 
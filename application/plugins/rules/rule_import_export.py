@@ -16,6 +16,7 @@ import importlib
 from datetime import datetime
 
 from mongoengine.errors import NotUniqueError, ValidationError
+from application.modules.rule.cache import bump_rule_version
 from .rule_definitions import rules as enabled_rules
 
 
@@ -115,6 +116,9 @@ def _save_rule(json_dict, model_class):
         return 'duplicate'
     except ValidationError:
         return 'invalid'
+    # Saved directly, not through the rule views — invalidate the
+    # cached outcomes of this rule type here
+    bump_rule_version(model_class._get_collection_name())  # pylint: disable=protected-access
     return 'imported'
 
 
@@ -0,0 +1,25 @@
+"""
+ServiceNow Import State
+"""
+# pylint: disable=too-few-public-methods
+from application import db
+
+
+class ServiceNowTableState(db.Document):
+    """
+    Last successful import of a table, per account, for incremental runs
+    """
+
+    account = db.StringField(required=True)
+    table = db.StringField(required=True)
+    # Start of the last run which read the table to the end
+    last_run = db.DateTimeField()
+    # Start of the last run which read the whole table
+    last_full_run = db.DateTimeField()
+
+    meta = {
+        'strict': False,
+        'indexes': [
+            {'fields': ['account', 'table'], 'unique': True},
+        ],
+    }
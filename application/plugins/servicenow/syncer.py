@@ -1,11 +1,16 @@
 """
 Import objects from ServiceNow
 """
+import datetime
+import math
+
 from requests.auth import HTTPBasicAuth
 
+from application import app
 from application.models.host import Host
 from application.modules.debug import ColorCodes as CC
 from application.modules.plugin import Plugin
+from application.plugins.servicenow.models import ServiceNowTableState
 
 
 class ServiceNowError(Exception):
@@ -41,10 +46,52 @@ class SyncServiceNow(Plugin):
 
 #.
 #   .-- Read one table (paged)
-    def get_table(self, table):
+    def _base_params(self, limit):
+        """
+        Query parameters every page request of a table sends
+        """
+        params = {
+            'sysparm_limit': limit,
+            'sysparm_display_value': self.config.get('sysparm_display_value', 'true'),
+            'sysparm_exclude_reference_link': 'true',
+        }
+        if fields := self.config.get('sysparm_fields'):
+            params['sysparm_fields'] = fields
+        return params
+
+    def _get_page(self, url, params, auth):
+        """
+        Request one page of records
+        """
+        response = self.inner_request(
+            'GET', url=url, params=params, auth=auth,
+            headers={'Accept': 'application/json'},
+        )
+
+        if response.status_code == 401:
+            raise ServiceNowError(
+                "Invalid login for ServiceNow, check username/password and roles")
+
+        payload = response.json()
+        if 'error' in payload:
+            raise ServiceNowError(payload['error'].get('message', payload['error']))
+        return payload.get('result', [])
+
+    def _query(self, *conditions):
+        """
+        The configured sysparm_query, ANDed with `conditions`
         """
-        Yield all records of a ServiceNow table, paging through the
-        Table API with sysparm_limit/sysparm_offset until exhausted.
+        parts = [self.config.get('sysparm_query') or '', *conditions]
+        return '^'.join(part for part in parts if part)
+
+    def get_table(self, table, updated_minutes=None):
+        """
+        Yield all records of a ServiceNow table.
+
+        The account field paging selects how: ``offset`` (default) pages
+        with sysparm_limit/sysparm_offset, ``keyset`` follows the sys_id
+        order, see _keyset_pages(). With `updated_minutes` only records
+        updated in that many minutes are read.
         """
         address = self.config['address'].rstrip('/')
         url = f"{address}/api/now/table/{table}"
@@ -55,33 +102,27 @@ class SyncServiceNow(Plugin):
         except (TypeError, ValueError):
             limit = 1000
 
+        since = None
+        if updated_minutes:
+            # Evaluated by the instance, so the time zone of the API user
+            # does not matter
+            since = f"sys_updated_on>=javascript:gs.minutesAgoStart({updated_minutes})"
+
+        paging = (self.config.get('paging') or 'offset').strip().lower()
+        if paging == 'keyset':
+            yield from self._keyset_pages(url, auth, limit, since)
+            return
+        if paging != 'offset':
+            raise ServiceNowError(f"Unknown paging {paging!r}, use offset or keyset")
+
         offset = 0
         while True:
-            params = {
-                'sysparm_limit': limit,
-                'sysparm_offset': offset,
-                'sysparm_display_value': self.config.get('sysparm_display_value', 'true'),
-                'sysparm_exclude_reference_link': 'true',
-            }
-            if query := self.config.get('sysparm_query'):
+            params = self._base_params(limit)
+            params['sysparm_offset'] = offset
+            if query := self._query(since):
                 params['sysparm_query'] = query
-            if fields := self.config.get('sysparm_fields'):
-                params['sysparm_fields'] = fields
 
-            response = self.inner_request(
-                'GET', url=url, params=params, auth=auth,
-                headers={'Accept': 'application/json'},
-            )
-
-            if response.status_code == 401:
-                raise ServiceNowError(
-                    "Invalid login for ServiceNow, check username/password and roles")
-
-            payload = response.json()
-            if 'error' in payload:
-                raise ServiceNowError(payload['error'].get('message', payload['error']))
-
-            results = payload.get('result', [])
+            results = self._get_page(url, params, auth)
             if not results:
                 break
 
@@ -91,6 +132,95 @@ class SyncServiceNow(Plugin):
                 break
             offset += limit
 
+    @staticmethod
+    def sys_id_ranges(count):
+        """
+        Split the sys_id space into `count` ranges of (lower, upper)
+        prefixes, None for open ends. sys_ids are random hex strings, so
+        the ranges hold about the same number of records.
+        """
+        count = min(max(count, 1), 256)
+        bounds = [None] + [f"{256 * number // count:02x}" for number in range(1, count)] \
+            + [None]
+        return list(zip(bounds, bounds[1:]))
+
+    def _keyset_pages(self, url, auth, limit, since):  # pylint: disable=too-many-locals
+        """
+        Yield the records ordered by sys_id, every page filtered past the
+        last sys_id of the one before. Unlike deep offsets, the instance
+        finds every page by the index.
+
+        The account field partitions splits the table into sys_id ranges
+        whose pages load at the same time, one request per range and
+        round, see map_requests().
+        """
+        configured = self.config.get('sysparm_query') or ''
+        if 'ORDERBY' in configured or '^NQ' in configured:
+            raise ServiceNowError(
+                "keyset paging needs a sysparm_query without ORDERBY and ^NQ")
+        params = self._base_params(limit)
+        params['sysparm_no_count'] = 'true'
+        fields = params.get('sysparm_fields')
+        added_key = bool(fields) and 'sys_id' not in fields.split(',')
+        if added_key:
+            params['sysparm_fields'] = f"{fields},sys_id"
+
+        def fetch(partition):
+            lower, upper, last = partition
+            conditions = [since, f"sys_id>{last}" if last else
+                          (f"sys_id>={lower}" if lower else None),
+                          f"sys_id<{upper}" if upper else None]
+            query = self._query(*conditions, 'ORDERBYsys_id')
+            return self._get_page(url, dict(params, sysparm_query=query), auth)
+
+        try:
+            count = int(self.config.get('partitions') or 1)
+        except (TypeError, ValueError):
+            count = 1
+        active = [(lower, upper, None) for lower, upper in self.sys_id_ranges(count)]
+        while active:
+            following = []
+            for (lower, upper, _), results, error in self.map_requests(fetch, active):
+                if error:
+                    raise error
+                if len(results) == limit:
+                    key = results[-1]['sys_id']
+                    if isinstance(key, dict):
+                        key = key.get('value')
+                    following.append((lower, upper, key))
+                for record in results:
+                    if added_key:
+                        record.pop('sys_id', None)
+                    yield record
+            active = following
+
+#.
+#   .-- Incremental state
+    def table_state(self, table):
+        """
+        Stored state of the last runs of `table`
+        """
+        state = ServiceNowTableState.objects(account=self.config['id'], table=table).first()
+        if not state:
+            state = ServiceNowTableState(account=self.config['id'], table=table)
+        return state
+
+    @staticmethod
+    def updated_minutes(state, started):
+        """
+        Minutes to look back for changes since the last run, None if the
+        whole table must be read: there is no last run, or the last full
+        read is older than SERVICENOW_FULL_SYNC_INTERVAL. The full reads
+        mark the unchanged hosts as seen, so the host cleanup keeps working.
+        """
+        if not state.last_run or not state.last_full_run:
+            return None
+        max_age = app.config.get('SERVICENOW_FULL_SYNC_INTERVAL', 86400)
+        if (started - state.last_full_run).total_seconds() > max_age:
+            return None
+        # One extra minute, the instance clock may differ from ours
+        return math.ceil((started - state.last_run).total_seconds() / 60) + 1
+
 #.
 #   .-- Import hosts
     def import_hosts(self):
@@ -105,8 +235,16 @@ class SyncServiceNow(Plugin):
         for table in tables:
             print(f"{CC.OKGREEN} -- {CC.ENDC}ServiceNow: Processing table {table}")
             count = 0
+            started = datetime.datetime.now()
+            state = updated_minutes = None
+            if self.config.get('incremental'):
+                state = self.table_state(table)
+                updated_minutes = self.updated_minutes(state, started)
+                if updated_minutes:
+                    print(f"{CC.OKBLUE} -- {CC.ENDC}Changes of the last "
+                          f"{updated_minutes} minutes only")
 
-            for record in self.get_table(table):
+            for record in self.get_table(table, updated_minutes):
                 labels = self.flatten_record(record)
 
                 hostname = labels.get(hostname_field)
@@ -130,3 +268,9 @@ class SyncServiceNow(Plugin):
                     print(f"{CC.WARNING} * {CC.ENDC} Managed by different master")
 
             print(f"{CC.OKGREEN} -- {CC.ENDC}Imported {count} objects from {table}\n")
+
+            if state is not None:
+                state.last_run = started
+                if not updated_minutes:
+                    state.last_full_run = started
+                state.save()
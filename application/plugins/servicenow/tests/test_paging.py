@@ -0,0 +1,120 @@
+"""
+Unit tests for the keyset paging and incremental runs of the ServiceNow import
+"""
+# pylint: disable=missing-function-docstring,protected-access
+import datetime
+import operator
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from application import app
+from application.plugins.servicenow.syncer import ServiceNowError, SyncServiceNow
+
+_OPERATORS = {'>=': operator.ge, '>': operator.gt, '<': operator.lt}
+
+
+class _Table:  # pylint: disable=too-few-public-methods
+    """Answers Table API requests from a list of records."""
+
+    def __init__(self, sys_ids):
+        self.records = [{'sys_id': sys_id, 'name': f"srv-{sys_id}"} for sys_id in sys_ids]
+        self.queries = []
+
+    def answer(self, _method, url, params, **_kwargs):
+        del url
+        query = params.get('sysparm_query', '')
+        self.queries.append(query)
+        records = sorted(self.records, key=lambda record: record['sys_id'])
+        for condition in query.split('^'):
+            for symbol, compare in _OPERATORS.items():
+                if condition.startswith(f"sys_id{symbol}"):
+                    bound = condition[len(symbol) + 6:]
+                    records = [record for record in records
+                               if compare(record['sys_id'], bound)]
+                    break
+        start = params.get('sysparm_offset', 0)
+        page = records[start:start + params['sysparm_limit']]
+        if fields := params.get('sysparm_fields'):
+            page = [{key: record[key] for key in fields.split(',')} for record in page]
+        return SimpleNamespace(status_code=200, json=lambda: {'result': page})
+
+
+class TestKeysetPaging(unittest.TestCase):
+    """Keyset paging follows the sys_id order in partitions."""
+
+    def setUp(self):
+        self.syncer = SyncServiceNow.__new__(SyncServiceNow)
+        self.syncer.config = {'address': 'https://sn.example.com', 'username': 'u',
+                              'password': 'p', 'sysparm_limit': '2', 'paging': 'keyset'}
+        self.table = _Table(['0a', '3f', '41', '7e', '80', 'c1', 'ff'])
+        self.syncer.inner_request = MagicMock(side_effect=self.table.answer)
+
+    def test_pages_follow_the_last_sys_id(self):
+        names = [record['name'] for record in self.syncer.get_table('cmdb_ci_server')]
+
+        self.assertEqual(names, [f"srv-{record['sys_id']}" for record in self.table.records])
+        self.assertEqual(self.table.queries, [
+            'ORDERBYsys_id', 'sys_id>3f^ORDERBYsys_id', 'sys_id>7e^ORDERBYsys_id',
+            'sys_id>c1^ORDERBYsys_id'])
+        for call in self.syncer.inner_request.call_args_list:
+            self.assertNotIn('sysparm_offset', call.kwargs['params'])
+
+    def test_partitions_cover_the_table_once(self):
+        self.syncer.config.update(partitions='2', sysparm_query='active=true',
+                                  sysparm_fields='name')
+
+        records = list(self.syncer.get_table('cmdb_ci_server'))
+
+        self.assertEqual(sorted(record['name'] for record in records),
+                         sorted(record['name'] for record in self.table.records))
+        # The key field was only added for the paging
+        self.assertTrue(all('sys_id' not in record for record in records))
+        self.assertIn('active=true^sys_id<80^ORDERBYsys_id', self.table.queries)
+        self.assertIn('active=true^sys_id>=80^ORDERBYsys_id', self.table.queries)
+
+    def test_sys_id_ranges(self):
+        self.assertEqual(SyncServiceNow.sys_id_ranges(1), [(None, None)])
+        self.assertEqual(SyncServiceNow.sys_id_ranges(4),
+                         [(None, '40'), ('40', '80'), ('80', 'c0'), ('c0', None)])
+
+    def test_own_order_is_rejected(self):
+        self.syncer.config['sysparm_query'] = 'active=true^ORDERBYname'
+        with self.assertRaises(ServiceNowError):
+            list(self.syncer.get_table('cmdb_ci_server'))
+
+
+class TestIncremental(unittest.TestCase):
+    """Incremental runs read the changes since the last run."""
+
+    def setUp(self):
+        self.started = datetime.datetime(2026, 5, 1, 12, 0)
+
+    def test_changes_since_the_last_run(self):
+        state = SimpleNamespace(last_run=self.started - datetime.timedelta(minutes=30),
+                                last_full_run=self.started - datetime.timedelta(hours=2))
+        self.assertEqual(SyncServiceNow.updated_minutes(state, self.started), 31)
+
+    def test_full_read_without_state_or_when_due(self):
+        state = SimpleNamespace(last_run=None, last_full_run=None)
+        self.assertIsNone(SyncServiceNow.updated_minutes(state, self.started))
+
+        state = SimpleNamespace(last_run=self.started - datetime.timedelta(minutes=5),
+                                last_full_run=self.started - datetime.timedelta(hours=2))
+        with patch.dict(app.config, {'SERVICENOW_FULL_SYNC_INTERVAL': 3600}):
+            self.assertIsNone(SyncServiceNow.updated_minutes(state, self.started))
+
+    def test_offset_paging_filters_by_update_time(self):
+        syncer = SyncServiceNow.__new__(SyncServiceNow)
+        syncer.config = {'address': 'https://sn.example.com', 'username': 'u',
+                         'password': 'p', 'sysparm_query': 'active=true'}
+        table = _Table(['01'])
+        syncer.inner_request = MagicMock(side_effect=table.answer)
+
+        self.assertEqual(len(list(syncer.get_table('cmdb_ci_server', 31))), 1)
+        self.assertEqual(table.queries, [
+            'active=true^sys_updated_on>=javascript:gs.minutesAgoStart(31)'])
+
+
+if __name__ == '__main__':
+    unittest.main()
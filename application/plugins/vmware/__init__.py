@@ -39,6 +39,7 @@ def get_vmware_debug_data(hostname):
     from mongoengine.errors import DoesNotExist as _DoesNotExist
     from application.models.host import Host
     from application.modules.plugin import Plugin
+    from application.modules.rule.cache import get_cache_store
 
     try:
         db_host = Host.objects.get(hostname=hostname)
@@ -50,6 +51,7 @@ def get_vmware_debug_data(hostname):
         if key.lower().startswith('vmware'):
             del db_host.cache[key]
     db_host.save()
+    get_cache_store().clear(db_host, 'vmware')
 
     attribute_rewrite = Rewrite()
     attribute_rewrite.cache_name = 'vmware_rewrite'
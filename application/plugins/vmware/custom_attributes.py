@@ -21,14 +21,43 @@ from application import logger
 from .vmware import VMWareVcenterPlugin
 
 
+# Properties every reader needs, see _core_attributes
+_CORE_PATHS = ['name', 'runtime.powerState', 'runtime.host', 'config.guestFullName']
+
+_HARDWARE_PATHS = _CORE_PATHS + [
+    'resourcePool', 'network', 'datastore', 'runtime.bootTime',
+    'guest.ipAddress', 'guest.hostName', 'guest.guestFullName',
+    'guest.toolsStatus', 'guest.toolsVersion',
+    'config.hardware.numCPU', 'config.hardware.memoryMB', 'config.hardware.device',
+    'config.uuid', 'config.guestId', 'config.annotation',
+    'summary.config.numEthernetCards', 'summary.config.numVirtualDisks',
+]
+
+_CUSTOM_ATTRIBUTE_PATHS = _CORE_PATHS + ['customValue']
+
+
+def _has(props, prefix):
+    """
+    True if one of the properties below `prefix` is set
+    """
+    return any(path.startswith(prefix) for path in props)
+
+
 class VMwareCustomAttributesPlugin(VMWareVcenterPlugin):
     """
     VMware Custom Attributes
+
+    The VM properties are read in bulk with the PropertyCollector, the
+    readers get them as {property path: value}. References to other
+    objects (host, networks...) are resolved through `names`.
     """
     console = None
-    container_view = None
+    vm_handles = None
+    names = None
+    custom_fields = None
 
-    def _collect_hardware_devices(self, vm):
+    @staticmethod
+    def _collect_hardware_devices(devices):
         """Group virtual hardware into disks, network cards and controllers"""
         virtual_disks = []
         network_cards = []
@@ -48,7 +77,7 @@ class VMwareCustomAttributesPlugin(VMWareVcenterPlugin):
             vim.vm.device.VirtualVmxnet,
         )
 
-        for device in vm.config.hardware.device:
+        for device in devices:
             if isinstance(device, vim.vm.device.VirtualDisk):
                 # Store the raw capacity in its smallest native unit (KB) so
                 # export plugins can convert to whatever unit they need and
@@ -83,71 +112,74 @@ class VMwareCustomAttributesPlugin(VMWareVcenterPlugin):
             'scsi_controllers': scsi_controllers,
         }
 
-    @staticmethod
-    def _core_attributes(vm):
+    def _name(self, reference):
+        """
+        Name of a referenced managed object
+        """
+        if not reference:
+            return None
+        return self.names.get(reference._moId)  # pylint: disable=protected-access
+
+    def _core_attributes(self, props):
         """
         Identifying fields present on every VM regardless of which command
         collected it, so the ``inventory_filter`` always has something to
         match against (e.g. ``power_state``, ``guest_os``).
         """
         return {
-            "name": vm.name,
-            "power_state": vm.runtime.powerState,
-            "guest_os": vm.config.guestFullName if vm.config else None,
+            "name": props.get('name'),
+            "power_state": props.get('runtime.powerState'),
+            "guest_os": props.get('config.guestFullName'),
             # Readable ESXi host name instead of the internal MoRef
-            "runtime_host": vm.runtime.host.summary.config.name if vm.runtime.host else None,
+            "runtime_host": self._name(props.get('runtime.host')),
         }
 
-    def get_vm_hardware(self, vm, _content):
+    def get_vm_hardware(self, props):
         """Collect the VM's virtual-hardware inventory"""
-        attributes = self._core_attributes(vm)
-        attributes['resource_pool'] = vm.resourcePool.name if vm.resourcePool else "Default"
+        attributes = self._core_attributes(props)
+        attributes['resource_pool'] = self._name(props.get('resourcePool')) or "Default"
 
-        if vm.guest:
+        if _has(props, 'guest.'):
             attributes.update({
-                "ip_address": vm.guest.ipAddress,
-                "hostname": vm.guest.hostName,
-                "full_name": vm.guest.guestFullName,
-                "tools_status": vm.guest.toolsStatus,
-                "tools_version": vm.guest.toolsVersion,
+                "ip_address": props.get('guest.ipAddress'),
+                "hostname": props.get('guest.hostName'),
+                "full_name": props.get('guest.guestFullName'),
+                "tools_status": props.get('guest.toolsStatus'),
+                "tools_version": props.get('guest.toolsVersion'),
             })
-        if vm.config:
+        if _has(props, 'config.'):
             attributes.update({
-                "cpu_count": vm.config.hardware.numCPU,
-                "network_card_count": vm.summary.config.numEthernetCards,
-                "virtual_disk_count": vm.summary.config.numVirtualDisks,
-                "memory_mb": vm.config.hardware.memoryMB,
-                "uuid": vm.config.uuid,
-                "guest_id": vm.config.guestId,
-                "annotation": vm.config.annotation,
+                "cpu_count": props.get('config.hardware.numCPU'),
+                "network_card_count": props.get('summary.config.numEthernetCards'),
+                "virtual_disk_count": props.get('summary.config.numVirtualDisks'),
+                "memory_mb": props.get('config.hardware.memoryMB'),
+                "uuid": props.get('config.uuid'),
+                "guest_id": props.get('config.guestId'),
+                "annotation": props.get('config.annotation'),
             })
-        if vm.runtime:
-            attributes['boot_time'] = vm.runtime.bootTime
-        if vm.network:
-            attributes['networks'] = [{'name': network.name} for network in vm.network]
-        if vm.datastore:
-            attributes['datastores'] = [{'name': ds.info.name} for ds in vm.datastore]
-        if vm.config and vm.config.hardware.device:
-            attributes.update(self._collect_hardware_devices(vm))
+        if _has(props, 'runtime.'):
+            attributes['boot_time'] = props.get('runtime.bootTime')
+        if networks := props.get('network'):
+            attributes['networks'] = [{'name': self._name(network)} for network in networks]
+        if datastores := props.get('datastore'):
+            attributes['datastores'] = [{'name': self._name(ds)} for ds in datastores]
+        if devices := props.get('config.hardware.device'):
+            attributes.update(self._collect_hardware_devices(devices))
 
         return attributes
 
-    def get_vm_custom_attributes(self, vm, content):
+    def get_vm_custom_attributes(self, props):
         """Collect the VM's vCenter Custom Attributes (``vm.customValue``)"""
-        attributes = self._core_attributes(vm)
-        if vm.customValue:
-            for custom_field in vm.customValue:
-                field_key = custom_field.key
-                field_name = next(
-                    (f.name for f in content.customFieldsManager.field if f.key == field_key),
-                    f"custom_{field_key}"
-                )
-                attributes[field_name] = custom_field.value
+        attributes = self._core_attributes(props)
+        for custom_field in props.get('customValue') or []:
+            field_name = self.custom_fields.get(custom_field.key,
+                                                f"custom_{custom_field.key}")
+            attributes[field_name] = custom_field.value
         return attributes
 
-    def _collect(self, reader):
+    def _collect(self, reader, paths):
         """
-        Run ``reader(vm, content)`` for every VM, normalise the result and
+        Run ``reader(props)`` for every VM, normalise the result and
         keep only those matching the ``inventory_filter`` account setting
         (``key:value,key:value``; repeated key = OR, different keys = AND).
         """
@@ -158,25 +190,30 @@ class VMwareCustomAttributesPlugin(VMWareVcenterPlugin):
                 inventory_filter[key.strip()].append(value.strip())
 
         content = self.vcenter.RetrieveContent()
-        container = content.viewManager.CreateContainerView(content.rootFolder,
-                                                            [vim.VirtualMachine], True)
-        self.container_view = container.view
+        self.custom_fields = {}
+        if content.customFieldsManager:
+            self.custom_fields = {field.key: field.name
+                                  for field in content.customFieldsManager.field}
+        self.names = self.object_names([vim.HostSystem, vim.ResourcePool,
+                                        vim.Network, vim.Datastore])
+        self.vm_handles = {}
         data = []
-        for vm in self.container_view:
+        for vm, props in self.retrieve_properties([vim.VirtualMachine], paths):
             attributes = {key: value if isinstance(value, (str, list)) else str(value)
-                          for key, value in reader(vm, content).items()}
+                          for key, value in reader(props).items()}
             if all(str(attributes.get(key)) in values
                    for key, values in inventory_filter.items()):
                 data.append(attributes)
+                self.vm_handles[attributes['name']] = vm
         return data
 
 
-    def _write_custom_attributes(self, vm_handle, current_values, wanted):
+    def _plan_custom_attributes(self, current_values, wanted):
         """
-        Write each wanted custom attribute that differs from the VM's current
-        value (skipped on dry_run) and return the list of applied changes.
-        With ``--debug`` every attribute is reported with the reason it is
-        written or skipped.
+        Return the (name, value) of each wanted custom attribute that
+        differs from the VM's current value. Only compares, no vCenter
+        calls. With ``--debug`` every attribute is reported with the reason
+        it is written or skipped.
         """
         changes = []
         for attr_name, attr_value in wanted.items():
@@ -189,74 +226,134 @@ class VMwareCustomAttributesPlugin(VMWareVcenterPlugin):
                     self.console(f"   = {attr_name}: unchanged ({attr_value!r}), skipped")
                 continue
             reason = "not set on VM yet" if current is None else f"differs from {current!r}"
-            changes.append(f"{attr_name}: {current} to {attr_value}")
+            changes.append((attr_name, attr_value))
             if self.debug:
                 verb = "would write" if self.dry_run else "writing"
                 self.console(f"   * {attr_name}: {verb} {attr_value!r} — {reason}")
-            if not self.dry_run:
-                vm_handle.SetCustomValue(key=attr_name, value=attr_value)
         return changes
 
+    def _write_custom_attributes(self, write):
+        """
+        Apply the planned changes of one VM, each a SetCustomValue call.
+        Returns {attribute name: error or None}.
+        """
+        _hostname, vm_handle, changes = write
+        results = {}
+        for attr_name, attr_value in changes:
+            try:
+                vm_handle.SetCustomValue(key=attr_name, value=attr_value)
+                results[attr_name] = None
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                if self.debug:
+                    raise
+                results[attr_name] = error
+        return results
+
+    def _plan_writes(self, db_objects, current_attributes, progress):
+        """
+        Compare the wanted attributes of every host with the VM's and
+        return the writes as (hostname, VM handle, [(name, value)])
+        """
+        writes = []
+        task1 = progress.add_task("Calculating Attributes", total=db_objects.count())
+        for db_host in db_objects:
+            hostname = db_host.hostname
+            progress.advance(task1)
+            try:
+                all_attributes = self.get_attributes(db_host, 'vmware_vcenter')
+                if not all_attributes:
+                    continue
+                custom_rules = self.get_host_data(db_host, all_attributes['all'])
+                if not custom_rules:
+                    continue
+
+                self.console(f" * Work on {hostname}")
+                logger.debug("%s: %s", hostname, custom_rules)
+                if not (vm_host_data := current_attributes.get(hostname)):
+                    logger.debug(" Not found in VMware Data")
+                    continue
+                changes = self._plan_custom_attributes(vm_host_data,
+                                                       custom_rules['attributes'])
+                if changes and self.dry_run:
+                    described = [f"{name}: {vm_host_data.get(name)} to {value}"
+                                 for name, value in changes]
+                    self.console(f"   [dry-run] would update: {described}")
+                if changes:
+                    writes.append((hostname, self.vm_handles[hostname], changes))
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                if self.debug:
+                    raise
+                self.log_details.append((f'export_error {hostname}', str(error)))
+                self.console(f" Error in process: {error}")
+        return writes
+
+    def _count_results(self, write, results, summary):
+        """
+        Add the outcome of one VM's writes to the per attribute summary
+        """
+        hostname, _vm, changes = write
+        for attr_name, error in results.items():
+            if error:
+                summary[attr_name]['failed'] += 1
+                self.log_details.append((f'export_error {hostname}', f"{attr_name}: {error}"))
+                self.console(f" Error on {hostname}: {attr_name}: {error}")
+            else:
+                summary[attr_name]['written'] += 1
+        logger.debug(" Changes on %s: %s", hostname, changes)
+
+    def _print_summary(self, summary):
+        """
+        Report the writes per attribute at the end of the export
+        """
+        verb = "would write" if self.dry_run else "written"
+        for attr_name, counts in sorted(summary.items()):
+            line = f"{verb}={counts['written']} failed={counts['failed']}"
+            print(f" == Attribute {attr_name}: {line}")
+            self.log_details.append((f'attribute {attr_name}', line))
+
     def export_attributes(self):
         """
         Export Custom Attributes
+
+        All changes are calculated first, then written to the VMs in
+        parallel (http_workers at a time, see map_requests()).
         """
         self.connect()
-        current_attributes = {x['name']:x for x in self._collect(self.get_vm_custom_attributes)}
-
-        # Keep the VM handles in step with the filtered attribute set above,
-        # so the export only touches VMs that passed the inventory_filter.
-        current_vms = {x.name:x for x in self.container_view
-                       if x.name in current_attributes}
+        current_attributes = {x['name']:x for x in self._collect(self.get_vm_custom_attributes,
+                                                                 _CUSTOM_ATTRIBUTE_PATHS)}
 
         object_filter = self.config['settings'].get(self.name, {}).get('filter')
+        # Only VMs that passed the inventory_filter above are in
+        # current_attributes, so the export only touches those.
         db_objects = Host.objects_by_filter(object_filter)
-        total = db_objects.count()
+        summary = defaultdict(lambda: {'written': 0, 'failed': 0})
         with Progress(SpinnerColumn(),
                       MofNCompleteColumn(),
                       *Progress.get_default_columns(),
                       TimeElapsedColumn()) as progress:
             self.console = progress.console.print
-            task1 = progress.add_task("Updating Attributes", total=total)
-            hostname = None
-            for db_host in db_objects:
-                try:
-                    hostname = db_host.hostname
-                    all_attributes = self.get_attributes(db_host, 'vmware_vcenter')
-                    if not all_attributes:
-                        progress.advance(task1)
-                        continue
-                    custom_rules = self.get_host_data(db_host, all_attributes['all'])
-                    if not custom_rules:
-                        progress.advance(task1)
-                        continue
-
-                    self.console(f" * Work on {hostname}")
-                    logger.debug("%s: %s", hostname, custom_rules)
-                    if not (vm_host_data := current_attributes.get(hostname)):
-                        logger.debug(" Not found in VMware Data")
-                        progress.advance(task1)
-                        continue
-                    changes = self._write_custom_attributes(
-                        current_vms[hostname], vm_host_data, custom_rules['attributes'])
-                    if changes and self.dry_run:
-                        self.console(f"   [dry-run] would update: {changes}")
-                    logger.debug(" Updated: %s", changes)
-
-                except Exception as error:  # pylint: disable=broad-exception-caught
-                    if self.debug:
-                        raise
-                    self.log_details.append((f'export_error {hostname}', str(error)))
-                    self.console(f" Error in process: {error}")
-                progress.advance(task1)
-
+            writes = self._plan_writes(db_objects, current_attributes, progress)
+            if self.dry_run:
+                for write in writes:
+                    self._count_results(write, dict.fromkeys(name for name, _ in write[2]),
+                                        summary)
+                writes = []
+            task2 = progress.add_task("Updating Attributes", total=len(writes))
+            for write, results, error in self.map_requests(self._write_custom_attributes,
+                                                           writes):
+                progress.advance(task2)
+                if error and self.debug:
+                    raise error
+                self._count_results(write, results or {name: error for name, _ in write[2]},
+                                    summary)
+        self._print_summary(summary)
 
     def inventorize_attributes(self):
         """
         Inventorize the VMs' vCenter Custom Attributes
         """
         self.connect()
-        data = self._collect(self.get_vm_custom_attributes)
+        data = self._collect(self.get_vm_custom_attributes, _CUSTOM_ATTRIBUTE_PATHS)
         if self.dry_run:
             logger.info("Dry-run: would inventorize %s VMs, nothing written", len(data))
             return
@@ -267,7 +364,7 @@ class VMwareCustomAttributesPlugin(VMWareVcenterPlugin):
         Inventorize the VMs' virtual hardware under the ``_hardware`` sub-key
         """
         self.connect()
-        data = self._collect(self.get_vm_hardware)
+        data = self._collect(self.get_vm_hardware, _HARDWARE_PATHS)
         if self.dry_run:
             logger.info("Dry-run: would inventorize %s VMs, nothing written", len(data))
             return
@@ -0,0 +1,78 @@
+"""
+Unit tests for the custom attribute export of the VMware plugin
+"""
+# pylint: disable=missing-function-docstring,protected-access
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from application.plugins.vmware import custom_attributes as ca_module
+from application.plugins.vmware.custom_attributes import VMwareCustomAttributesPlugin
+
+
+class TestAttributeExport(unittest.TestCase):
+    """Changes are calculated first and written per VM in parallel."""
+
+    def setUp(self):
+        self.plugin = VMwareCustomAttributesPlugin.__new__(VMwareCustomAttributesPlugin)
+        self.plugin.config = {'name': 'vcenter', 'settings': {}}
+        self.plugin.debug = False
+        self.plugin.dry_run = False
+        self.plugin.log_details = []
+        self.vms = {'web1': MagicMock(), 'db1': MagicMock()}
+        self.vms['db1'].SetCustomValue.side_effect = [None, RuntimeError('no permission')]
+        wanted = {
+            'web1': {'owner': 'ops', 'stage': 'prod'},
+            'db1': {'owner': 'dba', 'stage': 'test'},
+            'gone': {'owner': 'ops'},
+        }
+        current = [{'name': 'web1', 'owner': 'ops', 'stage': 'dev'},
+                   {'name': 'db1'}]
+
+        def _collect(_reader, _paths):
+            self.plugin.vm_handles = dict(self.vms)
+            return current
+
+        hosts = MagicMock()
+        hosts.count.return_value = 3
+        hosts.__iter__.return_value = iter([SimpleNamespace(hostname=name)
+                                            for name in wanted])
+        for patcher in (
+                patch.object(ca_module, 'Progress'),
+                patch.object(ca_module.Host, 'objects_by_filter', create=True,
+                             return_value=hosts),
+                patch.object(self.plugin, 'connect', create=True),
+                patch.object(self.plugin, '_collect', side_effect=_collect),
+                patch.object(self.plugin, 'get_attributes', return_value={'all': {}}),
+                patch.object(self.plugin, 'get_host_data', side_effect=lambda host, _attrs: {
+                    'attributes': wanted[host.hostname]}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_changed_attributes_are_written(self):
+        with patch.object(self.plugin, 'http_workers', return_value=2):
+            self.plugin.export_attributes()
+
+        self.vms['web1'].SetCustomValue.assert_called_once_with(key='stage', value='prod')
+        self.assertEqual(self.vms['db1'].SetCustomValue.call_count, 2)
+        self.assertIn(('export_error db1', 'stage: no permission'), self.plugin.log_details)
+        self.assertIn(('attribute owner', 'written=1 failed=0'), self.plugin.log_details)
+        self.assertIn(('attribute stage', 'written=1 failed=1'), self.plugin.log_details)
+
+    def test_write_errors_are_raised_when_debugging(self):
+        self.plugin.debug = True
+        with self.assertRaisesRegex(RuntimeError, 'no permission'):
+            self.plugin.export_attributes()
+
+    def test_dry_run_writes_nothing(self):
+        self.plugin.dry_run = True
+        self.plugin.export_attributes()
+
+        for vm in self.vms.values():
+            vm.SetCustomValue.assert_not_called()
+        self.assertIn(('attribute stage', 'would write=2 failed=0'), self.plugin.log_details)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+"""
+Unit tests for the PropertyCollector reads of the VMware plugin
+"""
+# pylint: disable=missing-function-docstring,protected-access
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from application import app
+from application.plugins.vmware import vmware as vmware_module
+from application.plugins.vmware import custom_attributes as ca_module
+from application.plugins.vmware.custom_attributes import VMwareCustomAttributesPlugin
+
+
+def _ref(mo_id):
+    return SimpleNamespace(_moId=mo_id)
+
+
+def _object(mo_id, **props):
+    return SimpleNamespace(obj=_ref(mo_id), propSet=[
+        SimpleNamespace(name=name.replace('__', '.'), val=value)
+        for name, value in props.items()])
+
+
+class _FakeVim:  # pylint: disable=too-few-public-methods
+    """The vim types the plugin names, as plain markers."""
+    VirtualMachine = 'VirtualMachine'
+    HostSystem = 'HostSystem'
+    ResourcePool = 'ResourcePool'
+    Network = 'Network'
+    Datastore = 'Datastore'
+    view = SimpleNamespace(ContainerView='ContainerView')
+
+
+class TestPropertyCollector(unittest.TestCase):
+    """Bulk reads replace the per VM property access."""
+
+    def setUp(self):
+        self.plugin = VMwareCustomAttributesPlugin.__new__(VMwareCustomAttributesPlugin)
+        self.plugin.config = {'name': 'vcenter'}
+        self.plugin.debug = False
+        self.plugin.dry_run = False
+        self.content = MagicMock()
+        self.content.customFieldsManager.field = [SimpleNamespace(key=1, name='owner')]
+        self.plugin.vcenter = MagicMock()
+        self.plugin.vcenter.RetrieveContent.return_value = self.content
+        self.collector = self.content.propertyCollector
+        self.pages = {}
+        self.collector.RetrievePropertiesEx.side_effect = self._retrieve
+        self.collector.ContinueRetrievePropertiesEx.side_effect = \
+            lambda token: self.pages[token]
+        for module in (vmware_module, ca_module):
+            patcher = patch.object(module, 'vim', _FakeVim, create=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(vmware_module, 'vmodl', MagicMock(), create=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.retrieved_types = []
+
+    def _retrieve(self, _specs, _options):
+        view_types = self.content.viewManager.CreateContainerView.call_args.args[1]
+        self.retrieved_types.append(view_types)
+        if view_types == [_FakeVim.VirtualMachine]:
+            self.pages['next'] = SimpleNamespace(token=None, objects=[
+                _object('vm-2', name='db1', runtime__powerState='poweredOff',
+                        runtime__host=_ref('host-1'), customValue=[])])
+            return SimpleNamespace(token='next', objects=[
+                _object('vm-1', name='web1', runtime__powerState='poweredOn',
+                        runtime__host=_ref('host-1'), config__guestFullName='Linux',
+                        customValue=[SimpleNamespace(key=1, value='ops'),
+                                     SimpleNamespace(key=9, value='x')])])
+        return SimpleNamespace(token=None, objects=[
+            _object('host-1', name='esx1.example.com'),
+            _object('network-1', name='LAN')])
+
+    def test_custom_attributes_are_read_in_pages(self):
+        with patch.dict(app.config, {'VMWARE_PAGE_SIZE': 1}):
+            data = self.plugin._collect(self.plugin.get_vm_custom_attributes,
+                                        ca_module._CUSTOM_ATTRIBUTE_PATHS)
+
+        self.assertEqual(data, [
+            {'name': 'web1', 'power_state': 'poweredOn', 'guest_os': 'Linux',
+             'runtime_host': 'esx1.example.com', 'owner': 'ops', 'custom_9': 'x'},
+            {'name': 'db1', 'power_state': 'poweredOff', 'guest_os': 'None',
+             'runtime_host': 'esx1.example.com'},
+        ])
+        self.assertEqual(self.retrieved_types, [
+            [_FakeVim.HostSystem, _FakeVim.ResourcePool, _FakeVim.Network,
+             _FakeVim.Datastore],
+            [_FakeVim.VirtualMachine]])
+        self.collector.ContinueRetrievePropertiesEx.assert_called_once_with('next')
+        self.assertEqual(self.content.viewManager.CreateContainerView.return_value
+                         .Destroy.call_count, 2)
+        self.assertEqual(sorted(self.plugin.vm_handles), ['db1', 'web1'])
+
+    def test_inventory_filter_limits_vm_handles(self):
+        self.plugin.config['inventory_filter'] = 'power_state:poweredOn'
+        data = self.plugin._collect(self.plugin.get_vm_custom_attributes,
+                                    ca_module._CUSTOM_ATTRIBUTE_PATHS)
+        self.assertEqual([vm['name'] for vm in data], ['web1'])
+        self.assertEqual(list(self.plugin.vm_handles), ['web1'])
+
+    def test_hardware_reader_resolves_references(self):
+        self.plugin.names = {'host-1': 'esx1', 'network-1': 'LAN', 'datastore-1': 'ds1'}
+        props = {
+            'name': 'web1', 'runtime.powerState': 'poweredOn',
+            'runtime.host': _ref('host-1'), 'network': [_ref('network-1')],
+            'datastore': [_ref('datastore-1')], 'guest.ipAddress': '10.0.0.1',
+            'config.hardware.numCPU': 4,
+        }
+        attributes = self.plugin.get_vm_hardware(props)
+
+        self.assertEqual(attributes['runtime_host'], 'esx1')
+        self.assertEqual(attributes['resource_pool'], 'Default')
+        self.assertEqual(attributes['networks'], [{'name': 'LAN'}])
+        self.assertEqual(attributes['datastores'], [{'name': 'ds1'}])
+        self.assertEqual(attributes['ip_address'], '10.0.0.1')
+        self.assertEqual(attributes['cpu_count'], 4)
+        self.assertNotIn('virtual_disks', attributes)
+
+
+if __name__ == '__main__':
+    unittest.main()
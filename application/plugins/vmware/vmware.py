@@ -5,9 +5,10 @@ import ssl
 from syncerapi.v1.core import Plugin
 
 
-from application import logger
+from application import app, logger
 try:
     from pyVim.connect import SmartConnect
+    from pyVmomi import vim, vmodl
 except ImportError:
     logger.info("Info: VMware Plugin was not able to load required modules")
 
@@ -49,3 +50,44 @@ class VMWareVcenterPlugin(Plugin):
 
         if not self.vcenter:
             raise Exception("Cannot connect to vcenter")  # pylint: disable=broad-exception-raised
+
+    def retrieve_properties(self, obj_types, paths):
+        """
+        Read `paths` of all objects of `obj_types` with the
+        PropertyCollector: one RetrievePropertiesEx call, continued per
+        page of VMWARE_PAGE_SIZE objects, instead of a round trip for
+        every property of every object.
+        Yields (object, {path: value}); unset properties are missing.
+        """
+        content = self.vcenter.RetrieveContent()
+        view = content.viewManager.CreateContainerView(content.rootFolder, obj_types, True)
+        collector_type = vmodl.query.PropertyCollector
+        try:
+            traversal = collector_type.TraversalSpec(name='view', path='view', skip=False,
+                                                     type=vim.view.ContainerView)
+            filter_spec = collector_type.FilterSpec(
+                objectSet=[collector_type.ObjectSpec(obj=view, skip=True,
+                                                     selectSet=[traversal])],
+                propSet=[collector_type.PropertySpec(type=obj_type, pathSet=list(paths),
+                                                     all=False)
+                         for obj_type in obj_types])
+            options = collector_type.RetrieveOptions(
+                maxObjects=int(app.config.get('VMWARE_PAGE_SIZE', 1000)))
+            collector = content.propertyCollector
+            result = collector.RetrievePropertiesEx([filter_spec], options)
+            while result:
+                for obj_content in result.objects:
+                    yield obj_content.obj, {prop.name: prop.val
+                                            for prop in obj_content.propSet or []}
+                if not result.token:
+                    break
+                result = collector.ContinueRetrievePropertiesEx(result.token)
+        finally:
+            view.Destroy()
+
+    def object_names(self, obj_types):
+        """
+        Names of all objects of `obj_types`, by their managed object id
+        """
+        return {obj._moId: props.get('name')  # pylint: disable=protected-access
+                for obj, props in self.retrieve_properties(obj_types, ['name'])}
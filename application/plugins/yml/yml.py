@@ -6,6 +6,7 @@ import ast
 from requests.auth import HTTPBasicAuth, HTTPDigestAuth
 from application import logger
 from application.helpers.inventory import run_inventory
+from application.helpers.pagination import iter_pages, pagination_style
 from application.modules.plugin import Plugin, ResponseDataException
 try:
     import yaml as yml
@@ -48,6 +49,37 @@ class YMLSyncer(Plugin):
     def get_by_http(self):
         """
         Get YML File by HTTP
+
+        With pagination configured on the account, every page is a YML
+        document of its own and the hosts are returned as a generator.
+        Page and offset paging end on the first short page, which can not
+        be told apart from a page of few groups with many hosts, so only
+        the styles following a cursor or link are supported.
+        """
+        request = self._request_params()
+        if style := pagination_style(self.config):
+            if style in ('page', 'offset'):
+                raise ValueError(f"Pagination {style!r} is not supported for YML, "
+                                 "use cursor, next_link or link_header")
+            return self._paged_hosts(request)
+        return self.parse_yml(self._decode(self.inner_request(**request)))
+
+    def _paged_hosts(self, request):
+        # The groups of the document are the records of a page
+        for page in iter_pages(self, request, self._decode,
+                               lambda data: (data or {}).items()):
+            yield from self.parse_yml(dict(page))
+
+    @staticmethod
+    def _decode(response):
+        try:
+            return yml.safe_load(response.text)
+        except YAMLError as error:
+            raise ResponseDataException(f"{response.text}\n YML is no valid!") from error
+
+    def _request_params(self):
+        """
+        Keyword arguments of inner_request for the configured source
         """
         headers = {}
         if self.config.get('request_headers'):
@@ -76,12 +108,7 @@ class YMLSyncer(Plugin):
             params['auth'] = auth
         if cert:
             params['cert'] = cert
-
-        response = self.inner_request(**params)
-        try:
-            return self.parse_yml(yml.safe_load(response.text))
-        except YAMLError as error:
-            raise ResponseDataException(f"{response.text}\n YML is no valid!") from error
+        return params
 
     def get_from_file(self):
         """
@@ -100,39 +127,40 @@ class YMLSyncer(Plugin):
         """
         Import Hosts
         """
-        for entry in data:
-            hostname = entry['hostname']
-            if not hostname:
-                continue
-            del entry['hostname']
-            if 'rewrite_hostname' in self.config and self.config['rewrite_hostname']:
-                hostname = Host.rewrite_hostname(hostname, self.config['rewrite_hostname'], entry)
-
+        def _report(hostname, _do_save):
             print(f" {cc.OKGREEN}** {cc.ENDC} Update {hostname}")
-            host_obj = Host.get_host(hostname)
-            host_obj.update_host(entry)
 
-            do_save = host_obj.set_account(account_dict=self.config)
-
-            if do_save:
-                host_obj.save()
+        with Host.import_session(self.config, on_result=_report) as session:
+            for entry in data:
+                hostname = entry['hostname']
+                if not hostname:
+                    continue
+                del entry['hostname']
+                if 'rewrite_hostname' in self.config and self.config['rewrite_hostname']:
+                    hostname = Host.rewrite_hostname(hostname,
+                                                     self.config['rewrite_hostname'], entry)
+                session.add(hostname, entry)
+        for hostname, error in session.errors:
+            self.log_details.append((f'import_error {hostname}', error))
+            print(f" {cc.FAIL}Error: {hostname}: {error}{cc.ENDC}")
 
     def inventorize_objects(self, data):
         """
         Inventorize Hosts
         """
         rewrite = self.config.get('rewrite_hostname')
-        entries = []
-        for entry in data:
-            hostname = entry.get('hostname')
-            if not hostname:
-                continue
-            # Mirror the import path so inventory writes land on the
-            # same host key as the matching importer.
-            if rewrite:
-                hostname = Host.rewrite_hostname(hostname, rewrite, entry)
-            entries.append((hostname, entry))
-        run_inventory(self.config, entries)
+
+        def entries():
+            for entry in data:
+                hostname = entry.get('hostname')
+                if not hostname:
+                    continue
+                # Mirror the import path so inventory writes land on the
+                # same host key as the matching importer.
+                if rewrite:
+                    hostname = Host.rewrite_hostname(hostname, rewrite, entry)
+                yield hostname, entry
+        run_inventory(self.config, entries())
 
 
 def import_hosts_yml(account, debug=False):
@@ -66,6 +66,7 @@ from application.views.host_renderers import (
     format_labels,
     format_log,
     get_rule_json,
+    prefetch_rule_cache,
     _render_cmdb_fields,
     _render_cmdb_fields_preview,
     _render_cmdb_match_label,
@@ -1924,6 +1925,20 @@ Impact Chain.
         dt_str = now.strftime("%Y%m%d%H%M")
         return f"{self.model.__name__}_{dt_str}.syncer_json"
 
+    # pylint: disable-next=too-many-arguments,too-many-positional-arguments
+    def get_list(self, page, sort_column, sort_desc, search, filters,
+                 execute=True, page_size=None):
+        """
+        Load the Checkmk labels the label preview compares against
+        for the whole page with one query instead of one per row
+        """
+        count, query = super().get_list(page, sort_column, sort_desc, search,
+                                        filters, execute, page_size)
+        if execute and 'labels' not in self.column_exclude_list:
+            query = list(query)
+            prefetch_rule_cache(query, 'checkmk_hostattribute')
+        return count, query
+
     @staticmethod
     def _search_scope_flags():
         """
@@ -13,11 +13,12 @@ of the Host-action machinery (copy_as_new, bulk-label processors).
 import re
 from datetime import datetime
 
-from flask import request, url_for
+from flask import g, has_request_context, request, url_for
 from markupsafe import Markup, escape
 
 from application import app
 from application.models.host_cleanup import relation_target
+from application.modules.rule.cache import get_cache_store
 from application.modules.log.models import LogEntry
 from application.views.host_filters import FilterCmdbTemplate
 
@@ -359,6 +360,27 @@ def _render_labels_with_origin(_view, _context, model, _name):
     return Markup(''.join(html))
 
 
+def prefetch_rule_cache(models, name):
+    """
+    Read the rule cache entry `name` of all hosts of a list page with one
+    query, the row renderers pick it up through _rule_cache_entry()
+    """
+    g.rule_cache_rows = (name, get_cache_store().get_many(models, name))
+
+
+def _rule_cache_entry(model, name):
+    """
+    (stamp, value) of the host's rule cache entry or None. Exports write
+    the caches in other processes, so it is read fresh, not from the LRU.
+    """
+    if has_request_context():
+        prefetched_name, rows = g.get('rule_cache_rows', (None, {}))
+        pk = getattr(model, 'pk', None)
+        if prefetched_name == name and pk in rows:
+            return rows[pk]
+    return get_cache_store().get(model, name, fresh=True)
+
+
 def _render_labels(_view, _context, model, _name):
     # pylint: disable=too-many-branches
     """
@@ -382,10 +404,8 @@ def _render_labels(_view, _context, model, _name):
     # Truncation + `title` tooltip keeps customer hosts with very long
     # label values from stretching the row off-screen; the full value
     # is still available on hover.
-    checkmk_labels = (
-        model.cache.get('checkmk_hostattribute', {})
-        .get('attributes', {}).get('all', {})
-    )
+    cached = _rule_cache_entry(model, 'checkmk_hostattribute')
+    checkmk_labels = dict(cached[1].get('all', {})) if cached else {}
     html = f'<div style="{_LABEL_WRAPPER_STYLE}">'
     for key, value in (model.labels or {}).items():
         if not value:
@@ -412,12 +432,11 @@ def _render_labels(_view, _context, model, _name):
 
     # Labels coming from the Checkmk sync cache (the "green" badges).
     # A leading cloud icon + an explanatory tooltip clarifies that these
-    # are a sync-time snapshot — they vanish after an edit (because
-    # `on_model_change` clears `model.cache`) and reappear on the next
-    # sync. Customers used to read the disappearance as data loss.
+    # are a sync-time snapshot: they show the state of the last sync
+    # and are only refreshed by the next one, not by an edit.
     cache_tooltip = (
-        "From the Checkmk sync cache. Repopulates on the next Checkmk "
-        "sync; disappears briefly after editing this host."
+        "From the Checkmk sync cache. Shows the state of the last "
+        "Checkmk sync and refreshes on the next one."
     )
     for key, value in checkmk_labels.items():
         if not value:
@@ -679,14 +698,17 @@ def format_log(_v, _c, m, _p):
 
 def format_cache(_v, _c, m, _p):
     """ Format cache"""
-    if not m.cache:
+    cache = dict(m.cache or {})
+    # Rule caches live in their own store
+    cache.update(get_cache_store().entries(m, fresh=True))
+    if not cache:
         return Markup('<span class="text-muted">No cache data</span>')
 
     # Show summary (number of cache entries)
-    cache_count = len(m.cache)
+    cache_count = len(cache)
     html = f'<span class="text-muted">{cache_count} cache entrie(s)</span>'
 
-    if m.cache:
+    if cache:
         cache_id = f"cache_{m.id}"
 
         html += (
@@ -702,7 +724,7 @@ def format_cache(_v, _c, m, _p):
             f'<table class="table table-sm table-striped">'
         )
 
-        for key, value in m.cache.items():
+        for key, value in cache.items():
             html += f'<tr><th colspan="2" class="bg-light">{escape(key)}</th></tr>'
             if isinstance(value, dict):
                 for sub_key, sub_value in value.items():
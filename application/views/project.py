@@ -201,8 +201,8 @@ class ProjectView(DefaultModelView):
 
     def on_model_delete(self, model):
         """
-        Deleting a project changes which members are exported — drop the
-        per-host rule outcome caches.
+        Deleting a project changes which members are exported — invalidate
+        the per-host rule outcome caches.
         """
         invalidate_host_rule_caches()
         return super().on_model_delete(model)
@@ -300,7 +300,7 @@ class ProjectView(DefaultModelView):
 
         if projects:
             # Imported rules are saved directly (not through the rule views),
-            # so the per-host rule outcome caches must be dropped here.
+            # so the per-host rule outcome caches must be invalidated here.
             invalidate_host_rule_caches()
         flash(f'Imported {projects} project(s), {imported_rules} rule(s) and '
               f'{imported_dcd_rules} DCD rule(s)', 'success')
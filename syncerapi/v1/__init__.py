@@ -3,6 +3,7 @@ Syncer API
 """
 
 from application.models.host import Host
+from application.models.host_import import HostImportSession
 from application.helpers.get_account import get_account_by_name as get_account
 from application.helpers.cron import register_cronjob
 from application.modules.debug import ColorCodes as cc
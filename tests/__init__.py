@@ -13,6 +13,7 @@ are then loaded directly via `importlib.util` and registered under their
 canonical names, so the test files' normal `from application... import ...`
 statements resolve from the sys.modules cache without ever touching MongoDB.
 """
+import copy
 import importlib.util
 import os
 import sys
@@ -50,6 +51,9 @@ class _StubApp:  # pylint: disable=too-few-public-methods
         "DISABLE_SSL_ERRORS": False,
         # Rule engine
         "ADVANCED_RULE_DEBUG": False,
+        # Rule caches: the embedded backend works on Mock hosts, the
+        # collection store is tested against a fake collection
+        "RULE_CACHE_BACKEND": "host",
         # Checkmk syncer
         "PROCESS_TIMEOUT": 30,
         "CMK_GET_HOST_BY_FOLDER": False,
@@ -456,6 +460,8 @@ _syncerapi_v1.get_account = MagicMock(name="stub.get_account")
 _syncerapi_v1.Host = _Host
 _syncerapi_v1.cc = _ColorCodes
 _syncerapi_v1.render_jinja = MagicMock(name="stub.render_jinja")
+_syncerapi_v1_core = _stub_package("syncerapi.v1.core")
+_syncerapi_v1_core.app_config = _application.app.config
 
 
 # --- Real modules under test -------------------------------------------------
@@ -501,6 +507,13 @@ _load_real_module(
     os.path.join("models", "host_cleanup.py"),
 )
 
+# The import session only needs the (stubbed) Host at import time; the
+# tests swap in a fake Host with the methods it calls.
+_load_real_module(
+    "application.models.host_import",
+    os.path.join("models", "host_import.py"),
+)
+
 # application.modules.plugin pulls in render_jinja at import time, so the
 # helpers.syncer_jinja stub must be in place before the real plugin module
 # is loaded (the duplicated stub further down stays for the checkmk loaders
@@ -509,10 +522,38 @@ _syncer_jinja_early = _stub_package("application.helpers.syncer_jinja")
 _syncer_jinja_early.render_jinja = MagicMock(name="stub.render_jinja")
 _syncer_jinja_early.get_list = MagicMock(name="stub.get_list")
 
+# Rule cache stamps: plugin.py and rule.py import them at module load.
+# The RuleVersion model class collapses into a MagicMock on the stubbed
+# `db`, tests patch the helpers that query it.
+_load_real_module(
+    "application.modules.rule.cache",
+    os.path.join("modules", "rule", "cache.py"),
+)
+
 _try_load_real_module(
     "application.modules.plugin",
     os.path.join("modules", "plugin.py"),
 )
+# run_inventory: the tests swap in a fake Host
+_try_load_real_module(
+    "application.helpers.inventory",
+    os.path.join("helpers", "inventory.py"),
+)
+# Pure parsing, cmk2 imports it for the streamed host fetch
+_load_real_module(
+    "application.helpers.json_stream",
+    os.path.join("helpers", "json_stream.py"),
+)
+# Paged HTTP sources of the REST and YML imports
+_load_real_module(
+    "application.helpers.pagination",
+    os.path.join("helpers", "pagination.py"),
+)
+# Query building and row streaming of the SQL imports
+_load_real_module(
+    "application.helpers.sql",
+    os.path.join("helpers", "sql.py"),
+)
 _try_load_real_module(
     "application.plugins.checkmk.cmk2",
     os.path.join("plugins", "checkmk", "cmk2.py"),
@@ -571,7 +612,7 @@ for _name in (
     "CheckmkRewriteAttributeRule", "CheckmkFilterRule", "CheckmkDCDRule",
     "CheckmkNotificationRule",
     "CheckmkSite", "CheckmkSettings",
-    "CheckmkSitePool", "CheckmkSitePoolMember",
+    "CheckmkSitePool", "CheckmkSitePoolMember", "CheckmkHostState",
 ):
     setattr(_cmk_models, _name, MagicMock(name=f"stub.{_name}"))
 
@@ -631,6 +672,7 @@ for _mod_name, _mod_path in [
     ("dcd", "dcd.py"),
     ("downtimes", "downtimes.py"),
     ("groups", "groups.py"),
+    ("host_state", "host_state.py"),
     ("passwords", "passwords.py"),
     ("sites", "sites.py"),
     ("tags", "tags.py"),
@@ -668,6 +710,62 @@ _try_load_real_module(
 )
 
 
+
+# --- i-doit plugin modules ----------------------------------------------------
+_try_load_real_module(
+    "application.plugins.idoit.syncer",
+    os.path.join("plugins", "idoit", "syncer.py"),
+)
+
+
+# --- VMware plugin modules ----------------------------------------------------
+# Plugin comes from syncerapi.v1.core there; pyVmomi is not needed, the
+# tests patch `vim` and `vmodl`.
+if "application.modules.plugin" in sys.modules:
+    _syncerapi_v1_core.Plugin = sys.modules["application.modules.plugin"].Plugin
+_syncerapi_v1_inventory = _stub_package("syncerapi.v1.inventory")
+_syncerapi_v1_inventory.run_inventory = MagicMock(name="stub.run_inventory")
+_try_load_real_module(
+    "application.plugins.vmware.vmware",
+    os.path.join("plugins", "vmware", "vmware.py"),
+)
+_try_load_real_module(
+    "application.plugins.vmware.custom_attributes",
+    os.path.join("plugins", "vmware", "custom_attributes.py"),
+)
+
+
+# --- REST and YML plugin modules ------------------------------------------------------
+_try_load_real_module(
+    "application.plugins.rest.rest",
+    os.path.join("plugins", "rest", "rest.py"),
+)
+_try_load_real_module(
+    "application.plugins.yml.yml",
+    os.path.join("plugins", "yml", "yml.py"),
+)
+
+# --- SQL plugin modules -------------------------------------------------------
+# The database drivers are not installed, the tests patch `mysql` and `pyodbc`.
+_syncerapi_v1_core.logger = _application.logger
+_try_load_real_module(
+    "application.plugins.mysql.mysql",
+    os.path.join("plugins", "mysql", "mysql.py"),
+)
+_try_load_real_module(
+    "application.plugins.pyodbc.pyodbc",
+    os.path.join("plugins", "pyodbc", "pyodbc.py"),
+)
+
+# --- ServiceNow plugin modules -------------------------------------------------
+# The import state is a Document, tests patch it.
+_servicenow_models = _stub_package("application.plugins.servicenow.models")
+_servicenow_models.ServiceNowTableState = MagicMock(name="stub.ServiceNowTableState")
+_try_load_real_module(
+    "application.plugins.servicenow.syncer",
+    os.path.join("plugins", "servicenow", "syncer.py"),
+)
+
 # --- Jira Cloud plugin modules -----------------------------------------------
 # jira_cloud.py holds the base class both the import and the export use; it
 # only needs the syncerapi + plugin stubs above.
@@ -675,6 +773,20 @@ _try_load_real_module(
     "application.plugins.jira_cloud.jira_cloud",
     os.path.join("plugins", "jira_cloud", "jira_cloud.py"),
 )
+# The export needs the rule engine and the models, which are Documents
+# the tests patch.
+_jira_cloud_models = _stub_package("application.plugins.jira_cloud.models")
+for _name in ("JiraCloudFilterRule", "JiraCloudRewriteAttributeRule", "JiraExportRule",
+              "JiraExportState", "JiraSchemaCache"):
+    setattr(_jira_cloud_models, _name, MagicMock(name=f"stub.{_name}"))
+_try_load_real_module(
+    "application.plugins.jira_cloud.rules",
+    os.path.join("plugins", "jira_cloud", "rules.py"),
+)
+_try_load_real_module(
+    "application.plugins.jira_cloud.export",
+    os.path.join("plugins", "jira_cloud", "export.py"),
+)
 
 
 # --- API modules under test -------------------------------------------------
@@ -736,3 +848,30 @@ def make_checkmk_rule_sync():
                lambda self_param, account=False: base_mock_init(
                    self_param, rulsets_by_type={})):
         return cmk_rules.CheckmkRuleSync()
+
+
+class InProcessPool:
+    """
+    multiprocessing.Pool stand-in running the batches in this process.
+    The worker gets its own (shallow) copies of the initargs, like the
+    pickled ones a real worker would get.
+    """
+    def __init__(self, initializer, initargs):
+        initializer(*(copy.copy(arg) for arg in initargs))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        return False
+
+    @staticmethod
+    def imap(func, batches):
+        """Run func on every batch, lazily and in order like Pool.imap"""
+        return map(func, batches)
+
+    def close(self):
+        """Nothing to close"""
+
+    def join(self):
+        """Nothing to wait for"""
@@ -347,6 +347,31 @@ class HostViewFormattingTest(unittest.TestCase):
         self.assertIn('&lt;script&gt;alert(2)&lt;/script&gt;', rendered)
         self.assertNotIn('<script>alert(2)</script>', rendered)
 
+    def test_label_preview_uses_the_prefetched_rule_caches(self):
+        import_host_module()
+        renderers_module = _load_source_module(
+            'application.views.host_renderers',
+            os.path.join('application', 'views', 'host_renderers.py'),
+        )
+        store = MagicMock()
+        store.get_many.return_value = {
+            'id1': ('s', {'all': {'os': 'linux'}}), 'id2': None}
+        hosts = [SimpleNamespace(pk='id1'), SimpleNamespace(pk='id2')]
+
+        with patch.object(renderers_module, 'get_cache_store', return_value=store), \
+                Flask(__name__).test_request_context():
+            renderers_module.prefetch_rule_cache(hosts, 'checkmk_hostattribute')
+            self.assertEqual(renderers_module._rule_cache_entry(
+                hosts[0], 'checkmk_hostattribute'), ('s', {'all': {'os': 'linux'}}))
+            self.assertIsNone(renderers_module._rule_cache_entry(
+                hosts[1], 'checkmk_hostattribute'))
+            renderers_module._rule_cache_entry(SimpleNamespace(pk='id3'),
+                                               'checkmk_hostattribute')
+
+        store.get_many.assert_called_once_with(hosts, 'checkmk_hostattribute')
+        store.get.assert_called_once()
+        self.assertEqual(store.get.call_args.kwargs, {'fresh': True})
+
     def test_render_datetime_escapes_non_datetime_values(self):
         host_module = import_host_module()
         model = SimpleNamespace(last_import_seen='<img src=x onerror=alert(1)>')
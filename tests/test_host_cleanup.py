@@ -1,10 +1,11 @@
 """
 Tests for the side-document cleanup that runs on every host deletion.
 
-Three stores hang off a Host without a MongoEngine delete rule to reach
+Four stores hang off a Host without a MongoEngine delete rule to reach
 them: the inventory trees and field approvals (keyed by hostname as a
-plain string) and the inbound relation edges (a reference inside an
-embedded document). These tests pin that all three are handled, and that
+plain string), the rule caches (keyed by the host id as a plain ObjectId)
+and the inbound relation edges (a reference inside an embedded
+document). These tests pin that all four are handled, and that
 the hook sits on the queryset rather than on a delete signal — a signal
 receiver makes MongoEngine fall back to a per-document loop for every
 bulk delete.
@@ -22,6 +23,10 @@ class _FieldApproval:  # pylint: disable=too-few-public-methods
     objects = MagicMock()
 
 
+class _HostRuleCache:  # pylint: disable=too-few-public-methods
+    objects = MagicMock()
+
+
 _fa_module = types.ModuleType('application.models.field_approval')
 _fa_module.FieldApproval = _FieldApproval
 sys.modules['application.models.field_approval'] = _fa_module
@@ -59,8 +64,12 @@ def _host(pk, hostname):
 class PurgeSideDocumentsTest(unittest.TestCase):
 
     def setUp(self):
-        for model in (Host, HostInventoryTree, _FieldApproval):
+        for model in (Host, HostInventoryTree, _FieldApproval, _HostRuleCache):
             model.objects.reset_mock()
+        rule_cache = patch('application.modules.rule.cache.HostRuleCache',
+                           _HostRuleCache)
+        rule_cache.start()
+        self.addCleanup(rule_cache.stop)
 
     def test_inventory_trees_are_deleted_by_hostname(self):
         host_cleanup._purge_side_documents(['id1'], ['host-a', 'host-b'])
@@ -90,10 +99,17 @@ class PurgeSideDocumentsTest(unittest.TestCase):
             __raw__={'$pull': {'relations': {
                 'target_host': {'$in': ['id1', 'id2']}}}})
 
+    def test_rule_caches_are_deleted_by_host_id(self):
+        host_cleanup._purge_side_documents(['id1', 'id2'], ['host-a'])
+        _HostRuleCache.objects.assert_called_once_with(
+            host_id__in=['id1', 'id2'])
+        _HostRuleCache.objects.return_value.delete.assert_called_once_with()
+
     def test_nothing_runs_without_matches(self):
         host_cleanup._purge_side_documents([], [])
         HostInventoryTree.objects.assert_not_called()
         _FieldApproval.objects.assert_not_called()
+        _HostRuleCache.objects.assert_not_called()
         Host.objects.assert_not_called()
 
 
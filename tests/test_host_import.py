@@ -0,0 +1,155 @@
+"""
+Tests for the batched host import session.
+"""
+# pylint: disable=missing-function-docstring,protected-access
+import unittest
+from unittest.mock import MagicMock, patch
+
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from application.models import host_import
+from application.models.host_import import HostImportSession
+
+
+class _FakeHost:
+    """The parts of Host the session uses."""
+    stored = {}
+    queries = []
+    collection = MagicMock()
+    refuse = set()
+
+    def __init__(self, hostname=None, pk=None, labels=None):
+        self.hostname = hostname
+        self.pk = pk
+        self.labels = labels or {}
+        self.create_time = None
+        self.changed = {}
+
+    @classmethod
+    def objects(cls, hostname__in):
+        cls.queries.append(list(hostname__in))
+        return [cls.stored[name] for name in hostname__in if name in cls.stored]
+
+    @classmethod
+    def _get_collection(cls):
+        return cls.collection
+
+    def update_host(self, labels):
+        if labels.get('broken'):
+            raise ValueError("broken label")
+        if labels != self.labels:
+            self.changed['labels'] = labels
+        self.labels = labels
+
+    def set_account(self, account_dict, import_id):  # pylint: disable=unused-argument
+        return self.hostname not in self.refuse
+
+    def validate(self):
+        pass
+
+    def to_mongo(self):
+        return {'_id': self.pk, 'hostname': self.hostname, 'labels': self.labels}
+
+    def _delta(self):
+        return dict(self.changed), {}
+
+
+class TestHostImportSession(unittest.TestCase):
+    """Tests for HostImportSession batching and writes."""
+
+    def setUp(self):
+        _FakeHost.stored = {'known': _FakeHost('known', pk='id1', labels={'a': '1'})}
+        _FakeHost.queries = []
+        _FakeHost.collection = MagicMock()
+        _FakeHost.refuse = set()
+        patches = (
+            patch.object(host_import, 'Host', _FakeHost),
+            patch.object(host_import, 'app', MagicMock(config={
+                'LOWERCASE_HOSTNAMES': False, 'IMPORT_BATCH_SIZE': 500})),
+        )
+        for item in patches:
+            item.start()
+            self.addCleanup(item.stop)
+
+    def _operations(self):
+        return [call.args[0]
+                for call in _FakeHost.collection.bulk_write.call_args_list]
+
+    def test_rows_are_written_in_one_bulk_per_batch(self):
+        with HostImportSession({'name': 'csv'}, batch_size=2) as session:
+            for name in ('known', 'new1', 'new2'):
+                session.add(name, {'a': '2'})
+        self.assertEqual(_FakeHost.queries, [['known', 'new1'], ['new2']])
+        batches = self._operations()
+        self.assertEqual([len(batch) for batch in batches], [2, 1])
+        for call in _FakeHost.collection.bulk_write.call_args_list:
+            self.assertEqual(call.kwargs, {'ordered': False})
+        self.assertEqual(session.num_rows, 3)
+        self.assertEqual(session.num_saved, 3)
+
+    def test_existing_hosts_get_a_partial_update(self):
+        with HostImportSession({'name': 'csv'}) as session:
+            session.add('known', {'a': '2'})
+        operation = self._operations()[0][0]
+        self.assertEqual(operation, UpdateOne({'_id': 'id1'},
+                                              {'$set': {'labels': {'a': '2'}}}))
+
+    def test_new_hosts_are_inserted(self):
+        with HostImportSession({'name': 'csv'}) as session:
+            session.add('  new  ', {'a': '1'})
+        operation = self._operations()[0][0]
+        self.assertIsInstance(operation, InsertOne)
+        self.assertEqual(operation._doc['hostname'], 'new')
+        self.assertIsNotNone(operation._doc['_id'])
+
+    def test_unchanged_hosts_are_not_written(self):
+        results = []
+        with HostImportSession({'name': 'csv'},
+                               on_result=lambda *r: results.append(r)) as session:
+            session.add('known', {'a': '1'})
+        _FakeHost.collection.bulk_write.assert_not_called()
+        self.assertEqual(results, [('known', True)])
+
+    def test_refused_hosts_are_reported_and_not_written(self):
+        _FakeHost.refuse = {'known'}
+        results = []
+        with HostImportSession({'name': 'csv'},
+                               on_result=lambda *r: results.append(r)) as session:
+            session.add('known', {'a': '2'})
+        _FakeHost.collection.bulk_write.assert_not_called()
+        self.assertEqual(results, [('known', False)])
+        self.assertEqual(session.num_saved, 0)
+
+    def test_a_repeated_host_sees_the_earlier_row(self):
+        with HostImportSession({'name': 'csv'}) as session:
+            session.add('new', {'a': '1'})
+            session.add('new', {'a': '2'})
+        self.assertEqual(_FakeHost.queries, [['new'], ['new']])
+
+    def test_failing_rows_are_collected(self):
+        with HostImportSession({'name': 'csv'}) as session:
+            session.add('known', {'broken': 'yes'})
+            session.add('', {})
+            session.add(None, {})
+            session.add('new', {'a': '1'})
+        self.assertCountEqual([name for name, _error in session.errors],
+                              ['known', 'row 2', 'None'])
+        self.assertEqual(session.num_saved, 1)
+
+    def test_failed_writes_are_collected(self):
+        _FakeHost.collection.bulk_write.side_effect = BulkWriteError({
+            'writeErrors': [{'index': 1, 'errmsg': 'E11000 duplicate key'}],
+        })
+        results = []
+        with HostImportSession({'name': 'csv'},
+                               on_result=lambda *r: results.append(r)) as session:
+            session.add('known', {'a': '2'})
+            session.add('new', {'a': '1'})
+        self.assertEqual(session.errors, [('new', 'E11000 duplicate key')])
+        self.assertEqual(results, [('known', True)])
+        self.assertEqual(session.num_saved, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
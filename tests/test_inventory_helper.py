@@ -0,0 +1,145 @@
+"""
+Tests for the batched run_inventory.
+"""
+# pylint: disable=missing-function-docstring,protected-access
+import unittest
+from unittest.mock import MagicMock, patch
+
+from pymongo import UpdateOne
+
+from application.helpers import inventory as inventory_helper
+
+
+class _FakeQuery:
+    """Host.objects: callable for hostname__in, scalar for the domain index."""
+
+    def __init__(self, hosts):
+        self.hosts = hosts
+        self.queries = []
+
+    def __call__(self, hostname__in):
+        self.queries.append(sorted(hostname__in))
+        return [self.hosts[name] for name in hostname__in if name in self.hosts]
+
+    def scalar(self, field):
+        assert field == 'hostname'
+        return list(self.hosts)
+
+
+class _FakeHost:
+    """The parts of Host run_inventory uses, with MongoEngine's delta."""
+    objects = None
+    collection = None
+
+    def __init__(self, hostname, inventory=None):
+        self.hostname = hostname
+        self.pk = f"id-{hostname}"
+        self.inventory = dict(inventory or {})
+        self._loaded = dict(self.inventory)
+
+    @classmethod
+    def _get_collection(cls):
+        return cls.collection
+
+    def update_inventory(self, key, new_data, _config=False):
+        for name in [name for name in self.inventory if name.startswith(key + '__')]:
+            del self.inventory[name]
+        self.inventory.update({f"{key}__{name}": value
+                               for name, value in new_data.items()})
+        return self.inventory != self._loaded
+
+    def mark_inventorized(self, changed=False):
+        pass
+
+    def _delta(self):
+        # Deleting a key marks the whole dict as changed
+        if self.inventory != self._loaded:
+            return {'inventory': dict(self.inventory)}, {}
+        return {}, {}
+
+
+class TestRunInventory(unittest.TestCase):
+    """Tests for loading and writing the inventorized hosts in bulk."""
+
+    def setUp(self):
+        hosts = {
+            'web1.example.com': _FakeHost('web1.example.com',
+                                          {'vm__cpu': 2, 'vm__ram': 4, 'other': 1}),
+            'web2.example.com': _FakeHost('web2.example.com', {'vm__cpu': 2}),
+            'db.example.org': _FakeHost('db.example.org'),
+        }
+        _FakeHost.objects = _FakeQuery(hosts)
+        _FakeHost.collection = MagicMock()
+        patches = (
+            patch.object(inventory_helper, 'Host', _FakeHost),
+            patch.dict(inventory_helper.app_config, {'LOWERCASE_HOSTNAMES': False,
+                                                     'IMPORT_BATCH_SIZE': 2}),
+            patch('builtins.print'),
+        )
+        for item in patches:
+            item.start()
+            self.addCleanup(item.stop)
+
+    def _operations(self):
+        return [operation
+                for call in _FakeHost.collection.bulk_write.call_args_list
+                for operation in call.args[0]]
+
+    def test_hosts_are_loaded_and_written_per_batch(self):
+        inventory_helper.run_inventory({'inventorize_key': 'vm'}, [
+            ('web1.example.com', {'cpu': 4, 'ram': 4}),
+            ('web2.example.com', {'cpu': 2}),
+            ('missing.example.com', {'cpu': 1}),
+        ])
+        self.assertEqual(_FakeHost.objects.queries, [
+            ['web1.example.com', 'web2.example.com'], ['missing.example.com']])
+        self.assertEqual(_FakeHost.collection.bulk_write.call_count, 1)
+        self.assertEqual(self._operations(), [
+            UpdateOne({'_id': 'id-web1.example.com'},
+                      {'$set': {'inventory.vm__cpu': 4}})])
+
+    def test_removed_keys_are_unset(self):
+        inventory_helper.run_inventory({'inventorize_key': 'vm'}, [
+            ('web1.example.com', {'cpu': 2}),
+        ])
+        self.assertEqual(self._operations(), [
+            UpdateOne({'_id': 'id-web1.example.com'},
+                      {'$unset': {'inventory.vm__ram': 1}})])
+
+    def test_dotted_keys_fall_back_to_the_whole_inventory(self):
+        inventory_helper.run_inventory({'inventorize_key': 'vm'}, [
+            ('web2.example.com', {'os.name': 'linux'}),
+        ])
+        self.assertEqual(self._operations(), [
+            UpdateOne({'_id': 'id-web2.example.com'},
+                      {'$set': {'inventory': {'vm__os.name': 'linux'}}})])
+
+    def test_domain_match_uses_the_reversed_index(self):
+        inventory_helper.run_inventory(
+            {'inventorize_key': 'dns', 'inventorize_match_by_domain': True},
+            [('example.com', {'zone': 'a'})])
+        self.assertEqual(_FakeHost.objects.queries,
+                         [['web1.example.com', 'web2.example.com']])
+        self.assertEqual(len(self._operations()), 2)
+
+    def test_collected_values_follow_lowercase_hostnames(self):
+        with patch.dict(inventory_helper.app_config, {'LOWERCASE_HOSTNAMES': True}):
+            inventory_helper.run_inventory(
+                {'inventorize_key': 'vm', 'inventorize_collect_by_key': 'cluster'},
+                [('WEB2.example.com', {'cluster': ' DB.Example.org '})])
+        self.assertEqual(_FakeHost.objects.queries,
+                         [['web2.example.com'], ['db.example.org']])
+        self.assertIn(UpdateOne({'_id': 'id-db.example.org'},
+                                {'$set': {'inventory.vm_collection__0': 'web2.example.com'}}),
+                      self._operations())
+
+    def test_domain_index_matches_suffixes(self):
+        index = inventory_helper._DomainIndex()
+        self.assertEqual(sorted(index.match('.example.com')),
+                         ['web1.example.com', 'web2.example.com'])
+        self.assertEqual(index.match('db.example.org'), ['db.example.org'])
+        self.assertEqual(index.match('.net'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+"""Tests for application.helpers.json_stream."""
+# pylint: disable=missing-function-docstring
+import json
+import unittest
+
+from application.helpers.json_stream import iter_json_array
+
+
+def _chunks(document, size):
+    raw = json.dumps(document, ensure_ascii=False).encode('utf-8')
+    return [raw[start:start + size] for start in range(0, len(raw), size)]
+
+
+class TestIterJsonArray(unittest.TestCase):
+    """Items of the top level array, whatever the chunk borders."""
+
+    document = {
+        'links': [{'value': 'not this one', 'title': 'Übersicht'}],
+        'count': 12345,
+        'value': [{'id': f'host{i}', 'title': 'äöü' * i} for i in range(20)],
+        'extensions': {},
+    }
+
+    def test_items_are_the_same_for_every_chunk_size(self):
+        for size in (1, 2, 7, 64, 1024 * 1024):
+            with self.subTest(size=size):
+                self.assertEqual(list(iter_json_array(_chunks(self.document, size))),
+                                 self.document['value'])
+
+    def test_items_are_yielded_before_the_body_is_read(self):
+        read = []
+
+        def chunks():
+            for chunk in _chunks(self.document, 16):
+                read.append(chunk)
+                yield chunk
+
+        items = iter_json_array(chunks())
+        next(items)
+        self.assertLess(len(read), len(_chunks(self.document, 16)))
+
+    def test_other_key(self):
+        self.assertEqual(list(iter_json_array(['{"data": [1, 2]}'], key='data')),
+                         [1, 2])
+
+    def test_missing_or_empty_array(self):
+        self.assertEqual(list(iter_json_array(['{}'])), [])
+        self.assertEqual(list(iter_json_array(['{"value": []}'])), [])
+        self.assertEqual(list(iter_json_array(['{"other": 1}'])), [])
+
+    def test_truncated_body_raises(self):
+        with self.assertRaises(ValueError):
+            list(iter_json_array(['{"value": [{"id": "a"}, {"id"']))
+        with self.assertRaises(ValueError):
+            list(iter_json_array(['']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+"""
+Tests for the paged HTTP sources of the REST and YML imports.
+"""
+# pylint: disable=missing-function-docstring,missing-class-docstring,protected-access
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from application.helpers import pagination
+from application.modules.plugin import Plugin
+from application.plugins.rest.rest import RestImport
+from application.plugins.yml.yml import YMLSyncer
+
+
+class _Api:  # pylint: disable=too-few-public-methods
+    """Answers inner_request calls from a list of records."""
+
+    def __init__(self, total):
+        self.records = [{'host': f"srv{number}"} for number in range(total)]
+
+    def page(self, params):
+        size = params.get('per_page') or params.get('limit')
+        if 'offset' in params:
+            start = params['offset']
+        else:
+            start = (params['page'] - 1) * size
+        return self.records[start:start + size]
+
+
+def _plugin(config, answer):
+    plugin = Plugin.__new__(Plugin)
+    plugin.config = config
+    plugin.inner_request = MagicMock(side_effect=answer)
+    return plugin
+
+
+def _decode(response):
+    return response.body
+
+
+def _records(body):
+    return body['result']
+
+
+class PageNumberTest(unittest.TestCase):
+
+    def test_pages_until_a_short_page(self):
+        api = _Api(5)
+        plugin = _plugin({'pagination': 'page', 'page_size': '2'}, lambda **kwargs: (
+            SimpleNamespace(body={'result': api.page(kwargs['params'])})))
+        request = {'method': 'GET', 'url': 'https://api/assets'}
+
+        pages = list(pagination.iter_pages(plugin, request, _decode, _records))
+
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual([call.kwargs['params'] for call in plugin.inner_request.call_args_list],
+                         [{'per_page': 2, 'page': 1}, {'per_page': 2, 'page': 2},
+                          {'per_page': 2, 'page': 3}])
+
+    def test_offset_pages_load_in_parallel_and_keep_order(self):
+        api = _Api(7)
+        plugin = _plugin({'pagination': 'offset', 'page_size': '2', 'page_workers': '3'},
+                         lambda **kwargs: SimpleNamespace(
+                             body={'result': api.page(kwargs['params'])}))
+
+        records = [record['host'] for page in pagination.iter_pages(
+            plugin, {'url': 'https://api/assets'}, _decode, _records) for record in page]
+
+        self.assertEqual(records, [f"srv{number}" for number in range(7)])
+        # Two windows of three pages, the last one starts past the end
+        self.assertEqual(plugin.inner_request.call_count, 6)
+
+
+class FollowTest(unittest.TestCase):
+
+    def test_cursor_from_the_body(self):
+        answers = {None: ({'result': [1, 2], 'meta': {'next': 'abc'}}),
+                   'abc': ({'result': [3], 'meta': {'next': None}})}
+        plugin = _plugin({'pagination': 'cursor', 'next_key': 'meta.next'},
+                         lambda **kwargs: SimpleNamespace(
+                             body=answers[kwargs['params'].get('cursor')]))
+
+        pages = list(pagination.iter_pages(plugin, {'url': 'https://api/x'},
+                                           _decode, _records))
+
+        self.assertEqual(pages, [[1, 2], [3]])
+
+    def test_relative_next_link(self):
+        answers = {'https://api/x': {'result': [1], 'next': '/x?page=2'},
+                   'https://api/x?page=2': {'result': [2], 'next': None}}
+        plugin = _plugin({'pagination': 'next_link'}, lambda **kwargs: SimpleNamespace(
+            body=answers[kwargs['url']]))
+
+        pages = list(pagination.iter_pages(plugin, {'url': 'https://api/x'},
+                                           _decode, _records))
+
+        self.assertEqual(pages, [[1], [2]])
+        self.assertIsNone(plugin.inner_request.call_args.kwargs['params'])
+
+    def test_link_header_repeating_itself_stops(self):
+        plugin = _plugin({'pagination': 'link_header'}, lambda **kwargs: SimpleNamespace(
+            body={'result': [1]}, links={'next': {'url': 'https://api/x?page=2'}}))
+
+        pages = list(pagination.iter_pages(plugin, {'url': 'https://api/x'},
+                                           _decode, _records))
+
+        self.assertEqual(pages, [[1], [1]])
+
+    def test_link_header_is_followed_as_given(self):
+        answers = {'https://api/x': ([1], {'next': {'url': 'https://api/x?page=2&limit=2'}}),
+                   'https://api/x?page=2&limit=2': ([2], {})}
+        plugin = _plugin({'pagination': 'link_header', 'page_size': '2'},
+                         lambda **kwargs: SimpleNamespace(
+                             body={'result': answers[kwargs['url']][0]},
+                             links=answers[kwargs['url']][1]))
+
+        pages = list(pagination.iter_pages(plugin, {'url': 'https://api/x'},
+                                           _decode, _records))
+
+        self.assertEqual(pages, [[1], [2]])
+        self.assertEqual([call.kwargs['params'] for call in plugin.inner_request.call_args_list],
+                         [{'per_page': 2}, None])
+
+    def test_unknown_style_is_rejected(self):
+        with self.assertRaises(ValueError):
+            pagination.pagination_style({'pagination': 'pages'})
+        self.assertIsNone(pagination.pagination_style({'pagination': ''}))
+
+
+class RestImportTest(unittest.TestCase):
+
+    def test_paged_records_are_a_generator(self):
+        api = _Api(3)
+        importer = RestImport.__new__(RestImport)
+        importer.config = {'address': 'https://api/assets', 'data_key': 'result',
+                           'pagination': 'page', 'page_size': '2'}
+        importer.inner_request = MagicMock(side_effect=lambda **kwargs: MagicMock(
+            json=lambda: {'result': api.page(kwargs['params'])}))
+
+        records = importer.get_by_http()
+
+        importer.inner_request.assert_not_called()
+        self.assertEqual([record['host'] for record in records], ['srv0', 'srv1', 'srv2'])
+        # Records from pages pass the data_key extraction unchanged
+        self.assertIs(importer.records(records), records)
+
+    def test_single_response_keeps_the_data_key(self):
+        importer = RestImport.__new__(RestImport)
+        importer.config = {'address': 'https://api/assets', 'data_key': 'result'}
+        importer.inner_request = MagicMock(return_value=MagicMock(
+            json=lambda: {'result': [{'host': 'a'}]}))
+
+        self.assertEqual(importer.records(importer.get_by_http()), [{'host': 'a'}])
+
+
+class YmlImportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.syncer = YMLSyncer.__new__(YMLSyncer)
+        self.syncer.config = {'address': 'https://api/inventory.yml',
+                              'name_of_hosts_key': 'hosts',
+                              'name_of_variables_key': 'vars'}
+
+    def test_cursor_pages_yield_the_hosts_of_their_groups(self):
+        pages = {
+            None: "web:\n  hosts: [web1, web2, web3]\n  vars: {role: web}\n"
+                  "next: {cursor: c2}\n",
+            'c2': "db:\n  hosts: [db1]\n  vars: {role: db}\n",
+        }
+        self.syncer.config.update(pagination='cursor', page_size='2', next_key='next.cursor')
+
+        self.syncer.inner_request = MagicMock(side_effect=lambda **kwargs: SimpleNamespace(
+            text=pages[kwargs['params'].get('cursor')]))
+
+        hosts = self.syncer.get_by_http()
+
+        self.assertEqual([(host['hostname'], host['role']) for host in hosts],
+                         [('web1', 'web'), ('web2', 'web'), ('web3', 'web'), ('db1', 'db')])
+
+    def test_page_and_offset_paging_are_rejected(self):
+        self.syncer.inner_request = MagicMock()
+        for style in ('page', 'offset'):
+            self.syncer.config['pagination'] = style
+            with self.assertRaisesRegex(ValueError, 'not supported for YML'):
+                self.syncer.get_by_http()
+        self.syncer.inner_request.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -120,6 +120,24 @@ class TestPlugin(unittest.TestCase):
             timeout=30,
         )
 
+    @patch('application.modules.plugin.app')
+    @patch('application.modules.plugin.requests')
+    @patch('application.modules.plugin.logger')
+    def test_inner_request_stream_does_not_read_the_body(self, _logger, mock_requests,
+                                                         mock_app):
+        mock_app.config = self.mock_app_config
+        mock_response = Mock()
+        mock_session = Mock()
+        mock_session.request.return_value = mock_response
+        mock_requests.Session.return_value = mock_session
+
+        plugin = Plugin()
+        result = plugin.inner_request('GET', 'http://example.com', stream=True)
+
+        self.assertEqual(result, mock_response)
+        self.assertTrue(mock_session.request.call_args[1]['stream'])
+        mock_response.json.assert_not_called()
+
     @patch('application.modules.plugin.app')
     @patch('application.modules.plugin.requests')
     @patch('application.modules.plugin.logger')
@@ -354,6 +372,74 @@ class TestPlugin(unittest.TestCase):
         self.assertEqual(result.status_code, 200)
         self.assertEqual(result.headers, {})
 
+    @patch('application.modules.plugin.app')
+    def test_map_requests_keeps_order_and_collects_errors(self, mock_app):
+        mock_app.config = self.mock_app_config
+        def func(item):
+            if item == 3:
+                raise ValueError('boom')
+            time.sleep(0.01 * (5 - item))
+            return item * 2
+
+        plugin = Plugin()
+        results = list(plugin.map_requests(func, range(5), max_workers=4))
+
+        self.assertEqual([item for item, _, _ in results], [0, 1, 2, 3, 4])
+        self.assertEqual([result for _, result, _ in results], [0, 2, 4, None, 8])
+        self.assertIsInstance(results[3][2], ValueError)
+        self.assertIsNone(results[0][2])
+
+    @patch('application.modules.plugin.app')
+    @patch('application.modules.plugin.logger')
+    def test_http_workers_account_override(self, mock_logger, mock_app):
+        mock_app.config = dict(self.mock_app_config, HTTP_MAX_WORKERS=8)
+        plugin = Plugin()
+        self.assertEqual(plugin.http_workers(), 8)
+        plugin.config = {'name': 'test_account', 'http_workers': '20'}
+        self.assertEqual(plugin.http_workers(), 20)
+        plugin.config = {'name': 'test_account', 'http_workers': 'many'}
+        self.assertEqual(plugin.http_workers(), 8)
+        mock_logger.warning.assert_called_once()
+
+    @patch('application.modules.plugin.app')
+    @patch('application.modules.plugin.requests')
+    @patch('application.modules.plugin.logger')
+    def test_session_pool_sized_for_workers(self, _logger, mock_requests, mock_app):
+        mock_app.config = dict(self.mock_app_config, HTTP_MAX_WORKERS=16)
+        mock_session = Mock()
+        mock_session.request.return_value = Mock(json=lambda: {})
+        mock_requests.Session.return_value = mock_session
+
+        plugin = Plugin()
+        plugin.inner_request('GET', 'http://example.com')
+        plugin.inner_request('GET', 'http://example.com')
+
+        mock_requests.Session.assert_called_once()
+        mock_requests.adapters.HTTPAdapter.assert_called_once_with(
+            pool_connections=16, pool_maxsize=16)
+        self.assertEqual(mock_session.mount.call_count, 2)
+
+    @patch('application.modules.plugin.app')
+    @patch('application.modules.plugin.requests')
+    @patch('application.modules.plugin.logger')
+    @patch('application.modules.plugin.time')
+    def test_rate_limit_spaces_requests_per_target(self, mock_time, _logger,
+                                                   mock_requests, mock_app):
+        mock_app.config = dict(self.mock_app_config, HTTP_RATE_LIMIT=2)
+        mock_time.monotonic.return_value = 1000.0
+        mock_session = Mock()
+        mock_session.request.return_value = Mock(json=lambda: {})
+        mock_requests.Session.return_value = mock_session
+
+        plugin = Plugin()
+        plugin.inner_request('GET', 'http://limited.example.com/a')
+        plugin.inner_request('GET', 'http://limited.example.com/b')
+        plugin.inner_request('GET', 'http://limited.example.com/c')
+        plugin.inner_request('GET', 'http://other.example.com/a')
+
+        self.assertEqual([call.args[0] for call in mock_time.sleep.call_args_list],
+                         [0.5, 1.0])
+
     @patch('application.modules.plugin.app')
     @patch('application.modules.plugin.CustomAttributeRule')
     @patch('application.modules.plugin.CustomAttributeRuleModel')
@@ -379,18 +465,18 @@ class TestPlugin(unittest.TestCase):
     def test_get_attributes_with_cache_hit(self, _logger, mock_app):
         mock_app.config = self.mock_app_config
 
-        mock_host = Mock()
-        mock_host.hostname = 'test-host'
+        mock_host = self._cacheable_host()
         mock_host.cache = {
             'test_cache_hostattribute': {
-                'attributes': {
+                'stamp': 'current',
+                'value': {
                     'all': {'attr1': 'value1'},
                     'filtered': {'attr2': 'value2'}
                 }
             }
         }
 
-        plugin = Plugin()
+        plugin = self._stamped_plugin('current')
         result = plugin.get_attributes(mock_host, 'test_cache')
 
         expected = {
@@ -403,22 +489,84 @@ class TestPlugin(unittest.TestCase):
     def test_get_attributes_ignore_host(self, mock_app):
         mock_app.config = self.mock_app_config
 
-        mock_host = Mock()
-        mock_host.hostname = 'test-host'
+        mock_host = self._cacheable_host()
         mock_host.cache = {
             'test_cache_hostattribute': {
-                'attributes': {
+                'stamp': 'current',
+                'value': {
                     'all': {'attr1': 'value1'},
                     'filtered': {'ignore_host': True}
                 }
             }
         }
 
-        plugin = Plugin()
+        plugin = self._stamped_plugin('current')
         result = plugin.get_attributes(mock_host, 'test_cache')
 
         self.assertFalse(result)
 
+    @patch('application.modules.plugin.app')
+    def test_get_attributes_stale_cache_is_recomputed(self, mock_app):
+        """A cache entry with an outdated stamp (rule edit, new host data) is ignored."""
+        mock_app.config = self.mock_app_config
+
+        mock_host = self._cacheable_host()
+        mock_host.cache = {
+            'test_cache_hostattribute': {
+                'stamp': 'before-rule-edit',
+                'value': {
+                    'all': {'attr1': 'old'},
+                    'filtered': {}
+                }
+            }
+        }
+
+        plugin = self._stamped_plugin('after-rule-edit')
+        plugin.custom_attributes.get_outcomes.return_value = {'attr1': 'new'}
+        result = plugin.get_attributes(mock_host, 'test_cache')
+
+        self.assertEqual(result['all']['attr1'], 'new')
+        self.assertEqual(mock_host.cache['test_cache_hostattribute']['stamp'],
+                         'after-rule-edit')
+        mock_host.save.assert_called_once()
+
+    @patch('application.modules.plugin.app')
+    def test_attribute_cache_stamp_follows_host_data_and_rules(self, mock_app):
+        mock_app.config = self.mock_app_config
+        plugin = Plugin()
+        plugin.custom_attributes = Mock()
+        plugin.custom_attributes.rule_version_stamp.return_value = '0.1'
+        plugin.rewrite = None
+        plugin.filter = None
+        mock_host = self._cacheable_host()
+
+        stamp = plugin._attribute_cache_stamp(mock_host, {'a': '1'})
+        self.assertEqual(stamp, plugin._attribute_cache_stamp(mock_host, {'a': '1'}))
+        self.assertNotEqual(stamp, plugin._attribute_cache_stamp(mock_host, {'a': '2'}))
+        plugin.custom_attributes.rule_version_stamp.return_value = '0.2'
+        self.assertNotEqual(stamp, plugin._attribute_cache_stamp(mock_host, {'a': '1'}))
+
+    @staticmethod
+    def _cacheable_host():
+        mock_host = Mock()
+        mock_host.hostname = 'test-host'
+        mock_host.source_account_name = None
+        mock_host.labels = {}
+        mock_host.inventory = {}
+        mock_host.cmdb_templates = []
+        return mock_host
+
+    @staticmethod
+    def _stamped_plugin(stamp):
+        plugin = Plugin()
+        plugin.custom_attributes = Mock()
+        plugin.custom_attributes.get_outcomes.return_value = {}
+        plugin.init_custom_attributes = Mock()
+        plugin.rewrite = None
+        plugin.filter = None
+        plugin._attribute_cache_stamp = Mock(return_value=stamp)
+        return plugin
+
     @patch('application.modules.plugin.app')
     def test_get_attributes_deferred_cache_save(self, mock_app):
         mock_app.config = self.mock_app_config
@@ -438,13 +586,15 @@ class TestPlugin(unittest.TestCase):
         plugin.rewrite.get_outcomes.return_value = {'add_extra': 'y'}
         plugin.filter = Mock()
         plugin.filter.get_outcomes.return_value = {'filtered': 'z'}
+        for engine in (plugin.custom_attributes, plugin.rewrite, plugin.filter):
+            engine.rule_version_stamp.return_value = '0.0'
 
         result = plugin.get_attributes(mock_host, 'test_cache', persist_cache=False)
 
         self.assertEqual(result['all']['custom'], 'x')
         self.assertEqual(result['all']['extra'], 'y')
         self.assertEqual(result['filtered'], {'filtered': 'z'})
-        self.assertTrue(mock_host.cache['test_cache_hostattribute']['attributes'])
+        self.assertTrue(mock_host.cache['test_cache_hostattribute']['value'])
         mock_host.save.assert_not_called()
         self.assertTrue(getattr(mock_host, '_cache_dirty', False))
         plugin.custom_attributes.get_outcomes.assert_called_once()
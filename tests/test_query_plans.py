@@ -0,0 +1,78 @@
+"""
+Tests for the hot-query registry and its plan walk.
+"""
+# pylint: disable=missing-function-docstring,missing-class-docstring,protected-access
+import unittest
+from unittest.mock import MagicMock
+
+from tests import _load_real_module  # pylint: disable=no-name-in-module
+
+query_plans = _load_real_module(
+    'application.helpers.query_plans_under_test',
+    'helpers/query_plans.py',
+)
+
+
+def _queryset(winning_plan):
+    queryset = MagicMock()
+    queryset.explain.return_value = {'queryPlanner': {'winningPlan': winning_plan}}
+    return lambda: queryset
+
+
+class PlanStagesTest(unittest.TestCase):
+
+    def test_classic_plan_is_walked_root_first(self):
+        plan = {'stage': 'FETCH', 'inputStage': {
+            'stage': 'IXSCAN', 'indexName': 'project_1'}}
+        self.assertEqual(query_plans.plan_stages(plan), ['FETCH', 'IXSCAN'])
+
+    def test_or_branches_are_included(self):
+        plan = {'stage': 'SUBPLAN', 'inputStage': {'stage': 'OR', 'inputStages': [
+            {'stage': 'IXSCAN'}, {'stage': 'COLLSCAN'}]}}
+        self.assertIn('COLLSCAN', query_plans.plan_stages(plan))
+
+    def test_slot_based_engine_plan_is_unwrapped(self):
+        plan = {'queryPlan': {'stage': 'COLLSCAN'}, 'slotBasedPlan': {}}
+        self.assertEqual(query_plans.plan_stages(plan), ['COLLSCAN'])
+
+
+class RegisterTest(unittest.TestCase):
+
+    def test_the_host_queries_are_registered(self):
+        for name in ('get_export_hosts', 'delete_host_not_found_on_import',
+                     'get_dependents', 'template_consumers'):
+            self.assertIn(name, query_plans._HOT_QUERIES)
+
+
+class ExplainTest(unittest.TestCase):
+
+    def setUp(self):
+        self._saved = dict(query_plans._HOT_QUERIES)
+        query_plans._HOT_QUERIES.clear()
+
+    def tearDown(self):
+        query_plans._HOT_QUERIES.clear()
+        query_plans._HOT_QUERIES.update(self._saved)
+
+    def test_each_registered_query_is_explained(self):
+        query_plans.register_hot_query('export', _queryset({'stage': 'COLLSCAN'}))
+        query_plans.register_hot_query('deps', _queryset({'stage': 'IXSCAN'}))
+        self.assertEqual(list(query_plans.explain_hot_queries()), [
+            ('export', ['COLLSCAN'], None), ('deps', ['IXSCAN'], None)])
+
+    def test_registering_a_name_again_replaces_it(self):
+        query_plans.register_hot_query('export', _queryset({'stage': 'COLLSCAN'}))
+        query_plans.register_hot_query('export', _queryset({'stage': 'IXSCAN'}))
+        self.assertEqual(list(query_plans.explain_hot_queries()),
+                         [('export', ['IXSCAN'], None)])
+
+    def test_failing_query_is_reported_not_raised(self):
+        def broken():
+            raise RuntimeError('no connection')
+        query_plans.register_hot_query('broken', broken)
+        self.assertEqual(list(query_plans.explain_hot_queries()),
+                         [('broken', [], 'no connection')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,10 +2,11 @@
 Unit tests for the Rule base class optimizations.
 """
 # pylint: disable=missing-function-docstring,protected-access
+import pickle
 import unittest
 from unittest.mock import Mock, patch
 
-from application.modules.rule.rule import Rule
+from application.modules.rule.rule import Rule, index_key
 
 
 class _RuleForTests(Rule):
@@ -14,6 +15,16 @@ class _RuleForTests(Rule):
         return outcomes
 
 
+class _StoredRule:  # pylint: disable=too-few-public-methods
+    """Picklable stand-in for a rule document."""
+
+    def __init__(self, doc):
+        self.doc = doc
+
+    def to_mongo(self):
+        return dict(self.doc)
+
+
 class TestRuleOptimizations(unittest.TestCase):
     """Tests for low-risk Rule matching optimizations."""
     def setUp(self):
@@ -91,16 +102,215 @@ class TestRuleOptimizations(unittest.TestCase):
         self.assertEqual(second, {'hits': ['r1']})
         rule_doc.to_mongo.assert_called_once()
 
+    @patch('application.modules.rule.rule.app')
+    def test_engine_can_be_pickled_after_matching(self, mock_app):
+        mock_app.config = {'ADVANCED_RULE_DEBUG': False}
+        self.rule.rules = [_StoredRule({
+            'name': 'r1', '_id': '1', 'condition_typ': 'any',
+            'conditions': [_host_condition('host-a')],
+            'outcomes': [], 'last_match': False,
+        })]
+        self.rule.debug = False
+        self.assertEqual(self.rule.check_rules('host-a'), {'hits': ['r1']})
+        self.assertIsNotNone(self.rule._compiled_rules_cache)
+
+        copy = pickle.loads(pickle.dumps(self.rule))
+
+        self.assertIsNone(copy._compiled_rules_cache)
+        self.assertIsNone(copy._rule_index_cache)
+        self.assertEqual(copy.check_rules('host-a'), {'hits': ['r1']})
+        self.assertEqual(copy.check_rules('host-b'), {})
+        self.assertIsNotNone(self.rule._compiled_rules_cache)
+
+
+def _tag_condition(tag, value, **options):
+    """
+    Tag condition, options: tag_match, value_match, tag_negate, value_negate
+    """
+    return {
+        'match_type': 'tag',
+        'tag': tag,
+        'tag_match': options.get('tag_match', 'equal'),
+        'tag_match_negate': options.get('tag_negate', False),
+        'value': value,
+        'value_match': options.get('value_match', 'equal'),
+        'value_match_negate': options.get('value_negate', False),
+    }
+
+
+def _host_condition(hostname, hostname_match='equal', negate=False):
+    return {
+        'match_type': 'host',
+        'hostname': hostname,
+        'hostname_match': hostname_match,
+        'hostname_match_negate': negate,
+    }
+
+
+class TestCompiledConditions(unittest.TestCase):
+    """Compiled condition predicates must agree with the interpreter."""
+
+    CONDITIONS = [
+        _tag_condition('env', 'prod'),
+        _tag_condition('env', 'PROD'),
+        _tag_condition('ENV', 'prod'),
+        _tag_condition('env', 'prod', tag_negate=True),
+        _tag_condition('env', 'prod', value_negate=True),
+        _tag_condition('env', '', tag_match='ignore', tag_negate=True),
+        _tag_condition('missing', '', tag_match='ignore', tag_negate=True),
+        _tag_condition('env', 'prod, dev', value_match='in_list'),
+        _tag_condition('os', 'win', tag_match='ignore', value_match='swith'),
+        _tag_condition('e', 'pro', tag_match='swith', value_match='in'),
+        _tag_condition('^o.*', r'lin.*', tag_match='regex', value_match='regex'),
+        _tag_condition('custom_fields["role"]', 'web'),
+        _tag_condition("custom_fields['role']", 'WEB', tag_match='in'),
+        _tag_condition('env', '{{ env }}'),
+        _host_condition('HOST-A'),
+        _host_condition('host', 'swith'),
+        _host_condition('host-b', negate=True),
+        _host_condition(r'host-\w', 'REGEX'),
+    ]
+    ATTRIBUTES = [
+        {'env': 'prod', 'os': 'linux', 'custom_fields': {'role': 'web'}},
+        {'env': 'Dev', 'os': 'windows'},
+        {},
+    ]
+
+    def setUp(self):
+        self.rule = _RuleForTests()
+
+    @patch('application.modules.rule.rule.render_jinja',
+           side_effect=lambda value, **kwargs: kwargs.get('env', ''))
+    @patch('application.modules.rule.rule.app')
+    def test_compiled_predicates_match_interpreter(self, mock_app, _render):
+        mock_app.config = {'ADVANCED_RULE_DEBUG': False}
+        for condition in self.CONDITIONS:
+            predicate = self.rule._compile_condition(condition)
+            for attributes in self.ATTRIBUTES:
+                for hostname in ('host-a', 'HOST-B'):
+                    self.rule.attributes = attributes
+                    with self.subTest(condition=condition, attributes=attributes,
+                                      hostname=hostname):
+                        self.assertEqual(
+                            predicate(hostname, hostname.lower()),
+                            self.rule.handle_match(condition, hostname))
+
+    @patch('application.modules.rule.rule.app')
+    def test_check_rules_compiles_once_per_rule_set(self, mock_app):
+        mock_app.config = {'ADVANCED_RULE_DEBUG': False}
+        rule_doc = Mock()
+        rule_doc.to_mongo.return_value = {
+            'name': 'r1',
+            '_id': '1',
+            'condition_typ': 'all',
+            'conditions': [_tag_condition('env', 'prod')],
+            'outcomes': [],
+            'last_match': False,
+        }
+        self.rule.rules = [rule_doc]
+        with patch.object(self.rule, '_compile_condition',
+                          wraps=self.rule._compile_condition) as compile_mock:
+            self.rule.attributes = {'env': 'prod'}
+            self.assertEqual(self.rule.check_rules('host-a'), {'hits': ['r1']})
+            self.rule.attributes = {'env': 'dev'}
+            self.assertEqual(self.rule.check_rules('host-b'), {})
+        compile_mock.assert_called_once()
+
+
+def _rule_doc(name, condition_typ, conditions, last_match=False):
+    doc = Mock()
+    doc.name = name
+    doc.to_mongo.return_value = {
+        'name': name,
+        '_id': name,
+        'condition_typ': condition_typ,
+        'conditions': conditions,
+        'outcomes': [],
+        'last_match': last_match,
+    }
+    return doc
+
+
+class TestRuleIndex(unittest.TestCase):
+    """The rule index only skips rules a host can not match."""
+
+    def setUp(self):
+        self.rule = _RuleForTests()
+        self.rule.rules = [
+            _rule_doc('windows', 'all', [_tag_condition('os', 'Windows')]),
+            _rule_doc('always', 'anyway', []),
+            _rule_doc('linux-prod', 'all', [_tag_condition('env', 'prod', value_match='in'),
+                                            _tag_condition('os', 'linux')]),
+            _rule_doc('hosts', 'any', [_host_condition('HOST-A'),
+                                       _host_condition('host-c')]),
+            _rule_doc('mixed-any', 'any', [_host_condition('host-b'),
+                                           _tag_condition('os', 'lin', value_match='swith')]),
+            _rule_doc('stop', 'all', [_tag_condition('env', 'stage')], last_match=True),
+            _rule_doc('after-stop', 'all', [_tag_condition('os', 'linux')]),
+        ]
+
+    def _all_rules(self, prepared_rules, _hostname_lower):
+        return range(len(prepared_rules))
+
+    @patch('application.modules.rule.rule.app')
+    def test_index_gives_same_outcomes_as_full_scan(self, mock_app):
+        mock_app.config = {'ADVANCED_RULE_DEBUG': False}
+        hosts = [
+            ('host-a', {'os': 'windows'}),
+            ('host-b', {'os': 'LINUX', 'env': 'preprod'}),
+            ('host-c', {'os': 'linux', 'env': 'stage'}),
+            ('host-d', {'os': 'solaris'}),
+            ('host-e', {}),
+        ]
+        for hostname, attributes in hosts:
+            self.rule.attributes = attributes
+            with self.subTest(hostname=hostname):
+                indexed = self.rule.check_rules(hostname)
+                with patch.object(self.rule, '_candidate_rules', self._all_rules):
+                    full = self.rule.check_rules(hostname)
+                self.assertEqual(indexed, full)
+
+    @patch('application.modules.rule.rule.app')
+    def test_host_only_evaluates_candidate_rules(self, mock_app):
+        mock_app.config = {'ADVANCED_RULE_DEBUG': False}
+        self.rule.attributes = {'os': 'solaris'}
+        _objs, prepared = self.rule._iter_rule_docs()
+        names = [prepared[idx]['name']
+                 for idx in self.rule._candidate_rules(prepared, 'host-d')]
+        self.assertEqual(names, ['always', 'mixed-any'])
+
+    def test_index_keys(self):
+        self.assertEqual(index_key(_tag_condition('os', 'Linux')),
+                         ('tag', 'os', 'linux'))
+        self.assertEqual(index_key(_host_condition('Host-A')),
+                         ('hostname', 'host-a'))
+        self.assertIsNone(index_key(_tag_condition('os', 'linux', tag_negate=True)))
+        self.assertIsNone(index_key(_tag_condition('os', 'lin', value_match='regex')))
+        self.assertIsNone(index_key(_tag_condition('os', '{{ os }}')))
+        self.assertIsNone(index_key(_tag_condition('custom_fields["os"]', 'linux')))
+        self.assertIsNone(index_key(_host_condition('host-a', negate=True)))
+
 
 class TestGetOutcomesCache(unittest.TestCase):
     """Tests for the per-host outcome cache handling in get_outcomes."""
     def setUp(self):
+        versions = patch('application.modules.rule.rule.rule_versions',
+                         return_value={})
+        self.rule_versions = versions.start()
+        self.addCleanup(versions.stop)
         self.rule = _RuleForTests()
         self.rule.check_rule_match = Mock(return_value={'hits': ['fresh']})
         self.db_host = Mock()
         self.db_host.hostname = 'host-a'
         self.db_host.cache = {}
 
+    def _cached(self, outcomes, attributes=None, rule=None):
+        rule = rule or self.rule
+        return {
+            'stamp': rule.cache_stamp(self.db_host.hostname, attributes or {}),
+            'value': outcomes,
+        }
+
     def test_cache_key_defaults_to_class_name(self):
         self.rule.get_outcomes(self.db_host, {})
         self.assertIn('_RuleForTests', self.db_host.cache)
@@ -122,20 +332,52 @@ class TestGetOutcomesCache(unittest.TestCase):
         other.check_rule_match.assert_called_once()
 
     def test_cached_result_is_returned(self):
-        self.db_host.cache['_RuleForTests'] = {'hits': ['cached']}
+        self.db_host.cache['_RuleForTests'] = self._cached({'hits': ['cached']})
         result = self.rule.get_outcomes(self.db_host, {})
         self.assertEqual(result, {'hits': ['cached']})
         self.rule.check_rule_match.assert_not_called()
 
+    def test_changed_attributes_invalidate_the_cache(self):
+        self.db_host.cache['_RuleForTests'] = self._cached(
+            {'hits': ['cached']}, attributes={'os': 'linux'})
+        result = self.rule.get_outcomes(self.db_host, {'os': 'windows'})
+        self.assertEqual(result, {'hits': ['fresh']})
+        self.assertEqual(self.db_host.cache['_RuleForTests']['value'],
+                         {'hits': ['fresh']})
+
+    def test_rule_version_bump_invalidates_the_cache(self):
+        self.rule.rules = Mock()
+        self.rule.rules._document._get_collection_name.return_value = 'downtimes'
+        self.db_host.cache['_RuleForTests'] = self._cached({'hits': ['cached']})
+
+        # A rule of another type was edited: the cache stays valid
+        other = _RuleForTests()
+        other.rules = self.rule.rules
+        self.rule_versions.return_value = {'filters': 3}
+        self.assertEqual(other.get_outcomes(self.db_host, {}), {'hits': ['cached']})
+
+        # A rule of this type was edited
+        self.rule_versions.return_value = {'filters': 3, 'downtimes': 1}
+        other = _RuleForTests()
+        other.rules = self.rule.rules
+        other.check_rule_match = Mock(return_value={'hits': ['fresh']})
+        self.assertEqual(other.get_outcomes(self.db_host, {}), {'hits': ['fresh']})
+
+    def test_legacy_cache_entry_is_recomputed(self):
+        # Entries written before the cache was stamped hold the bare outcomes
+        self.db_host.cache['_RuleForTests'] = {'hits': ['cached']}
+        result = self.rule.get_outcomes(self.db_host, {})
+        self.assertEqual(result, {'hits': ['fresh']})
+
     def test_use_cache_false_bypasses_read_and_write(self):
         # Debug evaluations run with a different rule set than the exports
         # and must neither return the export's cached outcomes nor
         # overwrite them.
-        self.db_host.cache['_RuleForTests'] = {'hits': ['cached']}
+        cached = self._cached({'hits': ['cached']})
+        self.db_host.cache['_RuleForTests'] = cached
         result = self.rule.get_outcomes(self.db_host, {}, use_cache=False)
         self.assertEqual(result, {'hits': ['fresh']})
-        self.assertEqual(self.db_host.cache['_RuleForTests'],
-                         {'hits': ['cached']})
+        self.assertEqual(self.db_host.cache['_RuleForTests'], cached)
         self.db_host.save.assert_not_called()
 
 
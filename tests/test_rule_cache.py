@@ -0,0 +1,216 @@
+"""
+Tests for the per-host rule cache store.
+"""
+# pylint: disable=missing-function-docstring,protected-access
+import re
+import types
+import unittest
+from unittest.mock import patch
+
+import bson
+from bson.raw_bson import RawBSONDocument
+
+from application.modules.rule import cache as cache_module
+from application.modules.rule.cache import (
+    CollectionCacheStore, HostDocumentCacheStore, get_cache_store,
+)
+
+
+class _FakeCollection:
+    """The parts of a pymongo collection the store uses."""
+
+    def __init__(self):
+        self.docs = {}
+        self.finds = 0
+        self.bulk_writes = []
+
+    def find(self, query, _projection):
+        self.finds += 1
+        host_ids = query['host_id']
+        host_ids = host_ids['$in'] if isinstance(host_ids, dict) else [host_ids]
+        return [RawBSONDocument(bson.encode(dict(doc, cache_name=name, host_id=host_id)))
+                for (host_id, name), doc in self.docs.items()
+                if host_id in host_ids and query.get('cache_name', name) == name]
+
+    def bulk_write(self, operations, ordered=True):
+        self.bulk_writes.append((len(operations), ordered))
+        for operation in operations:
+            key = (operation._filter['host_id'], operation._filter['cache_name'])
+            self.docs[key] = dict(operation._doc['$set'].items())
+
+    def delete_many(self, query):
+        pattern = re.compile(query.get('cache_name', {}).get('$regex', ''), re.I)
+        host_ids = query.get('host_id')
+        if not isinstance(host_ids, dict):
+            host_ids = {'$in': [host_ids]} if host_ids is not None else None
+        for key in list(self.docs):
+            if (host_ids is None or key[0] in host_ids['$in']) and pattern.match(key[1]):
+                del self.docs[key]
+
+
+def _host(pk, hostname='host-a'):
+    return types.SimpleNamespace(pk=pk, hostname=hostname)
+
+
+class TestCollectionCacheStore(unittest.TestCase):
+    """Tests for the collection backend with its LRU and write queue."""
+
+    def setUp(self):
+        self.collection = _FakeCollection()
+        collection = patch.object(CollectionCacheStore, '_collection',
+                                  return_value=self.collection)
+        collection.start()
+        self.addCleanup(collection.stop)
+        self.store = CollectionCacheStore(lru_hosts=2, write_batch=3)
+        self.addCleanup(setattr, self.store, '_pending', {})
+
+    def test_entries_of_a_host_are_loaded_once(self):
+        host = _host(1)
+        self.assertIsNone(self.store.get(host, 'checkmk_hostattribute'))
+        self.store.set(host, 'checkmk_hostattribute', 's1', {'all': {'a': 1}})
+        self.store.set(host, 'CheckmkRule', 's2', {'hits': []})
+        self.assertEqual(self.store.get(host, 'checkmk_hostattribute'),
+                         ('s1', {'all': {'a': 1}}))
+        self.assertEqual(self.store.get(host, 'CheckmkRule'), ('s2', {'hits': []}))
+        self.assertEqual(self.collection.finds, 1)
+
+    def test_returned_values_are_copies(self):
+        host = _host(1)
+        self.store.set(host, 'cache', 's', {'all': {'a': 1}})
+        self.store.get(host, 'cache')[1]['all']['a'] = 2
+        self.assertEqual(self.store.get(host, 'cache'), ('s', {'all': {'a': 1}}))
+
+    def test_writes_are_sent_in_one_unordered_bulk(self):
+        for pk in (1, 2):
+            self.store.set(_host(pk), 'cache', 's', {'pk': pk})
+        self.assertEqual(self.collection.bulk_writes, [])
+        self.store.set(_host(1), 'other', 's', {})
+        self.assertEqual(self.collection.bulk_writes, [(3, False)])
+        self.assertEqual(self.store._pending, {})
+
+    def test_repeated_writes_of_one_entry_are_merged(self):
+        host = _host(1)
+        self.store.set(host, 'cache', 's1', {})
+        self.store.set(host, 'cache', 's2', {})
+        self.store.flush()
+        self.assertEqual(self.collection.bulk_writes, [(1, False)])
+        self.assertEqual(self.collection.docs[(1, 'cache')]['stamp'], 's2')
+
+    def test_flushed_entries_are_read_by_other_processes(self):
+        self.store.set(_host(1), 'cache', 's', {'all': {'a': 1}})
+        self.store.flush()
+        other = CollectionCacheStore()
+        self.assertEqual(other.get(_host(1), 'cache'), ('s', {'all': {'a': 1}}))
+
+    def test_fresh_reads_bypass_the_lru(self):
+        host = _host(1)
+        self.assertIsNone(self.store.get(host, 'cache'))
+        other = CollectionCacheStore()
+        other.set(host, 'cache', 's', {'all': {'a': 1}})
+        other.flush()
+        self.assertIsNone(self.store.get(host, 'cache'))
+        self.assertEqual(self.store.get(host, 'cache', fresh=True),
+                         ('s', {'all': {'a': 1}}))
+        self.assertEqual(self.store.entries(host, fresh=True),
+                         {'cache': {'stamp': 's', 'value': {'all': {'a': 1}}}})
+        self.assertIsNone(self.store._hosts[1].get('cache'))
+
+    def test_models_without_a_key_have_no_entries(self):
+        model = types.SimpleNamespace(hostname='host-a')
+        self.assertEqual(self.store.entries(model), {})
+        self.assertIsNone(self.store.get(model, 'cache', fresh=True))
+        self.assertEqual(self.collection.finds, 0)
+
+    def test_one_entry_of_many_hosts_in_one_query(self):
+        self.store.get(_host(1), 'cache')
+        self.store.set(_host(1), 'cache', 's1', {'pk': 1})
+        self.store.set(_host(2), 'other', 's2', {'pk': 2})
+        finds = self.collection.finds
+        self.assertEqual(self.store.get_many([_host(1), _host(2), _host(None)], 'cache'),
+                         {1: ('s1', {'pk': 1}), 2: None})
+        self.assertEqual(self.collection.finds, finds + 1)
+        self.assertEqual(self.store._pending, {})
+
+    def test_least_recently_used_host_is_evicted(self):
+        for pk in (1, 2):
+            self.store.get(_host(pk), 'cache')
+        self.store.get(_host(1), 'cache')
+        self.store.get(_host(3), 'cache')
+        self.assertEqual(list(self.store._hosts), [1, 3])
+
+    def test_fork_child_drops_the_queue_of_the_parent(self):
+        self.store.set(_host(1), 'cache', 's', {})
+        with patch.object(cache_module.mp_util, 'Finalize') as finalize:
+            self.store._after_fork()
+        self.assertEqual(self.store._pending, {})
+        finalize.assert_called_once_with(self.store, self.store.flush,
+                                         exitpriority=10)
+
+    def test_clear_removes_stored_and_queued_entries(self):
+        host = _host(1)
+        self.store.set(host, 'checkmk_hostattribute', 's', {})
+        self.store.flush()
+        self.store.set(host, 'CheckmkRule', 's', {})
+        self.store.set(host, 'idoit_hostattribute', 's', {})
+        self.store.clear(host, 'checkmk')
+        self.assertEqual(list(self.store._pending), [(1, 'idoit_hostattribute')])
+        self.assertIsNone(self.store.get(host, 'checkmk_hostattribute'))
+
+    def test_clear_hosts_removes_all_their_entries(self):
+        for pk in (1, 2):
+            self.store.set(_host(pk), 'cache', 's', {})
+        self.store.flush()
+        self.store.set(_host(1), 'other', 's', {})
+        self.store.clear_hosts([1])
+        self.assertEqual(list(self.collection.docs), [(2, 'cache')])
+        self.assertEqual(self.store._pending, {})
+        self.assertNotIn(1, self.store._hosts)
+
+    def test_unstorable_values_are_not_cached(self):
+        self.store.set(_host(1), 'cache', 's', {1: 'not a string key'})
+        self.assertIsNone(self.store.get(_host(1), 'cache'))
+        self.assertEqual(self.store._pending, {})
+
+    def test_unsaved_hosts_are_not_cached(self):
+        self.store.set(_host(None), 'cache', 's', {})
+        self.assertIsNone(self.store.get(_host(None), 'cache'))
+        self.assertEqual(self.collection.finds, 0)
+
+
+class TestHostDocumentCacheStore(unittest.TestCase):
+    """Tests for the legacy backend inside the Host document."""
+
+    def test_deferred_write_marks_the_host(self):
+        host = types.SimpleNamespace(cache={}, save=None)
+        HostDocumentCacheStore.set(host, 'cache', 's', {'a': 1}, persist=False)
+        self.assertEqual(HostDocumentCacheStore.get(host, 'cache'), ('s', {'a': 1}))
+        self.assertTrue(host._cache_dirty)
+
+    def test_unstamped_entries_are_ignored(self):
+        host = types.SimpleNamespace(cache={'cmk_tags_stamp': 'x',
+                                            'cache': {'outcomes': []}})
+        self.assertIsNone(HostDocumentCacheStore.get(host, 'cache'))
+        self.assertEqual(HostDocumentCacheStore.entries(host), {})
+
+
+class TestGetCacheStore(unittest.TestCase):
+    """Tests for the backend selection."""
+
+    def test_backend_is_taken_from_the_config(self):
+        with patch.object(cache_module, 'app') as app, \
+                patch.dict(cache_module._STORES, clear=True):
+            app.config = {'RULE_CACHE_BACKEND': 'host'}
+            store = get_cache_store()
+            self.assertIsInstance(store, HostDocumentCacheStore)
+            self.assertIs(get_cache_store(), store)
+
+    def test_unknown_backend_raises(self):
+        with patch.object(cache_module, 'app') as app, \
+                patch.dict(cache_module._STORES, clear=True):
+            app.config = {'RULE_CACHE_BACKEND': 'redis'}
+            with self.assertRaises(ValueError):
+                get_cache_store()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -13,6 +13,7 @@ import re
 
 from application.modules.rule.match import (
     check_condition,
+    compile_match,
     match,
     make_bool,
     MatchException,
@@ -236,5 +237,39 @@ class TestRegexCache(unittest.TestCase):
             _compiled_regex(overlong)
 
 
+class TestCompileMatch(unittest.TestCase):
+    """compile_match must behave exactly like match() with the same needle."""
+
+    VALUES = ["prod", "PROD", "web-01", "Web-01.example.com", "prod, dev",
+              ["linux", "prod"], 42, True, None, "", "true", "False"]
+    NEEDLES = ["prod", "PROD", "web", ".com", "prod, dev, stage",
+               ["prod", "dev"], r"web-\d+", "true", "", "none"]
+    CONDITIONS = ["equal", "in", "not_in", "string_in_list", "in_list",
+                  "swith", "ewith", "regex", "bool", "ignore", "unknown"]
+
+    def _result_of(self, func, *args):
+        try:
+            return ("ok", func(*args))
+        except MatchException as error:
+            return ("error", str(error))
+
+    def test_same_outcome_as_match(self):
+        for condition in self.CONDITIONS:
+            for needle in self.NEEDLES:
+                for negate in (False, True):
+                    compiled = compile_match(needle, condition, negate)
+                    for value in self.VALUES:
+                        with self.subTest(condition=condition, needle=needle,
+                                          negate=negate, value=value):
+                            self.assertEqual(
+                                self._result_of(compiled, value),
+                                self._result_of(match, value, needle, condition, negate))
+
+    def test_invalid_regex_raises_on_call_not_on_compile(self):
+        compiled = compile_match(r"[unclosed", "regex")
+        with self.assertRaises(MatchException):
+            compiled("web-01")
+
+
 if __name__ == "__main__":
     unittest.main(verbosity=2)
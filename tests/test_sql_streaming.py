@@ -0,0 +1,122 @@
+"""
+Tests for the streamed row reads of the MySQL and ODBC imports.
+"""
+# pylint: disable=missing-function-docstring,missing-class-docstring,protected-access
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+from application import app
+from application.helpers import sql
+from application.plugins.pyodbc.pyodbc import ODBC
+
+mysql_module = sys.modules['application.plugins.mysql.mysql']
+odbc_module = sys.modules['application.plugins.pyodbc.pyodbc']
+
+
+class _Cursor:
+    """Hands out its rows through fetchmany() only."""
+
+    def __init__(self, rows, description=None):
+        self.rows = list(rows)
+        self.description = description
+        self.fetches = []
+
+    def execute(self, _query):
+        pass
+
+    def fetchmany(self, size):
+        self.fetches.append(size)
+        chunk, self.rows = self.rows[:size], self.rows[size:]
+        return chunk
+
+    def fetchall(self):
+        raise AssertionError("fetchall() loads the whole result set")
+
+    def close(self):
+        pass
+
+
+class IterRowsTest(unittest.TestCase):
+
+    def test_rows_are_fetched_in_chunks(self):
+        cursor = _Cursor(range(5))
+        self.assertEqual(list(sql.iter_rows(cursor, 2)), [0, 1, 2, 3, 4])
+        self.assertEqual(cursor.fetches, [2, 2, 2, 2])
+
+    def test_fetch_size_from_the_account(self):
+        self.assertEqual(sql.fetch_size({'fetch_size': '50'}, 1000), 50)
+        self.assertEqual(sql.fetch_size({'fetch_size': ''}, 1000), 1000)
+        with self.assertRaises(ValueError):
+            sql.fetch_size({'fetch_size': '0'}, 1000)
+
+
+class MysqlStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.config = {'name': 'cmdb', 'address': 'db', 'username': 'u', 'password': 'p',
+                       'database': 'cmdb', 'fields': 'host,site', 'table': 'hosts',
+                       'hostname_field': 'host', 'inventorize_key': 'cmdb'}
+        self.cursor = _Cursor([('srv1', 'a'), (None, 'b'), ('srv2 ', 'c')])
+        self.connector = MagicMock()
+        self.connector.connector.connect.return_value.cursor.return_value = self.cursor
+        patcher = patch.object(mysql_module, 'mysql', self.connector, create=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_rows_stream_on_an_unbuffered_cursor(self):
+        with patch.dict(app.config, {'SQL_FETCH_SIZE': 2}):
+            rows = mysql_module._query_rows(self.config)
+            self.connector.connector.connect.assert_not_called()
+            self.assertEqual(len(list(rows)), 3)
+
+        connection = self.connector.connector.connect.return_value
+        connection.cursor.assert_called_once_with()
+        connection.close.assert_called_once()
+        self.assertEqual(self.cursor.fetches, [2, 2, 2])
+
+    def test_inventorize_hands_a_generator_to_the_inventory(self):
+        seen = []
+
+        def _run_inventory(_config, objects):
+            self.assertFalse(isinstance(objects, list))
+            seen.extend(objects)
+
+        with patch.object(mysql_module, 'get_account_by_name', return_value=self.config), \
+                patch.object(mysql_module, 'run_inventory', side_effect=_run_inventory):
+            mysql_module.mysql_inventorize('cmdb')
+
+        self.assertEqual(seen, [('srv1', {'site': 'a'}), ('srv2', {'site': 'c'})])
+
+
+class OdbcStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.plugin = ODBC.__new__(ODBC)
+        self.plugin.config = {'name': 'mssql', 'address': 'db', 'serverport': '1433',
+                              'driver': 'FreeTDS', 'database': 'cmdb', 'username': 'u',
+                              'password': 'p', 'fields': 'host,site', 'table': 'hosts',
+                              'hostname_field': 'host', 'fetch_size': '2'}
+        self.plugin.log_details = []
+        self.cursor = _Cursor([('srv1', 'a'), ('srv2', 'b'), ('srv3', 'c')],
+                              description=[('host',), ('site',)])
+        self.driver = MagicMock()
+        self.driver.connect.return_value.cursor.return_value = self.cursor
+        for patcher in (patch.object(odbc_module, 'pyodbc', self.driver, create=True),
+                        patch.dict(app.config, {'LOWERCASE_HOSTNAMES': False})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_hosts_are_yielded_while_rows_arrive(self):
+        hosts = self.plugin._innter_sql()
+
+        self.assertEqual(next(hosts), ('srv1', {'host': 'srv1', 'site': 'a'}))
+        self.assertEqual(self.cursor.fetches, [2])
+        self.assertEqual([hostname for hostname, _ in hosts], ['srv2', 'srv3'])
+        self.assertEqual(self.cursor.fetches, [2, 2, 2])
+        self.assertIn(('found_hosts', 3), self.plugin.log_details)
+        self.driver.connect.return_value.close.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()